@@ -0,0 +1,46 @@
+"""Add session_events append-only log and sessions.event_seq
+
+Revision ID: 004_add_session_events
+Revises: 003_add_cache_and_session_fields
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_add_session_events'
+down_revision = '003_add_cache_and_session_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 1. Log de eventos (append-only)
+    op.create_table(
+        'session_events',
+        sa.Column('id', sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column('session_id', sa.String(20), sa.ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('event_type', sa.String(30), nullable=False),
+        sa.Column('route_id', sa.String(50), nullable=True),
+        sa.Column('package_ids', sa.JSON(), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=True),
+        sa.Column('actor_telegram_id', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('idx_session_events_session_id', 'session_events', ['session_id', 'id'])
+    
+    # 2. Último evento incluído no snapshot da sessão
+    op.add_column('sessions', sa.Column('event_seq', sa.BigInteger(), server_default='0', nullable=True))
+    
+    print("✅ Tabela session_events criada")
+    print("✅ Coluna event_seq adicionada a sessions")
+
+
+def downgrade():
+    op.drop_column('sessions', 'event_seq')
+    op.drop_index('idx_session_events_session_id', table_name='session_events')
+    op.drop_table('session_events')
+    
+    print("⏮️ Log de eventos removido")
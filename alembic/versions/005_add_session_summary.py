@@ -0,0 +1,30 @@
+"""Add sessions.summary header for lazy session loading
+
+Revision ID: 005_add_session_summary
+Revises: 004_add_session_events
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005_add_session_summary'
+down_revision = '004_add_session_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Cabeçalho da sessão (status, contagens). Sessões antigas são preenchidas
+    # na primeira listagem pelo SessionStore.
+    op.add_column('sessions', sa.Column('summary', sa.JSON(), nullable=True))
+    
+    print("✅ Coluna summary adicionada a sessions")
+
+
+def downgrade():
+    op.drop_column('sessions', 'summary')
+    
+    print("⏮️ Coluna summary removida")
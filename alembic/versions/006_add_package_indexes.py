@@ -0,0 +1,54 @@
+"""Add indexes for packages/routes/sessions filters used by analytics and persistence
+
+Revision ID: 006_add_package_indexes
+Revises: 005_add_session_summary
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006_add_package_indexes'
+down_revision = '005_add_session_summary'
+branch_labels = None
+depends_on = None
+
+
+# nome -> (tabela, colunas/expressões, predicado do índice parcial)
+INDEXES = {
+    'idx_packages_session_status': ('packages', ['session_id', 'status'], None),
+    'idx_packages_assigned_delivered': ('packages', ['assigned_to_telegram_id', 'delivered_at'], None),
+    'idx_packages_route_id': ('packages', ['route_id'], None),
+    'idx_packages_activity_date': ('packages', [sa.text('DATE(COALESCE(delivered_at, created_at))')], None),
+    'idx_packages_created_at': ('packages', ['created_at'], None),
+    'idx_packages_status_coords': ('packages', ['status', 'lat', 'lng'], 'lat <> 0 AND lng <> 0'),
+    'idx_packages_lat_lng': ('packages', ['lat', 'lng'], None),
+    'idx_routes_session_id': ('routes', ['session_id'], None),
+    'idx_routes_assigned_to': ('routes', ['assigned_to_telegram_id'], 'assigned_to_telegram_id IS NOT NULL'),
+    'idx_sessions_created_at': ('sessions', ['created_at'], None),
+    'idx_sessions_open': ('sessions', ['created_at'], 'is_finalized = false'),
+}
+
+
+def upgrade():
+    # CONCURRENTLY não bloqueia gravações na tabela de pacotes (precisa de autocommit)
+    with op.get_context().autocommit_block():
+        for name, (table, columns, where) in INDEXES.items():
+            op.create_index(
+                name, table, columns,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+    
+    print(f"✅ {len(INDEXES)} índices criados (packages, routes, sessions)")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, (table, _, _) in INDEXES.items():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    
+    print("⏮️ Índices removidos")
@@ -0,0 +1,205 @@
+"""Normalize romaneios_data / optimized_order into romaneios, stops and stop_packages
+
+Revision ID: 007_normalize_romaneios_stops
+Revises: 006_add_package_indexes
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from bot_multidelivery.session_changes import POINT_FIELDS, STOP_FIELDS, STOP_PACKAGE_FIELDS, group_stops
+
+
+# revision identifiers, used by Alembic.
+revision = '007_normalize_romaneios_stops'
+down_revision = '006_add_package_indexes'
+branch_labels = None
+depends_on = None
+
+
+sessions = sa.table(
+    'sessions',
+    sa.column('session_id', sa.String),
+    sa.column('romaneios_data', sa.JSON),
+)
+routes = sa.table(
+    'routes',
+    sa.column('id', sa.String),
+    sa.column('session_id', sa.String),
+    sa.column('optimized_order', sa.JSON),
+)
+romaneios = sa.table(
+    'romaneios',
+    sa.column('id', sa.Integer),
+    sa.column('session_id', sa.String),
+    sa.column('romaneio_id', sa.String),
+    sa.column('filename', sa.String),
+    sa.column('uploaded_at', sa.DateTime),
+    sa.column('position', sa.Integer),
+)
+stops = sa.table(
+    'stops',
+    sa.column('id', sa.Integer),
+    sa.column('session_id', sa.String),
+    sa.column('romaneio_pk', sa.Integer),
+    sa.column('route_id', sa.String),
+    sa.column('sequence', sa.Integer),
+    *(sa.column(f) for f in STOP_FIELDS),
+)
+stop_packages = sa.table(
+    'stop_packages',
+    sa.column('stop_id', sa.Integer),
+    sa.column('session_id', sa.String),
+    sa.column('romaneio_pk', sa.Integer),
+    sa.column('route_id', sa.String),
+    sa.column('position', sa.Integer),
+    *(sa.column(f) for f in STOP_PACKAGE_FIELDS),
+)
+
+
+def _insert_stops(bind, points, session_id, romaneio_pk=None, route_id=None):
+    grouped = group_stops(points or [])
+    container = {'session_id': session_id, 'romaneio_pk': romaneio_pk, 'route_id': route_id}
+    if not grouped:
+        return
+    stop_ids = bind.execute(
+        stops.insert().returning(stops.c.id, sort_by_parameter_order=True),
+        [{**container, 'sequence': sequence, **stop} for sequence, (stop, _) in enumerate(grouped)]
+    ).scalars().all()
+    bind.execute(stop_packages.insert(), [
+        {**container, 'stop_id': stop_id, 'position': position, **package}
+        for stop_id, (_, packages) in zip(stop_ids, grouped)
+        for position, package in packages
+    ])
+
+
+def upgrade():
+    # 1. Tabelas normalizadas
+    op.create_table(
+        'romaneios',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('session_id', sa.String(20), sa.ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('romaneio_id', sa.String(50), nullable=False),
+        sa.Column('filename', sa.String(300), nullable=True),
+        sa.Column('uploaded_at', sa.DateTime(), nullable=True),
+        sa.Column('position', sa.Integer(), nullable=False),
+    )
+    op.create_index('idx_romaneios_session_position', 'romaneios', ['session_id', 'position'], unique=True)
+
+    op.create_table(
+        'stops',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('session_id', sa.String(20), sa.ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('romaneio_pk', sa.Integer(), sa.ForeignKey('romaneios.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('route_id', sa.String(50), sa.ForeignKey('routes.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('sequence', sa.Integer(), nullable=False),
+        sa.Column('address', sa.Text(), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=True),
+        sa.Column('lng', sa.Float(), nullable=True),
+        sa.Column('bairro', sa.String(100), nullable=True),
+        sa.CheckConstraint('(romaneio_pk IS NULL) <> (route_id IS NULL)', name='ck_stops_one_container'),
+    )
+    op.create_index('idx_stops_route_sequence', 'stops', ['route_id', 'sequence'])
+    op.create_index('idx_stops_romaneio_sequence', 'stops', ['romaneio_pk', 'sequence'])
+    op.create_index('idx_stops_session_id', 'stops', ['session_id'])
+
+    op.create_table(
+        'stop_packages',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('stop_id', sa.Integer(), sa.ForeignKey('stops.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('session_id', sa.String(20), sa.ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('romaneio_pk', sa.Integer(), sa.ForeignKey('romaneios.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('route_id', sa.String(50), sa.ForeignKey('routes.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('package_id', sa.String(50), nullable=False),
+        sa.Column('romaneio_id', sa.String(50), nullable=True),
+        sa.Column('priority', sa.String(20), server_default='normal', nullable=True),
+        sa.Column('status', sa.String(20), server_default='pending', nullable=True),
+        sa.Column('failure_reason', sa.String(100), nullable=True),
+        sa.Column('status_detail', sa.Text(), nullable=True),
+    )
+    op.create_index('idx_stop_packages_route_position', 'stop_packages', ['route_id', 'position'])
+    op.create_index('idx_stop_packages_romaneio_position', 'stop_packages', ['romaneio_pk', 'position'])
+    op.create_index('idx_stop_packages_session_package', 'stop_packages', ['session_id', 'package_id'])
+    op.create_index('idx_stop_packages_stop_id', 'stop_packages', ['stop_id'])
+
+    # 2. Backfill a partir do JSON (sessão por sessão) e limpa as colunas legadas
+    # (None no JSON pode ter sido gravado como 'null' em vez de NULL: filtra em Python)
+    bind = op.get_bind()
+    rows = [
+        (session_id, data) for session_id, data in
+        bind.execute(sa.select(sessions.c.session_id, sessions.c.romaneios_data)).fetchall()
+        if data is not None
+    ]
+    for session_id, romaneios_data in rows:
+        for position, r_data in enumerate(romaneios_data or []):
+            romaneio_pk = bind.execute(
+                romaneios.insert().returning(romaneios.c.id).values(
+                    session_id=session_id,
+                    romaneio_id=r_data['id'],
+                    filename=r_data.get('filename', ''),
+                    uploaded_at=datetime.fromisoformat(r_data['uploaded_at']) if r_data.get('uploaded_at') else None,
+                    position=position
+                )
+            ).scalar_one()
+            _insert_stops(bind, r_data.get('points'), session_id, romaneio_pk=romaneio_pk)
+
+        route_rows = bind.execute(
+            sa.select(routes.c.id, routes.c.optimized_order).where(routes.c.session_id == session_id)
+        ).fetchall()
+        for route_id, optimized_order in route_rows:
+            _insert_stops(bind, optimized_order, session_id, route_id=route_id)
+
+        bind.execute(routes.update().where(routes.c.session_id == session_id).values(optimized_order=None))
+        bind.execute(sessions.update().where(sessions.c.session_id == session_id).values(romaneios_data=None))
+
+    print("✅ Tabelas romaneios, stops e stop_packages criadas")
+    print(f"✅ {len(rows)} sessões migradas do JSON")
+
+
+def _points(bind, container_filter):
+    """Reconstrói a lista de pontos (dicts do JSON legado) de um romaneio ou rota"""
+    rows = bind.execute(
+        sa.select(*(stop_packages.c[f] for f in STOP_PACKAGE_FIELDS), *(stops.c[f] for f in STOP_FIELDS))
+        .select_from(stop_packages.join(stops, stop_packages.c.stop_id == stops.c.id))
+        .where(container_filter)
+        .order_by(stop_packages.c.position)
+    ).mappings().all()
+    return [{f: row[f] for f in POINT_FIELDS} for row in rows]
+
+
+def downgrade():
+    # Devolve os dados para as colunas JSON antes de remover as tabelas
+    bind = op.get_bind()
+    session_ids = [
+        session_id for session_id, data in
+        bind.execute(sa.select(sessions.c.session_id, sessions.c.romaneios_data)).fetchall()
+        if data is None
+    ]
+
+    for session_id in session_ids:
+        romaneio_rows = bind.execute(
+            sa.select(romaneios).where(romaneios.c.session_id == session_id).order_by(romaneios.c.position)
+        ).mappings().all()
+        bind.execute(sessions.update().where(sessions.c.session_id == session_id).values(romaneios_data=[
+            {
+                'id': r['romaneio_id'],
+                'filename': r['filename'] or '',
+                'uploaded_at': (r['uploaded_at'] or datetime.now()).isoformat(),
+                'points': _points(bind, stop_packages.c.romaneio_pk == r['id'])
+            }
+            for r in romaneio_rows
+        ]))
+        for (route_id,) in bind.execute(sa.select(routes.c.id).where(routes.c.session_id == session_id)).fetchall():
+            bind.execute(routes.update().where(routes.c.id == route_id).values(
+                optimized_order=_points(bind, stop_packages.c.route_id == route_id)
+            ))
+
+    op.drop_table('stop_packages')
+    op.drop_table('stops')
+    op.drop_table('romaneios')
+
+    print("⏮️ Tabelas normalizadas removidas (dados devolvidos ao JSON)")
@@ -0,0 +1,39 @@
+"""Add deliverer_tracks (downsampled GPS tracks)
+
+Revision ID: 008_add_deliverer_tracks
+Revises: 007_normalize_romaneios_stops
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008_add_deliverer_tracks'
+down_revision = '007_normalize_romaneios_stops'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'deliverer_tracks',
+        sa.Column('id', sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column('session_id', sa.String(20), sa.ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('route_id', sa.String(50), nullable=False),
+        sa.Column('telegram_id', sa.BigInteger(), nullable=True),
+        sa.Column('points', sa.JSON(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('ended_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('idx_deliverer_tracks_session_route', 'deliverer_tracks', ['session_id', 'route_id', 'id'])
+    
+    print("✅ Tabela deliverer_tracks criada")
+
+
+def downgrade():
+    op.drop_index('idx_deliverer_tracks_session_route', table_name='deliverer_tracks')
+    op.drop_table('deliverer_tracks')
+    
+    print("⏮️ Trilhas GPS removidas")
@@ -229,13 +229,6 @@ class TerritoryDivider:
             result_clusters.append(Cluster(id=i, center_lat=center_lat, center_lng=center_lng, points=pts))
 
         logger.info(f"🗺️ Divisão Radial (Fatias): {len(points)} pacotes -> {k} clusters. Balance: {[len(c.points) for c in result_clusters]}")
-        return result_clusters
-                center_lng = sum(pt.lng for pt in pts) / len(pts)
-            else:
-                center_lat = self.base_lat
-                center_lng = self.base_lng
-            result_clusters.append(Cluster(id=i, center_lat=center_lat, center_lng=center_lng, points=pts))
-
         return result_clusters
     
     # ==================== OTIMIZAÇÃO DE ROTA ====================
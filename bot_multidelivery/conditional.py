@@ -0,0 +1,68 @@
+"""
+🏷️ GET CONDICIONAL - ETag forte + Last-Modified a partir da versão das sessões
+Os GETs de leitura (rota do entregador, mapa, histórico, analytics) montam o
+ETag só com o que identifica a versão da resposta (versão da sessão, ids,
+parâmetros) ANTES de montar paradas, chamar OSRM ou serializar. Se o cliente
+já tem essa versão (If-None-Match / If-Modified-Since) volta 304 sem corpo.
+
+Cache-Control: no-cache faz o navegador revalidar a cada polling (sem cache
+heurístico pelo Last-Modified) e o fetch recebe o corpo do cache no 304.
+"""
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """ETag forte (entre aspas) a partir das partes que identificam a versão"""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode("utf-8"), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match usa comparação fraca (RFC 9110): W/"x" casa com "x" """
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, last_modified: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return False
+    return int(last_modified) <= since  # Last-Modified tem resolução de segundos
+
+
+def conditional(request: Request, response: Response, etag: str,
+                last_modified: Optional[float] = None) -> Optional[Response]:
+    """
+    Grava ETag/Last-Modified/Cache-Control em `response` (resposta 200) e devolve
+    um 304 pronto se o cliente já tem essa versão. If-None-Match tem precedência
+    sobre If-Modified-Since.
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = bool(if_modified_since) and last_modified is not None and \
+            _not_modified_since(if_modified_since, last_modified)
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    return None
@@ -5,7 +5,7 @@ Persistência permanente para Railway - SCHEMA COMPLETO v2.0
 import os
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Float, Boolean, DateTime, Text, ForeignKey, JSON, text, CheckConstraint, Index
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Float, Boolean, DateTime, Text, ForeignKey, JSON, text, CheckConstraint, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
 from contextlib import contextmanager
@@ -49,9 +49,18 @@ class SessionDB(Base):
     is_finalized = Column(Boolean, default=False)
     finalized_at = Column(DateTime, nullable=True)
     current_step = Column(String(50), default='idle')
+    event_seq = Column(BigInteger, default=0)  # Último evento já incluído neste snapshot
+    summary = Column(JSON, nullable=True)  # Cabeçalho (status, contagens) para listar sem carregar a sessão
     
     # JSON fields para dados complexos
-    romaneios_data = Column(JSON, nullable=True)
+    romaneios_data = Column(JSON, nullable=True)  # Legado: NULL quando a sessão já está nas tabelas romaneios/stops
+    
+    __table_args__ = (
+        Index('idx_sessions_created_at', 'created_at'),
+        # Sessões em aberto (restauração da sessão ativa)
+        Index('idx_sessions_open', 'created_at',
+              postgresql_where=text('is_finalized = false'), sqlite_where=text('is_finalized = 0')),
+    )
     
     # Relacionamentos
     routes = relationship("RouteDB", back_populates="session", cascade="all, delete-orphan")
@@ -70,9 +79,16 @@ class RouteDB(Base):
     map_file = Column(String(200))
     
     # JSON fields
-    optimized_order = Column(JSON, nullable=True)
+    optimized_order = Column(JSON, nullable=True)  # Legado: NULL quando a rota já está na tabela stops
     delivered_packages = Column(JSON, default=list)
     
+    __table_args__ = (
+        Index('idx_routes_session_id', 'session_id'),
+        Index('idx_routes_assigned_to', 'assigned_to_telegram_id',
+              postgresql_where=text('assigned_to_telegram_id IS NOT NULL'),
+              sqlite_where=text('assigned_to_telegram_id IS NOT NULL')),
+    )
+    
     # Relacionamentos
     session = relationship("SessionDB", back_populates="routes")
     deliverer = relationship("DelivererDB", back_populates="routes")
@@ -102,12 +118,133 @@ class PackageDB(Base):
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
     
+    __table_args__ = (
+        # Pacotes de uma sessão por status (saves, resumos)
+        Index('idx_packages_session_status', 'session_id', 'status'),
+        # Histórico do entregador (streak, desempenho)
+        Index('idx_packages_assigned_delivered', 'assigned_to_telegram_id', 'delivered_at'),
+        # FK ON DELETE SET NULL: regravar rotas não varre a tabela inteira
+        Index('idx_packages_route_id', 'route_id'),
+        # Janela das queries de analytics: DATE(COALESCE(delivered_at, created_at)) >= :start_date
+        Index('idx_packages_activity_date', func.date(func.coalesce(delivered_at, created_at))),
+        Index('idx_packages_created_at', 'created_at'),
+        # Heatmap por status (só coordenadas válidas; lat/lng cobertos pelo índice)
+        Index('idx_packages_status_coords', 'status', 'lat', 'lng',
+              postgresql_where=text('lat <> 0 AND lng <> 0'), sqlite_where=text('lat <> 0 AND lng <> 0')),
+        # Retângulo envolvente do bairro
+        Index('idx_packages_lat_lng', 'lat', 'lng'),
+    )
+    
     # Relacionamentos
     session = relationship("SessionDB", back_populates="packages")
     route = relationship("RouteDB", back_populates="packages")
     deliverer = relationship("DelivererDB", back_populates="packages")
 
 
+# ==================== TABELAS NORMALIZADAS (romaneio → parada → pacote) ====================
+
+class RomaneioDB(Base):
+    """Romaneio importado numa sessão (substitui sessions.romaneios_data)"""
+    __tablename__ = 'romaneios'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(20), ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False)
+    romaneio_id = Column(String(50), nullable=False)
+    filename = Column(String(300))
+    uploaded_at = Column(DateTime)
+    position = Column(Integer, nullable=False)  # Ordem do romaneio na sessão
+    
+    __table_args__ = (
+        Index('idx_romaneios_session_position', 'session_id', 'position', unique=True),
+    )
+
+
+class StopDB(Base):
+    """
+    Parada: pontos consecutivos no mesmo endereço, dentro de um romaneio ou
+    de uma rota (substitui routes.optimized_order)
+    """
+    __tablename__ = 'stops'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(20), ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False)
+    romaneio_pk = Column(Integer, ForeignKey('romaneios.id', ondelete='CASCADE'), nullable=True)
+    route_id = Column(String(50), ForeignKey('routes.id', ondelete='CASCADE'), nullable=True)
+    sequence = Column(Integer, nullable=False)  # Ordem da parada na lista
+    address = Column(Text, nullable=False)
+    lat = Column(Float)
+    lng = Column(Float)
+    bairro = Column(String(100))
+    
+    __table_args__ = (
+        CheckConstraint('(romaneio_pk IS NULL) <> (route_id IS NULL)', name='ck_stops_one_container'),
+        Index('idx_stops_route_sequence', 'route_id', 'sequence'),
+        Index('idx_stops_romaneio_sequence', 'romaneio_pk', 'sequence'),
+        Index('idx_stops_session_id', 'session_id'),
+    )
+
+
+class StopPackageDB(Base):
+    """Pacote numa parada. position = índice do ponto na lista do romaneio/rota"""
+    __tablename__ = 'stop_packages'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    stop_id = Column(Integer, ForeignKey('stops.id', ondelete='CASCADE'), nullable=False)
+    # Contêiner repetido da parada: atualização de um ponto sem join
+    session_id = Column(String(20), ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False)
+    romaneio_pk = Column(Integer, ForeignKey('romaneios.id', ondelete='CASCADE'), nullable=True)
+    route_id = Column(String(50), ForeignKey('routes.id', ondelete='CASCADE'), nullable=True)
+    position = Column(Integer, nullable=False)
+    package_id = Column(String(50), nullable=False)
+    romaneio_id = Column(String(50))
+    priority = Column(String(20), default='normal')
+    status = Column(String(20), default='pending')
+    failure_reason = Column(String(100), nullable=True)
+    status_detail = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_stop_packages_route_position', 'route_id', 'position'),
+        Index('idx_stop_packages_romaneio_position', 'romaneio_pk', 'position'),
+        Index('idx_stop_packages_session_package', 'session_id', 'package_id'),
+        Index('idx_stop_packages_stop_id', 'stop_id'),
+    )
+
+
+class SessionEventDB(Base):
+    """Log append-only de ações de entrega (entregue, falha, transferência...)"""
+    __tablename__ = 'session_events'
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)  # Ordem global dos eventos
+    session_id = Column(String(20), ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False)
+    event_type = Column(String(30), nullable=False)
+    route_id = Column(String(50))
+    package_ids = Column(JSON, default=list)
+    data = Column(JSON, default=dict)
+    actor_telegram_id = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('idx_session_events_session_id', 'session_id', 'id'),
+    )
+
+
+class DelivererTrackDB(Base):
+    """Trilha GPS do entregador, já reduzida: um trecho (lote de pontos) por linha"""
+    __tablename__ = 'deliverer_tracks'
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    session_id = Column(String(20), ForeignKey('sessions.session_id', ondelete='CASCADE'), nullable=False)
+    route_id = Column(String(50), nullable=False)
+    telegram_id = Column(BigInteger, nullable=True)
+    points = Column(JSON, default=list)  # [[epoch_s, lat, lng], ...]
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_deliverer_tracks_session_route', 'session_id', 'route_id', 'id'),
+    )
+
+
 # ==================== TABELAS DE CACHE E CONFIG ====================
 
 class GeocodingCacheDB(Base):
@@ -245,6 +382,8 @@ class DatabaseManager:
             # Colunas para Sessions
             "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS current_step VARCHAR(50) DEFAULT 'idle';",
             "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS romaneios_data JSON;",
+            "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS event_seq BIGINT DEFAULT 0;",
+            "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary JSON;",
             
             # Colunas para Packages
             "ALTER TABLE packages ADD COLUMN IF NOT EXISTS failure_reason VARCHAR(100);",
@@ -256,6 +395,9 @@ class DatabaseManager:
             "ALTER TABLE geocoding_cache ADD COLUMN IF NOT EXISTS formatted_address TEXT;",
             "ALTER TABLE geocoding_cache ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();"
         ]
+        # Índices dos modelos ficam fora daqui: create_all só os cria junto com tabelas
+        # novas e, nas existentes, quem cria é o alembic 006 (CONCURRENTLY, sem travar
+        # gravações), nunca um CREATE INDEX dentro da transação de startup
         
         try:
             # Usamos uma conexão direta fora do sessionmaker para DDL
@@ -131,15 +131,19 @@ async def cmd_saldo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 2. Calcular intervalo da semana
         monday, sunday = get_week_monday_sunday()
         
-        # 3. Buscar todas as sessões da semana
-        all_sessions = session_manager.get_all_sessions()
+        # 3. Buscar as sessões da semana com rota deste entregador (pelos cabeçalhos)
+        week_headers = [
+            h for h in session_manager.list_headers()
+            if h.created_at and monday <= h.created_at <= sunday and tg_id in h.assigned_telegram_ids
+        ]
         
         total_packages_week = 0
         total_failed_week = 0
         
         # Procurar todas as sessões ativas/finalizadas dessa semana
-        for session in all_sessions:
-            if not (monday <= session.created_at <= sunday):
+        for header in week_headers:
+            session = session_manager.get_session(header.session_id)
+            if not session:
                 continue
             
             for route in session.routes:
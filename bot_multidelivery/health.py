@@ -74,8 +74,7 @@ async def health_check(response: Response):
         session_persistence_mode = "postgresql" if session_store.using_database else "json_local"
         
         # Conta sessões salvas
-        sessions_loaded = session_store.list_sessions(limit=100)
-        session_count = len(sessions_loaded) if sessions_loaded else 0
+        session_count = len(session_store.list_headers())
         
         if session_store.using_database:
             checks["session_persistence"] = {
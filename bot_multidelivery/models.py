@@ -26,8 +26,10 @@ class PackageStatus(Enum):
     TRANSFER_REQUEST = "solicitacao_transferencia"
 
 # --- MODELOS DE ENTREGA E CLUSTERIZAÇÃO ---
+# slots=True: sem __dict__ por instância (uma sessão carrega milhares de pontos;
+# ver scripts/benchmark_point_memory.py). Atributos fora dos campos declarados não são aceitos.
 
-@dataclass
+@dataclass(slots=True)
 class DeliveryPoint:
     """Ponto de entrega individual (um pacote)"""
     address: str
@@ -42,7 +44,7 @@ class DeliveryPoint:
     failure_reason: Optional[str] = None
     status_detail: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class DeliveryStop:
     """
     Uma PARADA na rota (pode ter múltiplos pacotes no mesmo endereço)
@@ -85,7 +87,7 @@ class Cluster:
     def centroid(self) -> Tuple[float, float]:
         return (self.center_lat, self.center_lng)
 
-@dataclass
+@dataclass(slots=True)
 class Package:
     """Pacote individual com todos os metadados (Model compatível com o banco)"""
     id: str
@@ -4,12 +4,12 @@ Armazena dados em PostgreSQL (quando disponível) ou arquivos JSON/JSONL
 Versão Logística: Removidas métricas financeiras.
 """
 
-import json
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List, Optional, Dict
 from pathlib import Path
 from .models import Package, Deliverer
+from . import snapshot_format
 
 try:
     from .database import db_manager, DelivererDB, RouteDB, PackageDB
@@ -27,7 +27,8 @@ class DataStore:
         self.data_dir.mkdir(exist_ok=True)
         
         # Diretórios específicos
-        self.deliverers_file = self.data_dir / "deliverers.json"
+        self.deliverers_file = self.data_dir / f"deliverers{snapshot_format.SUFFIX}"
+        self.legacy_deliverers_file = self.data_dir / "deliverers.json"  # só leitura
         self.packages_file = self.data_dir / "packages.jsonl"
         
         # Indica se está usando database ou JSON
@@ -89,8 +90,8 @@ class DataStore:
             'joined_date': d.joined_date.isoformat()
         } for d in deliverers]
         
-        with open(self.deliverers_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        snapshot_format.dump(self.deliverers_file, data)
+        self.legacy_deliverers_file.unlink(missing_ok=True)
     
     def load_deliverers(self) -> List[Deliverer]:
         """Carrega lista de entregadores"""
@@ -113,12 +114,13 @@ class DataStore:
             except Exception as e:
                 print(f"Erro ao carregar do PostgreSQL: {e}")
         
-        if not self.deliverers_file.exists():
+        if self.deliverers_file.exists():
+            data = snapshot_format.load(self.deliverers_file)
+        elif self.legacy_deliverers_file.exists():
+            data = snapshot_format.load(self.legacy_deliverers_file)
+        else:
             return []
         
-        with open(self.deliverers_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         return [Deliverer(
             telegram_id=d['telegram_id'],
             name=d['name'],
@@ -159,5 +161,28 @@ class DataStore:
         deliverers = self.load_deliverers()
         return next((d for d in deliverers if d.telegram_id == telegram_id), None)
 
+    # ==================== PACOTES ====================
+
+    def get_delivery_days(self, telegram_id: int, limit: int = 365) -> List[date]:
+        """Dias distintos com entrega do entregador (mais recentes primeiro)"""
+        self._check_db()
+        if not self.using_database:
+            return []  # Histórico de entregas só existe no PostgreSQL
+
+        from sqlalchemy import func
+        try:
+            with db_manager.get_session() as session:
+                # Usa idx_packages_assigned_delivered (assigned_to_telegram_id, delivered_at)
+                day = func.date(PackageDB.delivered_at)
+                rows = session.query(day).filter(
+                    PackageDB.assigned_to_telegram_id == telegram_id,
+                    PackageDB.status == 'delivered',
+                    PackageDB.delivered_at.isnot(None)
+                ).distinct().order_by(day.desc()).limit(limit).all()
+            return [d if isinstance(d, date) else date.fromisoformat(d) for (d,) in rows]
+        except Exception as e:
+            print(f"⚠️ Erro ao buscar dias de entrega: {e}")
+            return []
+
 # Instância global
 data_store = DataStore()
@@ -4,45 +4,44 @@
 Transforma dados brutos de entregas em inteligência de negócio
 """
 import logging
-from fastapi import APIRouter, HTTPException
-from typing import Dict, List, Any
+import os
+import time
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import Dict, List, Any, Optional
 from collections import defaultdict
 from datetime import datetime, timedelta
 from sqlalchemy import text
 from bot_multidelivery.database import db_manager
+from bot_multidelivery.session import session_manager
+from bot_multidelivery.conditional import conditional, make_etag
+from bot_multidelivery.services.reverse_geocoder import reverse_geocoder
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
+# Os dados vêm da tabela packages (também escrita por outros processos): além da
+# versão das sessões deste processo, o ETag vence a cada janela
+ANALYTICS_ETAG_WINDOW_S = int(os.getenv("ANALYTICS_ETAG_WINDOW_S", "60"))
+
+
+def _not_modified(request: Request, response: Response, *parts) -> Optional[Response]:
+    """304 se o cliente já tem esta versão (antes da consulta ao banco); senão grava ETag em response"""
+    version, modified_at = session_manager.version()
+    window = int(time.time() // ANALYTICS_ETAG_WINDOW_S)
+    etag = make_etag("analytics", session_manager.epoch, version, window, *parts)
+    return conditional(request, response, etag, max(modified_at, window * ANALYTICS_ETAG_WINDOW_S))
+
 
 def get_neighborhood_from_coords(lat: float, lng: float) -> str:
     """
-    Identifica bairro baseado em coordenadas.
-    TODO: Integrar com GeoJSON para precisão (atual: heurística simples)
+    Identifica bairro baseado em coordenadas (polígonos GeoJSON via STRtree).
+    Fora dos polígonos conhecidos agrupa em "Zona Sul".
     """
-    # Heurística simplificada para Zona Sul do Rio
-    # Copacabana: lat -22.96 a -22.98, lng -43.17 a -43.19
-    # Ipanema: lat -22.98 a -23.00, lng -43.19 a -43.21
-    # Leblon: lat -22.98 a -23.01, lng -43.21 a -43.23
-    
-    if -22.98 <= lat <= -22.96 and -43.19 <= lng <= -43.17:
-        return "Copacabana"
-    elif -23.00 <= lat <= -22.98 and -43.21 <= lng <= -43.19:
-        return "Ipanema"
-    elif -23.01 <= lat <= -22.98 and -43.23 <= lng <= -43.21:
-        return "Leblon"
-    elif -22.95 <= lat <= -22.93 and -43.19 <= lng <= -43.17:
-        return "Botafogo"
-    elif -22.93 <= lat <= -22.91 and -43.21 <= lng <= -43.19:
-        return "Lagoa"
-    elif -23.03 <= lat <= -23.01 and -43.25 <= lng <= -43.23:
-        return "São Conrado"
-    else:
-        return "Zona Sul"
+    return reverse_geocoder.neighborhood(lat, lng) or "Zona Sul"
 
 
 @router.get("/neighborhood-stats")
-async def get_neighborhood_stats(days: int = 7):
+async def get_neighborhood_stats(request: Request, response: Response, days: int = 7):
     """
     Retorna estatísticas simples por bairro para o dashboard
     Formato esperado pelo frontend: { neighborhoods: [{ name, total_deliveries, success_rate }] }
@@ -52,6 +51,9 @@ async def get_neighborhood_stats(days: int = 7):
             raise HTTPException(status_code=503, detail="Banco de dados indisponível")
 
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        cached = _not_modified(request, response, "neighborhood-stats", start_date)
+        if cached:
+            return cached
 
         query = text("""
             SELECT 
@@ -96,7 +98,7 @@ async def get_neighborhood_stats(days: int = 7):
 
 
 @router.get("/heatmap")
-async def get_heatmap_data(days: int = 7):
+async def get_heatmap_data(request: Request, response: Response, days: int = 7):
     """
     🎨 Retorna dados para renderizar mapa de calor inteligente
     
@@ -111,6 +113,9 @@ async def get_heatmap_data(days: int = 7):
         
         # Período de análise
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        cached = _not_modified(request, response, "heatmap", start_date)
+        if cached:
+            return cached
         
         # ==== 1. BUSCAR TODAS AS ENTREGAS DO PERÍODO ====
         query = text("""
@@ -215,7 +220,7 @@ async def get_heatmap_data(days: int = 7):
 
 
 @router.get("/neighborhood/{name}")
-async def get_neighborhood_detail(name: str, days: int = 7):
+async def get_neighborhood_detail(name: str, request: Request, response: Response, days: int = 7):
     """
     🔍 Detalhes de um bairro específico (para modal ao clicar)
     """
@@ -224,6 +229,9 @@ async def get_neighborhood_detail(name: str, days: int = 7):
             raise HTTPException(status_code=503, detail="Banco de dados indisponível")
         
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        cached = _not_modified(request, response, "neighborhood", name, start_date)
+        if cached:
+            return cached
         
         # Buscar todas entregas (filtro por bairro será feito em memória por agora)
         query = text("""
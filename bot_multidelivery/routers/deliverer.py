@@ -1,18 +1,24 @@
 """
 Router para Entregadores - Rota do Dia e Confirmação de Entregas
 """
-import asyncio
 import logging
 import os
-from fastapi import APIRouter, HTTPException, Query, Body
+import json
+from fastapi import APIRouter, HTTPException, Query, Body, Header, Request, Response, WebSocket, WebSocketDisconnect
 import uuid
 import time
 from bot_multidelivery.session import session_manager
 from bot_multidelivery.persistence import data_store
+from bot_multidelivery.schemas_models import GpsBatchInput
+from bot_multidelivery.security import (
+    create_tracking_token, verify_tracking_token, verify_telegram_init_data, TRACKING_TOKEN_TTL_S
+)
+from bot_multidelivery.conditional import conditional, make_etag
 from bot_multidelivery.services.osrm_service import osrm_client
 
-# Para broadcast de atualizações em tempo real
-from bot_multidelivery.routers.map_realtime import broadcast_delivery_update
+# Posições ao vivo do entregador (buffer + envio limitado ao mapa)
+from bot_multidelivery.services.gps_tracker import gps_tracker, GpsFix, parse_fix
+from bot_multidelivery.services.route_resequencer import route_resequencer, pending_stops
 router = APIRouter(prefix="/deliverer", tags=["Deliverer"])
 logger = logging.getLogger(__name__)
 
@@ -34,6 +40,10 @@ async def check_all_routes_completed(session):
     if all_completed:
         logger.info(f"🎉 TODAS as rotas foram finalizadas na sessão {session.session_id}")
         
+        # Dashboards de todos os workers (pelo broker)
+        from bot_multidelivery.services.dashboard_service import publish_notification
+        publish_notification('routes_completed', session_id=session.session_id, total_packages=session.total_packages)
+        
         # Enviar notificação ao admin
         try:
             from bot_multidelivery.services.telegram_notifier import notifier
@@ -83,39 +93,37 @@ Acesse: Fechamento → Adicione custos → Finalize a sessão
 
 
 def _build_stops_from_route(user_route):
-    """Agrupa pacotes por endereço/coordenadas em paradas únicas (ordem preservada)."""
-    stops = []
-    stop_index_by_key = {}
-
-    for point in user_route.optimized_order:
-        if not hasattr(point, 'lat') or not hasattr(point, 'lng'):
-            continue
-        if point.lat is None or point.lng is None:
-            continue
-
-        key = (round(point.lat, 4), round(point.lng, 4), (point.address or "").strip().lower())
-        if key not in stop_index_by_key:
-            stop_index_by_key[key] = len(stops)
-            stops.append({
-                "id": len(stops) + 1,
-                "address": point.address,
-                "lat": point.lat,
-                "lng": point.lng,
-                "packages": []
-            })
-
-        pkg_id = getattr(point, "package_id", None) or getattr(point, "id", None)
-        if not pkg_id:
-            pkg_id = f"pkg_{len(stops[stop_index_by_key[key]]['packages']) + 1}"
-        stops[stop_index_by_key[key]]["packages"].append(pkg_id)
-
-    return stops
+    """Paradas únicas por endereço/coordenadas (ordem preservada), do índice da rota."""
+    return [
+        {
+            "id": stop.stop_number,
+            "address": stop.address,
+            "lat": stop.lat,
+            "lng": stop.lng,
+            "packages": [p.package_id or f"pkg_{i + 1}" for i, p in enumerate(stop.packages)]
+        }
+        for stop in user_route.stops
+    ]
+
+def _route_etag(kind: str, session, route, *parts) -> str:
+    """
+    Versão da resposta da rota: sessão (sobe a cada mutação) + rota + janela do
+    tracking_token (renova na metade da validade, mesmo sem mudança na rota)
+    """
+    version, _ = session_manager.version(session.session_id)
+    token_window = int(time.time() // max(TRACKING_TOKEN_TTL_S // 2, 1))
+    return make_etag(kind, session_manager.epoch, session.session_id, version, route.id, token_window, *parts)
+
 
 @router.get("/route")
-async def get_deliverer_route(user_id: int = Query(...)):
+async def get_deliverer_route(request: Request, response: Response, user_id: int = Query(...),
+                              x_telegram_init_data: str = Header(None)):
     """
     Retorna a rota do entregador para o dia
     Apenas sua rota, com mapa, sequência e próxima parada
+    (ETag pela versão da sessão: polling sem mudança recebe 304 antes de montar paradas/OSRM)
+    tracking_token só para o próprio entregador: header X-Telegram-Init-Data (initData
+    do WebApp) assinado pelo bot com o mesmo user_id.
     """
     try:
         # 1. Verificar se entregador existe
@@ -143,7 +151,14 @@ async def get_deliverer_route(user_id: int = Query(...)):
                 "message": "Sua rota será definida em breve."
             }
 
-        # 4. Agrupar pacotes por parada
+        # 4. Cliente já tem esta versão: 304 sem montar paradas nem chamar OSRM
+        authenticated = verify_telegram_init_data(x_telegram_init_data) == user_id
+        cached = conditional(request, response, _route_etag("route", session, user_route, user_id, authenticated),
+                             session_manager.version(session.session_id)[1])
+        if cached:
+            return cached
+
+        # 5. Agrupar pacotes por parada
         stops = _build_stops_from_route(user_route)
         logger.info(f"🔎 Deliverer route debug: route_id={user_route.id} stops_count={len(stops)} base=({session.base_lat},{session.base_lng})")
 
@@ -171,7 +186,8 @@ async def get_deliverer_route(user_id: int = Query(...)):
             "completed": user_route.delivered_count,
             "total": user_route.total_packages,
             "completion_rate": user_route.completion_rate,
-            "has_route": True
+            "has_route": True,
+            "tracking_token": create_tracking_token(session.session_id, user_route.id, user_id) if authenticated else None
         }
     
     except HTTPException:
@@ -190,6 +206,7 @@ async def complete_stop(
     status_detail: str = Query(None), # Observações
     lat: float = Query(None),
     lng: float = Query(None),
+    package_id: str = Query(None), # Um pacote da parada: acha a parada mesmo se a rota foi reordenada
     failed_packages: list[str] = Body(default=[]) # Lista de IDs de pacotes que falharam especificamente
 ):
     """
@@ -201,48 +218,58 @@ async def complete_stop(
         if not session:
             raise HTTPException(status_code=400, detail="Sessão não ativa")
         
-        route = None
-        for r in session.routes:
-            if r.id == route_id:
-                route = r
-                break
-        
+        route = session.get_route(route_id)
         if not route:
             raise HTTPException(status_code=404, detail="Rota não encontrada")
         
-        # Recria paradas para mapear índice de parada -> pacotes
-        stops = _build_stops_from_route(route)
-        if stop_index >= len(stops):
+        # Índice de paradas da rota (stop_number = stop_index + 1)
+        stop = route.get_stop(stop_index + 1)
+        remaining = pending_stops(route)
+        if package_id and (stop is None or package_id not in stop.package_ids):
+            # Ordem mudou (resequenciamento) desde que o app leu a rota. O id pode
+            # estar em mais de uma parada (ids se repetem entre romaneios): a primeira pendente
+            candidates = route.stops_of(package_id)
+            stop = next((s for s in candidates if any(s is r for r in remaining)), None) or \
+                next(iter(candidates), None) or stop
+        if stop is None:
             raise HTTPException(status_code=400, detail="Índice inválido")
+        skipped_ahead = bool(remaining) and stop is not remaining[0] and any(s is stop for s in remaining)
 
         # Marcar TODOS os pacotes da parada com o status apropriado
-        stop_packages = stops[stop_index].get("packages", [])
-        for pkg_id in stop_packages:
-            if pkg_id:
-                if pkg_id in failed_packages:
-                    # Se pacote está na lista de falhas, força falha
-                    route.mark_as_failed(pkg_id, reason=reason or "Baixa parcial - Insucesso", detail=status_detail)
-                else:
-                    if status == "delivered":
-                        route.mark_as_delivered(pkg_id, detail=status_detail)
-                    elif status == "failed":
-                        route.mark_as_failed(pkg_id, reason=reason, detail=status_detail)
-                    elif status == "returned":
-                        route.mark_as_returned(pkg_id, reason=reason, detail=status_detail)
+        stop_packages = stop.package_ids
+        partial_failures = [p for p in stop_packages if p and p in failed_packages]
+        others = [p for p in stop_packages if p and p not in failed_packages]
+        # O id se repete entre romaneios: a chave do ponto limita a baixa a esta parada
+        keys_of = lambda ids: [route.point_key(p) for p in stop.packages if p.package_id in ids]
+        
+        # Cada ação vira um evento no log (append), sem regravar a sessão inteira
+        if partial_failures:
+            # Se pacote está na lista de falhas, força falha
+            session_manager.record_event(
+                session, "failed", route.id, partial_failures,
+                reason=reason or "Baixa parcial - Insucesso", detail=status_detail,
+                point_keys=keys_of(set(partial_failures))
+            )
+        if others and status in ("delivered", "failed", "returned"):
+            session_manager.record_event(
+                session, status, route.id, others,
+                reason=reason if status != "delivered" else None, detail=status_detail,
+                point_keys=keys_of(set(others))
+            )
         
         logger.info(f"✅ Parada {stop_index + 1} marcada como {status} ({reason or ''}) na rota {route.color}")
         
-        # Salvar sessão
-        session_manager.save_session(session)
+        # 🔴 Mapa do admin: os eventos acima já viraram deltas (stop_status);
+        # aqui só a posição do entregador no momento da baixa
+        if lat is not None and lng is not None:
+            gps_tracker.ingest(
+                session.session_id, route.id, route.assigned_to_telegram_id,
+                [GpsFix(time.time(), lat, lng)], route.assigned_to_name
+            )
         
-        # 🔴 IMPORTANTE: Broadcast em tempo real para o mapa do admin
-        if stop_packages:
-            asyncio.create_task(broadcast_delivery_update(
-                session_id=session.session_id,
-                point_id=stop_packages[0],  # Usar primeiro pacote como referência
-                status=status,
-                route_id=route_id
-            ))
+        # 🔀 Pulou paradas: reordena as restantes a partir daqui (em background)
+        if skipped_ahead:
+            route_resequencer.on_stop_completed(session, route, stop, lat, lng)
         
         # 🚨 VERIFICAR SE TODAS AS ROTAS FORAM FINALIZADAS
         await check_all_routes_completed(session)
@@ -262,6 +289,108 @@ async def complete_stop(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+# ==================== GPS AO VIVO ====================
+
+MAX_GPS_BATCH = 500
+
+
+def _tracking_route(token: str):
+    """Valida o token de rastreamento e retorna (sessão, rota, telegram_id)"""
+    claims = verify_tracking_token(token or "")
+    if not claims:
+        raise HTTPException(status_code=401, detail="Token de rastreamento inválido ou expirado")
+    session_id, route_id, telegram_id = claims
+    session = session_manager.get_session(session_id)
+    if not session or session.is_finalized:
+        raise HTTPException(status_code=410, detail="Sessão encerrada")
+    route = session.get_route(route_id)
+    if not route:
+        raise HTTPException(status_code=404, detail="Rota não encontrada")
+    # Token vale para a atribuição em que foi emitido (0 = rota ainda sem entregador)
+    if (route.assigned_to_telegram_id or 0) != telegram_id:
+        raise HTTPException(status_code=409, detail="Rota atribuída a outro entregador")
+    return session, route, telegram_id
+
+
+def _ingest_gps(session, route, telegram_id: int, raw_fixes) -> dict:
+    fixes = [f for f in (parse_fix(raw) for raw in raw_fixes if isinstance(raw, dict)) if f is not None]
+    result = gps_tracker.ingest(session.session_id, route.id, telegram_id or None, fixes, route.assigned_to_name)
+    result["rejected"] += len(raw_fixes) - len(fixes)
+    return result
+
+
+@router.post("/gps")
+async def ingest_gps(batch: GpsBatchInput, x_tracking_token: str = Header(None)):
+    """
+    Lote de posições do entregador (enviado a cada poucos segundos).
+    Header X-Tracking-Token: token recebido junto com a rota.
+    """
+    session, route, telegram_id = _tracking_route(x_tracking_token)
+    if len(batch.fixes) > MAX_GPS_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_GPS_BATCH} posições por lote")
+    return _ingest_gps(session, route, telegram_id, batch.fixes)
+
+
+@router.websocket("/gps/ws")
+async def ingest_gps_ws(websocket: WebSocket, token: str = Query(...)):
+    """
+    Canal contínuo de posições: cada mensagem é um fix ({t, lat, lng, acc?, speed?, heading?})
+    ou uma lista deles. Token inválido/rota reatribuída fecha com código 4000 + status HTTP
+    (4401 expirado, 4409 reatribuída), na conexão e a cada mensagem.
+    """
+    await websocket.accept()
+    try:
+        _tracking_route(token)
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+        return
+    try:
+        while True:
+            data = await websocket.receive_text()
+            # O canal fica aberto por horas: token expira e a rota pode mudar de dono
+            try:
+                session, route, telegram_id = _tracking_route(token)
+            except HTTPException as e:
+                await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+                return
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                continue
+            fixes = payload if isinstance(payload, list) else [payload]
+            _ingest_gps(session, route, telegram_id, fixes[:MAX_GPS_BATCH])
+    except WebSocketDisconnect:
+        pass
+
+
+@router.post("/resequence")
+async def resequence_route(
+    x_tracking_token: str = Header(None),
+    lat: float = Query(None),
+    lng: float = Query(None)
+):
+    """
+    Reordena as paradas restantes do entregador a partir da posição atual
+    (lat/lng ou último fix de GPS recebido). Só a rota dele, sem re-clusterizar a sessão.
+    """
+    session, route, _ = _tracking_route(x_tracking_token)
+    if lat is None or lng is None:
+        fix = next(iter(gps_tracker.recent(session.session_id, route.id, 1)), None)
+        if fix is None:
+            raise HTTPException(status_code=400, detail="Posição desconhecida: envie lat/lng")
+        lat, lng = fix.lat, fix.lng
+    try:
+        result = await route_resequencer.resequence(session, route, lat, lng, reason="manual")
+    except Exception as e:
+        logger.error(f"❌ Erro ao resequenciar rota {route.id}: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        return {"route_id": route.id, "applied": False, "message": "Nada a reordenar"}
+    if result["applied"]:
+        result["stops"] = _build_stops_from_route(route)
+    return result
+
+
 @router.post("/transfer-stop")
 async def transfer_stop(
     route_id: str = Query(...),
@@ -277,12 +406,7 @@ async def transfer_stop(
             raise HTTPException(status_code=400, detail="Sessão não ativa")
         
         # Encontrar rota de origem
-        source_route = None
-        for r in session.routes:
-            if r.id == route_id:
-                source_route = r
-                break
-        
+        source_route = session.get_route(route_id)
         if not source_route:
             raise HTTPException(status_code=404, detail="Rota não encontrada")
         
@@ -297,31 +421,23 @@ async def transfer_stop(
         if not target_route:
             raise HTTPException(status_code=404, detail=f"Entregador '{target_deliverer}' não encontrado")
         
-        # Reconstruir paradas
-        stops = _build_stops_from_route(source_route)
-        if stop_index >= len(stops):
+        # Parada pelo índice da rota (todos os pacotes do mesmo endereço)
+        stop = source_route.get_stop(stop_index + 1)
+        if stop is None:
             raise HTTPException(status_code=400, detail="Índice inválido")
         
-        transfer_stop = stops[stop_index]
-        
-        # Remover pacotes da rota de origem e adicionar na de destino
-        packages_to_transfer = []
-        for point in source_route.optimized_order[:]:
-            point_key = (round(point.lat, 4), round(point.lng, 4), (point.address or "").strip().lower())
-            stop_key = (round(transfer_stop['lat'], 4), round(transfer_stop['lng'], 4), transfer_stop['address'].strip().lower())
-            
-            if point_key == stop_key:
-                packages_to_transfer.append(point)
-                source_route.optimized_order.remove(point)
+        packages_to_transfer = stop.package_ids
         
-        # Adicionar na rota de destino
-        target_route.optimized_order.extend(packages_to_transfer)
+        # Move da rota de origem para o fim da de destino (evento no log). Só os
+        # pontos desta parada: o mesmo id pode estar em outro endereço da rota
+        if packages_to_transfer:
+            session_manager.record_event(
+                session, "transferred", source_route.id, packages_to_transfer, to_route=target_route.id,
+                point_keys=[source_route.point_key(p) for p in stop.packages]
+            )
         
         logger.info(f"📦 Transferidos {len(packages_to_transfer)} pacotes de {source_route.color} para {target_route.color}")
         
-        # Salvar sessão
-        session_manager.save_session(session)
-        
         return {
             "status": "success",
             "transferred_packages": len(packages_to_transfer),
@@ -375,7 +491,7 @@ async def create_deliverer_link(route_id: str = Body(...), ttl_seconds: int = Bo
 
 
 @router.get('/public-route/{token}')
-async def get_public_route_json(token: str):
+async def get_public_route_json(token: str, request: Request, response: Response):
     """
     Retorna DADOS DA ROTA (JSON) para um token público.
     Usado pelo frontend React quando acessado via /public/deliverer/{token}
@@ -407,6 +523,11 @@ async def get_public_route_json(token: str):
         if not user_route:
             raise HTTPException(status_code=404, detail="Rota não encontrada")
 
+        cached = conditional(request, response, _route_etag("public-route", session, user_route, token),
+                             session_manager.version(session.session_id)[1])
+        if cached:
+            return cached
+
         stops = _build_stops_from_route(user_route)
         
         try:
@@ -432,7 +553,8 @@ async def get_public_route_json(token: str):
             "total": user_route.total_packages,
             "completion_rate": user_route.completion_rate,
             "has_route": True,
-            "is_public_view": True
+            "is_public_view": True,
+            "tracking_token": create_tracking_token(session.session_id, user_route.id, user_route.assigned_to_telegram_id)
         }
 
     except HTTPException:
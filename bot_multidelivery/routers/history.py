@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from bot_multidelivery.session import session_manager
+from bot_multidelivery.conditional import conditional, make_etag
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/history", tags=["History"])
@@ -18,9 +19,16 @@ async def delete_session(session_id: str):
         # Retornamos sucesso mesmo se não encontrado para atualizar a UI
         return {"status": "warning", "message": "Sessão não encontrada ou já excluída"}
 @router.get("/sessions")
-async def list_history_sessions(limit: int = 100):
+async def list_history_sessions(request: Request, response: Response, limit: int = 100):
     """Lista sessões (finalizadas e ativas) para o histórico do frontend"""
-    sessions = session_manager.list_sessions(finalized_only=False)
+    # Versão global (sobe com mutação em qualquer sessão): sem mudança, 304
+    version, modified_at = session_manager.version()
+    cached = conditional(request, response, make_etag("history", session_manager.epoch, version, limit), modified_at)
+    if cached:
+        return cached
+
+    # Só cabeçalhos: não carrega romaneios/rotas das sessões antigas
+    sessions = session_manager.list_headers()
 
     result = []
     for s in sessions[:limit]:
@@ -36,33 +44,19 @@ async def list_history_sessions(limit: int = 100):
         else:
             status = "active"
 
-        # Contabilizar motivos de falha
-        failure_stats = {}
-        total_failed = 0
-        total_delivered = 0
-        
-        for route in (s.routes or []):
-            for point in (route.optimized_order or []):
-                if point.status == 'failed':
-                    total_failed += 1
-                    reason = point.failure_reason or "Não especificado"
-                    failure_stats[reason] = failure_stats.get(reason, 0) + 1
-                elif point.status == 'delivered':
-                    total_delivered += 1
-
         result.append({
             "id": s.session_id,
             "session_name": s.session_name,
             "created_at": s.created_at.isoformat() if s.created_at else None,
             "completed_at": s.finalized_at.isoformat() if s.finalized_at else None,
             "addresses_count": s.total_packages,
-            "deliverers_count": s.num_deliverers or len(s.routes or []),
+            "deliverers_count": s.num_deliverers or s.num_routes,
             "statistics": {
                 "step": s.current_step,
                 "is_finalized": is_completed,
-                "total_delivered": total_delivered,
-                "total_failed": total_failed,
-                "failure_reasons": failure_stats
+                "total_delivered": s.total_delivered,
+                "total_failed": s.total_failed,
+                "failure_reasons": s.failure_reasons
             },
             "status": status,
             "last_updated": (s.finalized_at or s.created_at).isoformat() if (s.finalized_at or s.created_at) else None,
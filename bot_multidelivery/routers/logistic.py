@@ -58,6 +58,7 @@ def build_route_preview(route: Route, idx: int) -> Dict:
 async def process_notifications(session_id: str, assignments: Dict[str, int]):
     """Processa o envio de notificações em segundo plano para não travar a UI"""
     from bot_multidelivery.services.telegram_notifier import notify_route_assigned
+    from bot_multidelivery.services.dashboard_service import publish_notification
     
     session = session_manager.get_session(session_id)
     if not session:
@@ -119,6 +120,13 @@ async def process_notifications(session_id: str, assignments: Dict[str, int]):
                 coordinates=coordinates,
                 duration_min=exact_duration_min
             )
+            publish_notification(
+                'route_assigned',
+                session_id=session_id,
+                route_id=route.id,
+                deliverer_id=deliverer_id,
+                total_packages=route.total_packages
+            )
         except Exception as e:
             logger.error(f"🚨 Erro ao notificar rota {route_id}: {e}", exc_info=True)
 
@@ -1,42 +1,25 @@
 """
 Router para Mapa Admin em Tempo Real
-WebSocket para atualização de rotas quando entregador completa/falha entrega
+WebSocket com deltas versionados (seq por sessão) quando entregador completa/falha entrega
 """
 import logging
-import os
 import json
 import asyncio
-from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from bot_multidelivery.session import session_manager
-from bot_multidelivery.services import geocoding_service
-
-_redis = None
-_redis_pubsub_tasks = {}
-try:
-    import redis.asyncio as aioredis
-except Exception:
-    aioredis = None
+from bot_multidelivery.conditional import conditional, make_etag
+from bot_multidelivery.services.geocoding_jobs import geocoding_jobs
+from bot_multidelivery.services.ws_fanout import map_fanout
+from bot_multidelivery.services.map_stream import map_stream, message_key
+from bot_multidelivery.services.gps_tracker import gps_tracker
+from bot_multidelivery.services.map_clusters import map_clusters
+from bot_multidelivery.services.map_sse import MapEventStream
 
 router = APIRouter(prefix="/map", tags=["Map"])
 logger = logging.getLogger(__name__)
 
-# Armazenar conexões WebSocket ativas por session_id
-active_connections: dict = {}
-
-
-def get_redis_client():
-    global _redis
-    if _redis:
-        return _redis
-    red_url = os.environ.get('REDIS_URL')
-    if not red_url or not aioredis:
-        return None
-    try:
-        _redis = aioredis.from_url(red_url)
-        return _redis
-    except Exception:
-        return None
-
 
 @router.get("/realtime/active")
 async def get_active_map_session():
@@ -47,12 +30,10 @@ async def get_active_map_session():
     try:
         session = session_manager.get_active_session()
         if not session:
-            # fallback: última sessão não finalizada
-            candidates = [s for s in session_manager.sessions if not s.is_finalized]
-            if candidates:
-                candidates.sort(key=lambda s: s.created_at, reverse=True)
-                session = candidates[0]
-            else:
+            # fallback: última sessão não finalizada (pelos cabeçalhos: inclui as fora do cache)
+            header = next((h for h in session_manager.list_headers() if not h.is_finalized), None)
+            session = session_manager.get_session(header.session_id) if header else None
+            if not session:
                 raise HTTPException(status_code=404, detail="Nenhuma sessão ativa")
 
         return {
@@ -71,120 +52,39 @@ async def get_active_map_session():
 
 
 @router.get("/realtime/{session_id}")
-async def get_map_realtime(session_id: str):
+async def get_map_realtime(session_id: str, request: Request, response: Response):
     """
     GET simples para iniciar carregamento do mapa
-    Retorna estado atual de todas as rotas e pontos
+    Retorna estado atual de todas as rotas e pontos, com a versão (epoch/seq/shape)
+    que o cliente informa ao inscrever no WebSocket. Não geocodifica: pontos sem
+    coordenadas entram no job em background (campo geocoding) e chegam pelo WebSocket.
+    ETag pela versão da sessão + seq do stream: sem mudança, 304 sem montar o estado.
     """
     try:
         session = session_manager.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Sessão não encontrada")
         
-        if not session.routes:
-            # Se não houver rotas, mostrar pontos dos romaneios (pré-separação)
-            # Tentativa leve de geocoding para permitir mapa antes da separação
-            all_points = []
-            geocoded_count = 0
-            geocode_limit = 10
-            pending_geocode = 0
-            for romaneio in session.romaneios:
-                for point in romaneio.points:
-                    if (not getattr(point, 'lat', 0)) or (not getattr(point, 'lng', 0)):
-                        pending_geocode += 1
-                        if geocoded_count < geocode_limit:
-                            try:
-                                lat, lng = geocoding_service.geocode(point.address)
-                                point.lat = float(lat)
-                                point.lng = float(lng)
-                                geocoded_count += 1
-                            except Exception:
-                                pass
+        # Sem geocoding na requisição: pontos sem coordenadas vão para o job em
+        # background e chegam aos inscritos como delta points_geocoded
+        points = [p for romaneio in session.romaneios for p in romaneio.points]
+        job = geocoding_jobs.ensure(session_id, points)
 
-                    if hasattr(point, 'lat') and hasattr(point, 'lng') and point.lat and point.lng:
-                        all_points.append({
-                            "id": getattr(point, "package_id", f"tmp_{point.lat}_{point.lng}"),
-                            "address": point.address,
-                            "lat": point.lat,
-                            "lng": point.lng,
-                            "bairro": getattr(point, 'bairro', ''),
-                            "cep": getattr(point, 'cep', ''),
-                            "color": "#9ca3af", # Cinza (pendente)
-                            "route_color": "#e5e7eb",
-                            "route_id": "unassigned",
-                            "deliverer": "Aguardando Separação",
-                            "sequence": 0,
-                            "status": "pending"
-                        })
+        version, modified_at = session_manager.version(session_id)
+        etag = make_etag(
+            "map", session_manager.epoch, session_id, version,
+            map_stream.epoch, map_stream.current_seq(session_id),
+            job.id if job else None, job.status.value if job else None
+        )
+        cached = conditional(request, response, etag, modified_at)
+        if cached:
+            return cached
 
-            if geocoded_count > 0:
-                session_manager.save_session(session)
-            
-            if not all_points:
-                return {
-                    "status": "empty",
-                    "session_id": session_id,
-                    "total_routes": 0,
-                    "total_points": 0,
-                    "points": [],
-                    "routes_summary": [],
-                    "message": "Nenhuma rota iniciada e nenhum ponto com coordenadas. Clique em 'Otimizar rotas' para geocodificar ou recarregue para tentar novamente."
-                }
-            
-            return {
-                "status": "planning",
-                "session_id": session_id,
-                "total_routes": 0,
-                "total_points": len(all_points),
-                "points": all_points,
-                "routes_summary": [],
-                "message": "Visualização pré-separação" + (f" • Geocodificados agora: {geocoded_count}" if geocoded_count else "")
-            }
-        
-        # Montar payload com todos os pontos coloridos
-        map_points = []
-        for route in session.routes:
-            for idx, point in enumerate(route.optimized_order):
-                # Determinar cor do ponto:
-                # Verde se entregue
-                # Vermelha se falha
-                # Cor da rota se pendente
-                
-                is_delivered = point.package_id in route.delivered_packages
-                point_color = "#22c55e" if is_delivered else route.color  # Verde ou cor da rota
-                
-                map_points.append({
-                    "id": point.package_id,
-                    "address": point.address,
-                    "lat": point.lat,
-                    "lng": point.lng,
-                    "color": point_color,
-                    "route_color": route.color,
-                    "route_id": route.id,
-                    "deliverer": route.assigned_to_name or "Não atribuído",
-                    "sequence": idx + 1,
-                    "status": "delivered" if is_delivered else "pending"
-                })
-        
-        return {
-            "status": "success",
-            "session_id": session_id,
-            "total_routes": len(session.routes),
-            "total_points": len(map_points),
-            "points": map_points,
-            "routes_summary": [
-                {
-                    "route_id": r.id,
-                    "color": r.color,
-                    "deliverer": r.assigned_to_name,
-                    "total": r.total_packages,
-                    "delivered": r.delivered_count,
-                    "pending": r.pending_count,
-                    "completion_rate": r.completion_rate
-                }
-                for r in session.routes
-            ]
-        }
+        state = map_stream.snapshot(session)
+        state["geocoding"] = job.summary() if job else None
+        if job and state["status"] == "planning":
+            state["message"] += f" • Geocodificando {job.pending_count} endereços em segundo plano"
+        return state
     
     except HTTPException:
         raise
@@ -193,6 +93,17 @@ async def get_map_realtime(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/realtime/{session_id}/track/{route_id}")
+async def get_deliverer_track(session_id: str, route_id: str):
+    """Trilha GPS reduzida do entregador da rota ([[epoch_s, lat, lng], ...])"""
+    try:
+        points = gps_tracker.track(session_id, route_id)
+        return {"session_id": session_id, "route_id": route_id, "total_points": len(points), "points": points}
+    except Exception as e:
+        logger.error(f"❌ Erro ao carregar trilha GPS: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/realtime/active")
 async def get_active_map_session():
     """
@@ -201,12 +112,10 @@ async def get_active_map_session():
     try:
         session = session_manager.get_active_session()
         if not session:
-            # fallback: última sessão não finalizada
-            candidates = [s for s in session_manager.sessions if not s.is_finalized]
-            if candidates:
-                candidates.sort(key=lambda s: s.created_at, reverse=True)
-                session = candidates[0]
-            else:
+            # fallback: última sessão não finalizada (pelos cabeçalhos: inclui as fora do cache)
+            header = next((h for h in session_manager.list_headers() if not h.is_finalized), None)
+            session = session_manager.get_session(header.session_id) if header else None
+            if not session:
                 raise HTTPException(status_code=404, detail="Nenhuma sessão ativa")
 
         return {
@@ -224,145 +133,176 @@ async def get_active_map_session():
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def _parse_bbox(bbox: Optional[str]):
+    """"oeste,sul,leste,norte" (graus) → tupla; None = mapa inteiro"""
+    if not bbox:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox deve ser 'oeste,sul,leste,norte'")
+    if west > east or south > north:
+        raise HTTPException(status_code=400, detail="bbox invertido (oeste > leste ou sul > norte)")
+    return west, south, east, north
+
+
+def _clusters_response(index, zoom: int, items: List[Dict], **extra) -> Dict:
+    return {
+        "version": index.version,
+        "zoom": zoom,
+        "total_points": index.total_points,
+        "total_items": len(items),
+        "items": items,
+        **extra
+    }
+
+
+@router.get("/clusters")
+async def get_map_clusters_multi(
+    session_ids: str = Query(..., description="IDs separados por vírgula"),
+    zoom: int = Query(12, ge=0, le=22),
+    bbox: Optional[str] = Query(None, description="oeste,sul,leste,norte")
+):
+    """
+    Clusters de várias sessões no mesmo mapa (histórico/comparação).
+    Pontos soltos trazem session_id.
+    """
+    ids = [sid for sid in dict.fromkeys(session_ids.split(",")) if sid]
+    sessions = [session_manager.get_session(sid) for sid in ids]
+    missing = [sid for sid, session in zip(ids, sessions) if not session]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Sessões não encontradas: {', '.join(missing)}")
+    area = _parse_bbox(bbox)
+    try:
+        index = await map_clusters.index_for(sessions)
+        return _clusters_response(index, zoom, index.query(zoom, area), session_ids=ids)
+    except Exception as e:
+        logger.error(f"❌ Erro ao agrupar pontos do mapa: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/realtime/{session_id}/clusters")
+async def get_map_clusters(
+    session_id: str,
+    zoom: int = Query(12, ge=0, le=22),
+    bbox: Optional[str] = Query(None, description="oeste,sul,leste,norte")
+):
+    """
+    Marcadores já agrupados para o zoom, só dentro do bbox visível.
+    Cluster: {type: cluster, id, lat, lng, count, expansion_zoom, statuses, color};
+    ponto solto: {type: point, ...mesmo formato do snapshot}.
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    area = _parse_bbox(bbox)
+    try:
+        index = await map_clusters.index_for([session])
+        return _clusters_response(index, zoom, index.query(zoom, area), session_id=session_id)
+    except Exception as e:
+        logger.error(f"❌ Erro ao agrupar pontos do mapa: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/realtime/{session_id}/tiles/{z}/{x}/{y}")
+async def get_map_tile(session_id: str, z: int, x: int, y: int):
+    """
+    Pedaço z/x/y (esquema XYZ do Leaflet) com os itens agrupados daquele zoom.
+    O cliente guarda os tiles por version e só pede de novo quando ela muda.
+    """
+    if not 0 <= z <= 22 or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=400, detail="Tile fora do intervalo")
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    try:
+        index = await map_clusters.index_for([session])
+        return _clusters_response(index, z, index.tile(z, x, y), session_id=session_id, tile=[z, x, y])
+    except Exception as e:
+        logger.error(f"❌ Erro ao montar tile do mapa: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.websocket("/ws/{session_id}")
 async def websocket_map_updates(websocket: WebSocket, session_id: str):
     """
-    WebSocket para mapa em tempo real
-    Envia updates quando:
-    1. Entregador completa uma entrega
-    2. Entregador marca como problema/falha
-    3. Rota é finalizada
+    WebSocket para mapa em tempo real (protocolo em services/map_stream.py)
+    Ao inscrever (ou pedir resync) o cliente informa o último seq visto e recebe
+    só os deltas perdidos; snapshot completo só se o buraco for mais antigo que o
+    buffer de replay. Depois disso só deltas com seq:
+    1. Entregador completa/falha/devolve uma parada (stop_status)
+    2. Parada transferida entre rotas (stop_moved) ou rota reordenada
+    3. Posição do entregador (deliverer_position)
     """
     await websocket.accept()
+    map_stream.bind_loop(asyncio.get_running_loop())
     
-    if session_id not in active_connections:
-        active_connections[session_id] = []
-    active_connections[session_id].append(websocket)
+    # Todo envio para este socket passa pela fila da conexão (um único sender)
+    subscriber = map_fanout.subscribe(session_id, websocket.send_json, websocket.close)
     
     logger.info(f"✅ Admin conectado ao WebSocket da sessão {session_id}")
-    # Se houver REDIS configurado, inicia subscriber global para essa sessão (apenas 1 por sessão)
-    redis_client = get_redis_client()
-    if redis_client and session_id not in _redis_pubsub_tasks:
-        task = asyncio.create_task(_redis_subscriber_forward(session_id, redis_client))
-        _redis_pubsub_tasks[session_id] = task
 
     try:
         while True:
             # Receber keep-alive ou comandos do admin
             data = await websocket.receive_text()
+            session = session_manager.get_session(session_id)
+            if not session:
+                continue
             
             if data == "ping":
-                # Enviar estado atual do mapa
-                session = session_manager.get_session(session_id)
-                if session:
-                    map_state = {
-                        "type": "state_update",
-                        "routes": [
-                            {
-                                "route_id": r.id,
-                                "color": r.color,
-                                "delivered": r.delivered_count,
-                                "total": r.total_packages,
-                                "completion": r.completion_rate
-                            }
-                            for r in session.routes
-                        ]
-                    }
-                    await websocket.send_json(map_state)
+                # Só a versão atual: o cliente pede resync se divergir da dele
+                pong = map_stream.pong(session)
+                subscriber.offer(pong, key=message_key(pong))
+                continue
+            
+            try:
+                command = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(command, dict) and command.get('type') in ('subscribe', 'resync'):
+                # Reconexão/buraco: só os deltas perdidos (buffer) ou snapshot se for antigo demais
+                for message in map_stream.catch_up(session, command.get('epoch'), command.get('seq'), command.get('shape')):
+                    subscriber.offer(message, key=message_key(message))
+                if command['type'] == 'subscribe':
+                    # Última posição conhecida de cada entregador (sem esperar o próximo fix)
+                    for message in gps_tracker.positions(session_id):
+                        subscriber.offer(message, key=message_key(message))
     
     except WebSocketDisconnect:
-        active_connections[session_id].remove(websocket)
+        pass
+    except Exception as e:
+        # Conexão derrubada pelo fan-out (envio travado) ou socket quebrado
+        logger.debug(f"WebSocket da sessão {session_id} encerrado: {e}")
+    finally:
+        await map_fanout.unsubscribe(subscriber)
         logger.info(f"❌ Admin desconectado da sessão {session_id}")
-        # Se não houver mais conexões para essa sessão, cancela subscriber
-        if not active_connections.get(session_id):
-            task = _redis_pubsub_tasks.pop(session_id, None)
-            if task:
-                task.cancel()
 
 
-async def broadcast_delivery_update(session_id: str, point_id: str, status: str, route_id: str):
+@router.get("/sse/{session_id}")
+async def sse_map_updates(session_id: str, request: Request, last_event_id: Optional[str] = Query(None)):
     """
-    Chamado quando um entregador completa uma entrega
-    Notifica todos os admins conectados ao WebSocket
+    Server-Sent Events: o mesmo stream do WebSocket, só leitura (protocolo em
+    services/map_sse.py). Retomada pelo header Last-Event-ID (reconexão automática
+    do EventSource) ou ?last_event_id=epoch:seq:shape na 1ª conexão (versão do GET).
     """
-    if session_id not in active_connections:
-        return
-    
     session = session_manager.get_session(session_id)
     if not session:
-        return
-    
-    # Encontrar rota e ponto
-    route = None
-    point = None
-    for r in session.routes:
-        if r.id == route_id:
-            route = r
-            for p in r.optimized_order:
-                if p.id == point_id:
-                    point = p
-                    break
-            break
-    
-    if not route or not point:
-        return
-    
-    # Determinar nova cor
-    new_color = "#22c55e" if status == "delivered" else "#ef4444"  # Verde ou vermelho
-    
-    update_payload = {
-        "type": "point_update",
-        "point_id": point_id,
-        "route_id": route_id,
-        "new_color": new_color,
-        "status": status,
-        "address": point.address,
-        "sequence": route.optimized_order.index(point) + 1,
-        "route_completion": route.completion_rate,
-        "delivered": route.delivered_count,
-        "total": route.total_packages
-    }
-    
-    # Broadcast para todos os WebSockets dessa sessão
-    for websocket in active_connections.get(session_id, []):
-        try:
-            await websocket.send_json(update_payload)
-        except Exception as e:
-            logger.error(f"❌ Erro ao enviar update: {e}")
-    # Publicar em Redis para múltiplas réplicas, se configurado
-    try:
-        redis_client = get_redis_client()
-        if redis_client:
-            channel = f"map_updates:{session_id}"
-            await redis_client.publish(channel, json.dumps(update_payload))
-    except Exception:
-        pass
-    
-    logger.info(f"📡 Broadcast enviado: {point.address} → {status}")
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    map_stream.bind_loop(asyncio.get_running_loop())
 
+    stream = MapEventStream(session_id, request.headers.get("last-event-id") or last_event_id)
+    stream.open(session)
+    logger.info(f"✅ Admin conectado ao SSE da sessão {session_id}")
+    return StreamingResponse(
+        stream.events(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-async def _redis_subscriber_forward(session_id: str, redis_client):
-    """Subscreve canal Redis e encaminha mensagens recebidas para websockets locais."""
-    try:
-        pubsub = redis_client.pubsub()
-        await pubsub.subscribe(f"map_updates:{session_id}")
 
-        async for message in pubsub.listen():
-            if message is None:
-                continue
-            if message.get('type') != 'message':
-                continue
-            try:
-                data = json.loads(message.get('data', b'{}'))
-            except Exception:
-                continue
-            # Enviar para conexões locais
-            for ws in active_connections.get(session_id, []):
-                try:
-                    await ws.send_json(data)
-                except Exception as e:
-                    logger.debug(f"Erro ao repassar msg Redis para WS: {e}")
-    except asyncio.CancelledError:
-        return
-    except Exception as e:
-        logger.error(f"Erro no subscriber Redis para session {session_id}: {e}")
+# Cada evento aplicado na sessão (entrega, falha, transferência...) vira delta do mapa
+# (publicado no broker: os outros workers também recebem)
+session_manager.add_event_listener(map_stream.on_session_event)
+# Coordenadas resolvidas pelo geocoding em background viram delta points_geocoded
+geocoding_jobs.add_listener(map_stream.on_points_geocoded)
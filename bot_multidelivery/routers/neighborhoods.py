@@ -2,7 +2,7 @@
 Router para Análise de Bairros (Neighborhoods Analytics)
 Mapa de Calor e Estatísticas por Zona Geográfica
 
-NOTA: Usa lat/lng para determinar bairros via bounding box,
+NOTA: Usa lat/lng para determinar bairros via polígonos GeoJSON (reverse_geocoder),
 pois o campo 'neighborhood' não existe no modelo PackageDB
 """
 import logging
@@ -10,32 +10,13 @@ from fastapi import APIRouter, Query
 from sqlalchemy import func, desc
 from typing import Dict, List, Optional, Tuple
 from bot_multidelivery.database import db_manager, PackageDB, DelivererDB
+from bot_multidelivery.services.reverse_geocoder import reverse_geocoder
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/stats", tags=["Analytics"])
 logger = logging.getLogger(__name__)
 
 
-# Bounding boxes aproximados dos bairros da Zona Sul do Rio
-# Formato: (lat_min, lat_max, lng_min, lng_max)
-BAIRROS_BOUNDS = {
-    'Copacabana': (-22.990, -22.960, -43.195, -43.170),
-    'Ipanema': (-22.995, -22.980, -43.215, -43.195),
-    'Leblon': (-23.015, -22.995, -43.240, -43.215),
-    'Lagoa': (-22.980, -22.960, -43.220, -43.195),
-    'Jardim Botânico': (-22.975, -22.955, -43.235, -43.210),
-    'Gávea': (-22.995, -22.975, -43.265, -43.235),
-    'São Conrado': (-23.015, -22.990, -43.280, -43.255),
-    'Laranjeiras': (-22.960, -22.935, -43.210, -43.185),
-    'Flamengo': (-22.950, -22.925, -43.185, -43.165),
-    'Botafogo': (-22.965, -22.940, -43.200, -43.175),
-    'Urca': (-22.965, -22.950, -43.175, -43.155),
-    'Humaitá': (-22.970, -22.955, -43.210, -43.190),
-    'Catete': (-22.935, -22.920, -43.185, -43.170),
-    'Glória': (-22.925, -22.905, -43.180, -43.165),
-    'Centro': (-22.920, -22.890, -43.195, -43.165),
-}
-
 # Coordenadas centrais para exibição no mapa
 BAIRROS_COORDS = {
     'Copacabana': {'lat': -22.974, 'lng': -43.182},
@@ -59,13 +40,9 @@ BAIRROS_COORDS = {
 def get_bairro_from_coords(lat: float, lng: float) -> Optional[str]:
     """
     Determina o bairro baseado nas coordenadas lat/lng
-    usando bounding boxes aproximados
+    usando os polígonos dos bairros (STRtree)
     """
-    for bairro, bounds in BAIRROS_BOUNDS.items():
-        lat_min, lat_max, lng_min, lng_max = bounds
-        if lat_min <= lat <= lat_max and lng_min <= lng <= lng_max:
-            return bairro
-    return None
+    return reverse_geocoder.neighborhood(lat, lng)
 
 
 @router.get("/neighborhoods")
@@ -178,7 +155,11 @@ async def get_neighborhoods_stats(
                     top_deliverer = max(data['deliverers'].items(), key=lambda x: x[1])[0]
                 
                 # Usar coordenadas do dicionário global
-                coords = BAIRROS_COORDS.get(bairro, {'lat': 0, 'lng': 0})
+                coords = (
+                    BAIRROS_COORDS.get(bairro)
+                    or reverse_geocoder.neighborhoods.centroid(bairro)
+                    or {'lat': 0, 'lng': 0}
+                )
                 
                 result[bairro] = {
                     'total_packages': total,
@@ -254,20 +235,21 @@ async def get_neighborhood_detail(bairro: str):
         Dict com estatísticas detalhadas
     """
     try:
-        bounds = BAIRROS_BOUNDS.get(bairro)
+        bounds = reverse_geocoder.neighborhoods.bounds(bairro)
         if not bounds:
             return {'error': 'Bairro não encontrado', 'bairro': bairro}
         
         lat_min, lat_max, lng_min, lng_max = bounds
         
         with db_manager.get_session() as db:
-            # Buscar todos os pacotes dentro das coordenadas do bairro
-            packages = db.query(PackageDB).filter(
+            # Pré-filtro pelo retângulo envolvente no SQL, depois teste exato no polígono
+            candidates = db.query(PackageDB).filter(
                 PackageDB.lat >= lat_min,
                 PackageDB.lat <= lat_max,
                 PackageDB.lng >= lng_min,
                 PackageDB.lng <= lng_max
             ).all()
+            packages = [p for p in candidates if get_bairro_from_coords(p.lat, p.lng) == bairro]
             
             if not packages:
                 return {
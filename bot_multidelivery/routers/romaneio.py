@@ -14,6 +14,9 @@ from bot_multidelivery.parsers.md_romaneio_parser import parse_md_romaneio_excel
 from bot_multidelivery.session import session_manager, Romaneio, DailySession
 from bot_multidelivery.persistence import data_store
 from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.services.geocoding_jobs import geocoding_jobs
+from bot_multidelivery.services.geocoding_service import geocoding_service
+from bot_multidelivery.schemas_models import ManualGeocodeInput
 from datetime import datetime
 import uuid
 import re
@@ -339,6 +342,10 @@ async def import_romaneio(
         logger.info(f"✅ Sessão {session_id} agora tem {sum(len(r.points) for r in session.romaneios)} pacotes totais")
         logger.info(f"📌 Sessão {session_id} definida como sessão ativa atual")
         
+        # ===== GEOCODIFICAR EM BACKGROUND =====
+        # Não bloqueia a requisição: o cliente acompanha via /romaneio/jobs/{job_id}
+        job = geocoding_jobs.submit(session_id, delivery_points, romaneio_id=rom.id)
+        
         return {
             "status": "success",
             "session_id": session_id,
@@ -347,6 +354,8 @@ async def import_romaneio(
             "session_total_packages": sum(len(r.points) for r in session.romaneios),
             "route_value": session.route_value,
             "imported_romaneios": len(session.romaneios),
+            "geocoding_job_id": job.id if job else None,
+            "geocoding": job.summary() if job else None,
             "message": f"Importado com sucesso: {len(addresses)} endereços"
         }
     
@@ -446,6 +455,8 @@ async def reoptimize_session(session_id: str, num_deliverers: int = None):
     Se `num_deliverers` for informado, usa esse valor, senão usa `session.num_deliverers`.
     Retorna resumo das novas rotas geradas.
     """
+    # Fixada no cache até o save: expulsa e recarregada no meio, save_session gravaria uma cópia órfã
+    session_manager.pin(session_id)
     try:
         session = session_manager.get_session(session_id)
         if not session:
@@ -459,6 +470,16 @@ async def reoptimize_session(session_id: str, num_deliverers: int = None):
         if not all_points:
             return {"status": "empty", "message": "Nenhum ponto para otimizar"}
 
+        # Só entram na divisão os pacotes já geocodificados (o restante chega pelo job)
+        pending_geocoding = [p for p in all_points if not p.lat or not p.lng]
+        all_points = [p for p in all_points if p.lat and p.lng]
+        if not all_points:
+            return {
+                "status": "pending_geocoding",
+                "message": "Aguardando geocodificação dos endereços",
+                "pending_geocoding": len(pending_geocoding)
+            }
+
         # Decide número de entregadores
         k = num_deliverers if num_deliverers and num_deliverers > 0 else (session.num_deliverers or max(1, len(all_points) // 20))
 
@@ -529,10 +550,111 @@ async def reoptimize_session(session_id: str, num_deliverers: int = None):
             "session_id": session_id,
             "num_deliverers": k,
             "routes_created": len(new_routes),
-            "total_packages": sum(len(r.optimized_order) for r in new_routes)
+            "total_packages": sum(len(r.optimized_order) for r in new_routes),
+            "pending_geocoding": len(pending_geocoding)
         }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"❌ Erro ao reotimizar: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        session_manager.unpin(session_id)
+
+
+@router.get("/jobs/{job_id}")
+async def get_geocoding_job(job_id: str, since: int = Query(0, ge=0)):
+    """
+    Status do job de geocodificação: progresso, falhas por endereço e
+    resultados parciais a partir do cursor `since` (retornado como `cursor`).
+    """
+    job = geocoding_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.to_dict(since=since)
+
+
+@router.post("/jobs/{job_id}/resume")
+async def resume_geocoding_job(job_id: str):
+    """Reprocessa os endereços que falharam ou ficaram pendentes no job"""
+    job = geocoding_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    job = geocoding_jobs.resume(job_id)
+    return job.summary()
+
+
+@router.post("/{session_id}/geocode")
+async def geocode_session(session_id: str):
+    """
+    Inicia um job para todos os pacotes da sessão ainda sem coordenadas
+    (ex: retomar após reinício do servidor, quando o job original se perdeu).
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+
+    all_points = [p for rom in session.romaneios for p in rom.points]
+    job = geocoding_jobs.ensure(session_id, all_points)
+    if not job:
+        return {"status": "nothing_to_do", "session_id": session_id, "message": "Todos os pacotes já têm coordenadas"}
+    return job.summary()
+
+
+@router.get("/{session_id}/needs-fix")
+async def list_addresses_needing_fix(session_id: str):
+    """
+    Endereços da sessão sem coordenadas, agrupados por endereço, com o motivo
+    da falha registrado no cache negativo (se houver).
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+
+    grouped = {}
+    for rom in session.romaneios:
+        for p in rom.points:
+            if p.lat and p.lng:
+                continue
+            entry = grouped.setdefault(p.address, {"address": p.address, "bairro": p.bairro, "package_ids": []})
+            entry["package_ids"].append(p.package_id)
+
+    items = []
+    for entry in grouped.values():
+        failure = geocoding_service.failure_for(entry["address"])
+        items.append({
+            **entry,
+            "reason": failure["reason"] if failure else None,
+            "attempts": failure["attempts"] if failure else 0,
+            "last_failed_at": failure["last_failed_at"] if failure else None
+        })
+
+    return {"session_id": session_id, "total": len(items), "addresses": items}
+
+
+@router.post("/{session_id}/fix-address")
+async def fix_address(session_id: str, data: ManualGeocodeInput):
+    """
+    Correção manual: aplica lat/lng a todos os pacotes da sessão com esse endereço
+    e grava no cache de geocoding (próximas importações já acertam).
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+
+    target = data.address.strip().lower()
+    updated = 0
+    for points in [rom.points for rom in session.romaneios] + [r.optimized_order for r in session.routes]:
+        for p in points:
+            if (p.address or "").strip().lower() == target:
+                p.lat = data.lat
+                p.lng = data.lng
+                updated += 1
+
+    if not updated:
+        raise HTTPException(status_code=404, detail="Endereço não encontrado na sessão")
+
+    geocoding_service.set_manual_coordinates(data.address, data.lat, data.lng)
+    session_manager.save_session(session, set_as_current=False)
+
+    return {"status": "success", "session_id": session_id, "updated_packages": updated}
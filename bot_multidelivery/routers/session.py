@@ -195,6 +195,19 @@ async def resume_session(session_id: str):
         "routes_count": len(session.routes)
     }
 
+@router.get("/{session_id}/events")
+async def get_session_events(session_id: str, limit: int = Query(None, ge=1)):
+    """Linha do tempo de eventos da sessão (entregas, falhas, transferências...)"""
+    if not session_manager.get_session(session_id):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+
+    events = session_manager.get_timeline(session_id, limit)
+    return {
+        "session_id": session_id,
+        "total": len(events),
+        "events": events
+    }
+
 @router.post("/cancel-import")
 async def cancel_import():
     """Cancela a importação e limpa a sessão atual"""
@@ -300,13 +313,13 @@ async def list_all_sessions():
     return {
         "sessions": [
             {
-                "id": sid,
-                "name": s.session_name,
-                "date": s.date,
-                "total_packages": sum(len(r.points) for r in s.romaneios),
-                "routes_count": len(s.routes),
-                "is_finalized": s.is_finalized
+                "id": h.session_id,
+                "name": h.session_name,
+                "date": h.date,
+                "total_packages": h.total_packages,
+                "routes_count": h.num_routes,
+                "is_finalized": h.is_finalized
             }
-            for sid, s in session_manager.active_sessions.items()
+            for h in session_manager.list_headers()
         ]
     }
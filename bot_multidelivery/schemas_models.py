@@ -23,6 +23,10 @@ class FinalizeSessionInput(BaseModel):
     other_costs: float = 0.0
     expenses: Optional[List[Dict[str, object]]] = None
 
+# ==================== GPS ====================
+class GpsBatchInput(BaseModel):
+    fixes: List[Dict[str, Optional[float]]]
+
 # ==================== ROUTES & OPTIMIZATION ====================
 class RouteValueInput(BaseModel):
     value: float
@@ -48,6 +52,11 @@ class SaveCreativeRoutesInput(BaseModel):
     session_id: str
     routes: List[CreativeRouteInput]
 
+class ManualGeocodeInput(BaseModel):
+    address: str
+    lat: float
+    lng: float
+
 # ==================== SEPARATION ====================
 class SeparationScanInput(BaseModel):
     barcode: str
@@ -1,5 +1,12 @@
 import os
+import base64
+import hashlib
+import hmac
+import json
 import logging
+import time
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
 from fastapi import Security, HTTPException, status, Request
 from fastapi.security.api_key import APIKeyHeader
 from dotenv import load_dotenv
@@ -44,3 +51,66 @@ async def verify_api_key(api_key: str = Security(API_KEY_HEADER)):
         )
     
     return api_key
+
+
+# ==================== TOKEN DE RASTREAMENTO (GPS) ====================
+# Sem estado no servidor (vale em qualquer worker): sessão, rota e entregador
+# assinados com a API_SECRET_KEY. Entregue junto com a rota do entregador.
+
+TRACKING_TOKEN_TTL_S = int(os.getenv("TRACKING_TOKEN_TTL_S", str(18 * 3600)))
+
+
+def _tracking_signature(payload: str) -> str:
+    digest = hmac.new(SERVER_API_KEY.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode().rstrip("=")
+
+
+def create_tracking_token(session_id: str, route_id: str, telegram_id: Optional[int]) -> str:
+    """Token de envio de posições para a rota (expira em TRACKING_TOKEN_TTL_S)"""
+    expires_at = int(time.time()) + TRACKING_TOKEN_TTL_S
+    payload = f"{session_id}:{route_id}:{telegram_id or 0}:{expires_at}"
+    encoded = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+    return f"{encoded}.{_tracking_signature(payload)}"
+
+
+def verify_tracking_token(token: str) -> Optional[Tuple[str, str, int]]:
+    """(session_id, route_id, telegram_id) se o token é válido e não expirou, senão None"""
+    try:
+        encoded, signature = token.split(".", 1)
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+        session_id, rest = payload.split(":", 1)
+        route_id, telegram_id, expires_at = rest.rsplit(":", 2)
+        if not hmac.compare_digest(signature, _tracking_signature(payload)):
+            return None
+        if int(expires_at) < time.time():
+            return None
+        return session_id, route_id, int(telegram_id)
+    except (ValueError, AttributeError, UnicodeDecodeError):
+        return None
+
+
+# ==================== TELEGRAM WEBAPP (initData) ====================
+# O WebApp do Telegram assina initData com o token do bot: é a única prova de que
+# quem chama é mesmo o user_id informado (o user_id da query não prova nada).
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TELEGRAM_INIT_DATA_TTL_S = int(os.getenv("TELEGRAM_INIT_DATA_TTL_S", str(24 * 3600)))
+
+
+def verify_telegram_init_data(init_data: Optional[str]) -> Optional[int]:
+    """telegram_id do usuário se initData tem a assinatura do bot e não expirou, senão None"""
+    if not init_data or not TELEGRAM_BOT_TOKEN:
+        return None
+    try:
+        fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+        received = fields.pop("hash")
+        data_check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+        secret = hmac.new(b"WebAppData", TELEGRAM_BOT_TOKEN.encode(), hashlib.sha256).digest()
+        expected = hmac.new(secret, data_check.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(received, expected):
+            return None
+        if int(fields.get("auth_date", 0)) + TELEGRAM_INIT_DATA_TTL_S < time.time():
+            return None
+        return int(json.loads(fields["user"])["id"])
+    except (KeyError, ValueError, TypeError):
+        return None
@@ -4,6 +4,7 @@ Serviços do bot - Gerenciadores de lógica de negócio
 
 from .deliverer_service import deliverer_service
 from .geocoding_service import geocoding_service
+from .geocoding_jobs import geocoding_jobs
 from .genetic_optimizer import genetic_optimizer
 from .gamification_service import gamification_service
 from .dashboard_service import dashboard_ws
@@ -11,15 +12,28 @@ from .ml_predictor import predictor
 from .scooter_optimizer import scooter_optimizer
 from .export_service import export_service
 from .barcode_separator import barcode_separator
+from .ws_fanout import map_fanout
+from .broker import broker
+from .map_stream import map_stream
+from .gps_tracker import gps_tracker
+from .route_resequencer import route_resequencer
+from .map_clusters import map_clusters
 
 __all__ = [
     'deliverer_service',
     'geocoding_service', 
+    'geocoding_jobs',
     'genetic_optimizer',
     'gamification_service',
     'dashboard_ws',
     'predictor',
     'scooter_optimizer',
     'export_service',
-    'barcode_separator'
+    'barcode_separator',
+    'map_fanout',
+    'broker',
+    'map_stream',
+    'gps_tracker',
+    'route_resequencer',
+    'map_clusters'
 ]
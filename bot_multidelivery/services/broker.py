@@ -0,0 +1,371 @@
+"""
+📨 BROKER PUB/SUB - Tempo real entre processos
+Uma interface, três backends (BROKER_BACKEND):
+- memory: só este processo (um worker, scripts, testes)
+- local:  vários workers na mesma máquina, sem serviço extra. Cada processo
+          escuta um socket Unix datagram em BROKER_SOCKET_DIR e publica
+          enviando para os sockets dos outros (socket de worker morto é removido)
+- redis:  várias máquinas (REDIS_URL)
+Sem BROKER_BACKEND: redis se REDIS_URL estiver configurado, senão memory.
+
+publish() entrega aos handlers locais na hora e repassa aos outros processos;
+cada processo entrega aos seus handlers o que recebe (a própria mensagem que
+volta pelo Redis é descartada pela origem). Depois de start(), os handlers
+rodam sempre no loop do servidor, mesmo se publish() vier de outra thread.
+
+Estado de sessão é por processo: com backend remoto o SessionManager publica
+eventos e snapshots no tópico "sessions" (session_manager.enable_sync) e os
+demais workers atualizam/recarregam a cópia deles.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional
+
+from .. import snapshot_format
+
+try:
+    import redis.asyncio as aioredis
+except Exception:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict], None]
+
+
+class Broker:
+    """Backend em memória (e base dos demais): handlers por tópico, só neste processo"""
+
+    name = "memory"
+    remote = False  # repassa para outros processos?
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12]
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    # ==================== CICLO DE VIDA ====================
+
+    async def start(self):
+        # Origem nova por start: workers criados por fork herdam o objeto do pai
+        self.origin = uuid.uuid4().hex[:12]
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        self._loop = None
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+    # ==================== PUB/SUB ====================
+
+    def subscribe(self, topic: str, handler: Handler):
+        handlers = self._handlers.setdefault(topic, [])
+        if handler not in handlers:
+            handlers.append(handler)
+
+    def unsubscribe(self, topic: str, handler: Handler):
+        handlers = self._handlers.get(topic)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+
+    def publish(self, topic: str, message: Dict):
+        """Não bloqueia: entrega local + repasse aos outros processos (se iniciado)"""
+        self.published += 1
+        self._deliver_local(topic, message)
+        loop = self._loop
+        if not self.remote or loop is None or loop.is_closed():
+            return
+        try:
+            envelope = snapshot_format.dumps_json({"o": self.origin, "t": topic, "m": message})
+        except Exception as e:
+            self.dropped += 1
+            logger.warning(f"⚠️ Broker {self.name}: mensagem de '{topic}' não serializável: {e}")
+            return
+        # O repasse sempre roda no loop (sockets/cliente Redis não são thread-safe)
+        if self._on_loop():
+            self._forward(topic, envelope)
+        else:
+            loop.call_soon_threadsafe(self._forward, topic, envelope)
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _forward(self, topic: str, envelope: bytes):
+        """Repasse para os outros processos (memory: não há outros). Roda no loop."""
+
+    def _receive(self, raw: bytes):
+        """Mensagem vinda de outro processo"""
+        try:
+            envelope = snapshot_format.loads_json(raw)
+        except Exception:
+            return
+        if not isinstance(envelope, dict) or envelope.get("o") == self.origin:
+            return
+        self.received += 1
+        self._deliver_local(envelope.get("t"), envelope.get("m"))
+
+    def _deliver_local(self, topic: str, message: Dict):
+        if not self._handlers.get(topic):
+            return
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and not self._on_loop():
+            loop.call_soon_threadsafe(self._call_handlers, topic, message)
+            return
+        self._call_handlers(topic, message)
+
+    def _call_handlers(self, topic: str, message: Dict):
+        for handler in tuple(self._handlers.get(topic, ())):
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"❌ Handler do tópico '{topic}' falhou: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "origin": self.origin,
+            "topics": {t: len(h) for t, h in self._handlers.items() if h},
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped
+        }
+
+
+class _Peer:
+    """Socket conectado a um par + fila do que ainda não coube no buffer dele"""
+
+    __slots__ = ("path", "sock", "pending", "waiting")
+
+    def __init__(self, path: str, sock: socket.socket, max_pending: int):
+        self.path = path
+        self.sock = sock
+        self.pending: Deque[bytes] = deque(maxlen=max_pending)
+        self.waiting = False  # add_writer registrado
+
+
+class LocalSocketBroker(Broker):
+    """
+    Vários workers numa máquina: um socket Unix datagram por processo no mesmo
+    diretório (lista de pares relida a cada peer_refresh_s). A fila de datagramas
+    do kernel é curta (net.unix.max_dgram_qlen, 10 por padrão): com o par cheio a
+    mensagem espera numa fila limitada (max_pending) e sai quando o socket voltar a
+    aceitar escrita. Fila cheia descarta a mais antiga (dropped) e o cliente
+    recupera pelo seq/replay do stream do mapa.
+    """
+
+    name = "local"
+    remote = True
+    MAX_DATAGRAM = 64 * 1024
+
+    def __init__(self, directory: str, peer_refresh_s: float = 1.0, max_pending: int = 1024):
+        super().__init__()
+        self.directory = Path(directory)
+        self.peer_refresh_s = peer_refresh_s
+        self.max_pending = max_pending
+        self.path: Optional[Path] = None
+        self._sock: Optional[socket.socket] = None
+        self._peers: Dict[str, _Peer] = {}
+        self._peers_at = 0.0
+
+    async def start(self):
+        await super().start()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"{os.getpid()}-{self.origin}.sock"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self.path))
+        sock.setblocking(False)
+        self._sock = sock
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+        print(f"📨 Broker local em {self.path}")
+
+    async def stop(self):
+        for path in list(self._peers):
+            self._drop_peer(path)
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(sock.fileno())
+            sock.close()
+            self.path.unlink(missing_ok=True)
+        await super().stop()
+
+    def _on_readable(self):
+        while self._sock is not None:
+            try:
+                raw = self._sock.recv(self.MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self._receive(raw)
+
+    # ==================== PARES ====================
+
+    def _refresh_peers(self):
+        now = time.monotonic()
+        if now - self._peers_at < self.peer_refresh_s:
+            return
+        self._peers_at = now
+        own = str(self.path)
+        found = {str(p) for p in self.directory.glob("*.sock")} - {own}
+        for path in set(self._peers) - found:
+            self._drop_peer(path, unlink=False)
+        for path in found - set(self._peers):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            try:
+                sock.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker morreu sem limpar o socket
+                sock.close()
+                Path(path).unlink(missing_ok=True)
+                continue
+            except OSError as e:
+                sock.close()
+                logger.debug(f"Broker local: par {path} indisponível: {e}")
+                continue
+            self._peers[path] = _Peer(path, sock, self.max_pending)
+
+    def _drop_peer(self, path: str, unlink: bool = False):
+        peer = self._peers.pop(path, None)
+        if peer is None:
+            return
+        self.dropped += len(peer.pending)
+        if peer.waiting and self._loop is not None:
+            self._loop.remove_writer(peer.sock.fileno())
+        peer.sock.close()
+        if unlink:
+            Path(path).unlink(missing_ok=True)
+
+    def _forward(self, topic: str, envelope: bytes):
+        if self._sock is None:
+            return
+        if len(envelope) > self.MAX_DATAGRAM:
+            self.dropped += 1
+            logger.warning(f"⚠️ Broker local: mensagem de {len(envelope)} bytes em '{topic}' excede o datagrama")
+            return
+        self._refresh_peers()
+        for peer in list(self._peers.values()):
+            if len(peer.pending) == peer.pending.maxlen:
+                self.dropped += 1  # deque descarta a mais antiga
+            peer.pending.append(envelope)
+            if not peer.waiting:
+                self._flush(peer)
+
+    def _flush(self, peer: _Peer):
+        """Envia a fila do par até esvaziar ou o buffer dele encher (aí espera escrita)"""
+        while peer.pending:
+            try:
+                peer.sock.send(peer.pending[0])
+            except (BlockingIOError, InterruptedError):
+                if not peer.waiting:
+                    peer.waiting = True
+                    self._loop.add_writer(peer.sock.fileno(), self._flush, peer)
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._drop_peer(peer.path, unlink=True)
+                return
+            except OSError as e:
+                logger.debug(f"Broker local: envio para {peer.path} falhou: {e}")
+                self._drop_peer(peer.path)
+                return
+            peer.pending.popleft()
+        if peer.waiting:
+            peer.waiting = False
+            self._loop.remove_writer(peer.sock.fileno())
+
+
+class RedisBroker(Broker):
+    """Várias máquinas: um canal Redis por tópico (prefixado), uma conexão de escuta por processo"""
+
+    name = "redis"
+    remote = True
+
+    def __init__(self, url: str, prefix: str = "mdelivery:", timeout_s: float = 5.0):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self.timeout_s = timeout_s
+        self._client = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await super().start()
+        self._client = aioredis.from_url(self.url)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._client is not None:
+            try:
+                await self._client.close()
+            except Exception:
+                pass
+            self._client = None
+        await super().stop()
+
+    async def _listen(self):
+        while self._client is not None:
+            try:
+                pubsub = self._client.pubsub()
+                await pubsub.psubscribe(f"{self.prefix}*")
+                async for message in pubsub.listen():
+                    if message and message.get('type') == 'pmessage':
+                        self._receive(message.get('data', b''))
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logger.error(f"Erro no subscriber Redis do broker: {e}")
+                await asyncio.sleep(1)
+
+    def _forward(self, topic: str, envelope: bytes):
+        if self._client is None:
+            return
+        if self._on_loop():
+            self._loop.create_task(self._send(topic, envelope))
+        else:
+            asyncio.run_coroutine_threadsafe(self._send(topic, envelope), self._loop)
+
+    async def _send(self, topic: str, envelope: bytes):
+        try:
+            await asyncio.wait_for(self._client.publish(f"{self.prefix}{topic}", envelope), timeout=self.timeout_s)
+        except Exception as e:
+            self.dropped += 1
+            logger.debug(f"Broker Redis: publicação em '{topic}' falhou: {e}")
+
+
+def create_broker() -> Broker:
+    """Escolhe o backend pelo ambiente (BROKER_BACKEND, REDIS_URL, BROKER_SOCKET_DIR)"""
+    redis_url = os.getenv("REDIS_URL")
+    backend = os.getenv("BROKER_BACKEND", "").strip().lower() or ("redis" if redis_url else "memory")
+    if backend == "redis":
+        if redis_url and aioredis is not None:
+            return RedisBroker(redis_url)
+        print("⚠️ BROKER_BACKEND=redis sem REDIS_URL/redis instalado: usando broker em memória")
+    elif backend == "local":
+        if hasattr(socket, "AF_UNIX"):
+            return LocalSocketBroker(os.getenv("BROKER_SOCKET_DIR", "/tmp/multidelivery-broker"))
+        print("⚠️ BROKER_BACKEND=local requer sockets Unix: usando broker em memória")
+    elif backend != "memory":
+        print(f"⚠️ BROKER_BACKEND desconhecido ({backend}): usando broker em memória")
+    return Broker()
+
+
+# Instância global (start/stop no lifespan do servidor)
+broker = create_broker()
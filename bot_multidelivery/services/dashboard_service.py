@@ -1,14 +1,21 @@
 """
 📡 WEBSOCKET SERVER - Dashboard em tempo real
 Streaming de dados de entregas ao vivo
+Atualizações chegam pelo broker (tópicos "dashboard" e "notifications"): o
+dashboard pode rodar em outro processo que o servidor onde as entregas acontecem.
 """
 import json
 import asyncio
 from datetime import datetime
-from typing import Set
+from typing import Optional, Set
 from aiohttp import web
 import aiohttp_cors
 
+from .broker import broker
+
+DASHBOARD_TOPIC = "dashboard"
+NOTIFICATIONS_TOPIC = "notifications"
+
 
 class DashboardWebSocket:
     """Servidor WebSocket para dashboard"""
@@ -16,8 +23,12 @@ class DashboardWebSocket:
     def __init__(self, port: int = 8765):
         self.port = port
         self.clients: Set[web.WebSocketResponse] = set()
+        # Loop dos sockets dos clientes (broadcast sempre roda nele)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self.app = web.Application()
         self._setup_routes()
+        broker.subscribe(DASHBOARD_TOPIC, self._on_broker_message)
+        broker.subscribe(NOTIFICATIONS_TOPIC, self._on_broker_message)
     
     def _setup_routes(self):
         """Configura rotas HTTP + WebSocket"""
@@ -36,12 +47,20 @@ class DashboardWebSocket:
         
         for route in list(self.app.router.routes()):
             cors.add(route)
+        
+        self.app.on_startup.append(self._start_broker)
+    
+    async def _start_broker(self, app):
+        """Processo próprio (run): liga o broker para receber dos workers da API"""
+        if not broker.started:
+            await broker.start()
     
     async def websocket_handler(self, request):
         """Handler WebSocket"""
         ws = web.WebSocketResponse()
         await ws.prepare(request)
         
+        self._loop = asyncio.get_running_loop()
         self.clients.add(ws)
         print(f"🔌 Cliente conectado. Total: {len(self.clients)}")
         
@@ -347,14 +366,34 @@ class DashboardWebSocket:
         # Remove clientes mortos
         self.clients -= dead_clients
     
+    def _on_broker_message(self, message: dict):
+        """
+        Mensagem de qualquer processo → clientes conectados a este. Pode chegar em
+        outra thread (ex: bot em polling com o broker não iniciado): o broadcast vai
+        para o loop dos clientes, nunca para o loop de quem publicou.
+        """
+        loop = self._loop
+        if not self.clients or loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(self.broadcast(message))
+        else:
+            asyncio.run_coroutine_threadsafe(self.broadcast(message), loop)
+    
     async def notify_delivery_update(self, package_id: str, status: str):
         """Notifica atualização de entrega"""
-        await self.broadcast({
-            'type': 'delivery_update',
-            'package_id': package_id,
-            'status': status,
-            'timestamp': datetime.now().isoformat()
-        })
+        publish_delivery_update(package_id, status)
+    
+    def on_session_event(self, session, event):
+        """Listener do SessionManager.record_event: entrega/falha/devolução → delivery_update"""
+        from ..session_events import EventType
+        if event.type in (EventType.DELIVERED, EventType.FAILED, EventType.RETURNED):
+            for package_id in event.package_ids:
+                publish_delivery_update(package_id, event.type.value)
     
     def run(self):
         """Inicia servidor"""
@@ -369,5 +408,25 @@ class DashboardWebSocket:
         print(f"🌐 Dashboard WebSocket rodando em http://0.0.0.0:{self.port}/dashboard")
 
 
+def publish_delivery_update(package_id: str, status: str):
+    """Publica no broker: todo processo com dashboard aberto repassa aos clientes"""
+    broker.publish(DASHBOARD_TOPIC, {
+        'type': 'delivery_update',
+        'package_id': package_id,
+        'status': status,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+def publish_notification(kind: str, **data):
+    """Gatilho de notificação (ex: rota atribuída) visível em tempo real nos dashboards"""
+    broker.publish(NOTIFICATIONS_TOPIC, {
+        'type': 'notification',
+        'kind': kind,
+        'timestamp': datetime.now().isoformat(),
+        **data
+    })
+
+
 # Singleton
 dashboard_ws = DashboardWebSocket()
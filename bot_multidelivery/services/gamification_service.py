@@ -206,31 +206,17 @@ class GamificationService:
     
     def _calculate_streak(self, deliverer_id: int) -> int:
         """Calcula dias consecutivos de entregas"""
-        packages = self.data_store.get_all_packages()
+        # Dias distintos com entrega, mais recentes primeiro (consulta indexada no banco)
+        delivery_days = self.data_store.get_delivery_days(deliverer_id)
         
-        # Filtra pacotes do entregador
-        deliverer_packages = [
-            p for p in packages 
-            if p.get('assigned_to') == deliverer_id and p.get('status') == 'delivered'
-        ]
-        
-        if not deliverer_packages:
+        if not delivery_days:
             return 0
         
-        # Ordena por data de entrega
-        sorted_packages = sorted(
-            deliverer_packages,
-            key=lambda p: datetime.fromisoformat(p.get('delivered_at', '2000-01-01')),
-            reverse=True
-        )
-        
         # Conta dias consecutivos
         streak = 0
         current_date = datetime.now().date()
         
-        for pkg in sorted_packages:
-            delivered_date = datetime.fromisoformat(pkg['delivered_at']).date()
-            
+        for delivered_date in delivery_days:
             if delivered_date == current_date:
                 streak += 1
                 current_date -= timedelta(days=1)
@@ -0,0 +1,342 @@
+"""
+⏳ GEOCODING JOBS - Geocodificação de importações em background
+O import devolve um job_id na hora; o worker geocodifica endereço por endereço,
+preenche as coordenadas dos pacotes assim que chegam e reporta o progresso.
+Listeners (ex: mapa em tempo real) são avisados a cada endereço resolvido.
+
+A sessão fica fixada no cache (session_manager.pin) enquanto o job roda e é
+relida a cada gravação: o job nunca altera nem salva uma cópia expulsa do LRU.
+Pacotes resolvidos depois da divisão em rotas NÃO entram em rota nenhuma
+(ficam só no romaneio): aparecem em `unrouted` no resumo do job, para o admin
+redistribuir/otimizar de novo.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+from .geocoding_service import geocoding_service
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class AddressTask:
+    """Um endereço único do job (pode cobrir vários pacotes do mesmo prédio)"""
+    address: str
+    bairro: str
+    package_ids: List[str]
+    status: str = "pending"  # pending, resolved, failed
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "address": self.address,
+            "bairro": self.bairro,
+            "package_ids": self.package_ids,
+            "status": self.status,
+            "lat": self.lat,
+            "lng": self.lng,
+            "error": self.error,
+            "attempts": self.attempts
+        }
+
+
+@dataclass
+class GeocodingJob:
+    """Job de geocodificação de um romaneio (ou de uma sessão inteira)"""
+    session_id: str
+    tasks: List[AddressTask]
+    romaneio_id: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: JobStatus = JobStatus.QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    # Índices de tasks na ordem em que terminaram (cursor para resultados parciais)
+    completed_order: List[int] = field(default_factory=list)
+    # Resolvidos quando a sessão já tinha rotas, mas fora de todas elas
+    unrouted: List[str] = field(default_factory=list)
+
+    @property
+    def total_addresses(self) -> int:
+        return len(self.tasks)
+
+    @property
+    def total_packages(self) -> int:
+        return sum(len(t.package_ids) for t in self.tasks)
+
+    @property
+    def resolved_count(self) -> int:
+        return sum(1 for t in self.tasks if t.status == "resolved")
+
+    @property
+    def failed_count(self) -> int:
+        return sum(1 for t in self.tasks if t.status == "failed")
+
+    @property
+    def pending_count(self) -> int:
+        return sum(1 for t in self.tasks if t.status == "pending")
+
+    @property
+    def progress(self) -> float:
+        if not self.tasks:
+            return 100.0
+        return round((self.total_addresses - self.pending_count) / self.total_addresses * 100, 1)
+
+    @property
+    def is_running(self) -> bool:
+        return self.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+    def summary(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "romaneio_id": self.romaneio_id,
+            "status": self.status.value,
+            "progress": self.progress,
+            "total_addresses": self.total_addresses,
+            "total_packages": self.total_packages,
+            "resolved": self.resolved_count,
+            "failed": self.failed_count,
+            "pending": self.pending_count,
+            "resumable": not self.is_running and (self.failed_count > 0 or self.pending_count > 0),
+            "unrouted": len(self.unrouted),
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+    def to_dict(self, since: int = 0) -> Dict:
+        """Resumo + resultados parciais a partir do cursor `since`"""
+        since = max(0, since)
+        finished = [self.tasks[i] for i in self.completed_order[since:]]
+        return {
+            **self.summary(),
+            "cursor": len(self.completed_order),
+            "results": [t.to_dict() for t in finished if t.status == "resolved"],
+            "failures": [t.to_dict() for t in self.tasks if t.status == "failed"]
+        }
+
+
+class GeocodingJobManager:
+    """Fila de jobs de geocodificação executados no event loop do FastAPI"""
+
+    def __init__(self, max_concurrency: Optional[int] = None, save_every: Optional[int] = None, max_jobs: int = 100):
+        self.jobs: Dict[str, GeocodingJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.max_concurrency = max_concurrency or int(os.getenv("GEOCODING_JOB_CONCURRENCY", "4"))
+        self.save_every = save_every or int(os.getenv("GEOCODING_JOB_SAVE_EVERY", "20"))
+        self.max_jobs = max_jobs
+        self._listeners: List[Callable] = []
+
+    def add_listener(self, listener: Callable):
+        """listener(session, package_ids): chamado no event loop quando um endereço é resolvido"""
+        self._listeners.append(listener)
+
+    def submit(self, session_id: str, points: List, romaneio_id: Optional[str] = None) -> Optional[GeocodingJob]:
+        """
+        Cria e inicia um job para os pontos sem coordenadas.
+        Retorna None se todos os pontos já estão geocodificados.
+        """
+        missing = [p for p in points if not getattr(p, 'lat', 0) or not getattr(p, 'lng', 0)]
+        if not missing:
+            return None
+
+        groups = geocoding_service.group_by_address([
+            (p.address, getattr(p, 'bairro', '') or '') for p in missing
+        ])
+        tasks = []
+        for indexes in groups.values():
+            first = missing[indexes[0]]
+            tasks.append(AddressTask(
+                address=first.address,
+                bairro=getattr(first, 'bairro', '') or '',
+                package_ids=[missing[i].package_id for i in indexes]
+            ))
+
+        job = GeocodingJob(session_id=session_id, romaneio_id=romaneio_id, tasks=tasks)
+        self.jobs[job.id] = job
+        self._prune()
+        self._start(job)
+        logger.info(f"⏳ Job de geocoding {job.id}: {len(missing)} pacotes → {len(tasks)} endereços únicos")
+        return job
+
+    def ensure(self, session_id: str, points: List) -> Optional[GeocodingJob]:
+        """
+        Job em andamento da sessão ou um novo para os pontos sem coordenadas
+        (chamar de novo enquanto ele roda não duplica o trabalho).
+        """
+        running = next((j for j in self.list_for_session(session_id) if j.is_running), None)
+        if running:
+            return running
+        return self.submit(session_id, points)
+
+    def get(self, job_id: str) -> Optional[GeocodingJob]:
+        return self.jobs.get(job_id)
+
+    def list_for_session(self, session_id: str) -> List[GeocodingJob]:
+        jobs = [j for j in self.jobs.values() if j.session_id == session_id]
+        jobs.sort(key=lambda j: j.created_at, reverse=True)
+        return jobs
+
+    def resume(self, job_id: str) -> Optional[GeocodingJob]:
+        """Reenfileira endereços que falharam ou ficaram pendentes"""
+        job = self.jobs.get(job_id)
+        if not job or job.is_running:
+            return job
+        for task in job.tasks:
+            if task.status == "failed":
+                task.status = "pending"
+                task.error = None
+        job.error = None
+        job.finished_at = None
+        self._start(job)
+        return job
+
+    def _start(self, job: GeocodingJob):
+        job.status = JobStatus.QUEUED
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+
+    def _prune(self):
+        """Descarta jobs finalizados mais antigos além do limite"""
+        if len(self.jobs) <= self.max_jobs:
+            return
+        finished = sorted(
+            (j for j in self.jobs.values() if not j.is_running),
+            key=lambda j: j.created_at
+        )
+        for job in finished[:len(self.jobs) - self.max_jobs]:
+            self.jobs.pop(job.id, None)
+            self._tasks.pop(job.id, None)
+
+    def _notify(self, session, package_ids: List[str]):
+        for listener in self._listeners:
+            try:
+                listener(session, package_ids)
+            except Exception as e:
+                logger.error(f"❌ Erro no listener de geocoding: {e}")
+
+    @staticmethod
+    def _points_by_package(session) -> Dict[str, List]:
+        """Pacotes podem existir como objetos distintos no romaneio e na rota"""
+        points_by_pkg: Dict[str, List] = {}
+        for rom in session.romaneios:
+            for p in rom.points:
+                points_by_pkg.setdefault(p.package_id, []).append(p)
+        for route in session.routes:
+            for p in route.optimized_order:
+                points_by_pkg.setdefault(p.package_id, []).append(p)
+        return points_by_pkg
+
+    async def _run(self, job: GeocodingJob):
+        from ..session import session_manager
+
+        job.status = JobStatus.RUNNING
+        job.started_at = job.started_at or datetime.now()
+
+        session_manager.pin(job.session_id)
+        if not session_manager.get_session(job.session_id):
+            session_manager.unpin(job.session_id)
+            job.status = JobStatus.FAILED
+            job.error = "Sessão não encontrada"
+            job.finished_at = datetime.now()
+            return
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        since_save = 0
+        indexed = {"session": None, "points": {}, "routed": set()}
+
+        def current_session():
+            """Sessão viva do cache (reindexa se o objeto mudou, ex: apagada e recriada)"""
+            session = session_manager.get_session(job.session_id)
+            if session is not None and session is not indexed["session"]:
+                indexed["session"] = session
+                indexed["points"] = self._points_by_package(session)
+                indexed["routed"] = {p.package_id for r in session.routes for p in r.optimized_order}
+            return session
+
+        async def work(index: int, task: AddressTask):
+            nonlocal since_save
+            async with semaphore:
+                task.attempts += 1
+                try:
+                    lat, lng = await loop.run_in_executor(
+                        None, geocoding_service.geocode, task.address, task.bairro or None
+                    )
+                    task.lat, task.lng = float(lat), float(lng)
+                    task.status = "resolved"
+                    session = current_session()
+                    if session is None:
+                        raise RuntimeError("Sessão removida durante o job")
+                    # Pacotes ficam roteáveis assim que as coordenadas chegam
+                    for pkg_id in task.package_ids:
+                        for point in indexed["points"].get(pkg_id, []):
+                            point.lat = task.lat
+                            point.lng = task.lng
+                        if session.routes and pkg_id not in indexed["routed"]:
+                            job.unrouted.append(pkg_id)
+                    since_save += 1
+                    session_manager.touch(session.session_id)  # invalida ETags dos GETs
+                    self._notify(session, task.package_ids)
+                except Exception as e:
+                    task.status = "failed"
+                    task.error = str(e)
+                job.completed_order.append(index)
+
+                if since_save >= self.save_every:
+                    since_save = 0
+                    session = current_session()
+                    if session is not None:
+                        session_manager.save_session(session, set_as_current=False)
+
+        try:
+            await asyncio.gather(*(
+                work(i, t) for i, t in enumerate(job.tasks) if t.status == "pending"
+            ))
+            job.status = JobStatus.COMPLETED
+        except Exception as e:
+            logger.error(f"❌ Job de geocoding {job.id} falhou: {e}")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            try:
+                session = current_session()
+                if session is not None:
+                    session_manager.save_session(session, set_as_current=False)
+            except Exception as e:
+                logger.error(f"❌ Erro ao salvar sessão do job {job.id}: {e}")
+            finally:
+                session_manager.unpin(job.session_id)
+            self._tasks.pop(job.id, None)
+            if job.unrouted:
+                logger.warning(
+                    f"⚠️ Job {job.id}: {len(job.unrouted)} pacotes geocodificados fora das rotas "
+                    f"(sessão já dividida) - redistribua para incluí-los"
+                )
+            logger.info(
+                f"✅ Job de geocoding {job.id} finalizado: "
+                f"{job.resolved_count} resolvidos, {job.failed_count} falhas"
+            )
+
+
+# Singleton
+geocoding_jobs = GeocodingJobManager()
@@ -6,8 +6,11 @@ import json
 import hashlib
 import os
 import re
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple, Optional, List, Dict
+from typing import Tuple, Optional, List, Dict, Callable
 from datetime import datetime, timedelta
 import math
 import logging
@@ -21,6 +24,7 @@ class GeocodingCache:
         self.cache_file.parent.mkdir(parents=True, exist_ok=True)
         self.cache = self._load_cache()
         self.ttl_days = 90  # Cache válido por 90 dias
+        self.version = 0  # Incrementa a cada escrita (índices derivados se reconstroem)
         from ..database import db_manager
         self.db_manager = db_manager
     
@@ -110,6 +114,7 @@ class GeocodingCache:
             'provider': provider,
             'cached_at': datetime.now().isoformat()
         }
+        self.version += 1
         self._save_cache()
     
     def stats(self) -> dict:
@@ -124,6 +129,224 @@ class GeocodingCache:
         }
 
 
+class UngeocodableAddressError(ValueError):
+    """Endereço que nenhum provider conseguiu geocodificar"""
+    
+    def __init__(self, address: str, reason: str, attempts: int = 1):
+        super().__init__(f"Não foi possível geocodificar o endereço: {address} ({reason})")
+        self.address = address
+        self.reason = reason
+        self.attempts = attempts
+
+
+class NegativeGeocodingCache:
+    """
+    Cache de endereços que falharam em TODOS os providers.
+    TTL curto que dobra a cada nova falha (até max_ttl), para que re-importações
+    e re-otimizações não repitam a cascata inteira (incluindo o sleep do Nominatim).
+    """
+    
+    def __init__(self, cache_file: str = "data/geocoding_failures.json"):
+        self.cache_file = Path(cache_file)
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = timedelta(minutes=float(os.getenv("GEOCODING_NEGATIVE_TTL_MIN", "60")))
+        self.max_ttl = timedelta(hours=float(os.getenv("GEOCODING_NEGATIVE_MAX_TTL_H", "24")))
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = self._load()
+    
+    def _load(self) -> Dict[str, dict]:
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception:
+                return {}
+        return {}
+    
+    def _save(self):
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+        except Exception as e:
+            logging.error(f"Erro ao salvar cache negativo: {e}")
+    
+    def _expires_at(self, entry: dict) -> datetime:
+        ttl = min(self.ttl * (2 ** max(0, entry['attempts'] - 1)), self.max_ttl)
+        return datetime.fromisoformat(entry['last_failed_at']) + ttl
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Retorna a falha registrada se ainda estiver dentro do TTL"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and datetime.now() < self._expires_at(entry):
+                return entry
+            return None
+    
+    def add(self, key: str, address: str, reason: str) -> dict:
+        now = datetime.now().isoformat()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry:
+                entry['attempts'] += 1
+                entry['reason'] = reason
+                entry['last_failed_at'] = now
+            else:
+                entry = {
+                    'address': address,
+                    'reason': reason,
+                    'attempts': 1,
+                    'first_failed_at': now,
+                    'last_failed_at': now
+                }
+                self.entries[key] = entry
+            self._save()
+            return dict(entry)
+    
+    def discard(self, key: str):
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+    
+    def list_active(self) -> List[dict]:
+        """Endereços que precisam de correção manual (dentro do TTL)"""
+        now = datetime.now()
+        with self._lock:
+            active = [
+                {**entry, 'key': key, 'retry_after': self._expires_at(entry).isoformat()}
+                for key, entry in self.entries.items()
+                if now < self._expires_at(entry)
+            ]
+        active.sort(key=lambda e: e['last_failed_at'], reverse=True)
+        return active
+
+
+@dataclass
+class GeocodingProvider:
+    """Provider da cascata de geocoding"""
+    name: str
+    # (query, raw_addr, bairro, expected_bairro) -> (lat, lng) ou None
+    geocode: Callable[[str, str, Optional[str], Optional[str]], Optional[Tuple[float, float]]]
+    daily_quota: Optional[int] = None  # None = sem limite diário
+    is_enabled: Callable[[], bool] = lambda: True
+    last_resort: bool = False  # Pago: só depois dos gratuitos
+    prior_latency: float = 1.0  # Latência assumida (s) antes de haver medições
+
+
+class ProviderStats:
+    """
+    Saúde por provider: latência EWMA, taxa de sucesso EWMA e quota diária.
+    Protegido por lock pois o geocoding roda em ThreadPoolExecutor.
+    
+    Sem medições novas as EWMAs voltam para o prior com meia-vida half_life_s:
+    um provider rebaixado por uma queda passageira deixa de receber tráfego e,
+    sem isso, nunca teria como se recuperar. Com o custo de volta ao prior ele
+    é tentado de novo; se ainda falhar, as medições o rebaixam outra vez.
+    """
+    
+    def __init__(self, alpha: float = 0.2, prior_success: float = 0.9, half_life_s: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.alpha = alpha
+        self.prior_success = prior_success
+        self.half_life_s = half_life_s
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stats: Dict[str, dict] = {}
+    
+    def _entry(self, name: str, prior_latency: float = 1.0) -> dict:
+        entry = self._stats.get(name)
+        today = datetime.now().date()
+        if entry is None:
+            entry = {
+                'ewma_latency': prior_latency,
+                'success_rate': self.prior_success,
+                'prior_latency': prior_latency,
+                'updated_at': None,  # clock() da última medição
+                'calls': 0,
+                'successes': 0,
+                'calls_today': 0,
+                'day': today,
+                'last_error': None,
+                'last_used': None
+            }
+            self._stats[name] = entry
+        elif entry['day'] != today:
+            entry['calls_today'] = 0
+            entry['day'] = today
+        return entry
+    
+    def try_reserve(self, provider: GeocodingProvider) -> bool:
+        """Consome 1 chamada da quota diária (atômico); False se esgotada"""
+        with self._lock:
+            entry = self._entry(provider.name, provider.prior_latency)
+            if provider.daily_quota is not None and entry['calls_today'] >= provider.daily_quota:
+                return False
+            entry['calls_today'] += 1
+            return True
+    
+    def _decayed(self, entry: dict) -> Tuple[float, float]:
+        """(latência, taxa de sucesso) puxadas para o prior pelo tempo sem medições"""
+        latency, success = entry['ewma_latency'], entry['success_rate']
+        if entry['updated_at'] is None or self.half_life_s <= 0:
+            return latency, success
+        w = 0.5 ** (max(0.0, self.clock() - entry['updated_at']) / self.half_life_s)
+        prior_latency = entry['prior_latency']
+        return (
+            prior_latency + (latency - prior_latency) * w,
+            self.prior_success + (success - self.prior_success) * w
+        )
+    
+    def record(self, name: str, latency: float, success: bool, error: Optional[str] = None):
+        """Registra resultado de uma chamada (EWMA a partir do valor já decaído)"""
+        with self._lock:
+            entry = self._entry(name)
+            a = self.alpha
+            ewma_latency, success_rate = self._decayed(entry)
+            entry['ewma_latency'] = (1 - a) * ewma_latency + a * latency
+            entry['success_rate'] = (1 - a) * success_rate + a * (1.0 if success else 0.0)
+            entry['updated_at'] = self.clock()
+            entry['calls'] += 1
+            entry['successes'] += 1 if success else 0
+            entry['last_used'] = datetime.now()
+            if error:
+                entry['last_error'] = error
+    
+    def expected_cost(self, provider: GeocodingProvider) -> float:
+        """
+        Custo esperado de tentar o provider antes dos demais: latência / P(sucesso).
+        Ordenar a cascata por esse valor minimiza a latência esperada por endereço.
+        """
+        with self._lock:
+            latency, success = self._decayed(self._entry(provider.name, provider.prior_latency))
+            return latency / max(success, 0.01)
+    
+    def quota_left(self, provider: GeocodingProvider) -> Optional[int]:
+        with self._lock:
+            entry = self._entry(provider.name, provider.prior_latency)
+            if provider.daily_quota is None:
+                return None
+            return max(0, provider.daily_quota - entry['calls_today'])
+    
+    def calls_today(self) -> int:
+        with self._lock:
+            today = datetime.now().date()
+            return sum(e['calls_today'] for e in self._stats.values() if e['day'] == today)
+    
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                name: {
+                    'ewma_latency_s': round(self._decayed(e)[0], 3),
+                    'success_rate': round(self._decayed(e)[1], 3),
+                    'calls': e['calls'],
+                    'successes': e['successes'],
+                    'calls_today': e['calls_today'],
+                    'last_error': e['last_error'],
+                    'last_used': e['last_used'].isoformat() if e['last_used'] else None
+                }
+                for name, e in self._stats.items()
+            }
+
+
 class GeocodingService:
     """Geocoding com fallback inteligente - Múltiplas APIs GRATUITAS"""
     
@@ -133,8 +356,11 @@ class GeocodingService:
         self.locationiq_key = locationiq_key  # 5.000 req/dia GRÁTIS, sem cartão
         self.geoapify_key = geoapify_key      # 3.000 req/dia GRÁTIS, sem cartão
         self.cache = GeocodingCache()
-        self.api_calls_today = 0
-        self.last_reset = datetime.now().date()
+        self.negative_cache = NegativeGeocodingCache()
+        self.provider_stats = ProviderStats(
+            half_life_s=float(os.getenv("GEOCODING_STATS_HALF_LIFE_S", "300"))
+        )
+        self.providers = self._default_providers()
         # Contexto padrao para enderecos sem cidade/UF
         self.default_city = os.getenv("DEFAULT_CITY", "Rio de Janeiro")
         self.default_state = os.getenv("DEFAULT_STATE", "RJ")
@@ -161,6 +387,55 @@ class GeocodingService:
         # Verbose debug flag para registrar respostas de API
         self.debug = os.getenv("GEOCODING_DEBUG", "0") == "1"
     
+    def _default_providers(self) -> List[GeocodingProvider]:
+        """Cascata padrão; a ordem efetiva é decidida em _ordered_providers()"""
+        return [
+            GeocodingProvider(
+                name="LocationIQ",  # 5.000/dia GRÁTIS, sem cartão, rápido
+                geocode=lambda q, raw, b, exp: self._geocode_locationiq(q, exp),
+                daily_quota=5000,
+                is_enabled=lambda: bool(self.locationiq_key),
+                prior_latency=0.5
+            ),
+            GeocodingProvider(
+                name="Geoapify",  # 3.000/dia GRÁTIS, sem cartão
+                geocode=lambda q, raw, b, exp: self._geocode_geoapify(q, exp),
+                daily_quota=3000,
+                is_enabled=lambda: bool(self.geoapify_key),
+                prior_latency=0.6
+            ),
+            GeocodingProvider(
+                name="OSM",  # GRÁTIS mas lento (rate limit 1 req/s)
+                geocode=lambda q, raw, b, exp: self._geocode_osm(q, raw, b),
+                prior_latency=2.0
+            ),
+            GeocodingProvider(
+                name="Google",  # PAGO - exige cartão
+                geocode=lambda q, raw, b, exp: self._geocode_google(q, exp),
+                daily_quota=2500,
+                is_enabled=lambda: bool(self.google_api_key),
+                last_resort=True,
+                prior_latency=0.5
+            ),
+        ]
+
+    def _ordered_providers(self) -> List[GeocodingProvider]:
+        """
+        Providers habilitados ordenados por custo esperado (latência / taxa de sucesso).
+        Providers pagos (last_resort) continuam depois dos gratuitos.
+        """
+        enabled = [p for p in self.providers if p.is_enabled()]
+        position = {p.name: i for i, p in enumerate(enabled)}
+        return sorted(
+            enabled,
+            key=lambda p: (p.last_resort, self.provider_stats.expected_cost(p), position[p.name])
+        )
+
+    @property
+    def api_calls_today(self) -> int:
+        """Total de chamadas a providers hoje (todas as APIs)"""
+        return self.provider_stats.calls_today()
+
     def _prepare_query(self, address: str) -> str:
         """Enriquece endereco com cidade/UF se faltar contexto."""
         addr = self._sanitize_address(address)
@@ -232,11 +507,10 @@ class GeocodingService:
         """
         Geocode com estratégia em cascata:
         1. Cache local (GRATUITO)
-        2. LocationIQ (GRATUITO)
-        3. Geoapify (GRATUITO)
-        4. OpenStreetMap Nominatim (GRATUITO, mais lento)
-        5. Google Maps API (PAGO - ÚLTIMO RECURSO)
-        6. Simulação baseada em hash (ÚLTIMO RECURSO)
+        2. Providers gratuitos (LocationIQ, Geoapify, OSM Nominatim), na ordem
+           de menor latência esperada segundo as estatísticas ao vivo
+        3. Google Maps API (PAGO - ÚLTIMO RECURSO)
+        Providers com quota diária esgotada são pulados.
         """
         raw_addr = self._sanitize_address(address)
         bairro = self._extract_neighborhood(raw_addr)
@@ -249,44 +523,62 @@ class GeocodingService:
         if cached:
             return cached
         
-        # 2. Tenta LocationIQ (5.000/dia GRÁTIS, sem cartão, rápido)
-        if self.locationiq_key and self.api_calls_today < 5000:
-            coords = self._geocode_locationiq(query, expected_bairro)
-            if coords:
-                self.cache.set(query, coords[0], coords[1], "LocationIQ")
-                self._increment_api_call()
-                logging.info(f"✅ Geocoded via LocationIQ: {address[:60]} -> {coords}")
-                return coords
+        # 1.1 Cache negativo: falhou recentemente em todos os providers
+        negative_key = " ".join(query.lower().split())
+        failure = self.negative_cache.get(negative_key)
+        if failure:
+            raise UngeocodableAddressError(address, failure['reason'], failure['attempts'])
         
-        # 3. Tenta Geoapify (3.000/dia GRÁTIS, sem cartão)
-        if self.geoapify_key and self.api_calls_today < 3000:
-            coords = self._geocode_geoapify(query, expected_bairro)
-            if coords:
-                self.cache.set(query, coords[0], coords[1], "Geoapify")
-                self._increment_api_call()
-                logging.info(f"✅ Geocoded via Geoapify: {address[:60]} -> {coords}")
-                return coords
-        
-        # 4. Fallback: OpenStreetMap Nominatim (GRÁTIS mas lento)
-        coords = self._geocode_osm(query, raw_addr, bairro)
-        if coords:
-            self.cache.set(query, coords[0], coords[1], "OSM")
-            logging.info(f"✅ Geocoded via OSM: {address[:60]} -> {coords}")
-            return coords
-
-        # 5. ÚLTIMO RECURSO: Google Maps (se configurado - exige cartão)
-        if self.google_api_key and self.api_calls_today < 2500:
-            coords = self._geocode_google(query, expected_bairro)
+        # 2. Cascata adaptativa
+        tried = []
+        errors = []
+        for provider in self._ordered_providers():
+            if not self.provider_stats.try_reserve(provider):
+                continue
+            tried.append(provider.name)
+            start = time.perf_counter()
+            coords = None
+            error = None
+            try:
+                coords = provider.geocode(query, raw_addr, bairro, expected_bairro)
+            except Exception as e:
+                error = str(e)
+                errors.append(f"{provider.name}: {e}")
+                logging.warning(f"Erro no provider {provider.name}: {e}")
+            self.provider_stats.record(provider.name, time.perf_counter() - start, coords is not None, error)
+            
             if coords:
-                self.cache.set(query, coords[0], coords[1], "Google")
-                self._increment_api_call()
-                logging.info(f"✅ Geocoded via Google Maps (último recurso): {address[:60]} -> {coords}")
+                self.cache.set(query, coords[0], coords[1], provider.name)
+                self.negative_cache.discard(negative_key)
+                logging.info(f"✅ Geocoded via {provider.name}: {address[:60]} -> {coords}")
                 return coords
         
         # ERRO: Nenhuma API conseguiu geocodificar
         logging.error(f"❌ FALHA TOTAL no geocoding: {address[:80]}")
-        logging.error(f"   APIs tentadas: LocationIQ={bool(self.locationiq_key)}, Geoapify={bool(self.geoapify_key)}, OSM=True, Google={bool(self.google_api_key)}")
-        raise ValueError(f"Não foi possível geocodificar o endereço: {address}")
+        logging.error(f"   APIs tentadas: {', '.join(tried) or 'nenhuma'}")
+        if not tried:
+            # Quotas esgotadas: não é culpa do endereço, não entra no cache negativo
+            raise ValueError(f"Nenhum provider disponível para geocodificar: {address}")
+        
+        reason = "; ".join(errors) if errors else f"Sem resultado válido ({', '.join(tried)})"
+        failure = self.negative_cache.add(negative_key, address, reason)
+        raise UngeocodableAddressError(address, reason, failure['attempts'])
+
+    def set_manual_coordinates(self, address: str, lat: float, lng: float):
+        """Correção manual: grava coordenadas no cache e remove do cache negativo"""
+        query = self._prepare_query(self._sanitize_address(address))
+        if not query:
+            raise ValueError("Endereco vazio para geocodificacao")
+        self.cache.set(query, lat, lng, "Manual")
+        self.negative_cache.discard(" ".join(query.lower().split()))
+
+    def needs_manual_fix(self) -> List[dict]:
+        """Endereços que falharam em todos os providers recentemente"""
+        return self.negative_cache.list_active()
+
+    def failure_for(self, address: str) -> Optional[dict]:
+        """Falha registrada no cache negativo para o endereço (se houver)"""
+        return self.negative_cache.get(self.canonical_address(self._sanitize_address(address)))
     
     def _geocode_osm(self, address: str, raw_addr: str, bairro: Optional[str]) -> Optional[Tuple[float, float]]:
         """
@@ -648,69 +940,45 @@ class GeocodingService:
                 best = res
         return best
     
-    def _increment_api_call(self):
-        """Incrementa contador de chamadas API"""
-        today = datetime.now().date()
-        if today > self.last_reset:
-            self.api_calls_today = 0
-            self.last_reset = today
-        
-        self.api_calls_today += 1
-    
-    async def geocode_address(self, address: str, expected_bairro: Optional[str] = None) -> Optional[Tuple[float, float]]:
+    def canonical_address(self, address: str) -> str:
         """
-        Versão async do geocode para uso com Telegram bot.
-        Retorna (lat, lng) ou None se falhar.
+        Chave canônica do endereço: mesma normalização usada na consulta ao cache
+        (sanitiza complementos, adiciona cidade/UF, minúsculas e espaços únicos).
+        Pacotes do mesmo prédio ("Apto 101", "Apto 302") caem na mesma chave.
         """
-        try:
-            return self.geocode(address, expected_bairro)
-        except Exception:
-            return None
-    
-    async def geocode_batch(self, addresses_data: List[Dict]) -> List[Dict]:
+        query = self._prepare_query(address or "")
+        return " ".join(query.lower().split())
+
+    def group_by_address(self, items: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[int]]:
         """
-        Geocodifica múltiplos endereços em paralelo (async).
-        
-        Args:
-            addresses_data: Lista de dicts com 'address' e 'bairro' (opcional)
-        
-        Returns:
-            Lista de dicts com 'address', 'bairro', 'lat', 'lon'
+        Agrupa índices de (endereço, bairro) pela chave canônica, preservando a ordem.
+        Importações geocodificam pelos grupos em geocoding_jobs (um geocode() por
+        grupo, com cache negativo): é o único caminho em lote.
         """
-        import asyncio
-        from concurrent.futures import ThreadPoolExecutor
-        
-        def geocode_single(item):
-            """Geocodifica um único endereço"""
-            try:
-                address = item.get('address', '')
-                bairro = item.get('bairro', '')
-                
-                if not address:
-                    return {**item, 'lat': None, 'lon': None}
-                
-                coords = self.geocode(address, bairro)
-                return {**item, 'lat': coords[0], 'lon': coords[1]}
-            except Exception as e:
-                logging.warning(f"Erro ao geocodificar {item.get('address', '')}: {e}")
-                return {**item, 'lat': None, 'lon': None}
-        
-        # Executa geocoding em paralelo com ThreadPoolExecutor
-        # Limita a 10 threads simultâneas para não sobrecarregar APIs
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(
-                None,
-                lambda: list(executor.map(geocode_single, addresses_data))
-            )
-        
-        return results
-    
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for idx, (address, bairro) in enumerate(items):
+            key = (self.canonical_address(address), (bairro or "").strip().lower())
+            groups.setdefault(key, []).append(idx)
+        return groups
+
     async def reverse_geocode(self, lat: float, lng: float) -> Optional[str]:
         """
-        Reverse geocoding: coordenadas → endereço
+        Reverse geocoding offline: coordenadas → endereço conhecido mais próximo
+        (cache de geocoding) e/ou bairro pelos polígonos. Sem chamadas externas.
         """
-        # Sem reverse gratuito configurado: retorna as coordenadas formatadas
+        from .reverse_geocoder import reverse_geocoder
+
+        try:
+            result = reverse_geocoder.reverse(lat, lng)
+        except Exception as e:
+            logging.warning(f"Erro no reverse geocoding offline: {e}")
+            result = {}
+
+        if result.get('address'):
+            return result['address']
+        if result.get('neighborhood'):
+            return f"{result['neighborhood']}, Rio de Janeiro ({lat:.6f}, {lng:.6f})"
+        # Fora dos polígonos e sem endereço próximo: coordenadas formatadas
         return f"Lat: {lat:.6f}, Lng: {lng:.6f}"
     
     def get_stats(self) -> dict:
@@ -725,41 +993,18 @@ class GeocodingService:
                 'google': bool(self.google_api_key),
                 'locationiq': bool(self.locationiq_key),
                 'geoapify': bool(self.geoapify_key)
+            },
+            'needs_manual_fix': len(self.negative_cache.list_active()),
+            'provider_order': [p.name for p in self._ordered_providers()],
+            'providers': {
+                p.name: {
+                    **self.provider_stats.snapshot().get(p.name, {}),
+                    'quota_left': self.provider_stats.quota_left(p),
+                    'expected_cost_s': round(self.provider_stats.expected_cost(p), 3)
+                }
+                for p in self.providers if p.is_enabled()
             }
         }
-    
-    def batch_geocode_async(self, addresses: List[str]) -> List[Tuple[float, float]]:
-        """
-        🚀 Geocodifica lista de endereços em PARALELO
-        - Usa ThreadPoolExecutor com 8 workers
-        - Cache integrado (sem re-geocodificar)
-        - Fallback com hash-seed (determinístico)
-        - Retorna lista na MESMA ORDEM dos inputs
-        """
-        from concurrent.futures import ThreadPoolExecutor
-        import hashlib
-        import random as rand
-        
-        results = []
-        
-        def geocode_wrapper(addr):
-            try:
-                coords = self.geocode(addr)
-                return coords if isinstance(coords, tuple) else None
-            except:
-                # Fallback determinístico com hash
-                seed = int(hashlib.md5(addr.encode()).hexdigest()[:8], 16)
-                rand.seed(seed)
-                return (
-                    -22.9570 + rand.uniform(-0.025, 0.025),
-                    -43.1910 + rand.uniform(-0.025, 0.025)
-                )
-        
-        # Executa até 8 requisições em paralelo
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            results = list(executor.map(geocode_wrapper, addresses))
-        
-        return results
 
 
 # Singleton
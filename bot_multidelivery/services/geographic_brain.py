@@ -46,24 +46,10 @@ class GeographicBrain:
     
     def get_neighborhood_from_coords(self, lat: float, lng: float) -> str:
         """
-        Identifica bairro baseado em coordenadas
-        TODO: Integrar com GeoJSON para precisão real
+        Identifica bairro baseado em coordenadas (polígonos GeoJSON)
         """
-        # Heurística para Zona Sul do Rio (expandir futuramente)
-        if -22.98 <= lat <= -22.96 and -43.19 <= lng <= -43.17:
-            return "Copacabana"
-        elif -23.00 <= lat <= -22.98 and -43.21 <= lng <= -43.19:
-            return "Ipanema"
-        elif -23.01 <= lat <= -22.98 and -43.23 <= lng <= -43.21:
-            return "Leblon"
-        elif -22.95 <= lat <= -22.93 and -43.19 <= lng <= -43.17:
-            return "Botafogo"
-        elif -22.93 <= lat <= -22.91 and -43.21 <= lng <= -43.19:
-            return "Lagoa"
-        elif -23.03 <= lat <= -23.01 and -43.25 <= lng <= -43.23:
-            return "São Conrado"
-        else:
-            return "Zona Sul"
+        from .reverse_geocoder import reverse_geocoder
+        return reverse_geocoder.neighborhood(lat, lng) or "Zona Sul"
     
     def learn_from_session(self, session_id: str):
         """
@@ -0,0 +1,336 @@
+"""
+📍 GPS DOS ENTREGADORES - Ingestão de posições ao vivo
+Cada entregador tem um buffer circular em memória (GPS_RING_SIZE fixes) com a
+trilha recente. Para o mapa vai só uma posição de tempos em tempos
+(GPS_BROADCAST_S) e só se ele andou (GPS_BROADCAST_MIN_M) ou ficou muito tempo
+sem atualizar. Para o banco vai a trilha reduzida: um ponto a cada
+GPS_PERSIST_MIN_M metros ou GPS_PERSIST_MAX_S segundos, gravado em lotes numa
+thread (tabela deliverer_tracks ou <sessão>.tracks.jsonl).
+
+Custo por fix: validação + append + uma conta de distância. Sem I/O no request.
+Chamado no loop do servidor (endpoints async), sem lock.
+"""
+import json
+import logging
+import math
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .map_stream import map_stream
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+
+class GpsFix(NamedTuple):
+    t: float                         # epoch (s) no aparelho
+    lat: float
+    lng: float
+    accuracy: Optional[float] = None  # metros
+    speed: Optional[float] = None     # m/s
+    heading: Optional[float] = None   # graus
+
+
+def distance_m(a: GpsFix, b: GpsFix) -> float:
+    """Equiretangular: erro desprezível nas distâncias curtas entre fixes"""
+    x = math.radians(b.lng - a.lng) * math.cos(math.radians((a.lat + b.lat) / 2))
+    y = math.radians(b.lat - a.lat)
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+
+def _optional_float(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def parse_fix(raw: Dict) -> Optional[GpsFix]:
+    """Fix do cliente ({t, lat, lng, acc?, speed?, heading?}; t em segundos ou ms)"""
+    try:
+        lat, lng = float(raw["lat"]), float(raw["lng"])
+        t = float(raw.get("t") or time.time())
+        if t > 1e11:
+            t /= 1000.0  # Date.now() do navegador
+        return GpsFix(
+            t, lat, lng,
+            _optional_float(raw.get("acc", raw.get("accuracy"))),
+            _optional_float(raw.get("speed")),
+            _optional_float(raw.get("heading"))
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class _Track:
+    """Estado de um entregador numa sessão"""
+
+    __slots__ = (
+        "session_id", "route_id", "telegram_id", "deliverer", "fixes",
+        "kept", "pending", "pending_since", "sent", "sent_at", "last_message", "seen_at"
+    )
+
+    def __init__(self, session_id: str, route_id: str, telegram_id: Optional[int], ring_size: int):
+        self.session_id = session_id
+        self.route_id = route_id
+        self.telegram_id = telegram_id
+        self.deliverer: Optional[str] = None
+        self.fixes: Deque[GpsFix] = deque(maxlen=ring_size)
+        self.kept: Optional[GpsFix] = None     # último ponto da trilha reduzida
+        self.pending: List[List[float]] = []   # trilha reduzida ainda não gravada
+        self.pending_since = 0.0
+        self.sent: Optional[GpsFix] = None     # última posição enviada ao mapa
+        self.sent_at = 0.0
+        self.last_message: Optional[Dict] = None
+        self.seen_at = 0.0
+
+
+class TrackLog:
+    """Trilhas reduzidas: tabela deliverer_tracks (PostgreSQL) ou <sessão>.tracks.jsonl"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _store():
+        from ..session_persistence import session_store
+        return session_store
+
+    def _file(self, session_id: str) -> Path:
+        return self._store().sessions_dir / f"{session_id}.tracks.jsonl"
+
+    def append(self, session_id: str, route_id: str, telegram_id: Optional[int], points: List[List[float]]):
+        started_at = datetime.fromtimestamp(points[0][0])
+        ended_at = datetime.fromtimestamp(points[-1][0])
+        store = self._store()
+        if store.using_database:
+            try:
+                from ..database import db_manager, DelivererTrackDB
+                with db_manager.get_session() as db_session:
+                    db_session.add(DelivererTrackDB(
+                        session_id=session_id,
+                        route_id=route_id,
+                        telegram_id=telegram_id,
+                        points=points,
+                        started_at=started_at,
+                        ended_at=ended_at
+                    ))
+                return
+            except Exception as e:
+                print(f"⚠️ Erro ao gravar trilha GPS no PostgreSQL: {e}, usando fallback JSON")
+        line = json.dumps({"route_id": route_id, "telegram_id": telegram_id, "points": points})
+        with self._lock:
+            with open(self._file(session_id), 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    def load(self, session_id: str, route_id: str) -> List[List[float]]:
+        """Trilha reduzida gravada da rota, em ordem"""
+        store = self._store()
+        if store.using_database:
+            from ..database import db_manager, DelivererTrackDB
+            with db_manager.get_session() as db_session:
+                rows = db_session.query(DelivererTrackDB.points).filter(
+                    DelivererTrackDB.session_id == session_id,
+                    DelivererTrackDB.route_id == route_id
+                ).order_by(DelivererTrackDB.id).all()
+                return [p for (chunk,) in rows for p in (chunk or [])]
+        path = self._file(session_id)
+        if not path.exists():
+            return []
+        points = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    chunk = json.loads(line)
+                except ValueError:
+                    break  # Linha truncada (crash no meio do append)
+                if chunk.get("route_id") == route_id:
+                    points.extend(chunk.get("points") or [])
+        return points
+
+
+class GpsTracker:
+    """Buffers por entregador + envio limitado ao mapa + gravação da trilha reduzida"""
+
+    def __init__(self, ring_size: int = 720, broadcast_interval_s: float = 3.0,
+                 broadcast_min_m: float = 15.0, heartbeat_s: float = 30.0,
+                 persist_min_m: float = 30.0, persist_max_s: float = 60.0,
+                 persist_batch: int = 60, max_accuracy_m: float = 150.0,
+                 idle_ttl_s: float = 6 * 3600):
+        self.ring_size = ring_size
+        self.broadcast_interval_s = broadcast_interval_s
+        self.broadcast_min_m = broadcast_min_m
+        self.heartbeat_s = heartbeat_s
+        self.persist_min_m = persist_min_m
+        self.persist_max_s = persist_max_s
+        self.persist_batch = persist_batch
+        self.max_accuracy_m = max_accuracy_m
+        self.idle_ttl_s = idle_ttl_s
+        self._tracks: Dict[Tuple[str, str], _Track] = {}
+        self._log = TrackLog()
+        # Uma thread: lotes da mesma rota gravados na ordem
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gps-tracks")
+        self._swept_at = time.monotonic()
+        self._listeners: List = []
+        self.accepted = 0
+        self.rejected = 0
+        self.broadcasts = 0
+        self.persisted = 0
+
+    def add_listener(self, listener):
+        """listener(session_id, route_id, fix): chamado com o último fix aceito de cada lote"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    # ==================== INGESTÃO ====================
+
+    def ingest(self, session_id: str, route_id: str, telegram_id: Optional[int],
+               fixes: Iterable[GpsFix], deliverer: Optional[str] = None) -> Dict:
+        """Aplica um lote de fixes (ordem do aparelho). Retorna aceitos/rejeitados."""
+        now = time.monotonic()
+        key = (session_id, route_id)
+        track = self._tracks.get(key)
+        if track is None:
+            track = self._tracks[key] = _Track(session_id, route_id, telegram_id, self.ring_size)
+        track.deliverer = deliverer or track.deliverer
+        track.seen_at = now
+
+        accepted = rejected = 0
+        wall_now = time.time()
+        for fix in fixes:
+            if not self._valid(track, fix, wall_now):
+                rejected += 1
+                continue
+            accepted += 1
+            track.fixes.append(fix)
+            kept = track.kept
+            if kept is None or fix.t - kept.t >= self.persist_max_s or distance_m(kept, fix) >= self.persist_min_m:
+                if not track.pending:
+                    track.pending_since = now
+                track.pending.append([round(fix.t, 1), round(fix.lat, 6), round(fix.lng, 6)])
+                track.kept = fix
+
+        self.accepted += accepted
+        self.rejected += rejected
+        if accepted:
+            self._maybe_broadcast(track, now)
+            for listener in self._listeners:
+                try:
+                    listener(session_id, route_id, track.fixes[-1])
+                except Exception as e:
+                    logger.error(f"❌ Listener de GPS falhou: {e}")
+            if len(track.pending) >= self.persist_batch:
+                self._persist(track)
+        if now - self._swept_at >= self.persist_max_s:
+            self._sweep(now)
+        return {"accepted": accepted, "rejected": rejected}
+
+    def _valid(self, track: _Track, fix: GpsFix, wall_now: float) -> bool:
+        if not (-90.0 <= fix.lat <= 90.0 and -180.0 <= fix.lng <= 180.0) or (fix.lat == 0 and fix.lng == 0):
+            return False
+        if fix.accuracy is not None and fix.accuracy > self.max_accuracy_m:
+            return False
+        if fix.t > wall_now + 60:
+            return False  # relógio do aparelho adiantado demais
+        last = track.fixes[-1] if track.fixes else None
+        return last is None or fix.t > last.t  # duplicado/fora de ordem (reenvio após queda)
+
+    def _maybe_broadcast(self, track: _Track, now: float):
+        fix = track.fixes[-1]
+        if track.sent is not None:
+            elapsed = now - track.sent_at
+            if elapsed < self.broadcast_interval_s:
+                return
+            if elapsed < self.heartbeat_s and distance_m(track.sent, fix) < self.broadcast_min_m:
+                return
+        track.sent = fix
+        track.sent_at = now
+        track.last_message = map_stream.deliverer_position(
+            track.session_id, track.route_id, fix.lat, fix.lng, track.deliverer,
+            accuracy=fix.accuracy, speed=fix.speed, heading=fix.heading,
+            at=datetime.fromtimestamp(fix.t)
+        )
+        self.broadcasts += 1
+
+    # ==================== PERSISTÊNCIA ====================
+
+    def _persist(self, track: _Track):
+        points, track.pending = track.pending, []
+        if points:
+            self.persisted += len(points)
+            self._writer.submit(self._write, track.session_id, track.route_id, track.telegram_id, points)
+
+    def _write(self, session_id: str, route_id: str, telegram_id: Optional[int], points: List[List[float]]):
+        try:
+            self._log.append(session_id, route_id, telegram_id, points)
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar trilha GPS da rota {route_id}: {e}")
+
+    def _sweep(self, now: float):
+        """Grava trilhas paradas há persist_max_s e esquece entregadores inativos"""
+        self._swept_at = now
+        for key, track in list(self._tracks.items()):
+            if track.pending and now - track.pending_since >= self.persist_max_s:
+                self._persist(track)
+            if now - track.seen_at >= self.idle_ttl_s:
+                self._persist(track)
+                del self._tracks[key]
+
+    def flush(self, wait: bool = True):
+        """Grava toda trilha pendente (desligamento)"""
+        for track in self._tracks.values():
+            self._persist(track)
+        if wait:
+            self._writer.shutdown(wait=True)
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gps-tracks")
+
+    # ==================== CONSULTA ====================
+
+    def positions(self, session_id: str) -> List[Dict]:
+        """Última posição enviada de cada entregador (para quem acabou de inscrever)"""
+        return [
+            t.last_message for t in self._tracks.values()
+            if t.session_id == session_id and t.last_message is not None
+        ]
+
+    def recent(self, session_id: str, route_id: str, limit: Optional[int] = None) -> List[GpsFix]:
+        track = self._tracks.get((session_id, route_id))
+        if track is None:
+            return []
+        fixes = list(track.fixes)
+        return fixes[-limit:] if limit else fixes
+
+    def track(self, session_id: str, route_id: str) -> List[List[float]]:
+        """Trilha reduzida completa: gravada + pendente em memória"""
+        points = self._log.load(session_id, route_id)
+        current = self._tracks.get((session_id, route_id))
+        if current is not None:
+            points.extend(current.pending)
+        return points
+
+    def stats(self) -> Dict:
+        return {
+            "tracks": len(self._tracks),
+            "fixes_in_memory": sum(len(t.fixes) for t in self._tracks.values()),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "broadcasts": self.broadcasts,
+            "persisted": self.persisted
+        }
+
+
+# Instância global
+gps_tracker = GpsTracker(
+    ring_size=int(os.getenv("GPS_RING_SIZE", "720")),
+    broadcast_interval_s=float(os.getenv("GPS_BROADCAST_S", "3")),
+    broadcast_min_m=float(os.getenv("GPS_BROADCAST_MIN_M", "15")),
+    persist_min_m=float(os.getenv("GPS_PERSIST_MIN_M", "30")),
+    persist_max_s=float(os.getenv("GPS_PERSIST_MAX_S", "60"))
+)
@@ -0,0 +1,265 @@
+"""
+🗺️ CLUSTERS DO MAPA - Agrupamento hierárquico no servidor + recorte por tile
+Sessões grandes (ou várias sessões/histórico no mesmo mapa) não cabem como um
+marcador por ponto no navegador. Aqui os pontos do mapa são agrupados uma vez
+por versão (epoch/seq/shape do map_stream) e o cliente pede só o que enxerga:
+- Projeção Web Mercator em [0, 1]²; nível max_zoom + 1 = pontos soltos
+- Cada zoom abaixo agrupa os itens do zoom de cima numa grade de
+  MAP_CLUSTER_RADIUS px (estilo supercluster, com grade no lugar da KD-tree):
+  centróide ponderado, contagem por status, cor da rota predominante e
+  expansion_zoom (zoom em que o cluster se abre). Tudo em arrays numpy
+- Consulta por bbox ou por tile z/x/y (JSON no lugar de MVT) recorta o zoom
+  pedido; cada item cai em exatamente um tile
+
+Índices ficam num LRU por versão: delta novo (entrega, geocoding...) muda o seq
+e o próximo pedido reconstrói, fora do event loop.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .map_stream import build_map_state, map_stream, session_shape
+
+logger = logging.getLogger(__name__)
+
+TILE_EXTENT = 256       # px por tile (Leaflet/OSM)
+MAX_LATITUDE = 85.05112878
+
+
+def project(lat: float, lng: float) -> Tuple[float, float]:
+    """(lat, lng) → (x, y) Web Mercator normalizado em [0, 1]"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    sin = math.sin(math.radians(lat))
+    x = lng / 360.0 + 0.5
+    y = 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+def unproject(x: float, y: float) -> Tuple[float, float]:
+    lng = (x - 0.5) * 360.0
+    lat = math.degrees(2 * math.atan(math.exp((0.5 - y) * 2 * math.pi)) - math.pi / 2)
+    return lat, lng
+
+
+class _Level:
+    """Itens de um zoom em arrays: centróide, contagem, expansion_zoom e ponto (-1 = cluster)"""
+    __slots__ = ("x", "y", "count", "expansion", "point", "statuses", "color")
+
+    def __init__(self, x, y, count, expansion, point, statuses, color):
+        self.x = x
+        self.y = y
+        self.count = count
+        self.expansion = expansion
+        self.point = point
+        self.statuses = statuses  # (n, nº de status)
+        self.color = color        # índice da cor predominante
+
+
+class ClusterIndex:
+    """Hierarquia de clusters de um conjunto de pontos (imutável depois de montada)"""
+
+    def __init__(self, points: Sequence[Dict], version: str, min_zoom: int = 0,
+                 max_zoom: int = 16, radius: int = 60):
+        self.version = version
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.leaf_zoom = max_zoom + 1
+        self.radius = radius
+        self._points: List[Dict] = [p for p in points if p.get("lat") and p.get("lng")]
+        self.total_points = len(self._points)
+        self._levels: Dict[int, _Level] = {}
+        self._build()
+
+    def _build(self):
+        points = self._points
+        n = len(points)
+        if not n:
+            return
+        lat = np.clip(np.array([float(p["lat"]) for p in points]), -MAX_LATITUDE, MAX_LATITUDE)
+        lng = np.array([float(p["lng"]) for p in points])
+        sin = np.sin(np.radians(lat))
+        leaf_x = np.clip(lng / 360.0 + 0.5, 0.0, 1.0)
+        leaf_y = np.clip(0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / np.pi, 0.0, 1.0)
+
+        self._status_names, leaf_status = self._categories(p.get("status") or "pending" for p in points)
+        self._color_names, leaf_color = self._categories(p.get("route_color") or p.get("color") for p in points)
+        n_status = len(self._status_names)
+
+        leaves = np.arange(n)
+        self._levels[self.leaf_zoom] = level = _Level(
+            leaf_x, leaf_y, np.ones(n, dtype=np.int64), np.zeros(n, dtype=np.int64), leaves,
+            np.eye(n_status, dtype=np.int64)[leaf_status],
+            leaf_color
+        )
+        leaf_cluster = leaves
+        for z in range(self.max_zoom, self.min_zoom - 1, -1):
+            # Grade de `radius` px no zoom z sobre os centróides do zoom de cima
+            scale = TILE_EXTENT * (1 << z) / self.radius
+            cells = int(scale) + 2
+            keys = np.floor(level.x * scale).astype(np.int64) * cells + np.floor(level.y * scale).astype(np.int64)
+            _, inverse, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+            m = len(sizes)
+            member = np.empty(m, dtype=np.int64)
+            member[inverse] = np.arange(len(inverse))
+            single = sizes == 1  # sobe inalterado
+
+            leaf_cluster = inverse[leaf_cluster]
+            count = np.bincount(leaf_cluster, minlength=m)
+            statuses = np.bincount(leaf_cluster * n_status + leaf_status, minlength=m * n_status).reshape(m, n_status)
+            level = _Level(
+                np.bincount(leaf_cluster, weights=leaf_x, minlength=m) / count,
+                np.bincount(leaf_cluster, weights=leaf_y, minlength=m) / count,
+                count,
+                np.where(single, level.expansion[member], z + 1),
+                np.where(single, level.point[member], -1),
+                statuses,
+                self._dominant(leaf_cluster, leaf_color, m)
+            )
+            self._levels[z] = level
+
+    @staticmethod
+    def _categories(values) -> Tuple[List, np.ndarray]:
+        names: Dict = {}
+        codes = [names.setdefault(v, len(names)) for v in values]
+        return list(names), np.array(codes, dtype=np.int64)
+
+    def _dominant(self, leaf_cluster: np.ndarray, leaf_color: np.ndarray, m: int) -> np.ndarray:
+        """Cor com mais pontos em cada cluster (pares cluster×cor existentes, sem matriz m×cores)"""
+        colors = max(len(self._color_names), 1)
+        pairs, counts = np.unique(leaf_cluster * colors + leaf_color, return_counts=True)
+        cluster, color = pairs // colors, pairs % colors
+        order = np.lexsort((-counts, cluster))
+        first = order[np.r_[True, cluster[order][1:] != cluster[order][:-1]]]
+        dominant = np.zeros(m, dtype=np.int64)
+        dominant[cluster[first]] = color[first]
+        return dominant
+
+    def _item(self, z: int, level: _Level, i: int) -> Dict:
+        point = int(level.point[i])
+        if point >= 0:
+            return {"type": "point", **self._points[point]}
+        lat, lng = unproject(float(level.x[i]), float(level.y[i]))
+        return {
+            "type": "cluster",
+            "id": f"{z}:{i}",
+            "lat": round(lat, 6),
+            "lng": round(lng, 6),
+            "count": int(level.count[i]),
+            "expansion_zoom": int(level.expansion[i]),
+            "statuses": {
+                name: int(total) for name, total in zip(self._status_names, level.statuses[i]) if total
+            },
+            "color": self._color_names[int(level.color[i])] if self._color_names else None
+        }
+
+    def _select(self, zoom: int, x0: float, y0: float, x1: float, y1: float, closed: bool = True) -> List[Dict]:
+        z = max(self.min_zoom, min(int(zoom), self.leaf_zoom))
+        level = self._levels.get(z)
+        if level is None:  # nenhum ponto com coordenadas
+            return []
+        if closed:
+            mask = (level.x >= x0) & (level.x <= x1) & (level.y >= y0) & (level.y <= y1)
+        else:
+            mask = (level.x >= x0) & (level.x < x1) & (level.y >= y0) & (level.y < y1)
+        return [self._item(z, level, int(i)) for i in np.flatnonzero(mask)]
+
+    def tile(self, z: int, x: int, y: int) -> List[Dict]:
+        """Itens do tile z/x/y (cada item cai em exatamente um tile do zoom)"""
+        n = 1 << z
+        return self._select(z, x / n, y / n, (x + 1) / n, (y + 1) / n, closed=False)
+
+    def query(self, zoom: int, bbox: Optional[Tuple[float, float, float, float]] = None) -> List[Dict]:
+        """Itens visíveis no zoom dentro do bbox (oeste, sul, leste, norte); sem bbox = tudo"""
+        if bbox is None:
+            return self._select(zoom, 0.0, 0.0, 1.0, 1.0)
+        west, south, east, north = bbox
+        x0, y1 = project(south, west)
+        x1, y0 = project(north, east)
+        return self._select(zoom, x0, y0, x1, y1)
+
+
+class MapClusterCache:
+    """LRU de ClusterIndex por versão do mapa (uma ou várias sessões)"""
+
+    def __init__(self, max_indexes: int = 16, max_zoom: int = 16, radius: int = 60):
+        self.max_indexes = max_indexes
+        self.max_zoom = max_zoom
+        self.radius = radius
+        self._indexes: "OrderedDict[str, ClusterIndex]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    @staticmethod
+    def version(sessions: Sequence) -> str:
+        """Muda com qualquer delta (seq) ou mudança estrutural (shape) de qualquer sessão"""
+        parts = [
+            f"{s.session_id}:{map_stream.current_seq(s.session_id)}:{session_shape(s)}"
+            for s in sessions
+        ]
+        return f"{map_stream.epoch}-{zlib.crc32('|'.join(parts).encode('utf-8')):08x}"
+
+    async def index_for(self, sessions: Sequence) -> ClusterIndex:
+        version = self.version(sessions)
+        with self._lock:
+            index = self._indexes.get(version)
+            if index is not None:
+                self._indexes.move_to_end(version)
+                self.hits += 1
+                return index
+        # Pedidos simultâneos da mesma versão esperam um único build
+        pending = self._building.get(version)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        future = self._building[version] = loop.create_future()
+        try:
+            # Pontos lidos no loop (a sessão muda nele); agrupamento no executor
+            points = []
+            for session in sessions:
+                state_points = build_map_state(session)["points"]
+                if len(sessions) > 1:
+                    state_points = [{**p, "session_id": session.session_id} for p in state_points]
+                points.extend(state_points)
+            index = await loop.run_in_executor(
+                None, lambda: ClusterIndex(points, version, max_zoom=self.max_zoom, radius=self.radius)
+            )
+            with self._lock:
+                self._indexes[version] = index
+                while len(self._indexes) > self.max_indexes:
+                    self._indexes.popitem(last=False)
+            self.builds += 1
+            future.set_result(index)
+            return index
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # evita "exception was never retrieved" sem ninguém esperando
+            raise
+        finally:
+            self._building.pop(version, None)
+
+    def stats(self) -> Dict:
+        return {
+            "indexes": len(self._indexes),
+            "builds": self.builds,
+            "hits": self.hits,
+            "max_zoom": self.max_zoom,
+            "radius": self.radius
+        }
+
+
+# Instância global
+map_clusters = MapClusterCache(
+    max_indexes=int(os.getenv("MAP_CLUSTER_CACHE", "16")),
+    max_zoom=int(os.getenv("MAP_CLUSTER_MAX_ZOOM", "16")),
+    radius=int(os.getenv("MAP_CLUSTER_RADIUS", "60"))
+)
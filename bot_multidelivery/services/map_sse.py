@@ -0,0 +1,132 @@
+"""
+📨 SSE DO MAPA - O mesmo stream do WebSocket numa resposta HTTP longa
+Para quem só assiste (e proxies que derrubam WebSocket): GET text/event-stream
+inscrito no map_fanout como qualquer conexão (mesma fila limitada, coalescência
+e timeout de envio). Cada delta com seq sai com id "epoch:seq:shape"; ao
+reconectar o EventSource manda Last-Event-ID e recebe só o que perdeu (buffer
+de replay do map_stream) ou o snapshot.
+
+Sem canal de volta, o próprio servidor conserta a sequência: delta fora de
+ordem (fila que descartou mensagens) vira catch_up a partir do último seq
+enviado, e o keep-alive (SSE_KEEPALIVE_S) confere epoch/seq/shape como o pong
+do WebSocket. Envio travado derruba a conexão; o navegador reconecta sozinho.
+"""
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..snapshot_format import dumps_json
+from .gps_tracker import gps_tracker
+from .map_stream import map_stream, message_key
+from .ws_fanout import map_fanout
+
+logger = logging.getLogger(__name__)
+
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+
+def event_id(epoch: str, seq: int, shape: int) -> str:
+    return f"{epoch}:{seq}:{shape}"
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """Last-Event-ID → (epoch, seq, shape); inválido/ausente → snapshot"""
+    try:
+        epoch, seq, shape = (value or "").split(":")
+        return epoch, int(seq), int(shape)
+    except ValueError:
+        return None, None, None
+
+
+class MapEventStream:
+    """Uma conexão SSE de uma sessão (versão que o cliente tem + fila de entrega)"""
+
+    def __init__(self, session_id: str, last_event_id: Optional[str] = None,
+                 keepalive_s: float = SSE_KEEPALIVE_S):
+        self.session_id = session_id
+        self.epoch, self.seq, self.shape = parse_event_id(last_event_id)
+        self.keepalive_s = keepalive_s
+        # O buffer é a fila do Subscriber; aqui só a entrega de uma mensagem por vez
+        self._inbox: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.subscriber = None
+
+    async def _send(self, message: Dict):
+        await self._inbox.put(message)
+
+    async def _close(self):
+        """Fan-out derrubou a conexão (envio travado): encerra a resposta"""
+        while not self._inbox.empty():
+            self._inbox.get_nowait()
+        self._inbox.put_nowait(None)
+
+    def open(self, session):
+        """Inscreve no fan-out e enfileira o catch-up da versão informada + posições atuais"""
+        self.subscriber = map_fanout.subscribe(self.session_id, self._send, self._close)
+        messages = map_stream.catch_up(session, self.epoch, self.seq, self.shape)
+        messages += gps_tracker.positions(self.session_id)
+        for message in messages:
+            self.subscriber.offer(message, key=message_key(message))
+
+    def _current_session(self):
+        from ..session import session_manager
+        return session_manager.get_session(self.session_id)
+
+    def _in_sync(self) -> bool:
+        return self.epoch == map_stream.epoch and isinstance(self.seq, int)
+
+    def _repair(self, message: Dict) -> List[Dict]:
+        """Delta que não é o próximo da sequência → o que falta desde o último enviado"""
+        seq = message.get("seq")
+        if message["type"] == "snapshot" or not isinstance(seq, int):
+            return [message]
+        if self._in_sync() and seq <= self.seq + 1:
+            return [message]
+        session = self._current_session()
+        if session is None:
+            return []
+        return map_stream.catch_up(session, self.epoch, self.seq, self.shape)
+
+    def _format(self, message: Dict) -> Optional[bytes]:
+        kind = message["type"]
+        if kind == "pong":
+            return b": pong\n\n"  # já em dia: só mantém a conexão viva
+        lines = b""
+        if kind == "snapshot":
+            self.epoch, self.seq, self.shape = message["epoch"], message["seq"], message["shape"]
+            lines = f"id: {event_id(self.epoch, self.seq, self.shape)}\n".encode()
+        elif isinstance(message.get("seq"), int):
+            if self._in_sync() and message["seq"] <= self.seq:
+                return None  # já enviado (replay e fila se sobrepõem)
+            self.seq = message["seq"]
+            self.shape = message.get("shape", self.shape)
+            lines = f"id: {event_id(self.epoch, self.seq, self.shape)}\n".encode()
+        return lines + b"data: " + dumps_json(message) + b"\n\n"
+
+    async def events(self, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[bytes]:
+        """Corpo da resposta text/event-stream (termina ao desconectar ou ser derrubada)"""
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+            while True:
+                try:
+                    message = await asyncio.wait_for(self._inbox.get(), timeout=self.keepalive_s)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+                    session = self._current_session()
+                    if session is None:
+                        return
+                    # Equivalente ao pong: mudança fora do log (shape) ou seq perdido
+                    batch = map_stream.catch_up(session, self.epoch, self.seq, self.shape)
+                else:
+                    if message is None:
+                        return
+                    batch = self._repair(message)
+                for item in batch:
+                    chunk = self._format(item)
+                    if chunk:
+                        yield chunk
+        finally:
+            if self.subscriber is not None:
+                await map_fanout.unsubscribe(self.subscriber)
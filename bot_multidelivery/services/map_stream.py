@@ -0,0 +1,397 @@
+"""
+🛰️ STREAM DO MAPA EM TEMPO REAL - Estado versionado + deltas
+Cada sessão tem um número de sequência contínuo. Toda mudança de estado do mapa
+(status de parada, parada movida entre rotas, rota reordenada) vira um delta
+pequeno com seq = anterior + 1. Os últimos deltas de cada sessão ficam num
+buffer circular (MAP_REPLAY_BUFFER): quem reconecta ou detecta buraco na
+sequência informa o último seq visto e recebe só o que perdeu. O snapshot
+completo só é montado quando o buraco é mais antigo que o buffer.
+
+Protocolo (JSON no WebSocket):
+    cliente → {"type": "subscribe", "epoch", "seq", "shape"}   (após conectar)
+    cliente → {"type": "resync", "epoch", "seq", "shape"}      (buraco de seq; sem seq = snapshot)
+    cliente → "ping"                                            (keep-alive)
+    servidor → snapshot | stop_status | stop_moved | route_reordered
+               | points_geocoded (coordenadas resolvidas pelo geocoding em background)
+               | deliverer_position (sem seq, só a última posição) | pong
+
+Só leitura sem WebSocket: o mesmo stream por SSE (services/map_sse.py).
+
+O epoch muda a cada processo: seq de outro epoch não é comparável (snapshot).
+Os deltas passam pelo broker (services/broker.py): cada worker recebe todos e
+numera com a sua própria sequência.
+"""
+import asyncio
+import logging
+import os
+import threading
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Deque, Dict, Hashable, List, Optional
+
+from .broker import broker
+from .ws_fanout import map_fanout
+
+logger = logging.getLogger(__name__)
+
+DELIVERED_COLOR = "#22c55e"  # Verde
+FAILED_COLOR = "#ef4444"     # Vermelho
+PENDING_COLOR = "#9ca3af"    # Cinza (pré-separação)
+MAP_TOPIC = "map"            # Tópico do broker (payload: session_id + delta sem seq)
+
+
+def point_status(route, point) -> str:
+    if route.is_delivered(point.package_id):
+        return "delivered"
+    if point.status in ("failed", "returned"):
+        return point.status
+    return "pending"
+
+
+def status_color(route, status: str) -> str:
+    if status == "delivered":
+        return DELIVERED_COLOR
+    if status in ("failed", "returned"):
+        return FAILED_COLOR
+    return route.color
+
+
+def route_summary(route) -> Dict:
+    return {
+        "route_id": route.id,
+        "color": route.color,
+        "deliverer": route.assigned_to_name,
+        "total": route.total_packages,
+        "delivered": route.delivered_count,
+        "pending": route.pending_count,
+        "completion_rate": route.completion_rate
+    }
+
+
+def session_shape(session) -> int:
+    """
+    Impressão digital barata (O(nº de rotas)) da estrutura do mapa. Mudanças que não
+    passam pelo log de eventos (otimizar, atribuir, importar) mudam o shape e o
+    cliente pede resync no próximo pong.
+    """
+    parts = [str(sum(len(r.points) for r in session.romaneios))]
+    for r in session.routes:
+        parts.append(f"{r.id}:{len(r.optimized_order)}:{r.color}:{r.assigned_to_name or ''}")
+    return zlib.crc32("|".join(parts).encode("utf-8"))
+
+
+def message_key(message: Dict) -> Optional[Hashable]:
+    """Chave de coalescência na fila da conexão (deltas com seq nunca coalescem)"""
+    kind = message.get("type")
+    if kind in ("snapshot", "pong"):
+        return (kind,)
+    if kind == "deliverer_position":
+        return ("position", message.get("route_id"))
+    return None
+
+
+def planning_point(point) -> Dict:
+    """Ponto de romaneio ainda sem rota (visualização pré-separação)"""
+    return {
+        "id": point.package_id,
+        "address": point.address,
+        "lat": point.lat,
+        "lng": point.lng,
+        "bairro": point.bairro,
+        "cep": point.cep,
+        "color": PENDING_COLOR,
+        "route_color": "#e5e7eb",
+        "route_id": "unassigned",
+        "deliverer": "Aguardando Separação",
+        "sequence": 0,
+        "status": "pending"
+    }
+
+
+def route_point(route, idx: int, point) -> Dict:
+    """Parada da rota (idx = posição em optimized_order)"""
+    status = point_status(route, point)
+    return {
+        "id": point.package_id,
+        "address": point.address,
+        "lat": point.lat,
+        "lng": point.lng,
+        "color": status_color(route, status),
+        "route_color": route.color,
+        "route_id": route.id,
+        "deliverer": route.assigned_to_name or "Não atribuído",
+        "sequence": idx + 1,
+        "status": status
+    }
+
+
+def build_map_state(session) -> Dict:
+    """Estado completo do mapa (pontos coloridos + resumo por rota), sem geocoding"""
+    session_id = session.session_id
+    if not session.routes:
+        # Sem rotas: pontos dos romaneios que já têm coordenadas (pré-separação)
+        points = [
+            planning_point(point)
+            for romaneio in session.romaneios
+            for point in romaneio.points
+            if point.lat and point.lng
+        ]
+        if not points:
+            return {
+                "status": "empty",
+                "session_id": session_id,
+                "total_routes": 0,
+                "total_points": 0,
+                "points": [],
+                "routes_summary": [],
+                "message": "Nenhuma rota iniciada e nenhum ponto com coordenadas ainda. Os endereços são geocodificados em segundo plano e aparecem no mapa conforme chegam."
+            }
+        return {
+            "status": "planning",
+            "session_id": session_id,
+            "total_routes": 0,
+            "total_points": len(points),
+            "points": points,
+            "routes_summary": [],
+            "message": "Visualização pré-separação"
+        }
+
+    points = [
+        route_point(route, idx, point)
+        for route in session.routes
+        for idx, point in enumerate(route.optimized_order)
+    ]
+
+    return {
+        "status": "success",
+        "session_id": session_id,
+        "total_routes": len(session.routes),
+        "total_points": len(points),
+        "points": points,
+        "routes_summary": [route_summary(r) for r in session.routes]
+    }
+
+
+class MapStream:
+    """Sequência por sessão + entrega dos deltas pelo fan-out (map_fanout)"""
+
+    def __init__(self, replay_size: int = 256):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.replay_size = replay_size
+        self._seq: Dict[str, int] = {}
+        self._history: Dict[str, Deque[Dict]] = {}  # últimos deltas (seq contínuo)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.deltas = 0
+        self.snapshots = 0
+        self.replays = 0
+        self.replayed = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Loop dos WebSockets: eventos gravados fora dele (threads do bot) são repassados"""
+        self._loop = loop
+
+    def current_seq(self, session_id: str) -> int:
+        return self._seq.get(session_id, 0)
+
+    # ==================== SNAPSHOT / PONG ====================
+
+    def snapshot(self, session) -> Dict:
+        with self._lock:
+            seq = self._seq.get(session.session_id, 0)
+            state = build_map_state(session)
+        self.snapshots += 1
+        state.update({
+            "type": "snapshot",
+            "epoch": self.epoch,
+            "seq": seq,
+            "shape": session_shape(session)
+        })
+        return state
+
+    def pong(self, session) -> Dict:
+        """Keep-alive: o cliente compara epoch/seq/shape e só pede snapshot se divergir"""
+        return {
+            "type": "pong",
+            "epoch": self.epoch,
+            "seq": self.current_seq(session.session_id),
+            "shape": session_shape(session)
+        }
+
+    def catch_up(self, session, epoch: Optional[str], seq: Optional[int], shape: Optional[int]) -> List[Dict]:
+        """
+        O que mandar para um cliente na versão (epoch, seq, shape): pong se já está em dia,
+        os deltas perdidos se ainda estão no buffer, senão o snapshot completo.
+        """
+        session_id = session.session_id
+        if epoch == self.epoch and isinstance(seq, int):
+            with self._lock:
+                current = self._seq.get(session_id, 0)
+                history = self._history.get(session_id)
+                missed = []
+                if seq < current and history and history[0]["seq"] <= seq + 1:
+                    missed = list(islice(history, seq + 1 - history[0]["seq"], None))
+            # Mais que meia fila da conexão transbordaria e viraria outro buraco
+            if 0 <= current - seq == len(missed) <= map_fanout.max_queue // 2:
+                expected = shape
+                for message in missed:
+                    expected = message.get("shape", expected)
+                if expected == session_shape(session):
+                    if missed:
+                        self.replays += 1
+                        self.replayed += len(missed)
+                        return missed
+                    return [self.pong(session)]
+        return [self.snapshot(session)]
+
+    # ==================== DELTAS ====================
+
+    def on_session_event(self, session, event):
+        """Listener do SessionManager.record_event: evento aplicado → delta"""
+        from ..session_events import EventType
+        route = session.get_route(event.route_id)
+        if route is None:
+            return
+        if event.type in (EventType.DELIVERED, EventType.FAILED, EventType.RETURNED):
+            self._emit(session.session_id, self._stop_status(route, event))
+        elif event.type == EventType.TRANSFERRED:
+            target = session.get_route(event.data.get('to_route'))
+            if target is not None:
+                self._emit(session.session_id, self._stop_moved(session, route, target, event))
+        elif event.type == EventType.REORDERED:
+            self._emit(session.session_id, {
+                "type": "route_reordered",
+                "route_id": route.id,
+                "order": list(event.data.get('order', []))
+            })
+
+    def on_points_geocoded(self, session, package_ids: List[str]):
+        """Listener do geocoding_jobs: coordenadas novas → delta com os pontos completos"""
+        wanted = set(package_ids)
+        if session.routes:
+            points = [
+                route_point(route, idx, point)
+                for route in session.routes
+                for idx, point in enumerate(route.optimized_order)
+                if point.package_id in wanted and point.lat and point.lng
+            ]
+        else:
+            points = [
+                planning_point(point)
+                for romaneio in session.romaneios
+                for point in romaneio.points
+                if point.package_id in wanted and point.lat and point.lng
+            ]
+        if points:
+            self._emit(session.session_id, {"type": "points_geocoded", "points": points})
+
+    def _stop_status(self, route, event) -> Dict:
+        status = event.type.value  # delivered, failed, returned
+        return {
+            "type": "stop_status",
+            "route_id": route.id,
+            "ids": list(event.package_ids),
+            "status": status,
+            "color": status_color(route, status),
+            "route": route_summary(route)
+        }
+
+    def _stop_moved(self, session, source, target, event) -> Dict:
+        points = []
+        for package_id in event.package_ids:
+            point = target.get_point(package_id)
+            if point is not None:
+                status = point_status(target, point)
+                points.append({"id": package_id, "status": status, "color": status_color(target, status)})
+        return {
+            "type": "stop_moved",
+            "from_route": source.id,
+            "to_route": target.id,
+            "points": points,
+            "routes": [route_summary(source), route_summary(target)],
+            "shape": session_shape(session)  # tamanho das rotas mudou
+        }
+
+    def deliverer_position(self, session_id: str, route_id: str, lat: float, lng: float,
+                           deliverer: Optional[str] = None, at: Optional[datetime] = None,
+                           **extra) -> Dict:
+        """
+        Posição do entregador: sem seq (não é estado do mapa), só a mais recente por rota.
+        extra: accuracy/speed/heading do GPS (omitidos se None).
+        """
+        message = {
+            "type": "deliverer_position",
+            "route_id": route_id,
+            "deliverer": deliverer,
+            "lat": lat,
+            "lng": lng,
+            "at": (at or datetime.now()).isoformat()
+        }
+        message.update((k, v) for k, v in extra.items() if v is not None)
+        self._emit(session_id, message)
+        return message
+
+    def _emit(self, session_id: str, message: Dict):
+        """Publica no broker: este e os demais processos recebem em _on_broker_message"""
+        broker.publish(MAP_TOPIC, {"session_id": session_id, "message": message})
+
+    def _on_broker_message(self, payload: Dict):
+        """Delta de qualquer processo: ganha o seq DESTE processo (a sequência é por processo)"""
+        session_id = payload.get("session_id")
+        message = dict(payload.get("message") or {})
+        if not session_id or "type" not in message:
+            return
+        if message["type"] == "deliverer_position":
+            self._dispatch(session_id, message, key=message_key(message))
+        else:
+            self._publish(session_id, message)
+
+    def _publish(self, session_id: str, message: Dict):
+        """
+        Incrementa o seq SEMPRE, mesmo sem inscritos: quem fez GET na versão
+        anterior (ou caiu) recupera pelo buffer ao inscrever.
+        """
+        with self._lock:
+            seq = self._seq.get(session_id, 0) + 1
+            self._seq[session_id] = seq
+            message["seq"] = seq
+            if self.replay_size:
+                history = self._history.get(session_id)
+                if history is None:
+                    history = self._history[session_id] = deque(maxlen=self.replay_size)
+                history.append(message)
+        self.deltas += 1
+        self._dispatch(session_id, message)
+
+    def _dispatch(self, session_id: str, message: Dict, key=None):
+        """Entrega no loop dos WebSockets (direto se já estamos nele)"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            map_fanout.publish(session_id, message, key=key)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(map_fanout.publish, session_id, message, key)
+
+    def stats(self) -> Dict:
+        return {
+            "epoch": self.epoch,
+            "sessions": len(self._seq),
+            "deltas": self.deltas,
+            "snapshots": self.snapshots,
+            "replays": self.replays,
+            "replayed": self.replayed,
+            "replay_size": self.replay_size
+        }
+
+
+# Instância global (recebe os deltas de todos os processos pelo broker)
+map_stream = MapStream(replay_size=int(os.getenv("MAP_REPLAY_BUFFER", "256")))
+broker.subscribe(MAP_TOPIC, map_stream._on_broker_message)
@@ -0,0 +1,255 @@
+"""
+🧭 REVERSE GEOCODER OFFLINE - Coordenadas → bairro / endereço conhecido
+Polígonos de bairros em índice espacial (STRtree) + KD-tree sobre o cache de
+geocoding. Sem chamadas externas: cada consulta custa microssegundos.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from shapely.geometry import Point, box, shape
+from shapely.ops import unary_union
+from shapely.strtree import STRtree
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy vem com scikit-learn, mas não é dependência direta
+    cKDTree = None
+
+logger = logging.getLogger(__name__)
+
+# Ordem de prioridade: arquivos anteriores vencem quando polígonos de bairros
+# diferentes se sobrepõem. O mesmo bairro em mais de um arquivo vira a união
+# das geometrias (bairros_rj.geojson só tem recortes de Leblon/Ipanema)
+DEFAULT_GEOJSON_FILES = [
+    "data/geojson/bairros_rj.geojson",
+    "data/geojson/zona_sul_rio.json",
+]
+
+# Bounding boxes aproximados (lat_min, lat_max, lng_min, lng_max) usados apenas
+# para bairros que ainda não têm polígono nos arquivos GeoJSON
+FALLBACK_BOUNDS = {
+    'Copacabana': (-22.990, -22.960, -43.195, -43.170),
+    'Ipanema': (-22.995, -22.980, -43.215, -43.195),
+    'Leblon': (-23.015, -22.995, -43.240, -43.215),
+    'Lagoa': (-22.980, -22.960, -43.220, -43.195),
+    'Jardim Botânico': (-22.975, -22.955, -43.235, -43.210),
+    'Gávea': (-22.995, -22.975, -43.265, -43.235),
+    'São Conrado': (-23.015, -22.990, -43.280, -43.255),
+    'Laranjeiras': (-22.960, -22.935, -43.210, -43.185),
+    'Flamengo': (-22.950, -22.925, -43.185, -43.165),
+    'Botafogo': (-22.965, -22.940, -43.200, -43.175),
+    'Urca': (-22.965, -22.950, -43.175, -43.155),
+    'Humaitá': (-22.970, -22.955, -43.210, -43.190),
+    'Catete': (-22.935, -22.920, -43.185, -43.170),
+    'Glória': (-22.925, -22.905, -43.180, -43.165),
+    'Centro': (-22.920, -22.890, -43.195, -43.165),
+}
+
+KM_PER_DEGREE = 111.32
+
+
+class NeighborhoodIndex:
+    """Polígonos de bairros em STRtree (consulta por ponto em ~O(log n)), um por nome"""
+
+    def __init__(self, geojson_files: Optional[List[str]] = None, fallback_bounds: Optional[Dict] = None):
+        self.names: List[str] = []
+        self.polygons: List = []
+        self.priorities: List[int] = []
+        self._index_of: Dict[str, int] = {}
+        files = geojson_files if geojson_files is not None else DEFAULT_GEOJSON_FILES
+
+        for priority, path in enumerate(files):
+            self._load_geojson(Path(path), priority)
+
+        # Bounding boxes só para bairros sem polígono
+        known = set(self.names)
+        for name, (lat_min, lat_max, lng_min, lng_max) in (fallback_bounds or FALLBACK_BOUNDS).items():
+            if name not in known:
+                self._add(name, box(lng_min, lat_min, lng_max, lat_max), len(files))
+
+        self.tree = STRtree(self.polygons) if self.polygons else None
+        logger.info(f"🧭 Índice de bairros: {len(self.polygons)} polígonos")
+
+    def _load_geojson(self, path: Path, priority: int):
+        if not path.exists():
+            logger.warning(f"⚠️ GeoJSON de bairros não encontrado: {path}")
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao ler GeoJSON {path}: {e}")
+            return
+
+        for feature in data.get('features', []):
+            name = (feature.get('properties') or {}).get('name')
+            if not name:
+                continue
+            try:
+                self._add(name, shape(feature['geometry']), priority)
+            except Exception as e:
+                logger.warning(f"Polígono inválido para {name} em {path}: {e}")
+
+    def _add(self, name: str, polygon, priority: int):
+        """Bairro novo ou, se já existe, une a geometria (mantém a prioridade do 1º arquivo)"""
+        idx = self._index_of.get(name)
+        if idx is not None:
+            self.polygons[idx] = unary_union([self.polygons[idx], polygon])
+            return
+        self._index_of[name] = len(self.names)
+        self.names.append(name)
+        self.polygons.append(polygon)
+        self.priorities.append(priority)
+
+    def lookup(self, lat: float, lng: float) -> Optional[str]:
+        """Bairro que contém o ponto (prioridade do arquivo, depois menor área)"""
+        if self.tree is None:
+            return None
+        point = Point(lng, lat)
+        candidates = self.tree.query(point, predicate="intersects")
+        if len(candidates) == 0:
+            return None
+        best = min(candidates, key=lambda i: (self.priorities[i], self.polygons[i].area))
+        return self.names[best]
+
+    def bounds(self, name: str) -> Optional[Tuple[float, float, float, float]]:
+        """(lat_min, lat_max, lng_min, lng_max) do bairro, para pré-filtro em SQL"""
+        polygon = self.polygon(name)
+        if polygon is None:
+            return None
+        lng_min, lat_min, lng_max, lat_max = polygon.bounds
+        return (lat_min, lat_max, lng_min, lng_max)
+
+    def centroid(self, name: str) -> Optional[Dict[str, float]]:
+        polygon = self.polygon(name)
+        if polygon is None:
+            return None
+        c = polygon.representative_point()
+        return {'lat': c.y, 'lng': c.x}
+
+    def polygon(self, name: str):
+        idx = self._index_of.get(name)
+        return self.polygons[idx] if idx is not None else None
+
+
+class AddressKDTree:
+    """
+    KD-tree sobre os endereços já geocodificados (cache de geocoding).
+    Coordenadas projetadas em km (equiretangular local), suficiente para a cidade.
+    """
+
+    def __init__(self, ref_lat: float = -22.9068):
+        self.cos_ref = math.cos(math.radians(ref_lat))
+        self.addresses: List[str] = []
+        self.coords = np.empty((0, 2))
+        self.tree = None
+
+    def _project(self, lat, lng):
+        return np.column_stack((
+            np.asarray(lng, dtype=float) * KM_PER_DEGREE * self.cos_ref,
+            np.asarray(lat, dtype=float) * KM_PER_DEGREE
+        ))
+
+    def build(self, entries: List[Tuple[str, float, float]]):
+        self.addresses = [e[0] for e in entries]
+        if not entries:
+            self.coords = np.empty((0, 2))
+            self.tree = None
+            return
+        self.coords = self._project([e[1] for e in entries], [e[2] for e in entries])
+        self.tree = cKDTree(self.coords) if cKDTree is not None else None
+
+    def nearest(self, lat: float, lng: float) -> Optional[Tuple[str, float]]:
+        """(endereço, distância em metros) do endereço conhecido mais próximo"""
+        if not self.addresses:
+            return None
+        q = self._project([lat], [lng])[0]
+        if self.tree is not None:
+            dist_km, idx = self.tree.query(q)
+        else:
+            d2 = ((self.coords - q) ** 2).sum(axis=1)
+            idx = int(d2.argmin())
+            dist_km = math.sqrt(d2[idx])
+        return self.addresses[int(idx)], float(dist_km) * 1000
+
+
+class ReverseGeocoder:
+    """Reverse geocoding offline: bairro por polígono + endereço mais próximo do cache"""
+
+    def __init__(self, geojson_files: Optional[List[str]] = None, rebuild_interval_s: float = 60.0):
+        self._geojson_files = geojson_files
+        self._neighborhoods: Optional[NeighborhoodIndex] = None
+        self._addresses = AddressKDTree()
+        self._addresses_version = None
+        self._addresses_built_at = 0.0
+        self.rebuild_interval_s = rebuild_interval_s
+        self.max_address_distance_m = float(os.getenv("REVERSE_GEOCODE_MAX_DISTANCE_M", "150"))
+        self._lock = threading.Lock()
+
+    @property
+    def neighborhoods(self) -> NeighborhoodIndex:
+        if self._neighborhoods is None:
+            with self._lock:
+                if self._neighborhoods is None:
+                    self._neighborhoods = NeighborhoodIndex(self._geojson_files)
+        return self._neighborhoods
+
+    def neighborhood(self, lat: float, lng: float) -> Optional[str]:
+        """Nome do bairro que contém as coordenadas (None se fora dos polígonos)"""
+        if lat is None or lng is None:
+            return None
+        return self.neighborhoods.lookup(lat, lng)
+
+    def _refresh_addresses(self):
+        """Reconstrói a KD-tree quando o cache de geocoding mudou (no máximo 1x/intervalo)"""
+        from .geocoding_service import geocoding_service
+
+        cache = geocoding_service.cache
+        version = getattr(cache, 'version', len(cache.cache))
+        if version == self._addresses_version:
+            return
+        if self._addresses_version is not None and time.monotonic() - self._addresses_built_at < self.rebuild_interval_s:
+            return
+        with self._lock:
+            entries = [
+                (e.get('address', ''), e['lat'], e['lng'])
+                for e in list(cache.cache.values())
+                if e.get('lat') is not None and e.get('lng') is not None
+            ]
+            self._addresses.build(entries)
+            self._addresses_version = version
+            self._addresses_built_at = time.monotonic()
+
+    def nearest_address(self, lat: float, lng: float, max_distance_m: Optional[float] = None) -> Optional[Dict]:
+        """Endereço conhecido mais próximo dentro de max_distance_m"""
+        self._refresh_addresses()
+        found = self._addresses.nearest(lat, lng)
+        if not found:
+            return None
+        address, distance_m = found
+        limit = self.max_address_distance_m if max_distance_m is None else max_distance_m
+        if distance_m > limit:
+            return None
+        return {'address': address, 'distance_m': round(distance_m, 1)}
+
+    def reverse(self, lat: float, lng: float) -> Dict:
+        """Resultado completo: bairro + endereço conhecido mais próximo"""
+        nearest = self.nearest_address(lat, lng)
+        return {
+            'lat': lat,
+            'lng': lng,
+            'neighborhood': self.neighborhood(lat, lng),
+            'address': nearest['address'] if nearest else None,
+            'distance_m': nearest['distance_m'] if nearest else None
+        }
+
+
+# Singleton
+reverse_geocoder = ReverseGeocoder()
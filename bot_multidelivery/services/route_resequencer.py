@@ -0,0 +1,330 @@
+"""
+🔀 RESEQUENCIAMENTO AO VIVO - Reordena só as paradas restantes de UM entregador
+Quando o entregador pula paradas ou desvia, a ordem otimizada fica velha. Aqui,
+a partir da posição atual, recalcula a ordem das paradas ainda pendentes:
+- Matriz parada×parada da rota calculada uma vez (OSRM /table, fallback
+  Haversine) e guardada em memória; chamadas seguintes só recortam as restantes
+- Linha da posição atual por Haversine × fator de desvio da malha (estimado da
+  própria matriz), sem ida à rede
+- Caminho aberto (não volta à base): vizinho mais próximo + 2-opt vetorizado,
+  partindo também da ordem atual; só publica se ganhar RESEQUENCE_MIN_GAIN
+
+A nova ordem vira evento REORDERED (log + delta route_reordered no mapa); o app
+do entregador recebe na próxima leitura da rota.
+
+Gatilhos automáticos: baixa fora da sequência (pulou paradas) e fix de GPS longe
+da próxima parada com outra pendente bem mais perto (checado a cada
+RESEQUENCE_CHECK_S por entregador).
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .gps_tracker import gps_tracker, distance_m, GpsFix
+from .map_stream import point_status
+from .osrm_service import osrm_client
+
+logger = logging.getLogger(__name__)
+
+
+def pending_stops(route) -> List:
+    """Paradas com algum pacote ainda pendente, na ordem atual"""
+    return [
+        stop for stop in route.stops
+        if any(point_status(route, p) == "pending" for p in stop.packages)
+    ]
+
+
+def path_cost(dist: np.ndarray, path: List[int]) -> float:
+    """Custo do caminho aberto 0 → path[0] → ... (índices da matriz)"""
+    nodes = [0] + list(path)
+    return float(dist[nodes[:-1], nodes[1:]].sum())
+
+
+def nearest_neighbor(dist: np.ndarray) -> List[int]:
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    path, current = [], 0
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[current])
+        current = int(row.argmin())
+        visited[current] = True
+        path.append(current)
+    return path
+
+
+def two_opt(dist: np.ndarray, path: List[int], deadline: float) -> List[int]:
+    """
+    2-opt para caminho aberto com início fixo (nó 0). Um nó fantasma com custo
+    zero fecha o caminho, então inverter o trecho final também é avaliado.
+    Usa a matriz simetrizada (inverter trecho em matriz assimétrica muda o custo interno).
+    """
+    n = len(dist)
+    sym = np.zeros((n + 1, n + 1))
+    sym[:n, :n] = (dist + dist.T) / 2
+    tour = np.array([0] + list(path) + [n])
+    m = len(tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, m - 2):
+            a, b = tour[i - 1], tour[i]
+            c = tour[i + 1:m - 1]   # candidatos a fim do trecho invertido
+            d = tour[i + 2:m]       # seus sucessores
+            delta = sym[a, c] + sym[b, d] - sym[a, b] - sym[c, d]
+            j = int(delta.argmin())
+            if delta[j] < -1e-9:
+                tour[i:i + j + 2] = tour[i:i + j + 2][::-1].copy()
+                improved = True
+    return [int(x) for x in tour[1:-1]]
+
+
+class _RouteMatrix:
+    """Matriz parada×parada de uma rota (km) + fator de desvio da malha"""
+
+    __slots__ = ("index", "matrix", "circuity", "fallback")
+
+    def __init__(self, keys: List[Tuple], matrix: np.ndarray, circuity: float, fallback: bool):
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.matrix = matrix
+        self.circuity = circuity
+        self.fallback = fallback
+
+
+def _stop_key(stop) -> Tuple:
+    return (round(stop.lat, 5), round(stop.lng, 5))
+
+
+def _haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    dlat = np.radians(lats - lat)
+    dlng = np.radians(lngs - lng)
+    a = np.sin(dlat / 2) ** 2 + math.cos(math.radians(lat)) * np.cos(np.radians(lats)) * np.sin(dlng / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class RouteResequencer:
+    """Reordena as paradas restantes de uma rota a partir da posição do entregador"""
+
+    def __init__(self, max_routes: int = 200, min_gain: float = 0.03, min_gain_km: float = 0.1,
+                 time_budget_s: float = 0.3, check_interval_s: float = 60.0,
+                 detour_m: float = 1500.0, cooldown_s: float = 120.0):
+        self.max_routes = max_routes
+        self.min_gain = min_gain
+        self.min_gain_km = min_gain_km
+        self.time_budget_s = time_budget_s
+        self.check_interval_s = check_interval_s
+        self.detour_m = detour_m
+        self.cooldown_s = cooldown_s
+        self._matrices: "OrderedDict[Tuple[str, str], _RouteMatrix]" = OrderedDict()
+        self._running: set = set()
+        self._checked_at: Dict[Tuple[str, str], float] = {}
+        self._done_at: Dict[Tuple[str, str], float] = {}
+        self.runs = 0
+        self.applied = 0
+        self.matrix_builds = 0
+
+    # ==================== MATRIZ ====================
+
+    async def _matrix(self, session_id: str, route, stops: List) -> _RouteMatrix:
+        """Matriz da rota em cache; recalcula se apareceu parada nova (ex: transferência)"""
+        key = (session_id, route.id)
+        cached = self._matrices.get(key)
+        if cached is not None and all(_stop_key(s) in cached.index for s in stops):
+            self._matrices.move_to_end(key)
+            return cached
+
+        all_stops = route.stops
+        keys = list(dict.fromkeys(_stop_key(s) for s in all_stops))
+        points = [(lat, lng) for lat, lng in keys]
+        result = await osrm_client.get_distance_matrix_async(points)
+        matrix = np.array(result.distances_km, dtype=float)
+
+        circuity = 1.0
+        if not result.fallback_used and len(points) > 1:
+            lats = np.array([p[0] for p in points])
+            lngs = np.array([p[1] for p in points])
+            straight = np.vstack([_haversine_km(lat, lng, lats, lngs) for lat, lng in points])
+            mask = straight > 0.05
+            if mask.any():
+                circuity = float(np.clip(np.median(matrix[mask] / straight[mask]), 1.0, 2.0))
+
+        entry = _RouteMatrix(keys, matrix, circuity, result.fallback_used)
+        self._matrices[key] = entry
+        self._matrices.move_to_end(key)
+        while len(self._matrices) > self.max_routes:
+            self._matrices.popitem(last=False)
+        self.matrix_builds += 1
+        return entry
+
+    def forget(self, session_id: str, route_id: str):
+        self._matrices.pop((session_id, route_id), None)
+
+    # ==================== RESEQUENCIAMENTO ====================
+
+    async def resequence(self, session, route, lat: float, lng: float, reason: str = "manual") -> Optional[Dict]:
+        """
+        Reordena as paradas pendentes a partir de (lat, lng). Retorna o resumo
+        (applied=False se a ordem atual já é boa) ou None se não há o que reordenar.
+        """
+        from ..session import session_manager
+        key = (session.session_id, route.id)
+        if key in self._running:
+            return None
+        self._running.add(key)
+        try:
+            # Fixada durante o await do OSRM; agendado antes, o handler pode ter
+            # entregue uma cópia já expulsa do cache: trabalha sobre a viva
+            with session_manager.pinned(session.session_id):
+                live = session_manager.get_session(session.session_id)
+                if live is not None:
+                    session, route = live, live.get_route(route.id)
+                    if route is None:
+                        return None
+                return await self._resequence(session, route, lat, lng, reason)
+        finally:
+            self._running.discard(key)
+
+    async def _resequence(self, session, route, lat: float, lng: float, reason: str) -> Optional[Dict]:
+        # Baixas/transferências podem chegar durante o await do OSRM: as pendentes
+        # são relidas depois dele; se mudaram, tenta de novo uma vez (matriz já em
+        # cache) e, mudando outra vez, desiste em vez de reordenar lista velha
+        for _ in range(2):
+            remaining = pending_stops(route)
+            if len(remaining) < 2:
+                return None
+            entry = await self._matrix(session.session_id, route, remaining)
+            current_stops = pending_stops(route)
+            if [id(s) for s in current_stops] == [id(s) for s in remaining]:
+                break
+        else:
+            logger.info(f"🔀 Rota {route.id} mudou durante o resequenciamento ({reason}): abortado")
+            return None
+        started = time.perf_counter()
+        self.runs += 1
+
+        idx = [entry.index[_stop_key(s)] for s in remaining]
+        n = len(idx) + 1
+        dist = np.zeros((n, n))
+        dist[1:, 1:] = entry.matrix[np.ix_(idx, idx)]
+        lats = np.array([s.lat for s in remaining])
+        lngs = np.array([s.lng for s in remaining])
+        dist[0, 1:] = _haversine_km(lat, lng, lats, lngs) * entry.circuity
+        dist[1:, 0] = dist[0, 1:]
+
+        deadline = started + self.time_budget_s
+        current = list(range(1, n))
+        current_km = path_cost(dist, current)
+        best, best_km = current, current_km
+        for seed in (current, nearest_neighbor(dist)):
+            candidate = two_opt(dist, seed, deadline)
+            cost = path_cost(dist, candidate)
+            if cost < best_km - 1e-9:
+                best, best_km = candidate, cost
+
+        gain_km = current_km - best_km
+        applied = gain_km >= self.min_gain_km and gain_km >= current_km * self.min_gain
+        summary = {
+            "route_id": route.id,
+            "reason": reason,
+            "remaining_stops": len(remaining),
+            "before_km": round(current_km, 3),
+            "after_km": round(best_km, 3),
+            "applied": applied,
+            "fallback_used": entry.fallback,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        if applied:
+            self._apply(session, route, remaining, best, reason)
+            self.applied += 1
+            logger.info(f"🔀 Rota {route.id} resequenciada ({reason}): {current_km:.2f} → {best_km:.2f} km")
+        return summary
+
+    def _apply(self, session, route, remaining: List, order: List[int], reason: str):
+        """
+        Concluídas primeiro (ordem atual), depois as pendentes na ordem nova → evento
+        REORDERED. O replay usa order_keys (id + parada); order (ids) vai para o mapa.
+        """
+        from ..session import session_manager
+        pending_ids = {id(s) for s in remaining}
+        done = [p for s in route.stops if id(s) not in pending_ids for p in s.packages]
+        ahead = [p for i in order for p in remaining[i - 1].packages]
+        points = done + ahead
+        session_manager.record_event(
+            session, "reordered", route.id, [],
+            order=[p.package_id for p in points], order_keys=[route.point_key(p) for p in points],
+            reason=reason
+        )
+        self._done_at[(session.session_id, route.id)] = time.monotonic()
+
+    # ==================== GATILHOS ====================
+
+    def on_stop_completed(self, session, route, stop, lat: Optional[float], lng: Optional[float]):
+        """Baixa numa parada que não era a próxima: o entregador pulou paradas"""
+        if lat is None or lng is None:
+            fix = next(iter(gps_tracker.recent(session.session_id, route.id, 1)), None)
+            if fix is None:
+                return
+            lat, lng = fix.lat, fix.lng
+        self._schedule(session, route, lat, lng, "skip")
+
+    def on_fix(self, session_id: str, route_id: str, fix: GpsFix):
+        """Listener do gps_tracker: desvio (longe da próxima parada, outra pendente bem mais perto)"""
+        key = (session_id, route_id)
+        now = time.monotonic()
+        if now - self._checked_at.get(key, 0.0) < self.check_interval_s:
+            return
+        self._checked_at[key] = now
+        if now - self._done_at.get(key, -self.cooldown_s) < self.cooldown_s:
+            return
+        from ..session import session_manager
+        session = session_manager.get_session(session_id)
+        route = session.get_route(route_id) if session else None
+        if route is None:
+            return
+        remaining = pending_stops(route)
+        if len(remaining) < 2:
+            return
+        here = GpsFix(fix.t, fix.lat, fix.lng)
+        to_next = distance_m(here, GpsFix(0, remaining[0].lat, remaining[0].lng))
+        if to_next < self.detour_m:
+            return
+        closest = min(distance_m(here, GpsFix(0, s.lat, s.lng)) for s in remaining[1:])
+        if closest < to_next / 2:
+            self._schedule(session, route, fix.lat, fix.lng, "detour")
+
+    def _schedule(self, session, route, lat: float, lng: float, reason: str):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(self._run_logged(session, route, lat, lng, reason))
+
+    async def _run_logged(self, session, route, lat: float, lng: float, reason: str):
+        try:
+            await self.resequence(session, route, lat, lng, reason)
+        except Exception as e:
+            logger.error(f"❌ Erro ao resequenciar rota {route.id}: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "cached_routes": len(self._matrices),
+            "matrix_builds": self.matrix_builds,
+            "runs": self.runs,
+            "applied": self.applied
+        }
+
+
+# Instância global (ouve os fixes de GPS para detectar desvio)
+route_resequencer = RouteResequencer(
+    min_gain=float(os.getenv("RESEQUENCE_MIN_GAIN", "0.03")),
+    check_interval_s=float(os.getenv("RESEQUENCE_CHECK_S", "60")),
+    detour_m=float(os.getenv("RESEQUENCE_DETOUR_M", "1500"))
+)
+gps_tracker.add_listener(route_resequencer.on_fix)
@@ -0,0 +1,157 @@
+"""
+📡 FAN-OUT EM TEMPO REAL - Fila limitada + task de envio por conexão
+O publicador só enfileira (não espera nenhum socket): cada conexão tem sua
+fila de saída e sua task de envio. Cliente lento perde as mensagens mais
+antigas (ou tem a mesma chave coalescida); envio travado estoura o timeout e
+a conexão é derrubada e removida.
+"""
+import asyncio
+import itertools
+import logging
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """Uma conexão inscrita num canal (WebSocket ou qualquer send assíncrono)"""
+
+    _unkeyed = itertools.count()
+
+    def __init__(self, hub: 'FanoutHub', channel: str, send: Callable[[Dict], Awaitable],
+                 close: Optional[Callable[[], Awaitable]] = None):
+        self.hub = hub
+        self.channel = channel
+        self.send = send
+        self.close_fn = close
+        # chave -> mensagem, em ordem de chegada. Mesma chave: substitui no lugar (coalesce)
+        self._queue: 'OrderedDict[Hashable, Dict]' = OrderedDict()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def offer(self, message: Dict, key: Optional[Hashable] = None):
+        """Enfileira sem bloquear (O(1)). Fila cheia: descarta a mais antiga"""
+        if self.closed:
+            return
+        if key is None:
+            key = ('_', next(self._unkeyed))
+        if key in self._queue:
+            self._queue[key] = message
+            self.coalesced += 1
+        else:
+            if len(self._queue) >= self.hub.max_queue:
+                self._queue.popitem(last=False)
+                self.dropped += 1
+            self._queue[key] = message
+        self._ready.set()
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                _, message = self._queue.popitem(last=False)
+                await asyncio.wait_for(self.send(message), timeout=self.hub.send_timeout_s)
+                self.sent += 1
+        except asyncio.CancelledError:
+            return
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Envio travado no canal {self.channel}: conexão derrubada")
+            await self.close()
+        except Exception as e:
+            logger.debug(f"Conexão morta no canal {self.channel}: {e}")
+            await self.close()
+
+    async def close(self, evicted: bool = True):
+        """Remove do canal e fecha a conexão (idempotente)"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._ready.set()
+        self.hub._remove(self, evicted)
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if self.close_fn:
+            try:
+                await asyncio.wait_for(self.close_fn(), timeout=self.hub.send_timeout_s)
+            except Exception:
+                pass
+
+
+class FanoutHub:
+    """Canais (ex: session_id) -> conexões inscritas"""
+
+    def __init__(self, max_queue: int = 64, send_timeout_s: float = 5.0):
+        self.max_queue = max_queue
+        self.send_timeout_s = send_timeout_s
+        self._channels: Dict[str, Set[Subscriber]] = {}
+        self.evicted = 0
+
+    def subscribe(self, channel: str, send: Callable[[Dict], Awaitable],
+                  close: Optional[Callable[[], Awaitable]] = None) -> Subscriber:
+        subscriber = Subscriber(self, channel, send, close)
+        self._channels.setdefault(channel, set()).add(subscriber)
+        subscriber.start()
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        """Saída normal (cliente desconectou): não tenta fechar o socket de novo"""
+        subscriber.close_fn = None
+        await subscriber.close(evicted=False)
+
+    def publish(self, channel: str, message: Dict, key: Optional[Hashable] = None) -> int:
+        """Entrega para as filas das conexões do canal sem esperar envio. Retorna nº de conexões"""
+        subscribers = self._channels.get(channel)
+        if not subscribers:
+            return 0
+        for subscriber in tuple(subscribers):
+            subscriber.offer(message, key)
+        return len(subscribers)
+
+    def has_subscribers(self, channel: str) -> bool:
+        return bool(self._channels.get(channel))
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._channels.get(channel, ()))
+
+    def stats(self) -> Dict:
+        subscribers = [s for subs in self._channels.values() for s in subs]
+        return {
+            'channels': len(self._channels),
+            'connections': len(subscribers),
+            'queued': sum(len(s._queue) for s in subscribers),
+            'dropped': sum(s.dropped for s in subscribers),
+            'coalesced': sum(s.coalesced for s in subscribers),
+            'evicted': self.evicted,
+            'max_queue': self.max_queue,
+            'send_timeout_s': self.send_timeout_s
+        }
+
+    def _remove(self, subscriber: Subscriber, evicted: bool):
+        subscribers = self._channels.get(subscriber.channel)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if evicted:
+            self.evicted += 1
+        if not subscribers:
+            del self._channels[subscriber.channel]
+
+
+# Instância global (mapa em tempo real: canal = session_id)
+map_fanout = FanoutHub(
+    max_queue=int(os.getenv("MAP_WS_QUEUE_SIZE", "64")),
+    send_timeout_s=float(os.getenv("MAP_WS_SEND_TIMEOUT_S", "5"))
+)
@@ -2,12 +2,20 @@
 📦 GERENCIADOR DE ESTADO - Sessões de Admin e Entregadores
 Controla fluxo de importação de romaneios, divisão de rotas e tracking
 """
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 from enum import Enum
+import os
+import threading
+import time
 import uuid
-from .clustering import DeliveryPoint, Cluster
+from .clustering import DeliveryPoint, DeliveryStop, Cluster
+from .session_cache import SessionCache, SessionHeader
+
+# Tópico do broker entre workers: eventos aplicados e snapshots gravados (origem = epoch)
+SESSIONS_TOPIC = "sessions"
 
 class RouteStatus(str, Enum):
     PENDING = "pending"
@@ -44,6 +52,131 @@ class Route:
     delivered_packages: List[str] = field(default_factory=list)  # package_ids
     map_file: Optional[str] = None  # Caminho do mapa HTML gerado
     
+    def __post_init__(self):
+        self._delivered = None
+        self._indexed = (None, -1)  # Construído no primeiro acesso
+    
+    # ==================== ÍNDICES O(1) ====================
+    # package_id -> posições, package_id -> paradas e stop_number -> parada, derivados
+    # de optimized_order. package_id NÃO é único (o import numera por romaneio:
+    # "<sessão>_pkg_<n>" se repete entre romaneios), por isso cada id aponta para
+    # todas as ocorrências. Lista nova (reordenação, transferência) ou append/extend/pop
+    # são detectados pela identidade/tamanho da lista; quem reordenar in-place chama reindex().
+    
+    @staticmethod
+    def stop_key(point: DeliveryPoint) -> Tuple:
+        """Chave de agrupamento em paradas (mesma coordenada arredondada + endereço)"""
+        return (round(point.lat, 4), round(point.lng, 4), (point.address or "").strip().lower())
+    
+    @staticmethod
+    def point_key(point: DeliveryPoint) -> str:
+        """Chave estável do ponto nos eventos: package_id + parada (o id sozinho se repete)"""
+        lat, lng = getattr(point, 'lat', None), getattr(point, 'lng', None)
+        where = f"{lat:.4f},{lng:.4f}" if lat is not None and lng is not None else "-"
+        return f"{point.package_id}@{where}@{(point.address or '').strip().lower()}"
+    
+    def reindex(self):
+        """Reconstrói os índices a partir de optimized_order (O(n), só quando a lista muda)"""
+        positions: Dict[str, List[int]] = {}
+        stops: List[DeliveryStop] = []
+        stop_of: Dict[str, List[DeliveryStop]] = {}
+        stop_by_key: Dict[Tuple, DeliveryStop] = {}
+        order = self.optimized_order
+        for idx, point in enumerate(order):
+            package_id = getattr(point, 'package_id', None)
+            if package_id is not None:
+                positions.setdefault(package_id, []).append(idx)
+            if getattr(point, 'lat', None) is None or getattr(point, 'lng', None) is None:
+                continue
+            key = self.stop_key(point)
+            stop = stop_by_key.get(key)
+            if stop is None:
+                stop = DeliveryStop(stop_number=len(stops) + 1, address=point.address, lat=point.lat, lng=point.lng)
+                stop_by_key[key] = stop
+                stops.append(stop)
+            stop.packages.append(point)
+            if package_id is not None:
+                stops_with_id = stop_of.setdefault(package_id, [])
+                if not any(s is stop for s in stops_with_id):
+                    stops_with_id.append(stop)
+        
+        self._positions = positions
+        self._stops = stops
+        self._stop_of = stop_of
+        self._indexed = (order, len(order))
+    
+    def _ensure_index(self):
+        order, size = self._indexed
+        if order is not self.optimized_order or size != len(order):
+            self.reindex()
+    
+    def point_indexes(self, package_id: str) -> List[int]:
+        """Posições de todos os pontos com esse package_id em optimized_order (O(k))"""
+        self._ensure_index()
+        indexes = self._positions.get(package_id, [])
+        order = self.optimized_order
+        if any(order[idx].package_id != package_id for idx in indexes):
+            # Lista alterada in-place sem reindex(): corrige e tenta de novo
+            self.reindex()
+            indexes = self._positions.get(package_id, [])
+        return indexes
+    
+    def point_index(self, package_id: str) -> Optional[int]:
+        """Posição da primeira ocorrência do pacote em optimized_order"""
+        indexes = self.point_indexes(package_id)
+        return indexes[0] if indexes else None
+    
+    def get_point(self, package_id: str) -> Optional[DeliveryPoint]:
+        idx = self.point_index(package_id)
+        return self.optimized_order[idx] if idx is not None else None
+    
+    def points_of(self, package_id: str, keys: Optional[set] = None) -> List[DeliveryPoint]:
+        """Pontos com esse package_id; com `keys` (point_key), só os dessas paradas"""
+        points = [self.optimized_order[idx] for idx in self.point_indexes(package_id)]
+        if keys is not None:
+            points = [p for p in points if self.point_key(p) in keys]
+        return points
+    
+    @property
+    def stops(self) -> List[DeliveryStop]:
+        """Paradas da rota na ordem de visita (stop_number começa em 1)"""
+        self._ensure_index()
+        return self._stops
+    
+    def get_stop(self, stop_number: int) -> Optional[DeliveryStop]:
+        stops = self.stops
+        return stops[stop_number - 1] if 1 <= stop_number <= len(stops) else None
+    
+    def stops_of(self, package_id: str) -> List[DeliveryStop]:
+        """Paradas que contêm o pacote, na ordem de visita (O(1))"""
+        self._ensure_index()
+        return self._stop_of.get(package_id, [])
+    
+    def stop_of(self, package_id: str) -> Optional[DeliveryStop]:
+        """Primeira parada que contém o pacote"""
+        stops = self.stops_of(package_id)
+        return stops[0] if stops else None
+    
+    def is_delivered(self, package_id: str) -> bool:
+        """package_id está em delivered_packages (O(1), espelho em set)"""
+        mirror = self._delivered
+        if mirror is None or mirror[0] is not self.delivered_packages or mirror[1] != len(self.delivered_packages):
+            mirror = (self.delivered_packages, len(self.delivered_packages), set(self.delivered_packages))
+            self._delivered = mirror
+        return package_id in mirror[2]
+    
+    def _set_delivered(self, package_id: str, delivered: bool):
+        if self.is_delivered(package_id) == delivered:
+            return
+        ids = self._delivered[2]
+        if delivered:
+            self.delivered_packages.append(package_id)
+            ids.add(package_id)
+        else:
+            self.delivered_packages.remove(package_id)
+            ids.discard(package_id)
+        self._delivered = (self.delivered_packages, len(self.delivered_packages), ids)
+    
     @property
     def total_packages(self) -> int:
         return len(self.optimized_order)
@@ -83,43 +216,39 @@ class Route:
             distance += haversine_distance(prev.lat, prev.lng, curr.lat, curr.lng)
         return round(distance, 2)
     
-    def mark_as_delivered(self, package_id: str, detail: Optional[str] = None):
+    # keys (point_key): limita a baixa aos pontos dessas paradas; sem keys vale
+    # para todos os pontos com o package_id (ids se repetem entre romaneios)
+    
+    def mark_as_delivered(self, package_id: str, detail: Optional[str] = None, keys: Optional[set] = None):
         """Marca pacote como entregue com sucesso"""
-        if package_id not in self.delivered_packages:
-            self.delivered_packages.append(package_id)
+        self._set_delivered(package_id, True)
         
-        for point in self.optimized_order:
-            if (hasattr(point, 'package_id') and point.package_id == package_id) or \
-               (hasattr(point, 'id') and point.id == package_id):
-                point.status = 'delivered'
-                point.status_detail = detail
-                point.failure_reason = None
-    
-    def mark_as_failed(self, package_id: str, reason: Optional[str] = None, detail: Optional[str] = None):
+        for point in self.points_of(package_id, keys):
+            point.status = 'delivered'
+            point.status_detail = detail
+            point.failure_reason = None
+    
+    def mark_as_failed(self, package_id: str, reason: Optional[str] = None, detail: Optional[str] = None,
+                       keys: Optional[set] = None):
         """Marca pacote como insucesso (não entregue)"""
         # Remove de delivered se estava lá
-        if package_id in self.delivered_packages:
-            self.delivered_packages.remove(package_id)
+        self._set_delivered(package_id, False)
         
-        # Atualiza status do ponto
-        for point in self.optimized_order:
-            if (hasattr(point, 'package_id') and point.package_id == package_id) or \
-               (hasattr(point, 'id') and point.id == package_id):
-                point.status = 'failed'
-                point.failure_reason = reason
-                point.status_detail = detail
-    
-    def mark_as_returned(self, package_id: str, reason: Optional[str] = None, detail: Optional[str] = None):
+        # Atualiza status dos pontos
+        for point in self.points_of(package_id, keys):
+            point.status = 'failed'
+            point.failure_reason = reason
+            point.status_detail = detail
+    
+    def mark_as_returned(self, package_id: str, reason: Optional[str] = None, detail: Optional[str] = None,
+                         keys: Optional[set] = None):
         """Marca pacote como devolvido"""
-        if package_id in self.delivered_packages:
-            self.delivered_packages.remove(package_id)
+        self._set_delivered(package_id, False)
         
-        for point in self.optimized_order:
-            if (hasattr(point, 'package_id') and point.package_id == package_id) or \
-               (hasattr(point, 'id') and point.id == package_id):
-                point.status = 'returned'
-                point.failure_reason = reason
-                point.status_detail = detail
+        for point in self.points_of(package_id, keys):
+            point.status = 'returned'
+            point.failure_reason = reason
+            point.status_detail = detail
 
 
 @dataclass
@@ -140,6 +269,7 @@ class DailySession:
     current_step: str = 'idle'  # idle, importing, imported, optimizing, optimized, assigning, assigned, separating, completed
     route_value: float = 0.0  # Valor total da rota
     num_deliverers: int = 0  # Número de entregadores pra otimização
+    event_seq: int = 0  # Último evento do log já aplicado (snapshot + eventos = estado)
     
     @property
     def total_packages(self) -> int:
@@ -152,42 +282,96 @@ class DailySession:
     @property
     def total_pending(self) -> int:
         return sum(r.pending_count for r in self.routes)
+    
+    def __post_init__(self):
+        self._index = None
+    
+    # ==================== ÍNDICES O(1) ====================
+    # route_id -> rota e package_id -> rota. Validados a cada acesso em O(nº de rotas)
+    # (identidade/tamanho das listas), nunca em O(nº de pacotes).
+    
+    def _indexes(self) -> Tuple[Dict[str, Route], Dict[str, Route]]:
+        index = self._index
+        routes = self.routes
+        if index is None or index[0] is not routes or len(index[1]) != len(routes) or any(
+            route is not r or route.optimized_order is not order or len(order) != size
+            for route, (r, order, size) in zip(routes, index[1])
+        ):
+            by_id = {r.id: r for r in routes}
+            by_package: Dict[str, Route] = {}
+            for route in routes:
+                for point in route.optimized_order:
+                    by_package.setdefault(point.package_id, route)
+            refs = [(r, r.optimized_order, len(r.optimized_order)) for r in routes]
+            index = self._index = (routes, refs, by_id, by_package)
+        return index[2], index[3]
+    
+    def get_route(self, route_id: str) -> Optional[Route]:
+        return self._indexes()[0].get(route_id)
+    
+    def find_package(self, package_id: str) -> Optional[Tuple[Route, DeliveryPoint]]:
+        """Rota e ponto do pacote (O(1) no tamanho das rotas)"""
+        route = self._indexes()[1].get(package_id)
+        point = route.get_point(package_id) if route else None
+        return (route, point) if point is not None else None
 
 
 class SessionManager:
     """Gerencia múltiplas sessões com auto-save"""
     
     def __init__(self):
-        self.active_sessions: Dict[str, DailySession] = {}  # session_id -> DailySession
         self.current_session_id: Optional[str] = None  # Sessão em foco
+        # Todas as sessões ficam só como cabeçalho; as completas vivem num LRU limitado
+        self.headers: Dict[str, SessionHeader] = {}  # session_id -> SessionHeader
+        self.active_sessions = SessionCache(
+            max_size=int(os.getenv("SESSION_CACHE_SIZE", "20")),
+            ttl_s=int(os.getenv("SESSION_CACHE_TTL_S", "1800")),
+            finalized_ttl_s=int(os.getenv("SESSION_CACHE_FINALIZED_TTL_S", "60")),
+            on_evict=self._on_evict,
+            is_pinned=lambda session_id: session_id == self.current_session_id or session_id in self._pins
+        )
+        # Sessões em uso por trabalhos em background (ex: job de geocoding): não saem do
+        # cache, senão o trabalho seguiria alterando uma cópia órfã
+        self._pins: Dict[str, int] = {}
+        self._pins_lock = threading.Lock()
+        self._hydrate_lock = threading.Lock()
         self.admin_state: Dict[int, str] = {}  # telegram_id -> estado do fluxo
         self.temp_data: Dict[int, Dict] = {}   # Dados temporários do admin
-        self._load_all_sessions()
+        # Eventos gravados desde o último snapshot, por sessão
+        self._events_since_snapshot: Dict[str, int] = {}
+        self.snapshot_every = int(os.getenv("SESSION_SNAPSHOT_EVERY", "50"))
+        # Chamados após cada evento aplicado (ex: deltas do mapa em tempo real)
+        self._event_listeners: List = []
+        # Versão por sessão (sobe a cada mutação) → ETag/Last-Modified dos GETs.
+        # O epoch muda a cada processo: versão de outro processo não é comparável
+        self.epoch = uuid.uuid4().hex[:8]
+        self._started_at = time.time()
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        self._global_version: Tuple[int, float] = (0, self._started_at)
+        self._version_lock = threading.Lock()
+        # Broker remoto (vários workers): mudanças publicadas em SESSIONS_TOPIC (enable_sync)
+        self._sync = None
+        # Saves coalescidos em background (SESSION_FLUSH_WINDOW_MS=0 → síncrono)
+        from .session_flusher import WriteBehindFlusher
+        self._flusher = WriteBehindFlusher(
+            self._persist, window_s=int(os.getenv("SESSION_FLUSH_WINDOW_MS", "250")) / 1000
+        )
+        self._load_headers()
     
-    def _load_all_sessions(self):
-        """Carrega todas as sessões do disco na inicialização"""
+    def _load_headers(self):
+        """Carrega só os cabeçalhos na inicialização (sessão completa no 1º acesso)"""
         try:
             from .session_persistence import session_store
-            sessions = session_store.list_sessions(limit=100)
+            for header in session_store.list_headers():
+                self.headers[header.session_id] = header
             
-            latest_active_session = None
-            for s_info in sessions:
-                try:
-                    session = session_store.load_session(s_info['session_id'])
-                    if session:
-                        self.active_sessions[session.session_id] = session
-                        if not session.is_finalized:
-                            if not latest_active_session or session.created_at > latest_active_session.created_at:
-                                latest_active_session = session
-                except Exception as load_err:
-                    print(f"⚠️ Erro ao carregar sessão {s_info.get('session_id', '?')}: {load_err}")
-                    continue
+            open_sessions = [h for h in self.headers.values() if not h.is_finalized]
+            if open_sessions:
+                latest = max(open_sessions, key=lambda h: h.created_at or datetime.min)
+                self.current_session_id = latest.session_id
+                print(f"📌 Sessão ativa restaurada: {latest.session_name} ({latest.session_id})")
             
-            if latest_active_session:
-                self.current_session_id = latest_active_session.session_id
-                print(f"📌 Sessão ativa restaurada: {latest_active_session.session_name} ({latest_active_session.session_id})")
-                    
-            print(f"✅ {len(self.active_sessions)} sessões carregadas do disco")
+            print(f"✅ {len(self.headers)} sessões indexadas ({len(open_sessions)} em aberto)")
         except ImportError as e:
             print(f"⚠️ session_persistence não disponível: {e}")
         except Exception as e:
@@ -195,13 +379,226 @@ class SessionManager:
             import traceback
             traceback.print_exc()
     
-    def _auto_save(self, session: DailySession):
-        """Auto-save da sessão"""
+    def _hydrate(self, session_id: str) -> Optional[DailySession]:
+        """Carrega a sessão completa para o cache (uma vez, mesmo com acessos concorrentes)"""
+        with self._hydrate_lock:
+            session = self.active_sessions.get(session_id)
+            if session is not None:
+                return session
+            try:
+                from .session_persistence import session_store
+                session = session_store.load_session(session_id)
+            except Exception as e:
+                print(f"⚠️ Erro ao carregar sessão {session_id}: {e}")
+                return None
+            if session is not None:
+                self.active_sessions.put(session)
+            return session
+    
+    def _on_evict(self, session: DailySession):
+        """Sessão saiu do cache: grava pendências e libera o change tracking"""
+        from .session_persistence import session_store
+        session_id = session.session_id
+        self._flusher.flush(session_id)
+        if self._events_since_snapshot.get(session_id):
+            # Snapshot agora: o próximo load não precisa reaplicar eventos
+            self._persist(session)
+        self._events_since_snapshot.pop(session_id, None)
+        self.headers[session_id] = SessionHeader.from_session(session)
+        session_store.release(session_id)
+    
+    def _auto_save(self, session: DailySession, immediate: bool = False):
+        """Auto-save da sessão: marca como suja (write-behind) ou grava já"""
+        self.touch(session.session_id)
+        if session.session_id not in self.headers:
+            self.headers[session.session_id] = SessionHeader.from_session(session)
+        if immediate:
+            self._flusher.discard(session.session_id)
+            self._persist(session)
+        else:
+            self._flusher.mark_dirty(session)
+    
+    def _persist(self, session: DailySession):
+        """Grava o snapshot da sessão (chamado pelo write-behind)"""
         try:
             from .session_persistence import session_store
             session_store.save_session(session)
+            self._events_since_snapshot[session.session_id] = 0
         except Exception as e:
             print(f"⚠️ Erro ao salvar sessão: {e}")
+            return
+        self._publish_sync(session.session_id, header=SessionHeader.from_session(session).to_dict())
+    
+    def pin(self, session_id: str):
+        """Mantém a sessão no cache até o unpin correspondente (contador)"""
+        with self._pins_lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+    
+    def unpin(self, session_id: str):
+        with self._pins_lock:
+            count = self._pins.get(session_id, 0) - 1
+            if count > 0:
+                self._pins[session_id] = count
+            else:
+                self._pins.pop(session_id, None)
+        self.active_sessions.sweep()
+    
+    @contextmanager
+    def pinned(self, session_id: str):
+        """pin/unpin em volta de um trecho que altera a sessão entre awaits"""
+        self.pin(session_id)
+        try:
+            yield
+        finally:
+            self.unpin(session_id)
+    
+    def touch(self, session_id: str):
+        """Mutação na sessão (fora do save/evento, ex: geocoding em background): nova versão"""
+        now = time.time()
+        with self._version_lock:
+            version = self._versions.get(session_id, (0, 0.0))[0]
+            self._versions[session_id] = (version + 1, now)
+            self._global_version = (self._global_version[0] + 1, now)
+
+    def version(self, session_id: Optional[str] = None) -> Tuple[int, float]:
+        """
+        (versão, epoch_s da última mutação) da sessão, ou de todas sem session_id.
+        Sem mutação neste processo: versão 0 e o horário de início do processo.
+        """
+        if session_id is None:
+            return self._global_version
+        return self._versions.get(session_id, (0, self._started_at))
+
+    def flush_pending(self, session_id: Optional[str] = None):
+        """Grava agora os saves pendentes (desligamento, transições críticas)"""
+        self._flusher.flush(session_id)
+    
+    # ==================== VÁRIOS WORKERS ====================
+
+    def enable_sync(self, broker):
+        """
+        Com broker remoto cada worker tem seu cache de sessões: eventos aplicados
+        aqui são repetidos na cópia dos outros workers, e um snapshot gravado aqui
+        faz os outros descartarem a cópia e recarregarem do armazenamento
+        compartilhado. Versões (ETag) sobem em todos. Chamar após broker.start().
+        """
+        if not broker.remote:
+            return
+        from .session_persistence import session_store
+        if not session_store.using_database:
+            print(f"⚠️ Broker {broker.name} com sessões em arquivo local: "
+                  "workers só enxergam as mudanças uns dos outros se compartilharem o disco")
+        self._sync = broker
+        broker.subscribe(SESSIONS_TOPIC, self._on_sync_message)
+
+    def _publish_sync(self, session_id: str, **change):
+        if self._sync is None:
+            return
+        try:
+            self._sync.publish(SESSIONS_TOPIC, {"origin": self.epoch, "session_id": session_id, **change})
+        except Exception as e:
+            print(f"⚠️ Erro ao publicar mudança da sessão {session_id}: {e}")
+
+    def _on_sync_message(self, message: Dict):
+        """Mudança feita por outro worker (já gravada no armazenamento compartilhado)"""
+        session_id = message.get("session_id")
+        if not session_id or message.get("origin") == self.epoch:
+            return
+        if message.get("deleted"):
+            self._flusher.discard(session_id)
+            self.headers.pop(session_id, None)
+            self._events_since_snapshot.pop(session_id, None)
+            self.active_sessions.pop(session_id)
+            if self.current_session_id == session_id:
+                self.current_session_id = None
+            self.touch(session_id)
+            return
+
+        if message.get("header"):
+            self.headers[session_id] = SessionHeader.from_dict(message["header"])
+        if session_id in self.active_sessions:
+            if message.get("event"):
+                from .session_events import SessionEvent, apply_event
+                event = SessionEvent.from_dict(message["event"])
+                session = self.active_sessions.get(session_id)
+                # Listeners não rodam aqui: o worker de origem já publicou os deltas
+                if event.seq > session.event_seq:
+                    apply_event(session, event)
+                    session.event_seq = event.seq
+            else:
+                self._reload(session_id)
+        self.touch(session_id)
+
+    def _reload(self, session_id: str):
+        """Descarta a cópia local: o próximo acesso carrega o snapshot do outro worker"""
+        from .session_persistence import session_store
+        if session_id in self._pins:
+            # Trabalho em background segura a cópia: ela é gravada no unpin/evicção
+            print(f"⚠️ Sessão {session_id} mudou em outro worker durante trabalho em background")
+            return
+        self._flusher.flush(session_id)  # pendências locais primeiro (save incremental)
+        self.active_sessions.pop(session_id)
+        self._events_since_snapshot.pop(session_id, None)
+        session_store.release(session_id)
+
+    def add_event_listener(self, listener):
+        """listener(session, event) após cada record_event (não pode bloquear)"""
+        if listener not in self._event_listeners:
+            self._event_listeners.append(listener)
+    
+    def record_event(self, session: DailySession, event_type, route_id: str, package_ids: List[str],
+                     actor_telegram_id: Optional[int] = None, **data):
+        """
+        Aplica uma ação de entrega na sessão e grava só o evento (append O(1)).
+        A cada SESSION_SNAPSHOT_EVERY eventos a sessão inteira vira snapshot.
+        """
+        from .session_events import SessionEvent, EventType, apply_event
+        from .session_persistence import session_store
+        
+        # O handler pode segurar uma cópia órfã (sessão expulsa e recarregada enquanto
+        # ele aguardava OSRM etc.): o evento vai para a cópia viva, nunca o contrário
+        live = self.get_session(session.session_id)
+        if live is None:
+            print(f"⚠️ Evento {event_type} ignorado: sessão {session.session_id} não existe mais")
+            return None
+        session = live
+        
+        event = SessionEvent(
+            session_id=session.session_id,
+            type=EventType(event_type),
+            route_id=route_id,
+            package_ids=tuple(package_ids),
+            data={k: v for k, v in data.items() if v is not None},
+            actor_telegram_id=actor_telegram_id
+        )
+        apply_event(session, event)
+        self.touch(session.session_id)
+        for listener in self._event_listeners:
+            try:
+                listener(session, event)
+            except Exception as e:
+                print(f"⚠️ Erro no listener de eventos: {e}")
+        
+        try:
+            event = session_store.append_event(event, session)
+            session.event_seq = event.seq
+        except Exception as e:
+            # Sem log não há como reconstruir depois: grava o snapshot agora
+            print(f"⚠️ Erro ao gravar evento ({e}), salvando snapshot completo")
+            self._auto_save(session, immediate=True)
+            return event
+        
+        self._publish_sync(session.session_id, event=event.to_dict())
+        pending = self._events_since_snapshot.get(session.session_id, 0) + 1
+        self._events_since_snapshot[session.session_id] = pending
+        if pending >= self.snapshot_every:
+            self._auto_save(session)
+        return event
+    
+    def get_timeline(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Linha do tempo de eventos da sessão (auditoria)"""
+        from .session_persistence import session_store
+        return [e.to_dict() for e in session_store.get_timeline(session_id, limit)]
     
     def create_new_session(self, date: str, period: str = 'manhã') -> DailySession:
         """Cria nova sessão com nome automático"""
@@ -224,8 +621,21 @@ class SessionManager:
         return session
     
     def get_session(self, session_id: str) -> Optional[DailySession]:
-        """Retorna sessão específica por ID"""
-        return self.active_sessions.get(session_id)
+        """Retorna sessão específica por ID (carrega do disco/banco no 1º acesso)"""
+        if not session_id:
+            return None
+        session = self.active_sessions.get(session_id)
+        if session is None and session_id in self.headers:
+            session = self._hydrate(session_id)
+        self.active_sessions.sweep()
+        return session
+    
+    def list_headers(self) -> List[SessionHeader]:
+        """Cabeçalhos de todas as sessões, mais recentes primeiro (as carregadas refletem a memória)"""
+        headers = dict(self.headers)
+        for session_id, session in self.active_sessions.items():
+            headers[session_id] = SessionHeader.from_session(session)
+        return sorted(headers.values(), key=lambda h: h.created_at or datetime.min, reverse=True)
 
     def save_session(self, session: DailySession, set_as_current: bool = True):
         """Salva explicitamente a sessão"""
@@ -238,25 +648,24 @@ class SessionManager:
     def get_current_session(self) -> Optional[DailySession]:
         """Retorna sessão atual em foco"""
         if self.current_session_id:
-            return self.active_sessions.get(self.current_session_id)
+            return self.get_session(self.current_session_id)
         return None
 
     def get_active_session(self) -> Optional[DailySession]:
         """Retorna a sessão ativa em foco (com fallback para última não finalizada)"""
         if self.current_session_id:
-            sess = self.active_sessions.get(self.current_session_id)
+            sess = self.get_session(self.current_session_id)
             if sess:
                 return sess
 
-        candidates = [s for s in self.active_sessions.values() if not s.is_finalized]
+        candidates = [h for h in self.list_headers() if not h.is_finalized]
         if not candidates:
             return None
-        candidates.sort(key=lambda x: x.created_at, reverse=True)
-        return candidates[0]
+        return self.get_session(candidates[0].session_id)
     
     def set_current_session(self, session_id: str):
         """Define qual sessão está em foco"""
-        if session_id in self.active_sessions:
+        if session_id in self.headers or session_id in self.active_sessions:
             self.current_session_id = session_id
     
     def delete_session(self, session_id: str, force: bool = False) -> bool:
@@ -264,24 +673,26 @@ class SessionManager:
         try:
             from .session_persistence import session_store
 
-            session = self.active_sessions.get(session_id)
-            if not session:
-                return session_store.delete_session(session_id)
-
-            if session_id in self.active_sessions:
-                del self.active_sessions[session_id]
+            self._flusher.discard(session_id)
+            self.headers.pop(session_id, None)
+            self._events_since_snapshot.pop(session_id, None)
+            self.active_sessions.pop(session_id)
+            self.touch(session_id)  # histórico muda (versão global)
+            self._versions.pop(session_id, None)
 
             if self.current_session_id == session_id:
                 self.current_session_id = None
 
-            return session_store.delete_session(session_id)
+            deleted = session_store.delete_session(session_id)
+            self._publish_sync(session_id, deleted=True)
+            return deleted
         except Exception as e:
             print(f"⚠️ Erro ao excluir sessão {session_id}: {e}")
             raise
 
     def release_session_from_analysis(self, session_id: str) -> bool:
         """Libera a aba 'Análise' sem deletar a sessão"""
-        session = self.active_sessions.get(session_id)
+        session = self.get_session(session_id)
         if not session:
             return False
 
@@ -294,41 +705,48 @@ class SessionManager:
         return True
 
     def list_sessions(self, finalized_only: bool = False) -> List[DailySession]:
-        """Lista todas as sessões carregadas"""
-        sessions = list(self.active_sessions.values())
+        """Lista todas as sessões, mais recentes primeiro (filtra pelos cabeçalhos, carrega cada uma)"""
+        headers = self.list_headers()
         if finalized_only:
-            sessions = [s for s in sessions if s.is_finalized]
-        sessions.sort(key=lambda x: x.created_at, reverse=True)
-        return sessions
+            headers = [h for h in headers if h.is_finalized]
+        sessions = [self.get_session(h.session_id) for h in headers]
+        return [s for s in sessions if s]
 
     def get_all_sessions(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[DailySession]:
-        """Retorna todas as sessões, opcionalmente filtradas por data"""
+        """Retorna todas as sessões, opcionalmente filtradas por data (filtra pelos cabeçalhos)"""
         from datetime import datetime as dt
-        sessions = list(self.active_sessions.values())
+        headers = self.list_headers()
         
         if start_date or end_date:
             try:
                 start_dt = dt.strptime(start_date, '%Y-%m-%d') if start_date else dt.min
                 end_dt = dt.strptime(end_date, '%Y-%m-%d') if end_date else dt.max
-                sessions = [
-                    s for s in sessions
-                    if start_dt <= dt.strptime(s.date, '%Y-%m-%d') <= end_dt
+                headers = [
+                    h for h in headers
+                    if start_dt <= dt.strptime(h.date, '%Y-%m-%d') <= end_dt
                 ]
             except ValueError as e:
                 print(f"⚠️ Erro ao parsear datas: {e}")
                 return []
         
-        sessions.sort(key=lambda x: x.created_at, reverse=True)
-        return sessions
+        sessions = [self.get_session(h.session_id) for h in headers]
+        return [s for s in sessions if s]
     
     @property
     def sessions(self) -> List[DailySession]:
-        """Alias para compatibilidade"""
-        return list(self.active_sessions.values())
+        """
+        Só as sessões carregadas no LRU (não todas). Para percorrer todas:
+        list_headers() + get_session(), ou list_sessions()
+        """
+        return self.active_sessions.values()
     
     @sessions.setter
     def sessions(self, value: List[DailySession]):
-        self.active_sessions = {s.session_id: s for s in value}
+        self.active_sessions.clear()
+        for s in value:
+            self.headers[s.session_id] = SessionHeader.from_session(s)
+            self.active_sessions.put(s)
+            self.touch(s.session_id)
     
     def add_romaneio(self, romaneio: Romaneio, session_id: Optional[str] = None):
         """Adiciona romaneio à sessão"""
@@ -359,7 +777,7 @@ class SessionManager:
         if session:
             session.is_finalized = True
             session.finalized_at = datetime.now()
-            self._auto_save(session)
+            self._auto_save(session, immediate=True)
     
     def assign_route(self, route_id: str, deliverer_id: int, session_id: Optional[str] = None) -> bool:
         """Atribui rota a entregador"""
@@ -367,19 +785,20 @@ class SessionManager:
         if not session:
             return False
         
-        for route in session.routes:
-            if route.id == route_id:
-                route.assigned_to_telegram_id = deliverer_id
-                try:
-                    from .services.deliverer_service import DelivererService
-                    deliverer = DelivererService.get_deliverer(deliverer_id)
-                    if deliverer:
-                        route.assigned_to_name = deliverer.name
-                except Exception:
-                    pass
-                self._auto_save(session)
-                return True
-        return False
+        route = session.get_route(route_id)
+        if route is None:
+            return False
+        
+        route.assigned_to_telegram_id = deliverer_id
+        try:
+            from .services.deliverer_service import DelivererService
+            deliverer = DelivererService.get_deliverer(deliverer_id)
+            if deliverer:
+                route.assigned_to_name = deliverer.name
+        except Exception:
+            pass
+        self._auto_save(session)
+        return True
     
     def get_route_for_deliverer(self, telegram_id: int, session_id: Optional[str] = None) -> Optional[Route]:
         """Retorna rota atribuída a um entregador"""
@@ -392,14 +811,16 @@ class SessionManager:
         """Marca pacote como entregue"""
         route = self.get_route_for_deliverer(telegram_id, session_id)
         if route:
-            route.mark_as_delivered(package_id)
             session = self.get_session(session_id) if session_id else self.get_current_session()
-            if session:
-                all_finalized = all(r.delivered_count >= r.total_packages for r in session.routes)
-                if all_finalized and not session.is_finalized:
-                    session.is_finalized = True
-                    session.finalized_at = datetime.now()
-                self._auto_save(session)
+            if not session:
+                route.mark_as_delivered(package_id)
+                return True
+            self.record_event(session, 'delivered', route.id, [package_id], actor_telegram_id=telegram_id)
+            all_finalized = all(r.delivered_count >= r.total_packages for r in session.routes)
+            if all_finalized and not session.is_finalized:
+                session.is_finalized = True
+                session.finalized_at = datetime.now()
+                self._auto_save(session, immediate=True)
             return True
         return False
     
@@ -0,0 +1,213 @@
+"""
+🗂️ CACHE DE SESSÕES - Cabeçalhos leves + LRU limitado de sessões completas
+Na inicialização só os cabeçalhos (id, data, status, contagens) vão para a
+memória. A sessão completa (romaneios, rotas, pontos) é carregada no primeiro
+acesso e fica num LRU limitado por tamanho e idade; finalizadas saem cedo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class SessionHeader:
+    """Resumo de uma sessão (o suficiente para listagens e histórico)"""
+    session_id: str
+    session_name: str = ''
+    date: str = ''
+    period: str = ''
+    created_at: Optional[datetime] = None
+    is_finalized: bool = False
+    finalized_at: Optional[datetime] = None
+    current_step: str = 'idle'
+    base_address: str = ''
+    total_packages: int = 0
+    num_routes: int = 0
+    num_deliverers: int = 0
+    total_delivered: int = 0
+    total_failed: int = 0
+    total_returned: int = 0
+    failure_reasons: Dict[str, int] = field(default_factory=dict)
+    assigned_telegram_ids: List[int] = field(default_factory=list)
+
+    @classmethod
+    def from_session(cls, session) -> 'SessionHeader':
+        delivered = failed = returned = 0
+        reasons: Dict[str, int] = {}
+        for route in session.routes:
+            for point in route.optimized_order or []:
+                status = getattr(point, 'status', 'pending')
+                if status == 'delivered':
+                    delivered += 1
+                elif status == 'failed':
+                    failed += 1
+                    reason = getattr(point, 'failure_reason', None) or "Não especificado"
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                elif status == 'returned':
+                    returned += 1
+        return cls(
+            session_id=session.session_id,
+            session_name=session.session_name,
+            date=session.date,
+            period=session.period,
+            created_at=session.created_at,
+            is_finalized=session.is_finalized,
+            finalized_at=session.finalized_at,
+            current_step=session.current_step,
+            base_address=session.base_address,
+            total_packages=session.total_packages,
+            num_routes=len(session.routes),
+            num_deliverers=session.num_deliverers,
+            total_delivered=delivered,
+            total_failed=failed,
+            total_returned=returned,
+            failure_reasons=reasons,
+            assigned_telegram_ids=sorted({
+                r.assigned_to_telegram_id for r in session.routes if r.assigned_to_telegram_id
+            })
+        )
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        for key in ('created_at', 'finalized_at'):
+            if data[key] is not None:
+                data[key] = data[key].isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SessionHeader':
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        for key in ('created_at', 'finalized_at'):
+            if isinstance(known.get(key), str):
+                known[key] = datetime.fromisoformat(known[key])
+        return cls(**known)
+
+
+class SessionCache:
+    """
+    LRU de sessões completas. Expulsa a menos usada acima de max_size, as ociosas
+    há mais de ttl_s e as finalizadas ociosas há mais de finalized_ttl_s.
+    Sessões fixadas (ex: a sessão em foco) nunca saem. on_evict recebe a sessão
+    expulsa fora do lock (para gravar pendências e liberar change tracking).
+    """
+
+    def __init__(self, max_size: int = 20, ttl_s: float = 1800, finalized_ttl_s: float = 60,
+                 on_evict: Optional[Callable] = None, is_pinned: Optional[Callable[[str], bool]] = None):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.finalized_ttl_s = finalized_ttl_s
+        self.on_evict = on_evict
+        self.is_pinned = is_pinned or (lambda session_id: False)
+        self._items: 'OrderedDict[str, Tuple[object, float]]' = OrderedDict()  # id -> (sessão, último acesso)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: Optional[str], default=None):
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items[session_id] = (item[0], time.monotonic())
+            self._items.move_to_end(session_id)
+            return item[0]
+
+    def put(self, session):
+        with self._lock:
+            self._items[session.session_id] = (session, time.monotonic())
+            self._items.move_to_end(session.session_id)
+            evicted = self._collect()
+        self._evict(evicted)
+
+    def pop(self, session_id: str, default=None):
+        with self._lock:
+            item = self._items.pop(session_id, None)
+        return item[0] if item else default
+
+    def sweep(self):
+        """Expulsa sessões vencidas (chamado nos acessos do SessionManager)"""
+        with self._lock:
+            evicted = self._collect()
+        self._evict(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict:
+        return {
+            'loaded': len(self._items),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    # Interface de dict (compatibilidade com o antigo active_sessions)
+    def __contains__(self, session_id) -> bool:
+        return session_id in self._items
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id, session):
+        self.put(session)
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            del self._items[session_id]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._items)
+
+    def values(self) -> List:
+        with self._lock:
+            return [session for session, _ in self._items.values()]
+
+    def items(self) -> List[Tuple[str, object]]:
+        with self._lock:
+            return [(sid, session) for sid, (session, _) in self._items.items()]
+
+    def _collect(self) -> List:
+        """Remove (sob lock) e retorna as sessões que devem sair"""
+        now = time.monotonic()
+        evicted = []
+        for session_id, (session, last_access) in list(self._items.items()):
+            if self.is_pinned(session_id):
+                continue
+            idle = now - last_access
+            if idle > self.ttl_s or (session.is_finalized and idle > self.finalized_ttl_s):
+                evicted.append(self._items.pop(session_id)[0])
+
+        # Acima do limite: sai a menos usada (nunca a recém-acessada)
+        for session_id in list(self._items)[:-1]:
+            if len(self._items) <= self.max_size:
+                break
+            if not self.is_pinned(session_id):
+                evicted.append(self._items.pop(session_id)[0])
+        return evicted
+
+    def _evict(self, evicted: List):
+        for session in evicted:
+            self.evictions += 1
+            if self.on_evict:
+                try:
+                    self.on_evict(session)
+                except Exception as e:
+                    print(f"⚠️ Erro ao liberar sessão {session.session_id} do cache: {e}")
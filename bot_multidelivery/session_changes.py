@@ -0,0 +1,225 @@
+"""
+🔍 CHANGE TRACKING DE SESSÕES - O que mudou desde o último save
+Guarda assinaturas (tuplas de valores) do estado já persistido de cada
+DailySession / Route / DeliveryPoint e calcula só as linhas e campos alterados.
+Baseado em valores (não em hooks de atributo) porque vários routers alteram
+pontos e listas diretamente (ex: optimized_order.remove na transferência).
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Campos persistidos de cada ponto (mesma ordem da serialização)
+POINT_FIELDS = (
+    'package_id', 'romaneio_id', 'address', 'lat', 'lng', 'priority',
+    'bairro', 'status', 'failure_reason', 'status_detail'
+)
+POINT_DEFAULTS = {
+    'priority': 'normal',
+    'bairro': '',
+    'status': 'pending',
+    'failure_reason': None,
+    'status_detail': None
+}
+# Campos da sessão que mudam colunas do SessionDB
+SESSION_FIELDS = (
+    'session_name', 'date', 'period', 'base_address', 'base_lat', 'base_lng',
+    'is_finalized', 'finalized_at', 'current_step', 'event_seq'
+)
+# Campos de cabeçalho que podem ir no journal JSON sem reescrever o arquivo base
+JOURNAL_HEADER_FIELDS = {'event_seq'}
+# Campos da rota que mudam colunas do RouteDB
+ROUTE_FIELDS = ('assigned_to_telegram_id', 'assigned_to_name', 'color', 'map_file')
+# Campos do ponto que também vivem no PackageDB
+PACKAGE_FIELDS = ('address', 'lat', 'lng', 'priority', 'status', 'failure_reason', 'status_detail')
+# Tabelas normalizadas: campos da parada (endereço) e do pacote na parada
+STOP_FIELDS = ('address', 'lat', 'lng', 'bairro')
+STOP_PACKAGE_FIELDS = ('package_id', 'romaneio_id', 'priority', 'status', 'failure_reason', 'status_detail')
+_STOP_INDEXES = tuple(POINT_FIELDS.index(f) for f in STOP_FIELDS)
+
+
+def point_signature(point) -> Tuple:
+    return tuple(getattr(point, f, POINT_DEFAULTS.get(f)) for f in POINT_FIELDS)
+
+
+def point_to_dict(point) -> Dict:
+    return dict(zip(POINT_FIELDS, point_signature(point)))
+
+
+def group_stops(points: List[Dict]) -> List[Tuple[Dict, List[Tuple[int, Dict]]]]:
+    """
+    Agrupa pontos consecutivos no mesmo endereço em paradas.
+    Retorna [(parada, [(posição do ponto na lista, pacote), ...]), ...]
+    """
+    stops = []
+    for position, point in enumerate(points):
+        stop = {f: point.get(f, POINT_DEFAULTS.get(f)) for f in STOP_FIELDS}
+        package = {f: point.get(f, POINT_DEFAULTS.get(f)) for f in STOP_PACKAGE_FIELDS}
+        if stops and stops[-1][0] == stop:
+            stops[-1][1].append((position, package))
+        else:
+            stops.append((stop, [(position, package)]))
+    return stops
+
+
+def _stop_moved(old: Tuple, new: Tuple) -> bool:
+    """Endereço/coordenada do ponto mudou (a parada não é mais a mesma)"""
+    return any(old[i] != new[i] for i in _STOP_INDEXES)
+
+
+@dataclass
+class RouteSnapshot:
+    header: Tuple
+    delivered: Tuple
+    order: Tuple  # package_ids na ordem de visita
+    points: List[Tuple]
+
+
+@dataclass
+class SessionSnapshot:
+    """Assinatura do estado persistido de uma sessão"""
+    header: Tuple
+    romaneios: List[Tuple]  # (id, filename, uploaded_at, package_ids)
+    romaneio_points: List[List[Tuple]]
+    routes: Dict[str, RouteSnapshot]
+
+    @classmethod
+    def capture(cls, session) -> 'SessionSnapshot':
+        romaneio_points = [[point_signature(p) for p in r.points] for r in session.romaneios]
+        romaneios = [
+            (r.id, r.filename, r.uploaded_at, tuple(sig[0] for sig in points))
+            for r, points in zip(session.romaneios, romaneio_points)
+        ]
+        routes = {}
+        for route in session.routes:
+            points = [point_signature(p) for p in route.optimized_order]
+            routes[route.id] = RouteSnapshot(
+                header=tuple(getattr(route, f) for f in ROUTE_FIELDS),
+                delivered=tuple(route.delivered_packages),
+                order=tuple(sig[0] for sig in points),
+                points=points
+            )
+        return cls(
+            header=tuple(getattr(session, f) for f in SESSION_FIELDS),
+            romaneios=romaneios,
+            romaneio_points=romaneio_points,
+            routes=routes
+        )
+
+
+@dataclass
+class SessionChanges:
+    """Diferença entre a sessão em memória e o último snapshot persistido"""
+    is_new: bool = False
+    header: Dict[str, Any] = field(default_factory=dict)  # coluna -> valor
+    romaneios_rewrite: bool = False  # romaneio adicionado/removido/reordenado
+    romaneio_points: Dict[int, Dict[int, Dict]] = field(default_factory=dict)  # idx romaneio -> idx ponto -> ponto
+    routes_added: List[str] = field(default_factory=list)
+    routes_removed: List[str] = field(default_factory=list)
+    route_fields: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # rota -> coluna -> valor
+    route_points: Dict[str, Dict[int, Dict]] = field(default_factory=dict)  # rota -> idx ponto -> ponto
+    # Pontos com endereço/coordenada alterados (ex: geocoding): paradas da lista são regravadas
+    romaneios_relocated: Set[int] = field(default_factory=set)
+    routes_relocated: Set[str] = field(default_factory=set)
+    packages: Dict[str, str] = field(default_factory=dict)  # package_id -> route_id (linhas do PackageDB)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (
+            self.is_new or self.header or self.romaneios_rewrite or self.romaneio_points
+            or self.routes_added or self.routes_removed or self.route_fields
+            or self.route_points or self.packages
+        )
+
+    @property
+    def is_structural(self) -> bool:
+        """Mudanças que alteram a forma da sessão (não cabem em patch de campos)"""
+        return (
+            self.is_new or self.romaneios_rewrite or bool(self.routes_added) or bool(self.routes_removed)
+            or any('optimized_order' in f for f in self.route_fields.values())
+        )
+
+    def describe(self) -> str:
+        if self.is_new:
+            return "completo"
+        points = sum(len(p) for p in self.romaneio_points.values()) + sum(len(p) for p in self.route_points.values())
+        parts = []
+        if self.header:
+            parts.append(f"sessão: {', '.join(self.header)}")
+        if self.romaneios_rewrite:
+            parts.append("romaneios")
+        if self.routes_added or self.routes_removed:
+            parts.append(f"rotas +{len(self.routes_added)}/-{len(self.routes_removed)}")
+        if self.route_fields:
+            parts.append(f"{len(self.route_fields)} rota(s)")
+        if points:
+            parts.append(f"{points} ponto(s)")
+        if self.packages:
+            parts.append(f"{len(self.packages)} pacote(s)")
+        return "incremental: " + "; ".join(parts)
+
+
+def diff_session(previous: Optional[SessionSnapshot], session) -> Tuple[SessionChanges, SessionSnapshot]:
+    """Compara a sessão com o snapshot anterior. Retorna (mudanças, novo snapshot)"""
+    current = SessionSnapshot.capture(session)
+    changes = SessionChanges()
+
+    if previous is None:
+        changes.is_new = True
+        return changes, current
+
+    for name, old, new in zip(SESSION_FIELDS, previous.header, current.header):
+        if old != new:
+            changes.header[name] = new
+
+    # Romaneios: estrutura diferente → reescreve; senão só os pontos alterados
+    if previous.romaneios != current.romaneios:
+        changes.romaneios_rewrite = True
+    else:
+        for ri, (old_points, new_points) in enumerate(zip(previous.romaneio_points, current.romaneio_points)):
+            for pi, (old, new) in enumerate(zip(old_points, new_points)):
+                if old != new:
+                    changes.romaneio_points.setdefault(ri, {})[pi] = dict(zip(POINT_FIELDS, new))
+                    if _stop_moved(old, new):
+                        changes.romaneios_relocated.add(ri)
+
+    routes = {r.id: r for r in session.routes}
+    changes.routes_added = [rid for rid in current.routes if rid not in previous.routes]
+    changes.routes_removed = [rid for rid in previous.routes if rid not in current.routes]
+
+    for rid in changes.routes_added:
+        for sig in current.routes[rid].points:
+            changes.packages[sig[0]] = rid
+
+    for rid, new in current.routes.items():
+        old = previous.routes.get(rid)
+        if old is None:
+            continue
+        fields = {}
+        for name, old_value, new_value in zip(ROUTE_FIELDS, old.header, new.header):
+            if old_value != new_value:
+                fields[name] = new_value
+        if old.delivered != new.delivered:
+            fields['delivered_packages'] = list(new.delivered)
+
+        if old.order != new.order:
+            # Reordenação ou transferência: reescreve a lista inteira da rota
+            fields['optimized_order'] = [point_to_dict(p) for p in routes[rid].optimized_order]
+            old_by_pkg = dict(zip(old.order, old.points))
+            for sig in new.points:
+                if old_by_pkg.get(sig[0]) != sig:
+                    changes.packages[sig[0]] = rid
+        else:
+            for idx, (old_sig, new_sig) in enumerate(zip(old.points, new.points)):
+                if old_sig != new_sig:
+                    changes.route_points.setdefault(rid, {})[idx] = dict(zip(POINT_FIELDS, new_sig))
+                    changes.packages[new_sig[0]] = rid
+                    if _stop_moved(old_sig, new_sig):
+                        changes.routes_relocated.add(rid)
+
+        if 'assigned_to_telegram_id' in fields:
+            for sig in new.points:
+                changes.packages[sig[0]] = rid
+        if fields:
+            changes.route_fields[rid] = fields
+
+    return changes, current
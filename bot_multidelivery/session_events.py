@@ -0,0 +1,213 @@
+"""
+📜 LOG DE EVENTOS DE SESSÃO - Append-only + snapshots periódicos
+Cada ação de entrega (entregue, falha, devolução, transferência, reordenação)
+vira um evento imutável. O estado da sessão = último snapshot + eventos seguintes.
+
+package_id não identifica um ponto (se repete entre romaneios): os eventos levam
+também a chave do ponto (Route.point_key = id + parada) em data['point_keys'] /
+data['order_keys'] e o replay usa essa chave. Eventos antigos, sem chaves,
+caem no package_id (todas as ocorrências).
+"""
+import json
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+class EventType(str, Enum):
+    DELIVERED = "delivered"
+    FAILED = "failed"
+    RETURNED = "returned"
+    TRANSFERRED = "transferred"
+    REORDERED = "reordered"
+
+
+@dataclass(frozen=True)
+class SessionEvent:
+    """Evento imutável aplicado sobre uma rota da sessão"""
+    session_id: str
+    type: EventType
+    route_id: str
+    package_ids: Tuple[str, ...] = ()
+    data: Dict = field(default_factory=dict)  # reason, detail, to_route, order...
+    actor_telegram_id: Optional[int] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    seq: int = 0  # Atribuído pelo log no append
+
+    def to_dict(self) -> Dict:
+        return {
+            'seq': self.seq,
+            'session_id': self.session_id,
+            'type': self.type.value,
+            'route_id': self.route_id,
+            'package_ids': list(self.package_ids),
+            'data': self.data,
+            'actor_telegram_id': self.actor_telegram_id,
+            'created_at': self.created_at.isoformat()
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> 'SessionEvent':
+        return cls(
+            session_id=d['session_id'],
+            type=EventType(d['type']),
+            route_id=d.get('route_id'),
+            package_ids=tuple(d.get('package_ids') or ()),
+            data=d.get('data') or {},
+            actor_telegram_id=d.get('actor_telegram_id'),
+            created_at=datetime.fromisoformat(d['created_at']) if d.get('created_at') else datetime.now(),
+            seq=d.get('seq', 0)
+        )
+
+
+def apply_event(session, event: SessionEvent) -> bool:
+    """
+    Aplica o evento na sessão em memória. Eventos definem estado (não incrementam),
+    então reaplicar um evento já refletido no snapshot é inofensivo.
+    """
+    route = session.get_route(event.route_id)
+    if route is None:
+        return False
+
+    reason = event.data.get('reason')
+    detail = event.data.get('detail')
+    keys = set(event.data.get('point_keys') or ()) or None
+    package_ids = dict.fromkeys(event.package_ids)  # sem repetição, na ordem
+
+    if event.type == EventType.DELIVERED:
+        for pkg_id in package_ids:
+            route.mark_as_delivered(pkg_id, detail=detail, keys=keys)
+    elif event.type == EventType.FAILED:
+        for pkg_id in package_ids:
+            route.mark_as_failed(pkg_id, reason=reason, detail=detail, keys=keys)
+    elif event.type == EventType.RETURNED:
+        for pkg_id in package_ids:
+            route.mark_as_returned(pkg_id, reason=reason, detail=detail, keys=keys)
+    elif event.type == EventType.TRANSFERRED:
+        target = session.get_route(event.data.get('to_route'))
+        if target is None:
+            return False
+        if keys is not None:
+            is_moving = lambda p: route.point_key(p) in keys
+        else:
+            is_moving = lambda p: p.package_id in package_ids
+        moved = [p for p in route.optimized_order if is_moving(p)]
+        route.optimized_order = [p for p in route.optimized_order if not is_moving(p)]
+        target.optimized_order.extend(moved)
+    elif event.type == EventType.REORDERED:
+        order_keys = event.data.get('order_keys')
+        key_of = route.point_key if order_keys else (lambda p: p.package_id)
+        position: Dict[str, int] = {}
+        for i, key in enumerate(order_keys or event.data.get('order', [])):
+            position.setdefault(key, i)  # chave repetida: vale a primeira posição
+        tail = len(position)
+        # sorted é estável: pontos com a mesma chave mantêm a ordem relativa
+        route.optimized_order = sorted(
+            route.optimized_order,
+            key=lambda p: position.get(key_of(p), tail)
+        )
+    return True
+
+
+class SessionEventLog:
+    """
+    Log append-only: tabela session_events (PostgreSQL) ou <id>.events.jsonl local.
+    No PostgreSQL o seq é o id autoincrement (ordem global entre processos).
+    """
+
+    def __init__(self, sessions_dir: Path):
+        self.sessions_dir = sessions_dir
+        self._file_seq: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _events_file(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.events.jsonl"
+
+    def append(self, event: SessionEvent, use_database: bool, db_session=None) -> SessionEvent:
+        """
+        Grava o evento (uma linha/um INSERT) e retorna-o com o seq atribuído.
+        db_session: transação do chamador (o commit fica com ele)
+        """
+        if use_database:
+            from .database import db_manager, SessionEventDB
+            if db_session is None:
+                with db_manager.get_session() as db_session:
+                    return self.append(event, use_database, db_session)
+            row = SessionEventDB(
+                session_id=event.session_id,
+                event_type=event.type.value,
+                route_id=event.route_id,
+                package_ids=list(event.package_ids),
+                data=event.data,
+                actor_telegram_id=event.actor_telegram_id,
+                created_at=event.created_at
+            )
+            db_session.add(row)
+            db_session.flush()
+            return replace(event, seq=row.id)
+
+        with self._lock:
+            seq = self._last_file_seq(event.session_id) + 1
+            event = replace(event, seq=seq)
+            self.sessions_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._events_file(event.session_id), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+            self._file_seq[event.session_id] = seq
+        return event
+
+    def since(self, session_id: str, seq: int, use_database: bool) -> List[SessionEvent]:
+        """Eventos posteriores ao seq (em ordem), para reconstruir a sessão"""
+        if use_database:
+            from .database import db_manager, SessionEventDB
+            with db_manager.get_session() as db_session:
+                rows = db_session.query(SessionEventDB).filter(
+                    SessionEventDB.session_id == session_id,
+                    SessionEventDB.id > seq
+                ).order_by(SessionEventDB.id).all()
+                return [self._from_row(r) for r in rows]
+        return [e for e in self._read_file(session_id) if e.seq > seq]
+
+    def timeline(self, session_id: str, use_database: bool, limit: Optional[int] = None) -> List[SessionEvent]:
+        """Linha do tempo completa (auditoria), mais recentes por último"""
+        events = self.since(session_id, 0, use_database)
+        return events[-limit:] if limit else events
+
+    def delete(self, session_id: str):
+        """Remove o arquivo local (no PostgreSQL o CASCADE da sessão cuida)"""
+        self._events_file(session_id).unlink(missing_ok=True)
+        self._file_seq.pop(session_id, None)
+
+    @staticmethod
+    def _from_row(row) -> SessionEvent:
+        return SessionEvent(
+            session_id=row.session_id,
+            type=EventType(row.event_type),
+            route_id=row.route_id,
+            package_ids=tuple(row.package_ids or ()),
+            data=row.data or {},
+            actor_telegram_id=row.actor_telegram_id,
+            created_at=row.created_at,
+            seq=row.id
+        )
+
+    def _read_file(self, session_id: str) -> List[SessionEvent]:
+        path = self._events_file(session_id)
+        if not path.exists():
+            return []
+        events = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(SessionEvent.from_dict(json.loads(line)))
+                except (ValueError, KeyError):
+                    break  # Linha truncada (crash no meio do append)
+        return events
+
+    def _last_file_seq(self, session_id: str) -> int:
+        if session_id not in self._file_seq:
+            events = self._read_file(session_id)
+            self._file_seq[session_id] = events[-1].seq if events else 0
+        return self._file_seq[session_id]
@@ -0,0 +1,118 @@
+"""
+⏱️ WRITE-BEHIND DE SESSÕES - Coalescência de saves
+Mutações só marcam a sessão como suja; uma thread grava cada sessão no máximo
+uma vez por janela (padrão 250 ms), fora do request/handler que a alterou.
+Transições críticas (finalização, exclusão) usam flush imediato.
+"""
+import atexit
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class WriteBehindFlusher:
+    """Agrupa saves da mesma sessão dentro de uma janela e grava em background"""
+
+    def __init__(self, save_fn: Callable, window_s: float = 0.25):
+        self.save_fn = save_fn
+        self.window_s = window_s
+        self._dirty: Dict[str, object] = {}  # session_id -> sessão
+        self._dirty_since: Dict[str, float] = {}  # primeira marcação na janela
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()  # flush imediato e thread não gravam em paralelo
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.saves = 0
+        self.coalesced = 0
+        atexit.register(self.close)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0 and not self._closed
+
+    def mark_dirty(self, session):
+        """Agenda o save da sessão (várias marcações na janela viram um save só)"""
+        if not self.enabled:
+            self._save(session)
+            return
+        with self._cond:
+            if session.session_id in self._dirty:
+                self.coalesced += 1
+            self._dirty[session.session_id] = session
+            self._dirty_since.setdefault(session.session_id, time.monotonic())
+            self._ensure_thread()
+            self._cond.notify()
+
+    def flush(self, session_id: Optional[str] = None):
+        """Grava agora as sessões pendentes (uma específica ou todas)"""
+        with self._cond:
+            ids = [session_id] if session_id else list(self._dirty)
+            pending = [self._pop(sid) for sid in ids]
+        for session in pending:
+            if session is not None:
+                self._save(session)
+
+    def discard(self, session_id: str):
+        """Descarta save pendente (sessão excluída)"""
+        with self._cond:
+            self._pop(session_id)
+
+    def close(self):
+        """Flush durável no desligamento"""
+        self._closed = True
+        with self._cond:
+            self._cond.notify_all()
+        self.flush()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict:
+        return {
+            'window_ms': int(self.window_s * 1000),
+            'pending': len(self._dirty),
+            'saves': self.saves,
+            'coalesced': self.coalesced
+        }
+
+    def _pop(self, session_id: str):
+        self._dirty_since.pop(session_id, None)
+        return self._dirty.pop(session_id, None)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="session-write-behind", daemon=True)
+            self._thread.start()
+
+    def _save(self, session):
+        with self._save_lock:
+            try:
+                self.save_fn(session)
+                self.saves += 1
+            except Exception as e:
+                print(f"⚠️ Write-behind: erro ao salvar sessão {session.session_id}: {e}")
+                if not self._closed:
+                    # Tenta de novo na próxima janela
+                    with self._cond:
+                        self._dirty.setdefault(session.session_id, session)
+                        self._dirty_since.setdefault(session.session_id, time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return  # close() faz o flush final
+
+                now = time.monotonic()
+                oldest = min(self._dirty_since.values())
+                if now - oldest < self.window_s:
+                    self._cond.wait(self.window_s - (now - oldest))
+                    continue
+
+                due = [sid for sid, t in self._dirty_since.items() if now - t >= self.window_s]
+                pending = [self._pop(sid) for sid in due]
+
+            for session in pending:
+                if session is not None:
+                    self._save(session)
@@ -4,14 +4,26 @@ Salva sessões automaticamente com histórico completo
 """
 import json
 import os
+import sys
+import threading
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime
 from .session import DailySession, Route, Romaneio, DeliveryPoint
+from .session_changes import (
+    JOURNAL_HEADER_FIELDS, SESSION_FIELDS, STOP_FIELDS, STOP_PACKAGE_FIELDS,
+    SessionChanges, SessionSnapshot, diff_session, group_stops, point_to_dict
+)
+from .session_events import EventType, SessionEvent, SessionEventLog, apply_event
+from .session_cache import SessionHeader
+from . import snapshot_format
 
 # Import database - verificação de conexão será feita dinamicamente
 try:
-    from .database import db_manager, SessionDB, RouteDB, PackageDB
+    from sqlalchemy import bindparam, func, insert, update
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    from .database import db_manager, SessionDB, RouteDB, PackageDB, RomaneioDB, StopDB, StopPackageDB
     HAS_DATABASE_MODULE = True
 except Exception as e:
     print(f"⚠️ Database import failed: {e}")
@@ -19,6 +31,10 @@ except Exception as e:
     db_manager = None
 
 
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class SessionStore:
     """Gerencia persistência de sessões em disco ou PostgreSQL"""
     
@@ -26,6 +42,18 @@ class SessionStore:
         self.sessions_dir = Path(data_dir) / "sessions"
         self.sessions_dir.mkdir(parents=True, exist_ok=True)
         self._last_db_check = None
+        self._lock = threading.RLock()
+        # Último estado persistido por backend (base do save incremental)
+        self._snapshots: Dict[str, Dict[str, SessionSnapshot]] = {'db': {}, 'json': {}}
+        self._journal_lines: Dict[str, int] = {}
+        # Último cabeçalho persistido por sessão (evita regravar resumo igual)
+        self._headers: Dict[str, Dict] = {}
+        # Linhas do PackageDB já gravadas por eventos desde o último snapshot (assinatura)
+        self._synced_packages: Dict[str, Dict[str, Tuple]] = {}
+        self.journal_compact_every = int(os.getenv("SESSION_JOURNAL_COMPACT_EVERY", "200"))
+        # 13 colunas por linha: 1000 linhas ficam bem abaixo do limite de parâmetros do PG
+        self.package_upsert_batch = int(os.getenv("PACKAGE_UPSERT_BATCH", "1000"))
+        self.events = SessionEventLog(self.sessions_dir)
         self._check_database_connection()
     
     def _check_database_connection(self) -> bool:
@@ -49,9 +77,36 @@ class SessionStore:
         return self.using_database
     
     def _session_file(self, session_id: str) -> Path:
-        """Path do arquivo da sessão"""
+        """Path do snapshot binário da sessão"""
+        return self.sessions_dir / f"{session_id}{snapshot_format.SUFFIX}"
+    
+    def _legacy_session_file(self, session_id: str) -> Path:
+        """Path do arquivo JSON antigo (indent=2), só leitura"""
         return self.sessions_dir / f"{session_id}.json"
     
+    def _read_session_data(self, session_id: str) -> Optional[Dict]:
+        """Dict da sessão do snapshot binário ou, se não houver, do JSON legado"""
+        for file_path in (self._session_file(session_id), self._legacy_session_file(session_id)):
+            if file_path.exists():
+                return snapshot_format.load(file_path)
+        return None
+    
+    def _session_ids_on_disk(self) -> List[str]:
+        if not self.sessions_dir.exists():
+            return []
+        return sorted(
+            {p.stem for p in self.sessions_dir.glob(f"*{snapshot_format.SUFFIX}")}
+            | {p.stem for p in self.sessions_dir.glob("*.json")}
+        )
+    
+    def _unlink_session_files(self, session_id: str) -> bool:
+        removed = False
+        for file_path in (self._session_file(session_id), self._legacy_session_file(session_id)):
+            if file_path.exists():
+                file_path.unlink()
+                removed = True
+        return removed
+    
     def delete_session(self, session_id: str) -> bool:
         """Exclui sessão do PostgreSQL e/ou Disco"""
         success = True
@@ -74,11 +129,13 @@ class SessionStore:
                 success = False
 
         # 2. Sempre tenta remover arquivo JSON local (backup ou modo arquivo)
+        self._forget(session_id)
+        self._journal_file(session_id).unlink(missing_ok=True)
+        self.events.delete(session_id)
+        (self.sessions_dir / f"{session_id}.tracks.jsonl").unlink(missing_ok=True)  # Trilhas GPS
         try:
-            file_path = self._session_file(session_id)
-            if file_path.exists():
-                file_path.unlink()
-                print(f"🗑️ Arquivo de sessão {session_id}.json removido")
+            if self._unlink_session_files(session_id):
+                print(f"🗑️ Arquivo de sessão {session_id} removido")
             elif not self.using_database:
                 # Se não está no DB e não tem arquivo, falhou
                 success = False
@@ -89,213 +146,674 @@ class SessionStore:
         return success
 
     def save_session(self, session: DailySession):
-        """Salva sessão em disco ou PostgreSQL (auto-save)"""
+        """Salva sessão em disco ou PostgreSQL (auto-save incremental)"""
         # Re-verifica conexão antes de salvar (pode ter reconectado)
         if not self.using_database:
             self._check_database_connection()
         
-        if self.using_database:
-            # Salva no PostgreSQL
+        with self._lock:
+            if self.using_database:
+                try:
+                    self._save_to_database(session)
+                    return
+                except Exception as e:
+                    print(f"⚠️ Erro ao salvar sessão no PostgreSQL: {e}, usando fallback JSON")
+                    self.using_database = False  # Marca para usar JSON
+            
+            # Fallback: JSON
             try:
-                with db_manager.get_session() as db_session:
-                    # Serializa romaneios para JSON
-                    romaneios_data = [
-                        {
-                            'id': r.id,
-                            'filename': r.filename,
-                            'uploaded_at': r.uploaded_at.isoformat(),
-                            'points': [
-                                {
-                                    'package_id': p.package_id,
-                                    'romaneio_id': p.romaneio_id,
-                                    'address': p.address,
-                                    'lat': p.lat,
-                                    'lng': p.lng,
-                                    'priority': p.priority,
-                                    'bairro': getattr(p, 'bairro', ''),
-                                    'status': getattr(p, 'status', 'pending'),
-                                    'failure_reason': getattr(p, 'failure_reason', None),
-                                    'status_detail': getattr(p, 'status_detail', None)
-                                } for p in r.points
-                            ]
-                        } for r in session.romaneios
-                    ]
-                    
-                    # Verifica se sessão já existe
-                    session_db = db_session.query(SessionDB).filter_by(session_id=session.session_id).first()
-                    
-                    if session_db:
-                        # Atualiza existente
-                        session_db.session_name = session.session_name
-                        session_db.date = session.date
-                        session_db.period = session.period
-                        session_db.base_address = session.base_address
-                        session_db.base_lat = session.base_lat
-                        session_db.base_lng = session.base_lng
-                        session_db.is_finalized = session.is_finalized
-                        session_db.finalized_at = session.finalized_at
-                        session_db.current_step = session.current_step
-                        session_db.romaneios_data = romaneios_data
-                        
-                        # Remove rotas antigas
-                        db_session.query(RouteDB).filter_by(session_id=session.session_id).delete()
-                    else:
-                        # Cria nova
-                        session_db = SessionDB(
-                            session_id=session.session_id,
-                            session_name=session.session_name,
-                            date=session.date,
-                            period=session.period,
-                            created_at=session.created_at,
-                            base_address=session.base_address,
-                            base_lat=session.base_lat,
-                            base_lng=session.base_lng,
-                            is_finalized=session.is_finalized,
-                            finalized_at=session.finalized_at,
-                            current_step=session.current_step,
-                            romaneios_data=romaneios_data
-                        )
-                        db_session.add(session_db)
-                    
-                    # Salva rotas
-                    for route in session.routes:
-                        route_db = RouteDB(
-                            id=route.id,
-                            session_id=session.session_id,
-                            assigned_to_telegram_id=route.assigned_to_telegram_id,
-                            assigned_to_name=route.assigned_to_name,
-                            color=route.color,
-                            map_file=route.map_file,
-                            optimized_order=[
-                                {
-                                    'package_id': p.package_id,
-                                    'romaneio_id': p.romaneio_id,
-                                    'address': p.address,
-                                    'lat': p.lat,
-                                    'lng': p.lng,
-                                    'priority': p.priority,
-                                    'bairro': getattr(p, 'bairro', ''),
-                                    'status': getattr(p, 'status', 'pending'),
-                                    'failure_reason': getattr(p, 'failure_reason', None),
-                                    'status_detail': getattr(p, 'status_detail', None)
-                                } for p in route.optimized_order
-                            ],
-                            delivered_packages=route.delivered_packages
-                        )
-                        db_session.add(route_db)
-                        
-                        # Salva/Atualiza pacotes individuais para análise
-                        for p in route.optimized_order:
-                            package_db = db_session.query(PackageDB).filter_by(id=p.package_id).first()
-                            if package_db:
-                                package_db.status = getattr(p, 'status', 'pending')
-                                package_db.failure_reason = getattr(p, 'failure_reason', None)
-                                package_db.status_detail = getattr(p, 'status_detail', None)
-                                package_db.route_id = route.id
-                                package_db.assigned_to_telegram_id = route.assigned_to_telegram_id
-                                if package_db.status == 'delivered' and not package_db.delivered_at:
-                                    package_db.delivered_at = datetime.now()
-                            else:
-                                package_db = PackageDB(
-                                    id=p.package_id,
-                                    session_id=session.session_id,
-                                    romaneio_id=p.romaneio_id,
-                                    route_id=route.id,
-                                    address=p.address,
-                                    lat=p.lat,
-                                    lng=p.lng,
-                                    priority=p.priority,
-                                    status=getattr(p, 'status', 'pending'),
-                                    failure_reason=getattr(p, 'failure_reason', None),
-                                    status_detail=getattr(p, 'status_detail', None),
-                                    assigned_to_telegram_id=route.assigned_to_telegram_id,
-                                    delivered_at=datetime.now() if getattr(p, 'status', 'pending') == 'delivered' else None
-                                )
-                                db_session.add(package_db)
-                    
-                print(f"💾 Sessão {session.session_name} salva no PostgreSQL")
-                return
+                self._save_to_json(session)
             except Exception as e:
-                print(f"⚠️ Erro ao salvar sessão no PostgreSQL: {e}, usando fallback JSON")
-                self.using_database = False  # Marca para usar JSON
+                print(f"❌ Erro ao salvar sessão {session.session_id}: {e}")
+                import traceback
+                traceback.print_exc()
+    
+    # ==================== SERIALIZAÇÃO ====================
+    
+    @staticmethod
+    def _romaneio_to_dict(r: Romaneio) -> Dict:
+        return {
+            'id': r.id,
+            'filename': r.filename,
+            'uploaded_at': r.uploaded_at.isoformat(),
+            'points': [point_to_dict(p) for p in r.points]
+        }
+    
+    @staticmethod
+    def _point_from_dict(p: Dict) -> DeliveryPoint:
+        # Campos de baixa cardinalidade internados: milhares de pontos compartilham a mesma string
+        return DeliveryPoint(
+            package_id=p['package_id'],
+            romaneio_id=_intern(p['romaneio_id']),
+            address=p['address'],
+            lat=p['lat'],
+            lng=p['lng'],
+            priority=_intern(p.get('priority', 'normal')),
+            bairro=_intern(p.get('bairro', '')),
+            status=_intern(p.get('status', 'pending')),
+            failure_reason=_intern(p.get('failure_reason')),
+            status_detail=p.get('status_detail')
+        )
+    
+    def _session_to_dict(self, session: DailySession) -> Dict:
+        return {
+            'session_id': session.session_id,
+            'session_name': session.session_name,
+            'date': session.date,
+            'period': session.period,
+            'created_at': session.created_at.isoformat(),
+            'base_address': session.base_address,
+            'base_lat': session.base_lat,
+            'base_lng': session.base_lng,
+            'is_finalized': session.is_finalized,
+            'finalized_at': session.finalized_at.isoformat() if session.finalized_at else None,
+            'current_step': session.current_step,
+            'event_seq': session.event_seq,
+            'romaneios': [self._romaneio_to_dict(r) for r in session.romaneios],
+            'routes': [
+                {
+                    'id': r.id,
+                    'assigned_to_telegram_id': r.assigned_to_telegram_id,
+                    'assigned_to_name': r.assigned_to_name,
+                    'color': r.color,
+                    'optimized_order': [point_to_dict(p) for p in r.optimized_order],
+                    'delivered_packages': r.delivered_packages,
+                    'map_file': r.map_file
+                } for r in session.routes
+            ]
+        }
+    
+    # ==================== POSTGRESQL ====================
+    
+    def _save_to_database(self, session: DailySession):
+        """Grava só o que mudou desde o último save (sessão nova: grava tudo)"""
+        changes, snapshot = diff_session(self._snapshots['db'].get(session.session_id), session)
+        header = SessionHeader.from_session(session).to_dict()
+        summary = header if header != self._headers.get(session.session_id) else None
+        if changes.is_empty and summary is None:
+            return
         
-        # Fallback: JSON
-        try:
-            # Garante que diretório existe
-            self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        with db_manager.get_session() as db_session:
+            if changes.is_new:
+                self._write_full_db(db_session, session, header)
+            else:
+                self._write_changes_db(db_session, session, changes, summary)
+        
+        # Só avança a linha de base depois do commit
+        self._snapshots['db'][session.session_id] = snapshot
+        self._headers[session.session_id] = header
+        print(f"💾 Sessão {session.session_name} salva no PostgreSQL ({changes.describe()})")
+    
+    def _route_row(self, session_id: str, route: Route) -> 'RouteDB':
+        return RouteDB(
+            id=route.id,
+            session_id=session_id,
+            assigned_to_telegram_id=route.assigned_to_telegram_id,
+            assigned_to_name=route.assigned_to_name,
+            color=route.color,
+            map_file=route.map_file,
+            delivered_packages=route.delivered_packages
+        )
+    
+    def _write_full_db(self, db_session, session: DailySession, summary: Dict):
+        """Save completo: sessão + rotas + romaneios/paradas + todos os pacotes"""
+        session_id = session.session_id
+        
+        # Verifica se sessão já existe
+        session_db = db_session.query(SessionDB).filter_by(session_id=session_id).first()
+        
+        if session_db:
+            # Atualiza existente (e abandona o JSON legado, se houver)
+            for name in SESSION_FIELDS:
+                setattr(session_db, name, getattr(session, name))
+            session_db.romaneios_data = None
+            session_db.summary = summary
             
+            # Remove paradas, romaneios e rotas antigas
+            self._delete_stops(db_session, StopPackageDB.session_id == session_id, StopDB.session_id == session_id)
+            db_session.query(RomaneioDB).filter_by(session_id=session_id).delete()
+            db_session.query(RouteDB).filter_by(session_id=session_id).delete()
+        else:
+            # Cria nova
+            session_db = SessionDB(
+                session_id=session_id,
+                created_at=session.created_at,
+                summary=summary,
+                **{name: getattr(session, name) for name in SESSION_FIELDS}
+            )
+            db_session.add(session_db)
+        
+        # Salva rotas
+        for route in session.routes:
+            db_session.add(self._route_row(session_id, route))
+        
+        self._save_packages(db_session, session, [
+            (route, p) for route in session.routes for p in route.optimized_order
+        ])
+        db_session.flush()  # FK de romaneios/paradas
+        self._insert_romaneios(db_session, session)
+        for route in session.routes:
+            self._insert_stops(db_session, session_id, route.optimized_order, route_id=route.id)
+    
+    def _write_changes_db(self, db_session, session: DailySession, changes: SessionChanges,
+                          summary: Optional[Dict] = None):
+        """Save incremental: UPDATE só das colunas/linhas alteradas"""
+        session_id = session.session_id
+        
+        session_values = dict(changes.header)
+        if summary is not None:
+            session_values['summary'] = summary
+        if session_values:
+            db_session.query(SessionDB).filter_by(session_id=session_id).update(
+                session_values, synchronize_session=False
+            )
+        
+        if changes.romaneios_rewrite:
+            self._delete_stops(db_session,
+                               (StopPackageDB.session_id == session_id) & StopPackageDB.romaneio_pk.isnot(None),
+                               (StopDB.session_id == session_id) & StopDB.romaneio_pk.isnot(None))
+            db_session.query(RomaneioDB).filter_by(session_id=session_id).delete(synchronize_session=False)
+            self._insert_romaneios(db_session, session)
+        elif changes.romaneio_points:
+            romaneio_pks = dict(
+                db_session.query(RomaneioDB.position, RomaneioDB.id).filter_by(session_id=session_id).all()
+            )
+            updates = []
+            for ri, points in changes.romaneio_points.items():
+                pk = romaneio_pks[ri]
+                if ri in changes.romaneios_relocated:
+                    # Endereço mudou: regrava as paradas só deste romaneio
+                    self._delete_stops(db_session, StopPackageDB.romaneio_pk == pk, StopDB.romaneio_pk == pk)
+                    self._insert_stops(db_session, session_id, session.romaneios[ri].points, romaneio_pk=pk)
+                else:
+                    updates.extend((pk, None, pi, point) for pi, point in points.items())
+            self._update_stop_packages(db_session, updates)
+        
+        routes = {r.id: r for r in session.routes}
+        if changes.routes_removed:
+            self._delete_stops(db_session, StopPackageDB.route_id.in_(changes.routes_removed),
+                               StopDB.route_id.in_(changes.routes_removed))
+            db_session.query(RouteDB).filter(
+                RouteDB.session_id == session_id,
+                RouteDB.id.in_(changes.routes_removed)
+            ).delete(synchronize_session=False)
+        for route_id in changes.routes_added:
+            db_session.add(self._route_row(session_id, routes[route_id]))
+        if changes.routes_added:
+            db_session.flush()  # FK das paradas
+        
+        rewrite = set(changes.routes_added) | changes.routes_relocated | {
+            route_id for route_id, fields in changes.route_fields.items() if 'optimized_order' in fields
+        }
+        updates = []
+        for route_id in rewrite:
+            # Rota nova, reordenada/transferida ou com endereço alterado: regrava as paradas dela
+            if route_id not in changes.routes_added:
+                self._delete_stops(db_session, StopPackageDB.route_id == route_id, StopDB.route_id == route_id)
+            self._insert_stops(db_session, session_id, routes[route_id].optimized_order, route_id=route_id)
+        for route_id, points in changes.route_points.items():
+            if route_id not in rewrite:
+                updates.extend((None, route_id, idx, point) for idx, point in points.items())
+        self._update_stop_packages(db_session, updates)
+        
+        for route_id, values in changes.route_fields.items():
+            values = {k: v for k, v in values.items() if k != 'optimized_order'}
+            if values:
+                db_session.query(RouteDB).filter_by(id=route_id).update(values, synchronize_session=False)
+        
+        if changes.packages:
+            self._save_packages(db_session, session, [
+                (route, p) for route in session.routes for p in route.optimized_order
+                if changes.packages.get(p.package_id) == route.id
+            ])
+    
+    # ==================== PARADAS (romaneios / stops / stop_packages) ====================
+    
+    @staticmethod
+    def _delete_stops(db_session, packages_filter, stops_filter):
+        db_session.query(StopPackageDB).filter(packages_filter).delete(synchronize_session=False)
+        db_session.query(StopDB).filter(stops_filter).delete(synchronize_session=False)
+    
+    def _insert_romaneios(self, db_session, session: DailySession):
+        """Insere os romaneios da sessão (um INSERT ... RETURNING) e as paradas de cada um"""
+        if not session.romaneios:
+            return
+        pks = db_session.execute(
+            insert(RomaneioDB).returning(RomaneioDB.id, sort_by_parameter_order=True),
+            [
+                {
+                    'session_id': session.session_id,
+                    'romaneio_id': r.id,
+                    'filename': r.filename,
+                    'uploaded_at': r.uploaded_at,
+                    'position': position
+                }
+                for position, r in enumerate(session.romaneios)
+            ]
+        ).scalars().all()
+        for pk, romaneio in zip(pks, session.romaneios):
+            self._insert_stops(db_session, session.session_id, romaneio.points, romaneio_pk=pk)
+    
+    @staticmethod
+    def _insert_stops(db_session, session_id: str, points: List, romaneio_pk: Optional[int] = None,
+                      route_id: Optional[str] = None):
+        """Grava a lista de pontos como paradas + pacotes (2 INSERTs, ordem preservada)"""
+        stops = group_stops([point_to_dict(p) for p in points])
+        if not stops:
+            return
+        container = {'session_id': session_id, 'romaneio_pk': romaneio_pk, 'route_id': route_id}
+        stop_ids = db_session.execute(
+            insert(StopDB).returning(StopDB.id, sort_by_parameter_order=True),
+            [{**container, 'sequence': sequence, **stop} for sequence, (stop, _) in enumerate(stops)]
+        ).scalars().all()
+        db_session.execute(insert(StopPackageDB), [
+            {**container, 'stop_id': stop_id, 'position': position, **package}
+            for stop_id, (_, packages) in zip(stop_ids, stops)
+            for position, package in packages
+        ])
+    
+    @staticmethod
+    def _update_stop_packages(db_session, updates: List):
+        """
+        Atualiza pacotes pela posição no romaneio/rota (executemany, uma instrução).
+        updates: [(romaneio_pk, route_id, posição, ponto)]
+        """
+        if not updates:
+            return
+        table = StopPackageDB.__table__
+        by_romaneio = [u for u in updates if u[0] is not None]
+        by_route = [u for u in updates if u[0] is None]
+        values = {f: bindparam(f'v_{f}') for f in STOP_PACKAGE_FIELDS}
+        for rows, container_filter in (
+            (by_romaneio, table.c.romaneio_pk == bindparam('b_romaneio_pk')),
+            (by_route, table.c.route_id == bindparam('b_route_id')),
+        ):
+            if not rows:
+                continue
+            stmt = update(table).where(container_filter, table.c.position == bindparam('b_position')).values(values)
+            db_session.connection().execute(stmt, [
+                {
+                    'b_romaneio_pk': romaneio_pk,
+                    'b_route_id': route_id,
+                    'b_position': position,
+                    **{f'v_{f}': point.get(f) for f in STOP_PACKAGE_FIELDS}
+                }
+                for romaneio_pk, route_id, position, point in rows
+            ])
+    
+    def _load_stops_db(self, db_session, session_id: str) -> Tuple[List[Romaneio], Dict[str, List[DeliveryPoint]]]:
+        """Lê romaneios e pontos das rotas das tabelas normalizadas (1 query para todos os pontos)"""
+        romaneio_rows = db_session.query(RomaneioDB).filter_by(
+            session_id=session_id
+        ).order_by(RomaneioDB.position).all()
+        
+        rows = db_session.query(
+            StopPackageDB.romaneio_pk, StopPackageDB.route_id,
+            *(getattr(StopPackageDB, f) for f in STOP_PACKAGE_FIELDS),
+            *(getattr(StopDB, f) for f in STOP_FIELDS)
+        ).join(StopDB, StopPackageDB.stop_id == StopDB.id).filter(
+            StopPackageDB.session_id == session_id
+        ).order_by(StopPackageDB.position).all()
+        
+        by_romaneio: Dict[int, List[DeliveryPoint]] = {}
+        by_route: Dict[str, List[DeliveryPoint]] = {}
+        for row in rows:
+            point = self._point_from_dict(row._asdict())
+            if row.romaneio_pk is not None:
+                by_romaneio.setdefault(row.romaneio_pk, []).append(point)
+            else:
+                by_route.setdefault(row.route_id, []).append(point)
+        
+        romaneios = [
+            Romaneio(
+                id=r.romaneio_id,
+                filename=r.filename or '',
+                uploaded_at=r.uploaded_at,
+                points=by_romaneio.get(r.id, [])
+            )
+            for r in romaneio_rows
+        ]
+        return romaneios, by_route
+    
+    @staticmethod
+    def _package_rows(session: DailySession, items: List, delivered_at: Optional[datetime]) -> Dict[str, Dict]:
+        """Linhas do PackageDB dos (rota, ponto). Mesmo package_id repetido: vale o último"""
+        rows = {}
+        for route, p in items:
+            status = getattr(p, 'status', 'pending')
+            rows[p.package_id] = {
+                'id': p.package_id,
+                'session_id': session.session_id,
+                'romaneio_id': p.romaneio_id,
+                'route_id': route.id,
+                'address': p.address,
+                'lat': p.lat,
+                'lng': p.lng,
+                'priority': p.priority,
+                'status': status,
+                'failure_reason': getattr(p, 'failure_reason', None),
+                'status_detail': getattr(p, 'status_detail', None),
+                'assigned_to_telegram_id': route.assigned_to_telegram_id,
+                'delivered_at': delivered_at if status == 'delivered' else None
+            }
+        return rows
+    
+    @staticmethod
+    def _package_signature(row: Dict) -> Tuple:
+        return tuple(v for k, v in row.items() if k != 'delivered_at')
+    
+    def _save_packages(self, db_session, session: DailySession, items: List):
+        """
+        Salva/Atualiza pacotes individuais para análise no snapshot (set-based):
+        um INSERT ... ON CONFLICT DO UPDATE por lote, em vez de SELECT + INSERT/UPDATE
+        por pacote. Round-trips por save: O(n) → O(1) (lotes de PACKAGE_UPSERT_BATCH).
+        Linhas que os eventos já gravaram (append_event) e não mudaram depois ficam de fora.
+        """
+        synced = self._synced_packages.pop(session.session_id, {})
+        rows = self._package_rows(session, items, datetime.now())
+        values = [row for package_id, row in rows.items()
+                  if self._package_signature(row) != synced.get(package_id)]
+        # delivered_at do snapshot só vale para entrega que não passou por evento
+        self._upsert_packages(db_session, values, keep_delivered_at=True)
+    
+    def _upsert_packages(self, db_session, values: List[Dict], keep_delivered_at: bool):
+        """
+        keep_delivered_at: mantém a data de entrega já gravada (snapshot, transferência);
+        senão a linha traz a data do evento (entregue) ou a limpa (falha/devolução)
+        """
+        if not values:
+            return
+        
+        # Rotas/sessão novas precisam existir antes por causa das FKs
+        db_session.flush()
+        
+        dialect_insert = sqlite_insert if db_session.bind.dialect.name == 'sqlite' else pg_insert
+        for i in range(0, len(values), self.package_upsert_batch):
+            stmt = dialect_insert(PackageDB).values(values[i:i + self.package_upsert_batch])
+            delivered_at = stmt.excluded.delivered_at
+            if keep_delivered_at:
+                delivered_at = func.coalesce(PackageDB.delivered_at, delivered_at)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[PackageDB.id],
+                set_={
+                    'status': stmt.excluded.status,
+                    'failure_reason': stmt.excluded.failure_reason,
+                    'status_detail': stmt.excluded.status_detail,
+                    'route_id': stmt.excluded.route_id,
+                    'assigned_to_telegram_id': stmt.excluded.assigned_to_telegram_id,
+                    'delivered_at': delivered_at
+                }
+            )
+            db_session.execute(stmt)
+    
+    def _save_event_packages(self, db_session, session: DailySession, event: SessionEvent):
+        """
+        Linhas do PackageDB que o evento altera, na transação do próprio evento.
+        delivered_at = created_at do evento (não o horário do snapshot).
+        """
+        if event.type == EventType.REORDERED:
+            return
+        is_transfer = event.type == EventType.TRANSFERRED
+        route = session.get_route(event.data.get('to_route') if is_transfer else event.route_id)
+        if route is None:
+            return
+        keys = set(event.data.get('point_keys') or ()) or None
+        items = [(route, p) for package_id in dict.fromkeys(event.package_ids)
+                 for p in route.points_of(package_id, keys)]
+        rows = self._package_rows(session, items, None if is_transfer else event.created_at)
+        if not rows:
+            return
+        try:
+            # Savepoint: sessão/rota nova ainda no write-behind (FK) não derruba o evento;
+            # o snapshot grava essas linhas depois
+            with db_session.begin_nested():
+                self._upsert_packages(db_session, list(rows.values()), keep_delivered_at=is_transfer)
+        except Exception as e:
+            print(f"⚠️ Pacotes do evento {event.type.value} ficam para o snapshot: {e}")
+            return
+        synced = self._synced_packages.setdefault(session.session_id, {})
+        for package_id, row in rows.items():
+            synced[package_id] = self._package_signature(row)
+    
+    # ==================== JSON (FALLBACK) ====================
+    
+    def _journal_file(self, session_id: str) -> Path:
+        """Journal de patches da sessão (append-only, aplicado sobre o arquivo base)"""
+        return self.sessions_dir / f"{session_id}.journal.jsonl"
+    
+    def _save_to_json(self, session: DailySession):
+        """
+        Mudanças de pontos/rotas viram uma linha no journal (centenas de bytes).
+        Mudanças estruturais, de cabeçalho ou journal grande → reescreve o arquivo.
+        """
+        session_id = session.session_id
+        changes, snapshot = diff_session(self._snapshots['json'].get(session_id), session)
+        if changes.is_empty:
+            self._write_header_json(session)
+            return
+        
+        # Garante que diretório existe
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        
+        if (changes.is_structural or set(changes.header) - JOURNAL_HEADER_FIELDS
+                or self._journal_lines.get(session_id, 0) >= self.journal_compact_every):
             # AVISO em produção
             if os.getenv("RAILWAY_ENVIRONMENT"):
                 print(f"🚨 SALVANDO EM JSON LOCAL: {session.session_name}")
                 print("   Isso será PERDIDO no próximo deploy!")
             
-            data = {
-                'session_id': session.session_id,
-                'session_name': session.session_name,
-                'date': session.date,
-                'period': session.period,
-                'created_at': session.created_at.isoformat(),
-                'base_address': session.base_address,
-                'base_lat': session.base_lat,
-                'base_lng': session.base_lng,
-                'is_finalized': session.is_finalized,
-                'finalized_at': session.finalized_at.isoformat() if session.finalized_at else None,
-                'current_step': session.current_step,
-                'romaneios': [
-                    {
-                        'id': r.id,
-                        'filename': r.filename,
-                        'uploaded_at': r.uploaded_at.isoformat(),
-                        'points': [
-                            {
-                                'package_id': p.package_id,
-                                'romaneio_id': p.romaneio_id,
-                                'address': p.address,
-                                'lat': p.lat,
-                                'lng': p.lng,
-                                'priority': p.priority,
-                                'status': getattr(p, 'status', 'pending'),
-                                'failure_reason': getattr(p, 'failure_reason', None),
-                                'status_detail': getattr(p, 'status_detail', None)
-                            } for p in r.points
-                        ]
-                    } for r in session.romaneios
-                ],
-                'routes': [
-                    {
-                        'id': r.id,
-                        'assigned_to_telegram_id': r.assigned_to_telegram_id,
-                        'assigned_to_name': r.assigned_to_name,
-                        'color': r.color,
-                        'optimized_order': [
-                            {
-                                'package_id': p.package_id,
-                                'romaneio_id': p.romaneio_id,
-                                'address': p.address,
-                                'lat': p.lat,
-                                'lng': p.lng,
-                                'priority': p.priority,
-                                'status': getattr(p, 'status', 'pending'),
-                                'failure_reason': getattr(p, 'failure_reason', None),
-                                'status_detail': getattr(p, 'status_detail', None)
-                            } for p in r.optimized_order
-                        ],
-                        'delivered_packages': r.delivered_packages,
-                        'map_file': r.map_file
-                    } for r in session.routes
-                ]
+            # Snapshot binário atômico; o JSON legado deixa de ser a base
+            snapshot_format.dump(self._session_file(session_id), self._session_to_dict(session))
+            self._legacy_session_file(session_id).unlink(missing_ok=True)
+            self._journal_file(session_id).unlink(missing_ok=True)
+            self._journal_lines[session_id] = 0
+        else:
+            entry = {
+                'ts': datetime.now().isoformat(),
+                'session': changes.header,
+                'romaneio_points': {
+                    str(ri): {str(pi): point for pi, point in points.items()}
+                    for ri, points in changes.romaneio_points.items()
+                },
+                'routes': {
+                    route_id: {
+                        'fields': changes.route_fields.get(route_id, {}),
+                        'points': {str(idx): point for idx, point in changes.route_points.get(route_id, {}).items()}
+                    }
+                    for route_id in set(changes.route_fields) | set(changes.route_points)
+                }
             }
-            
-            file_path = self._session_file(session.session_id)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"❌ Erro ao salvar sessão {session.session_id}: {e}")
-            import traceback
-            traceback.print_exc()
+            with open(self._journal_file(session_id), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal_lines[session_id] = self._journal_lines.get(session_id, 0) + 1
+        
+        self._snapshots['json'][session_id] = snapshot
+        self._write_header_json(session)
+    
+    def _apply_journal(self, data: Dict) -> int:
+        """Aplica os patches do journal sobre o dict do arquivo base. Retorna nº de linhas"""
+        journal = self._journal_file(data['session_id'])
+        if not journal.exists():
+            return 0
+        
+        routes = {r['id']: r for r in data.get('routes', [])}
+        applied = 0
+        with open(journal, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Linha truncada (crash no meio do append): ignora o resto
+                data.update(entry.get('session', {}))
+                for ri, points in entry.get('romaneio_points', {}).items():
+                    for pi, point in points.items():
+                        data['romaneios'][int(ri)]['points'][int(pi)] = point
+                for route_id, patch in entry.get('routes', {}).items():
+                    route = routes.get(route_id)
+                    if route is None:
+                        continue
+                    route.update(patch.get('fields', {}))
+                    for idx, point in patch.get('points', {}).items():
+                        route['optimized_order'][int(idx)] = point
+                applied += 1
+        return applied
+    
+    def release(self, session_id: str):
+        """Descarta a linha de base de change tracking (sessão saiu da memória)"""
+        for snapshots in self._snapshots.values():
+            snapshots.pop(session_id, None)
+        self._journal_lines.pop(session_id, None)
+        self._synced_packages.pop(session_id, None)
+    
+    def _forget(self, session_id: str):
+        """Descarta todo o estado da sessão excluída (inclui o cabeçalho do índice)"""
+        self.release(session_id)
+        self._headers.pop(session_id, None)
+        if self._headers_file().exists():
+            with open(self._headers_file(), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'session_id': session_id, 'deleted': True}) + "\n")
+    
+    # ==================== CABEÇALHOS ====================
+    
+    def _headers_file(self) -> Path:
+        """Índice de cabeçalhos do modo JSON (append-only, vale a última linha de cada sessão)"""
+        return self.sessions_dir / "_headers.jsonl"
+    
+    def _write_header_json(self, session: DailySession):
+        header = SessionHeader.from_session(session).to_dict()
+        if header == self._headers.get(session.session_id):
+            return
+        with open(self._headers_file(), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        self._headers[session.session_id] = header
+    
+    def list_headers(self) -> List[SessionHeader]:
+        """Cabeçalhos de todas as sessões, sem carregar romaneios/rotas (mais recentes primeiro)"""
+        if not self.using_database:
+            self._check_database_connection()
+        
+        with self._lock:
+            headers = None
+            if self.using_database:
+                try:
+                    headers = self._list_headers_db()
+                except Exception as e:
+                    print(f"⚠️ Erro ao listar cabeçalhos do PostgreSQL: {e}, usando JSON")
+            if headers is None:
+                headers = self._list_headers_json()
+        
+        headers.sort(key=lambda h: h.created_at or datetime.min, reverse=True)
+        return headers
+    
+    def _list_headers_db(self) -> List[SessionHeader]:
+        with db_manager.get_session() as db_session:
+            rows = db_session.query(SessionDB.session_id, SessionDB.summary).all()
+        
+        headers = []
+        for session_id, summary in rows:
+            if not summary:
+                # Sessão anterior à coluna summary: calcula uma vez e grava
+                session = self.load_session(session_id)
+                if session is None:
+                    continue
+                summary = SessionHeader.from_session(session).to_dict()
+                self.release(session_id)
+                with db_manager.get_session() as db_session:
+                    db_session.query(SessionDB).filter_by(session_id=session_id).update(
+                        {'summary': summary}, synchronize_session=False
+                    )
+            self._headers[session_id] = summary
+            headers.append(SessionHeader.from_dict(summary))
+        return headers
+    
+    def _list_headers_json(self) -> List[SessionHeader]:
+        index: Dict[str, Dict] = {}
+        lines = 0
+        path = self._headers_file()
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Linha truncada (crash no meio do append)
+                    lines += 1
+                    if entry.get('deleted'):
+                        index.pop(entry['session_id'], None)
+                    else:
+                        index[entry['session_id']] = entry
+        
+        # Arquivo é a fonte da verdade: descarta órfãos e indexa sessões antigas
+        on_disk = set(self._session_ids_on_disk())
+        index = {sid: entry for sid, entry in index.items() if sid in on_disk}
+        for session_id in sorted(on_disk - set(index)):
+            try:
+                session = self.load_session(session_id)
+            except Exception as e:
+                print(f"⚠️ Erro ao indexar sessão {session_id}: {e}")
+                continue
+            if session is None:
+                continue
+            index[session_id] = SessionHeader.from_session(session).to_dict()
+            self.release(session_id)
+            lines = -1  # Força regravar o índice
+        
+        if lines < 0 or lines > 2 * len(index) + 50:
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for entry in index.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp, path)
+        
+        self._headers.update(index)
+        return [SessionHeader.from_dict(entry) for entry in index.values()]
+    
+    # ==================== EVENTOS ====================
+    
+    def append_event(self, event: SessionEvent, session: Optional[DailySession] = None) -> SessionEvent:
+        """
+        Registra um evento no log (append O(1), sem regravar a sessão). No PostgreSQL,
+        com a sessão já com o evento aplicado, as linhas do PackageDB afetadas vão na
+        mesma transação: analytics, streaks e get_delivery_days não esperam o snapshot.
+        """
+        if self.using_database:
+            try:
+                # Mesmo lock do save: o snapshot não intercala um status antigo no PackageDB
+                with self._lock, db_manager.get_session() as db_session:
+                    event = self.events.append(event, use_database=True, db_session=db_session)
+                    if session is not None:
+                        self._save_event_packages(db_session, session, event)
+                return event
+            except Exception as e:
+                print(f"⚠️ Erro ao gravar evento no PostgreSQL: {e}, usando fallback JSON")
+                self.using_database = False
+        return self.events.append(event, use_database=False)
+    
+    def get_timeline(self, session_id: str, limit: Optional[int] = None) -> List[SessionEvent]:
+        """Linha do tempo de auditoria da sessão"""
+        return self.events.timeline(session_id, self.using_database, limit)
     
     def load_session(self, session_id: str) -> Optional[DailySession]:
-        """Carrega sessão do PostgreSQL ou disco"""
+        """Carrega sessão: último snapshot + eventos gravados depois dele"""
+        session = self._load_snapshot(session_id)
+        if session is None:
+            return None
+        
+        try:
+            events = self.events.since(session_id, session.event_seq, self.using_database)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler eventos da sessão {session_id}: {e}")
+            events = []
+        
+        for event in events:
+            apply_event(session, event)
+            session.event_seq = event.seq
+        if events:
+            print(f"📜 Sessão {session_id}: {len(events)} evento(s) reaplicado(s) sobre o snapshot")
+        return session
+    
+    def _load_snapshot(self, session_id: str) -> Optional[DailySession]:
+        """Carrega o snapshot da sessão do PostgreSQL ou disco"""
         if self.using_database:
             # Carrega do PostgreSQL
             try:
@@ -305,47 +823,35 @@ class SessionStore:
                     if not session_db:
                         return None
                     
+                    # Sessão ainda no formato antigo (JSON): converte no próximo save
+                    legacy = session_db.romaneios_data is not None
+                    
                     # Reconstrói romaneios
-                    romaneios = []
-                    for r_data in (session_db.romaneios_data or []):
-                        points = [
-                            DeliveryPoint(
-                                package_id=p['package_id'],
-                                romaneio_id=p['romaneio_id'],
-                                address=p['address'],
-                                lat=p['lat'],
-                                lng=p['lng'],
-                                priority=p.get('priority', 'normal'),
-                                bairro=p.get('bairro', ''),
-                                status=p.get('status', 'pending'),
-                                failure_reason=p.get('failure_reason'),
-                                status_detail=p.get('status_detail')
-                            ) for p in r_data['points']
-                        ]
-                        romaneios.append(Romaneio(
-                            id=r_data['id'],
-                            filename=r_data.get('filename', ''),
-                            uploaded_at=datetime.fromisoformat(r_data['uploaded_at']),
-                            points=points
-                        ))
+                    if legacy:
+                        romaneios = []
+                        for r_data in session_db.romaneios_data:
+                            points = [
+                                self._point_from_dict(p) for p in r_data['points']
+                            ]
+                            romaneios.append(Romaneio(
+                                id=r_data['id'],
+                                filename=r_data.get('filename', ''),
+                                uploaded_at=datetime.fromisoformat(r_data['uploaded_at']),
+                                points=points
+                            ))
+                        route_points = {}
+                    else:
+                        romaneios, route_points = self._load_stops_db(db_session, session_id)
                     
                     # Reconstrói rotas
                     routes = []
                     for route_db in session_db.routes:
-                        optimized = [
-                            DeliveryPoint(
-                                package_id=p['package_id'],
-                                romaneio_id=p['romaneio_id'],
-                                address=p['address'],
-                                lat=p['lat'],
-                                lng=p['lng'],
-                                priority=p.get('priority', 'normal'),
-                                bairro=p.get('bairro', ''),
-                                status=p.get('status', 'pending'),
-                                failure_reason=p.get('failure_reason'),
-                                status_detail=p.get('status_detail')
-                            ) for p in (route_db.optimized_order or [])
-                        ]
+                        if legacy:
+                            optimized = [
+                                self._point_from_dict(p) for p in (route_db.optimized_order or [])
+                            ]
+                        else:
+                            optimized = route_points.get(route_db.id, [])
                         
                         route = Route(
                             id=route_db.id,
@@ -359,7 +865,7 @@ class SessionStore:
                         )
                         routes.append(route)
                     
-                    return DailySession(
+                    session = DailySession(
                         session_id=session_db.session_id,
                         session_name=session_db.session_name or '',
                         date=session_db.date,
@@ -372,36 +878,29 @@ class SessionStore:
                         routes=routes,
                         is_finalized=session_db.is_finalized,
                         finalized_at=session_db.finalized_at,
-                        current_step=session_db.current_step or 'idle'
+                        current_step=session_db.current_step or 'idle',
+                        event_seq=session_db.event_seq or 0
                     )
+                    if not legacy:
+                        # Sem linha de base, o próximo save é completo (migra para as tabelas)
+                        self._snapshots['db'][session.session_id] = SessionSnapshot.capture(session)
+                    return session
             except Exception as e:
                 print(f"⚠️ Erro ao carregar sessão do PostgreSQL: {e}, tentando JSON")
         
-        # Fallback: JSON
-        file_path = self._session_file(session_id)
-        
-        if not file_path.exists():
+        # Fallback: arquivo (snapshot binário ou JSON legado)
+        data = self._read_session_data(session_id)
+        if data is None:
             return None
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Patches incrementais gravados depois do último arquivo completo
+        self._journal_lines[session_id] = self._apply_journal(data)
         
         # Reconstrói objetos
         romaneios = []
         for r_data in data.get('romaneios', []):
             points = [
-                DeliveryPoint(
-                    package_id=p['package_id'],
-                    romaneio_id=p['romaneio_id'],
-                    address=p['address'],
-                    lat=p['lat'],
-                    lng=p['lng'],
-                    priority=p.get('priority', 'normal'),
-                    bairro=p.get('bairro', ''),
-                    status=p.get('status', 'pending'),
-                    failure_reason=p.get('failure_reason'),
-                    status_detail=p.get('status_detail')
-                ) for p in r_data['points']
+                self._point_from_dict(p) for p in r_data['points']
             ]
             romaneios.append(Romaneio(
                 id=r_data['id'],
@@ -413,18 +912,7 @@ class SessionStore:
         routes = []
         for r_data in data.get('routes', []):
             optimized = [
-                DeliveryPoint(
-                    package_id=p['package_id'],
-                    romaneio_id=p['romaneio_id'],
-                    address=p['address'],
-                    lat=p['lat'],
-                    lng=p['lng'],
-                    priority=p.get('priority', 'normal'),
-                    bairro=p.get('bairro', ''),
-                    status=p.get('status', 'pending'),
-                    failure_reason=p.get('failure_reason'),
-                    status_detail=p.get('status_detail')
-                ) for p in r_data['optimized_order']
+                self._point_from_dict(p) for p in r_data['optimized_order']
             ]
             
             route = Route(
@@ -452,8 +940,10 @@ class SessionStore:
             routes=routes,
             is_finalized=data.get('is_finalized', False),
             finalized_at=datetime.fromisoformat(data['finalized_at']) if data.get('finalized_at') else None,
-            current_step=data.get('current_step', 'idle')
+            current_step=data.get('current_step', 'idle'),
+            event_seq=data.get('event_seq', 0)
         )
+        self._snapshots['json'][session.session_id] = SessionSnapshot.capture(session)
         
         return session
     
@@ -476,7 +966,7 @@ class SessionStore:
                             'created_at': s.created_at,
                             'is_finalized': s.is_finalized,
                             'base_address': s.base_address,
-                            'total_packages': sum(len(r['points']) for r in (s.romaneios_data or [])),
+                            'total_packages': (s.summary or {}).get('total_packages', 0),
                             'num_routes': db_session.query(RouteDB).filter_by(session_id=s.session_id).count()
                         })
                     
@@ -485,16 +975,12 @@ class SessionStore:
             except Exception as e:
                 print(f"⚠️ Erro ao listar sessões do PostgreSQL: {e}")
         
-        # Fallback: JSON
+        # Fallback: arquivos
         try:
-            if not self.sessions_dir.exists():
-                return []
-            
-            for file_path in self.sessions_dir.glob("*.json"):
+            for session_id in self._session_ids_on_disk():
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
+                    data = self._read_session_data(session_id)
+                    
                     sessions.append({
                         'session_id': data['session_id'],
                         'session_name': data.get('session_name', ''),
@@ -507,7 +993,7 @@ class SessionStore:
                         'num_routes': len(data.get('routes', []))
                     })
                 except Exception as e:
-                    print(f"⚠️ Erro ao carregar {file_path}: {e}")
+                    print(f"⚠️ Erro ao carregar sessão {session_id}: {e}")
                     continue
             
             sessions.sort(key=lambda x: x['created_at'], reverse=True)
@@ -538,23 +1024,18 @@ class SessionStore:
             except Exception as e:
                 print(f"⚠️ Erro ao carregar sessões do PostgreSQL: {e}")
         
-        # Fallback: JSON
+        # Fallback: arquivos
         try:
-            if not self.sessions_dir.exists():
-                return []
-            
-            for file_path in self.sessions_dir.glob("*.json"):
+            for session_id in self._session_ids_on_disk():
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    session = self.load_session(data['session_id'])
+                    session = self.load_session(session_id)
                     if session:
                         sessions.append(session)
                 except Exception as e:
-                    print(f"⚠️ Erro ao carregar {file_path}: {e}")
+                    print(f"⚠️ Erro ao carregar sessão {session_id}: {e}")
                     continue
             
-            print(f"✅ {len(sessions)} sessões carregadas do JSON")
+            print(f"✅ {len(sessions)} sessões carregadas do disco")
             return sessions
         except Exception as e:
             print(f"⚠️ Erro ao carregar sessões: {e}")
@@ -579,11 +1060,12 @@ class SessionStore:
                 print(f"⚠️ Erro ao deletar sessão do PostgreSQL: {e}")
         
         # Deleta do JSON também (se existir)
-        file_path = self._session_file(session_id)
-        if file_path.exists():
-            file_path.unlink()
+        self._forget(session_id)
+        self._journal_file(session_id).unlink(missing_ok=True)
+        self.events.delete(session_id)
+        if self._unlink_session_files(session_id):
             deleted = True
-            print(f"✅ Sessão {session_id} deletada do JSON")
+            print(f"✅ Sessão {session_id} deletada do disco")
         
         return deleted
 
@@ -0,0 +1,121 @@
+"""
+📦 SNAPSHOTS BINÁRIOS - Formato compacto do fallback em arquivo
+Cabeçalho versionado (magic + versão + codec + compressão + tamanho + CRC32)
+seguido do payload JSON compacto (orjson quando instalado), opcionalmente
+comprimido com zstd. Gravação atômica: arquivo temporário + fsync + os.replace.
+Arquivos JSON legados (indent=2, sem cabeçalho) continuam legíveis.
+"""
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MAGIC = b'MDSN'
+VERSION = 1
+# magic, versão, codec, compressão, (reservado), tamanho do payload, crc32 do payload
+HEADER = struct.Struct('<4sBBBxII')
+
+CODEC_JSON = 0  # JSON UTF-8 compacto (orjson e json da stdlib geram o mesmo formato)
+COMPRESSION_NONE = 0
+COMPRESSION_ZSTD = 1
+COMPRESSIONS = {'none': COMPRESSION_NONE, 'zstd': COMPRESSION_ZSTD}
+
+SUFFIX = '.snap'
+
+
+class SnapshotError(ValueError):
+    """Snapshot truncado, corrompido ou de versão/formato desconhecido"""
+
+
+def _compression_from_env() -> int:
+    name = os.getenv("SNAPSHOT_COMPRESSION", "none").lower()
+    compression = COMPRESSIONS.get(name, COMPRESSION_NONE)
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        print("⚠️ SNAPSHOT_COMPRESSION=zstd mas o pacote zstandard não está instalado, gravando sem compressão")
+        return COMPRESSION_NONE
+    return compression
+
+
+DEFAULT_COMPRESSION = _compression_from_env()
+
+
+def dumps_json(data: Any) -> bytes:
+    """JSON compacto em bytes (orjson se disponível)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode(data: Any, compression: Optional[int] = None) -> bytes:
+    """Serializa para o formato de snapshot (cabeçalho + payload)"""
+    if compression is None:
+        compression = DEFAULT_COMPRESSION
+    payload = dumps_json(data)
+    if compression == COMPRESSION_ZSTD:
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    return HEADER.pack(MAGIC, VERSION, CODEC_JSON, compression, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(raw: bytes) -> Any:
+    """Lê snapshot binário ou JSON legado"""
+    if not raw.startswith(MAGIC):
+        return loads_json(raw)  # JSON legado (texto)
+
+    if len(raw) < HEADER.size:
+        raise SnapshotError("cabeçalho truncado")
+    _, version, codec, compression, length, crc = HEADER.unpack_from(raw)
+    if version > VERSION:
+        raise SnapshotError(f"versão {version} não suportada (máx {VERSION})")
+    if codec != CODEC_JSON:
+        raise SnapshotError(f"codec {codec} desconhecido")
+
+    payload = raw[HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise SnapshotError("payload truncado ou corrompido")
+
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise SnapshotError("snapshot comprimido com zstd, mas o pacote zstandard não está instalado")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif compression != COMPRESSION_NONE:
+        raise SnapshotError(f"compressão {compression} desconhecida")
+    return loads_json(payload)
+
+
+def write_atomic(path: Path, raw: bytes):
+    """Grava num temporário do mesmo diretório e troca com os.replace (nunca deixa arquivo pela metade)"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def dump(path: Path, data: Any, compression: Optional[int] = None):
+    write_atomic(path, encode(data, compression))
+
+
+def load(path: Path) -> Any:
+    with open(path, 'rb') as f:
+        return decode(f.read())
@@ -56,6 +56,14 @@ async def lifespan(app: FastAPI):
     """Controla inicialização e deslocamento do sistema"""
     print("🚀 Iniciando BotEntregador V2...")
     
+    # 0. Broker pub/sub: tempo real (mapa, dashboard) entre workers
+    from bot_multidelivery.services.broker import broker
+    from bot_multidelivery.services.dashboard_service import dashboard_ws
+    from bot_multidelivery.session import session_manager
+    await broker.start()
+    session_manager.enable_sync(broker)
+    session_manager.add_event_listener(dashboard_ws.on_session_event)
+    
     # 1. Inicializa App do Telegram
     bot_app = get_telegram_app()
     if bot_app:
@@ -75,9 +83,20 @@ async def lifespan(app: FastAPI):
 
     # 3. Desligamento Limpo
     print("🛑 Desligando sistema...")
+    try:
+        from bot_multidelivery.session import session_manager
+        session_manager.flush_pending()
+    except Exception as e:
+        print(f"⚠️ Erro ao gravar sessões pendentes: {e}")
+    try:
+        from bot_multidelivery.services.gps_tracker import gps_tracker
+        gps_tracker.flush()
+    except Exception as e:
+        print(f"⚠️ Erro ao gravar trilhas GPS pendentes: {e}")
     if bot_app:
         await bot_app.stop()
         await bot_app.shutdown()
+    await broker.stop()
 
 # Reaplica lifespan ao app existente (definido em web_scanner.py)
 scanner_app.router.lifespan_context = lifespan
@@ -0,0 +1,93 @@
+"""
+📊 BENCHMARK - Ingestão de GPS dos entregadores
+Simula N entregadores andando pela cidade, cada um mandando um fix a cada
+BENCH_FIX_S segundos em lotes de BENCH_BATCH_S segundos, e mede o tempo de CPU
+da ingestão (validação + buffer + redução da trilha + envio limitado ao mapa).
+A gravação da trilha é substituída por um contador (só CPU da ingestão).
+
+Uso:
+    python scripts/benchmark_gps_ingest.py
+    BENCH_DELIVERERS=200 BENCH_MINUTES=120 python scripts/benchmark_gps_ingest.py
+"""
+import math
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bot_multidelivery.services.gps_tracker import GpsTracker, GpsFix
+
+
+class CountingLog:
+    """No lugar do TrackLog: conta lotes/pontos sem tocar em disco/banco"""
+
+    def __init__(self):
+        self.chunks = 0
+        self.points = 0
+
+    def append(self, session_id, route_id, telegram_id, points):
+        self.chunks += 1
+        self.points += len(points)
+
+
+def walk(rng: random.Random, lat: float, lng: float, t0: float, fixes: int, every_s: float):
+    """Trajeto de moto/bike: ~5 m/s com curvas, paradas nas entregas e ruído de GPS"""
+    heading = rng.uniform(0, 2 * math.pi)
+    out = []
+    for i in range(fixes):
+        stopped = (i // 20) % 4 == 3  # parado em uma entrega
+        speed = 0.0 if stopped else rng.uniform(3, 8)
+        heading += rng.gauss(0, 0.3)
+        step = speed * every_s
+        lat += step * math.cos(heading) / 111_320
+        lng += step * math.sin(heading) / (111_320 * math.cos(math.radians(lat)))
+        noise = rng.gauss(0, 4) / 111_320
+        out.append(GpsFix(t0 + i * every_s, lat + noise, lng + noise, rng.uniform(5, 30), speed, math.degrees(heading) % 360))
+    return out
+
+
+def main():
+    deliverers = int(os.getenv("BENCH_DELIVERERS", "50"))
+    minutes = float(os.getenv("BENCH_MINUTES", "60"))
+    every_s = float(os.getenv("BENCH_FIX_S", "3"))
+    batch_s = float(os.getenv("BENCH_BATCH_S", "5"))
+    rng = random.Random(42)
+
+    per_deliverer = int(minutes * 60 / every_s)
+    t0 = time.time() - minutes * 60
+    tracks = [walk(rng, -23.55 + rng.uniform(-0.1, 0.1), -46.63 + rng.uniform(-0.1, 0.1), t0, per_deliverer, every_s)
+              for _ in range(deliverers)]
+    per_batch = max(1, round(batch_s / every_s))
+
+    tracker = GpsTracker()
+    tracker._log = CountingLog()
+    clock = [0.0]
+    simulated = SimpleNamespace(monotonic=lambda: clock[0], time=time.time)
+    with mock.patch("bot_multidelivery.services.gps_tracker.time", simulated):
+        start = time.process_time()
+        for offset in range(0, per_deliverer, per_batch):
+            clock[0] = (offset + per_batch) * every_s  # tempo simulado (envio limitado)
+            for d, fixes in enumerate(tracks):
+                tracker.ingest("bench", f"route_{d}", d + 1, fixes[offset:offset + per_batch], f"Entregador {d}")
+        cpu_s = time.process_time() - start
+        tracker.flush()
+
+    total = deliverers * per_deliverer
+    stats = tracker.stats()
+    print(f"🛵 {deliverers} entregadores × {minutes:.0f} min, 1 fix/{every_s:.0f}s, lote de {batch_s:.0f}s: {total} fixes")
+    print(f"⏱️  CPU total {cpu_s * 1000:.0f} ms | {cpu_s / total * 1e6:.1f} µs/fix | "
+          f"{cpu_s / (minutes * 60) * 100:.3f}% de um núcleo")
+    print(f"📡 posições enviadas ao mapa: {stats['broadcasts']} ({stats['broadcasts'] / total:.0%} dos fixes)")
+    print(f"💾 trilha gravada: {tracker._log.points} pontos em {tracker._log.chunks} lotes "
+          f"({tracker._log.points / total:.0%} dos fixes)")
+    print(f"🧠 em memória: {stats['fixes_in_memory']} fixes (buffer de {tracker.ring_size} por entregador)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+📊 BENCHMARK - Clusters do mapa no servidor
+Gera BENCH_POINTS pontos espalhados pela Grande SP (no formato do snapshot do
+mapa), monta o ClusterIndex e compara, por zoom, quantos itens/bytes o
+navegador recebe pela consulta do viewport contra o snapshot com todos os pontos.
+
+Uso:
+    python scripts/benchmark_map_clusters.py
+    BENCH_POINTS=50000 python scripts/benchmark_map_clusters.py
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bot_multidelivery.services.map_clusters import ClusterIndex
+
+COLORS = ["#ef4444", "#3b82f6", "#22c55e", "#f59e0b", "#8b5cf6", "#ec4899"]
+
+
+def build_points(total: int, rng: random.Random):
+    points = []
+    for i in range(total):
+        color = rng.choice(COLORS)
+        points.append({
+            "id": f"P{i}",
+            "address": f"Rua {i}, {i * 7}",
+            "lat": -23.55 + rng.gauss(0, 0.08),
+            "lng": -46.63 + rng.gauss(0, 0.1),
+            "color": color,
+            "route_color": color,
+            "route_id": f"rota_{COLORS.index(color)}",
+            "deliverer": "Entregador",
+            "sequence": i,
+            "status": rng.choice(["pending", "pending", "delivered", "failed"])
+        })
+    return points
+
+
+def viewport(zoom: int, lat: float = -23.55, lng: float = -46.63):
+    """bbox de uma tela ~1280×800 px centrada em (lat, lng)"""
+    span_lng = 1280 / 256 * 360 / (1 << zoom)
+    span_lat = span_lng * 800 / 1280 * 0.92
+    return lng - span_lng / 2, lat - span_lat / 2, lng + span_lng / 2, lat + span_lat / 2
+
+
+def main():
+    total = int(os.getenv("BENCH_POINTS", "10000"))
+    repeat = int(os.getenv("BENCH_REPEAT", "50"))
+    points = build_points(total, random.Random(42))
+
+    start = time.perf_counter()
+    index = ClusterIndex(points, "bench")
+    build_ms = (time.perf_counter() - start) * 1000
+    full_kb = len(json.dumps(points).encode("utf-8")) / 1024
+
+    print(f"🗺️  {total} pontos | snapshot completo: {full_kb:.0f} KB | montagem do índice: {build_ms:.0f} ms\n")
+    print(f"{'zoom':>4} | {'itens':>6} | {'KB':>7} | {'% snapshot':>10} | {'consulta ms':>11}")
+    print("-" * 52)
+    for zoom in (10, 12, 13, 14, 15, 16, 17):
+        bbox = viewport(zoom)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = index.query(zoom, bbox)
+            timings.append((time.perf_counter() - start) * 1000)
+        kb = len(json.dumps(items).encode("utf-8")) / 1024
+        print(f"{zoom:>4} | {len(items):>6} | {kb:>7.1f} | {kb / full_kb:>10.1%} | {statistics.median(timings):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+📊 BENCHMARK - Índices de packages (queries de analytics antes/depois)
+Popula uma tabela packages sintética (padrão: 1M linhas), mede as queries de
+analytics/bairros/gamificação sem índices, cria os índices declarados no
+PackageDB (os mesmos da migration 006) e mede de novo.
+
+Uso:
+    python scripts/benchmark_package_indexes.py                  # SQLite em arquivo temporário
+    BENCH_ROWS=200000 python scripts/benchmark_package_indexes.py
+    BENCH_DATABASE_URL=postgresql://... python scripts/benchmark_package_indexes.py
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, text
+
+from bot_multidelivery.database import PackageDB
+
+STATUSES = ['delivered'] * 7 + ['failed', 'returned', 'pending']
+SESSIONS = 2000
+DELIVERERS = 50
+
+# Mesmas queries dos routers (analytics.py, neighborhoods.py) e do DataStore
+QUERIES = {
+    'analytics (7 dias)': (
+        """
+        SELECT p.lat, p.lng, p.status, p.delivered_at, p.notes, p.created_at
+        FROM packages p
+        WHERE p.lat IS NOT NULL
+          AND p.lng IS NOT NULL
+          AND DATE(COALESCE(p.delivered_at, p.created_at)) >= :start_date
+        """,
+        lambda now: {'start_date': (now - timedelta(days=7)).strftime('%Y-%m-%d')}
+    ),
+    'heatmap (failed)': (
+        "SELECT lat, lng FROM packages WHERE status = :status AND lat <> 0 AND lng <> 0",
+        lambda now: {'status': 'failed'}
+    ),
+    'bairro (bbox)': (
+        """
+        SELECT id, lat, lng, status FROM packages
+        WHERE lat >= :lat_min AND lat <= :lat_max AND lng >= :lng_min AND lng <= :lng_max
+        """,
+        lambda now: {'lat_min': -22.990, 'lat_max': -22.980, 'lng_min': -43.200, 'lng_max': -43.185}
+    ),
+    'bairros (período)': (
+        "SELECT id, lat, lng FROM packages WHERE lat <> 0 AND lng <> 0 AND created_at >= :start",
+        lambda now: {'start': now - timedelta(days=3)}
+    ),
+    'streak (entregador)': (
+        """
+        SELECT DISTINCT DATE(delivered_at) AS day FROM packages
+        WHERE assigned_to_telegram_id = :tg AND status = 'delivered' AND delivered_at IS NOT NULL
+        ORDER BY day DESC LIMIT 365
+        """,
+        lambda now: {'tg': 1000 + 7}
+    ),
+    'sessão por status': (
+        "SELECT count(*) FROM packages WHERE session_id = :sid AND status = 'pending'",
+        lambda now: {'sid': 's1234'}
+    ),
+    'pacotes da rota': (
+        "SELECT id FROM packages WHERE route_id = :rid",
+        lambda now: {'rid': 'r1234_2'}
+    ),
+}
+
+
+def populate(engine, rows: int, now: datetime):
+    """Insere linhas sintéticas em lotes (1 ano de histórico, Rio de Janeiro)"""
+    rng = random.Random(42)
+    insert = PackageDB.__table__.insert()
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            created = now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+            status = rng.choice(STATUSES)
+            session = rng.randrange(SESSIONS)
+            batch.append({
+                'id': f"pkg_{i}",
+                'session_id': f"s{session}",
+                'romaneio_id': f"rom{session}",
+                'route_id': f"r{session}_{rng.randrange(5)}",
+                'address': f"Rua Sintética {i}",
+                'lat': 0.0 if i % 100 == 0 else rng.uniform(-23.05, -22.80),
+                'lng': 0.0 if i % 100 == 0 else rng.uniform(-43.60, -43.15),
+                'priority': 'normal',
+                'status': status,
+                'assigned_to_telegram_id': 1000 + rng.randrange(DELIVERERS),
+                'delivered_at': created + timedelta(hours=rng.randint(1, 10)) if status == 'delivered' else None,
+                'created_at': created,
+            })
+            if len(batch) == 10000:
+                conn.execute(insert, batch)
+                batch = []
+        if batch:
+            conn.execute(insert, batch)
+
+
+def measure(engine, now: datetime, repeat: int):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            timings = []
+            rows = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = len(conn.execute(text(sql), params(now)).fetchall())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (rows, statistics.median(timings))
+    return results
+
+
+def main():
+    rows = int(os.getenv("BENCH_ROWS", "1000000"))
+    repeat = int(os.getenv("BENCH_REPEAT", "5"))
+    url = os.getenv("BENCH_DATABASE_URL")
+    tmp_dir = None
+    if not url:
+        tmp_dir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{tmp_dir.name}/bench.db"
+    engine = create_engine(url)
+    table = PackageDB.__table__
+    now = datetime.now()
+
+    print(f"🗄️  Banco: {engine.dialect.name} | {rows:,} pacotes")
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.drop(conn)
+
+    start = time.perf_counter()
+    populate(engine, rows, now)
+    print(f"   carga: {time.perf_counter() - start:.1f}s")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE packages" if engine.dialect.name == 'postgresql' else "ANALYZE"))
+    before = measure(engine, now, repeat)
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.create(conn)
+        conn.execute(text("ANALYZE packages" if engine.dialect.name == 'postgresql' else "ANALYZE"))
+    print(f"   criação dos {len(table.indexes)} índices: {time.perf_counter() - start:.1f}s\n")
+    after = measure(engine, now, repeat)
+
+    print(f"{'query':<22} | {'linhas':>8} | {'sem índice ms':>13} | {'com índice ms':>13} | {'ganho':>7}")
+    print("-" * 76)
+    for name in QUERIES:
+        n, ms_before = before[name]
+        _, ms_after = after[name]
+        print(f"{name:<22} | {n:>8} | {ms_before:>13.1f} | {ms_after:>13.1f} | {ms_before / max(ms_after, 0.001):>6.1f}x")
+
+    table.drop(engine)
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
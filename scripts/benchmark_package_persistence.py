@@ -0,0 +1,100 @@
+"""
+📊 BENCHMARK - Persistência de pacotes (round-trips por save)
+Compara o loop antigo (SELECT + INSERT/UPDATE por pacote) com o upsert em lote
+do SessionStore._save_packages.
+
+Uso:
+    python scripts/benchmark_package_persistence.py            # SQLite em memória
+    BENCH_DATABASE_URL=postgresql://... python scripts/benchmark_package_persistence.py
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from bot_multidelivery.database import PackageDB
+from bot_multidelivery.session_persistence import session_store
+
+
+def legacy_save_packages(db_session, session, items):
+    """Versão anterior: uma query por pacote para decidir entre INSERT e UPDATE"""
+    for route, p in items:
+        package_db = db_session.query(PackageDB).filter_by(id=p.package_id).first()
+        if package_db:
+            package_db.status = p.status
+            package_db.route_id = route.id
+            package_db.assigned_to_telegram_id = route.assigned_to_telegram_id
+            if package_db.status == 'delivered' and not package_db.delivered_at:
+                package_db.delivered_at = datetime.now()
+        else:
+            db_session.add(PackageDB(
+                id=p.package_id, session_id=session.session_id, romaneio_id=p.romaneio_id,
+                route_id=route.id, address=p.address, lat=p.lat, lng=p.lng,
+                priority=p.priority, status=p.status,
+                assigned_to_telegram_id=route.assigned_to_telegram_id
+            ))
+
+
+def make_items(n: int, prefix: str, delivered_every: int = 3):
+    session = SimpleNamespace(session_id=prefix)
+    route = SimpleNamespace(id=None, assigned_to_telegram_id=None)
+    items = []
+    for i in range(n):
+        items.append((route, SimpleNamespace(
+            package_id=f"{prefix}_pkg_{i}", romaneio_id="rom", address=f"Rua Teste {i}",
+            lat=-22.97, lng=-43.18, priority="normal",
+            status='delivered' if i % delivered_every == 0 else 'pending',
+            failure_reason=None, status_detail=None
+        )))
+    return session, items
+
+
+def run(engine, label, save, n):
+    Session = sessionmaker(bind=engine)
+    session, items = make_items(n, f"{label}{n}")
+    statements = 0
+
+    def count(*_args, **_kwargs):
+        nonlocal statements
+        statements += 1
+
+    timings = []
+    for _ in range(2):  # 1º save insere, 2º save atualiza
+        event.listen(engine, "before_cursor_execute", count)
+        statements = 0
+        start = time.perf_counter()
+        with Session() as db:
+            save(db, session, items)
+            db.commit()
+        timings.append((statements, (time.perf_counter() - start) * 1000))
+        event.remove(engine, "before_cursor_execute", count)
+    return timings
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL", "sqlite://")
+    engine = create_engine(url)
+    PackageDB.__table__.create(engine, checkfirst=True)
+
+    print(f"🗄️  Banco: {engine.dialect.name}")
+    print(f"{'pacotes':>8} | {'método':<8} | {'insert: queries':>15} {'ms':>8} | {'update: queries':>15} {'ms':>8}")
+    print("-" * 76)
+    for n in (50, 300, 1000, 3000):
+        for label, save in (("legacy", legacy_save_packages), ("upsert", session_store._save_packages)):
+            (ins_q, ins_ms), (upd_q, upd_ms) = run(engine, label, save, n)
+            print(f"{n:>8} | {label:<8} | {ins_q:>15} {ins_ms:>8.1f} | {upd_q:>15} {upd_ms:>8.1f}")
+
+    with engine.begin() as conn:
+        conn.execute(PackageDB.__table__.delete().where(PackageDB.id.like("legacy%") | PackageDB.id.like("upsert%")))
+
+
+if __name__ == "__main__":
+    main()
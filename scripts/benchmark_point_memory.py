@@ -0,0 +1,109 @@
+"""
+📊 BENCHMARK - Memória e serialização de DeliveryPoint
+Reconstrói os pontos da sessão de exemplo (romaneios + rotas) como dataclass
+comum (antes), dataclass com slots e slots + strings internadas (como no
+SessionStore._point_from_dict), medindo bytes por ponto (tracemalloc) e o
+custo de montar/serializar os pontos.
+
+Uso:
+    python scripts/benchmark_point_memory.py
+    BENCH_SESSION=data/sessions/outra.json python scripts/benchmark_point_memory.py
+"""
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session_changes import point_to_dict
+from bot_multidelivery import snapshot_format
+
+ROOT = Path(__file__).resolve().parents[1]
+INTERNED = ('romaneio_id', 'priority', 'bairro', 'status', 'failure_reason')
+
+# Mesmo modelo, sem slots (como era antes)
+LegacyDeliveryPoint = make_dataclass(
+    'LegacyDeliveryPoint',
+    [(f.name, f.type, f) for f in fields(DeliveryPoint)]
+)
+
+
+def build(cls, dicts, intern: bool):
+    names = [f.name for f in fields(DeliveryPoint)]
+    points = []
+    for d in dicts:
+        values = {k: d[k] for k in names if k in d}
+        if intern:
+            for k in INTERNED:
+                if isinstance(values.get(k), str):
+                    values[k] = sys.intern(values[k])
+        points.append(cls(**values))
+    return points
+
+
+def measure_memory(cls, source, intern: bool):
+    """Bytes retidos por ponto (objeto + strings), partindo do JSON como num load real"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    dicts = json.loads(source)
+    points = build(cls, dicts, intern)
+    del dicts
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(points), points
+
+
+def timed(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    source_file = Path(os.getenv("BENCH_SESSION", ROOT / "data" / "sessions" / "d2825550.json"))
+    repeat = int(os.getenv("BENCH_REPEAT", "20"))
+    with open(source_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    dicts = [p for r in data.get('romaneios', []) for p in r['points']]
+    dicts += [p for r in data.get('routes', []) for p in r['optimized_order']]
+    source = json.dumps(dicts)
+
+    variants = [
+        ('dataclass (antes)', LegacyDeliveryPoint, False),
+        ('slots', DeliveryPoint, False),
+        ('slots + intern', DeliveryPoint, True),
+    ]
+    print(f"📦 {source_file.name}: {len(dicts)} pontos | mediana de {repeat} execuções\n")
+    print(f"{'modelo':<20} | {'bytes/ponto':>11} | {'montar ms':>9} | {'to_dict ms':>10} | {'dump ms':>8}")
+    print("-" * 72)
+    for name, cls, intern in variants:
+        per_point, points = measure_memory(cls, source, intern)
+        fresh = json.loads(source)
+        build_ms = timed(lambda: build(cls, fresh, intern), repeat)
+        to_dict_ms = timed(lambda: [point_to_dict(p) for p in points], repeat)
+        as_dicts = [point_to_dict(p) for p in points]
+        dump_ms = timed(lambda: snapshot_format.dumps_json(as_dicts), repeat)
+        print(f"{name:<20} | {per_point:>11.0f} | {build_ms:>9.1f} | {to_dict_ms:>10.1f} | {dump_ms:>8.1f}")
+
+    resident = int(os.getenv("BENCH_SESSIONS", "100"))
+    legacy, _ = measure_memory(LegacyDeliveryPoint, source, False)
+    compact, _ = measure_memory(DeliveryPoint, source, True)
+    saved_mb = (legacy - compact) * len(dicts) * resident / 1024 / 1024
+    print(f"\n💾 {resident} sessões deste tamanho residentes: ~{saved_mb:.0f} MB a menos")
+
+
+if __name__ == "__main__":
+    main()
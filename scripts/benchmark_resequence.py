@@ -0,0 +1,82 @@
+"""
+📊 BENCHMARK - Resequenciamento ao vivo das paradas restantes
+Monta uma rota sintética (BENCH_STOPS paradas espalhadas num raio de ~4 km),
+embaralha a ordem (entregador que desviou) e mede quanto leva para reordenar a
+partir da posição atual: 1ª chamada (monta a matriz) e seguintes (matriz em
+cache). Sem BENCH_OSRM=1 a matriz usa Haversine (sem rede).
+A publicação do evento é substituída por um contador.
+
+Uso:
+    python scripts/benchmark_resequence.py
+    BENCH_STOPS=200 BENCH_REPEAT=20 python scripts/benchmark_resequence.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import Route
+from bot_multidelivery.services.route_resequencer import RouteResequencer
+from bot_multidelivery.services.osrm_service import DistanceMatrixResult, osrm_client
+
+
+def build_route(stops: int, rng: random.Random) -> Route:
+    points = []
+    for i in range(stops):
+        lat = -23.55 + rng.uniform(-0.035, 0.035)
+        lng = -46.63 + rng.uniform(-0.035, 0.035)
+        points.append(DeliveryPoint(address=f"Rua {i}, {i * 7}", lat=lat, lng=lng,
+                                    romaneio_id="bench", package_id=f"P{i}"))
+    rng.shuffle(points)
+    return Route(id="bench", optimized_order=points)
+
+
+async def haversine_matrix(points, sources=None, destinations=None):
+    return DistanceMatrixResult(osrm_client._haversine_matrix(points, sources, destinations), None, True)
+
+
+async def run(stops: int, repeat: int):
+    rng = random.Random(7)
+    route = build_route(stops, rng)
+    session = SimpleNamespace(session_id="bench")
+    resequencer = RouteResequencer()
+    applied = []
+    resequencer._apply = lambda session, route, remaining, order, reason: applied.append(order)
+
+    start = time.perf_counter()
+    first = await resequencer.resequence(session, route, -23.55, -46.63, "bench")
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        lat, lng = -23.55 + rng.uniform(-0.02, 0.02), -46.63 + rng.uniform(-0.02, 0.02)
+        start = time.perf_counter()
+        await resequencer.resequence(session, route, lat, lng, "bench")
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"{stops:>6} | {cold_ms:>10.1f} | {statistics.median(timings):>10.1f} | {max(timings):>8.1f} | "
+          f"{first['before_km']:>9.1f} | {first['after_km']:>8.1f}")
+
+
+def main():
+    repeat = int(os.getenv("BENCH_REPEAT", "10"))
+    sizes = [int(os.getenv("BENCH_STOPS"))] if os.getenv("BENCH_STOPS") else [25, 50, 100, 200]
+    if os.getenv("BENCH_OSRM") != "1":
+        osrm_client.get_distance_matrix_async = haversine_matrix
+    print(f"Resequenciamento (mediana de {repeat} chamadas com matriz em cache)\n")
+    print(f"{'paradas':>6} | {'1ª ms':>10} | {'cache ms':>10} | {'máx ms':>8} | {'antes km':>9} | {'depois km':>8}")
+    print("-" * 68)
+    for stops in sizes:
+        asyncio.run(run(stops, repeat))
+
+
+if __name__ == "__main__":
+    main()
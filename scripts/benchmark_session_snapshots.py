@@ -0,0 +1,82 @@
+"""
+📊 BENCHMARK - Snapshots de sessão (JSON indent=2 legado vs formato binário)
+Grava e lê a sessão de exemplo (data/sessions/d2825550.json, ~1.1 MB) em cada
+formato, em arquivo temporário, e mostra mediana de save/load e tamanho.
+
+Uso:
+    python scripts/benchmark_session_snapshots.py
+    BENCH_SESSION=data/sessions/outra.json BENCH_REPEAT=50 python scripts/benchmark_session_snapshots.py
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path para importar os módulos do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bot_multidelivery import snapshot_format
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def legacy_save(path: Path, data):
+    # Como o fallback gravava antes: pretty-print direto no arquivo final
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def legacy_load(path: Path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def timed(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    source = Path(os.getenv("BENCH_SESSION", ROOT / "data" / "sessions" / "d2825550.json"))
+    repeat = int(os.getenv("BENCH_REPEAT", "20"))
+    data = legacy_load(source)
+    orjson = snapshot_format.orjson
+
+    variants = [('json indent=2 (legado)', legacy_save, legacy_load)]
+    if orjson is not None:
+        variants.append(('snapshot orjson', lambda p, d: snapshot_format.dump(p, d, snapshot_format.COMPRESSION_NONE),
+                         snapshot_format.load))
+    if snapshot_format.zstandard is not None:
+        variants.append(('snapshot orjson+zstd', lambda p, d: snapshot_format.dump(p, d, snapshot_format.COMPRESSION_ZSTD),
+                         snapshot_format.load))
+    # Sem orjson instalado o formato cai para o json da stdlib (compacto)
+    variants.append(('snapshot stdlib json', None, None))
+
+    print(f"📦 Sessão: {source.name} ({source.stat().st_size / 1024:.0f} KB) | mediana de {repeat} execuções\n")
+    print(f"{'formato':<24} | {'save ms':>8} | {'load ms':>8} | {'tamanho KB':>10}")
+    print("-" * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, save, load in variants:
+            path = Path(tmp) / name.replace(' ', '_')
+            if save is None:
+                snapshot_format.orjson = None
+                save = lambda p, d: snapshot_format.dump(p, d, snapshot_format.COMPRESSION_NONE)
+                load = snapshot_format.load
+            try:
+                save_ms = timed(lambda: save(path, data), repeat)
+                load_ms = timed(lambda: load(path), repeat)
+                assert load(path) == data, f"{name}: dados divergentes após leitura"
+            finally:
+                snapshot_format.orjson = orjson
+            print(f"{name:<24} | {save_ms:>8.1f} | {load_ms:>8.1f} | {path.stat().st_size / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
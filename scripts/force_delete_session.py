@@ -14,7 +14,6 @@ Risco: operação destrutiva. Execute apenas se tiver backup.
 """
 import argparse
 import os
-import shutil
 import json
 from datetime import datetime
 
@@ -35,11 +34,12 @@ def make_backup(session_id: str, backups_dir: str = "backups") -> str:
     backup_name = f"{session_id}_{timestamp}.json"
     backup_path = os.path.join(backups_dir, backup_name)
 
-    # 1) se existir arquivo JSON local, copia
+    # 1) se existir arquivo local (snapshot binário ou JSON legado), exporta como JSON legível
     try:
-        file_path = session_store._session_file(session_id)
-        if file_path.exists():
-            shutil.copy2(file_path, backup_path)
+        data = session_store._read_session_data(session_id)
+        if data is not None:
+            with open(backup_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
             return backup_path
     except Exception:
         # ignora e tenta serializar via load_session
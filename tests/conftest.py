@@ -0,0 +1,62 @@
+"""
+🧪 Fixtures compartilhadas
+sqlite_db: db_manager apontando para um SQLite em memória com as tabelas de
+sessão (o PostgreSQL de produção não é necessário para os caminhos de persistência).
+fresh_manager: SessionManager novo, gravando em tmp_path, no lugar do singleton.
+"""
+import pytest
+from sqlalchemy import BigInteger, create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from bot_multidelivery import session as session_module, session_persistence
+from bot_multidelivery.database import Base, db_manager
+from bot_multidelivery.session import SessionManager
+from bot_multidelivery.session_persistence import SessionStore
+
+SESSION_TABLES = (
+    'deliverers', 'sessions', 'routes', 'packages', 'romaneios', 'stops',
+    'stop_packages', 'session_events'
+)
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_as_integer(type_, compiler, **kw):
+    # SQLite só gera autoincrement para INTEGER PRIMARY KEY (session_events.id)
+    return "INTEGER"
+
+
+class StatementLog(list):
+    """SQL executado no engine (uma entrada por execute/executemany)"""
+
+    def matching(self, prefix: str, table: str):
+        return [s for s in self if s.lstrip().upper().startswith(prefix) and f" {table}" in s]
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    # Só as tabelas da sessão (geocoding_cache usa DEFAULT NOW(), exclusivo do PostgreSQL)
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables[name] for name in SESSION_TABLES])
+    monkeypatch.setattr(db_manager, "engine", engine)
+    monkeypatch.setattr(db_manager, "SessionLocal", sessionmaker(bind=engine))
+
+    statements = StatementLog()
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    engine.statements = statements
+    return engine
+
+
+@pytest.fixture
+def fresh_manager(tmp_path, monkeypatch):
+    """
+    Substitui session_manager (quem importa o nome no módulo — routers — precisa
+    de monkeypatch próprio). Saves síncronos: o teste lê o disco logo depois.
+    """
+    monkeypatch.setattr(session_persistence, "session_store", SessionStore(data_dir=str(tmp_path)))
+    monkeypatch.setenv("SESSION_FLUSH_WINDOW_MS", "0")
+    manager = SessionManager()
+    monkeypatch.setattr(session_module, "session_manager", manager)
+    return manager
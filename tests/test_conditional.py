@@ -0,0 +1,103 @@
+"""
+🧪 GET condicional (ETag / Last-Modified → 304)
+If-None-Match (inclusive W/ e lista) e If-Modified-Since devolvem 304 sem corpo;
+If-None-Match tem precedência; qualquer mutação da sessão troca o ETag do mapa.
+"""
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from bot_multidelivery.conditional import CACHE_CONTROL, conditional, make_etag
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.routers import map_realtime
+from bot_multidelivery.session import Route
+
+MODIFIED_AT = 1_760_000_000.0
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.state.builds = 0
+
+    @app.get("/thing")
+    async def thing(request: Request, response: Response):
+        cached = conditional(request, response, make_etag("thing", 1), MODIFIED_AT)
+        if cached:
+            return cached
+        app.state.builds += 1
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        client.app_state = app.state
+        yield client
+
+
+def test_first_get_carries_validators(client):
+    response = client.get("/thing")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == make_etag("thing", 1)
+    assert response.headers["last-modified"] == formatdate(MODIFIED_AT, usegmt=True)
+    assert response.headers["cache-control"] == CACHE_CONTROL
+
+
+@pytest.mark.parametrize("if_none_match", [
+    make_etag("thing", 1),
+    f"W/{make_etag('thing', 1)}",
+    f'"outro", {make_etag("thing", 1)}',
+    "*",
+])
+def test_matching_if_none_match_is_304(client, if_none_match):
+    response = client.get("/thing", headers={"If-None-Match": if_none_match})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == make_etag("thing", 1)
+    assert client.app_state.builds == 0  # corpo nem foi montado
+
+
+def test_stale_etag_gets_the_body(client):
+    response = client.get("/thing", headers={"If-None-Match": make_etag("thing", 0)})
+
+    assert response.status_code == 200 and response.json() == {"ok": True}
+
+
+def test_if_modified_since(client):
+    fresh = client.get("/thing", headers={"If-Modified-Since": formatdate(MODIFIED_AT, usegmt=True)})
+    stale = client.get("/thing", headers={"If-Modified-Since": formatdate(MODIFIED_AT - 60, usegmt=True)})
+    garbage = client.get("/thing", headers={"If-Modified-Since": "ontem"})
+
+    assert [r.status_code for r in (fresh, stale, garbage)] == [304, 200, 200]
+
+
+def test_if_none_match_takes_precedence(client):
+    response = client.get("/thing", headers={
+        "If-None-Match": make_etag("thing", 0),
+        "If-Modified-Since": formatdate(MODIFIED_AT, usegmt=True)
+    })
+
+    assert response.status_code == 200
+
+
+def test_map_etag_changes_with_the_session(fresh_manager, monkeypatch):
+    monkeypatch.setattr(map_realtime, "session_manager", fresh_manager)
+    session = fresh_manager.create_new_session("2026-10-19")
+    session.routes = [Route(id="r1", optimized_order=[
+        DeliveryPoint(address="Rua A, 1", lat=-22.9, lng=-43.2, romaneio_id="A", package_id="P0")
+    ])]
+    fresh_manager.save_session(session)
+    app = FastAPI()
+    app.include_router(map_realtime.router)
+    url = f"/map/realtime/{session.session_id}"
+
+    with TestClient(app) as client:
+        etag = client.get(url).headers["etag"]
+        unchanged = client.get(url, headers={"If-None-Match": etag})
+        fresh_manager.touch(session.session_id)  # qualquer mutação sobe a versão
+        changed = client.get(url, headers={"If-None-Match": etag})
+
+    assert unchanged.status_code == 304
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
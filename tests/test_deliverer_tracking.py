@@ -0,0 +1,170 @@
+"""
+🧪 Token de rastreamento do entregador
+Só o entregador autenticado (initData do WebApp assinado pelo bot) recebe o
+tracking_token; o WebSocket de GPS revalida token e dono da rota a cada mensagem.
+"""
+import hashlib
+import hmac
+import json
+import threading
+import time
+from urllib.parse import urlencode
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from bot_multidelivery import security
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.routers import deliverer
+from bot_multidelivery.security import create_tracking_token, verify_telegram_init_data
+from bot_multidelivery.services.gps_tracker import gps_tracker
+from bot_multidelivery.session import Route
+
+BOT_TOKEN = "123456:TESTE"
+
+
+def _init_data(telegram_id, auth_date=None, bot_token=BOT_TOKEN):
+    """initData como o Telegram monta (campos ordenados + hash HMAC com a chave do bot)"""
+    fields = {
+        "auth_date": str(int(auth_date or time.time())),
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": json.dumps({"id": telegram_id, "first_name": "Ana"}, separators=(",", ":")),
+    }
+    data_check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, data_check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+@pytest.fixture(autouse=True)
+def bot_token(monkeypatch):
+    monkeypatch.setattr(security, "TELEGRAM_BOT_TOKEN", BOT_TOKEN)
+
+
+@pytest.fixture
+def session(fresh_manager, monkeypatch):
+    monkeypatch.setattr(deliverer, "session_manager", fresh_manager)
+    monkeypatch.setattr(deliverer.data_store, "get_deliverer", lambda telegram_id: object())
+    monkeypatch.setattr(deliverer.osrm_client, "get_route_geometry", lambda coords: None)
+    session = fresh_manager.create_new_session("2026-10-19")
+    session.routes = [Route(id="r1", assigned_to_telegram_id=111, assigned_to_name="Ana", optimized_order=[
+        DeliveryPoint(address="Rua A, 1", lat=-22.9, lng=-43.2, romaneio_id="A", package_id="P0")
+    ])]
+    fresh_manager.save_session(session)
+    return session
+
+
+@pytest.fixture
+def client(session):
+    app = FastAPI()
+    app.include_router(deliverer.router)
+    with TestClient(app) as client:
+        yield client
+
+
+class Ingested(list):
+    """Fixes que chegaram ao gps_tracker; o WebSocket roda em outra thread, então dá pra esperar"""
+
+    def __init__(self):
+        super().__init__()
+        self.arrived = threading.Event()
+
+    def __call__(self, session_id, route_id, telegram_id, batch, name=None):
+        self.extend(batch)
+        self.arrived.set()
+        return {"accepted": len(batch), "rejected": 0}
+
+
+@pytest.fixture
+def ingested(monkeypatch):
+    recorder = Ingested()
+    monkeypatch.setattr(gps_tracker, "ingest", recorder)
+    return recorder
+
+
+def test_init_data_signed_by_the_bot_is_accepted():
+    assert verify_telegram_init_data(_init_data(111)) == 111
+
+
+@pytest.mark.parametrize("init_data", [
+    None,
+    "",
+    _init_data(111, bot_token="999:OUTRO_BOT"),
+    _init_data(111).replace("Ana", "Bia"),      # adulterado
+    _init_data(111, auth_date=time.time() - 3 * 24 * 3600),  # expirado
+    "user=%7B%22id%22%3A111%7D",                 # sem hash
+])
+def test_invalid_init_data_is_rejected(init_data):
+    assert verify_telegram_init_data(init_data) is None
+
+
+def test_route_without_authentication_has_no_tracking_token(client):
+    data = client.get("/deliverer/route", params={"user_id": 111}).json()
+
+    assert data["has_route"] and data["route_id"] == "r1"
+    assert data["tracking_token"] is None
+
+
+def test_route_with_another_users_init_data_has_no_tracking_token(client):
+    data = client.get("/deliverer/route", params={"user_id": 111},
+                      headers={"X-Telegram-Init-Data": _init_data(222)}).json()
+
+    assert data["tracking_token"] is None
+
+
+def test_authenticated_deliverer_gets_a_tracking_token(client, session):
+    unauthenticated = client.get("/deliverer/route", params={"user_id": 111})
+    response = client.get("/deliverer/route", params={"user_id": 111}, headers={
+        "X-Telegram-Init-Data": _init_data(111),
+        "If-None-Match": unauthenticated.headers["etag"]  # ETag muda com a autenticação
+    })
+
+    assert response.status_code == 200
+    assert security.verify_tracking_token(response.json()["tracking_token"]) == (session.session_id, "r1", 111)
+
+
+def _fix():
+    return json.dumps({"t": time.time(), "lat": -22.9, "lng": -43.2})
+
+
+def test_gps_ws_closes_when_the_route_is_reassigned(client, session, ingested):
+    token = create_tracking_token(session.session_id, "r1", 111)
+
+    with client.websocket_connect(f"/deliverer/gps/ws?token={token}") as ws:
+        ws.send_text(_fix())
+        assert ingested.arrived.wait(2)
+        session.get_route("r1").assigned_to_telegram_id = 222
+        ws.send_text(_fix())
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_text()
+
+    assert closed.value.code == 4409
+    assert len(ingested) == 1  # o fix depois da reatribuição não entra
+
+
+def test_gps_ws_closes_when_the_token_expires(client, session, ingested, monkeypatch):
+    token = create_tracking_token(session.session_id, "r1", 111)
+
+    with client.websocket_connect(f"/deliverer/gps/ws?token={token}") as ws:
+        ws.send_text(_fix())
+        assert ingested.arrived.wait(2)
+        later = time.time() + security.TRACKING_TOKEN_TTL_S + 60
+        monkeypatch.setattr(security.time, "time", lambda: later)
+        ws.send_text(_fix())
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_text()
+
+    assert closed.value.code == 4401
+    assert len(ingested) == 1
+
+
+def test_gps_post_rejects_a_reassigned_route(client, session, ingested):
+    token = create_tracking_token(session.session_id, "r1", 111)
+    session.get_route("r1").assigned_to_telegram_id = 222
+
+    response = client.post("/deliverer/gps", json={"fixes": [json.loads(_fix())]}, headers={"X-Tracking-Token": token})
+
+    assert response.status_code == 409
+    assert ingested == []
@@ -0,0 +1,133 @@
+"""
+🧪 Geocoding em background
+O mapa responde na hora com os pontos que já têm coordenadas; o job resolve um
+geocode() por endereço único, preenche romaneio e rota, avisa os listeners e não
+duplica trabalho quando o mapa é reaberto.
+"""
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.routers import map_realtime
+from bot_multidelivery.services.geocoding_jobs import GeocodingJobManager, JobStatus
+from bot_multidelivery.services.geocoding_service import geocoding_service
+from bot_multidelivery.session import Romaneio, Route
+
+COORDS = {"Rua A, 1": (-22.90, -43.20), "Rua C, 3": (-22.92, -43.22)}
+
+
+def _point(package_id, address, lat=0.0, lng=0.0):
+    return DeliveryPoint(address=address, lat=lat, lng=lng, romaneio_id="A", package_id=package_id)
+
+
+@pytest.fixture
+def geocoder(monkeypatch):
+    """geocode() falso: COORDS ou ValueError; `calls` conta as chamadas por endereço"""
+    calls = []
+
+    def geocode(address, bairro=None):
+        calls.append(address)
+        if address not in COORDS:
+            raise ValueError("endereço não encontrado")
+        return COORDS[address]
+
+    monkeypatch.setattr(geocoding_service, "geocode", geocode)
+    return calls
+
+
+@pytest.fixture
+def session(fresh_manager):
+    session = fresh_manager.create_new_session("2026-10-19")
+    session.romaneios = [Romaneio(id="A", uploaded_at=datetime(2026, 10, 19, 8, 0), points=[
+        _point("P0", "Rua A, 1"), _point("P1", "Rua A, 1"), _point("P2", "Rua B, 2"),
+        _point("P3", "Rua D, 4", -22.95, -43.25)
+    ])]
+    # A rota tem cópias próprias dos pontos (como depois de um load)
+    session.routes = [Route(id="r1", optimized_order=[
+        _point("P0", "Rua A, 1"), _point("P3", "Rua D, 4", -22.95, -43.25)
+    ])]
+    fresh_manager.save_session(session)
+    return session
+
+
+def _run_job(jobs, session):
+    async def scenario():
+        job = jobs.submit(session.session_id, session.romaneios[0].points, romaneio_id="A")
+        await jobs._tasks[job.id]
+        return job
+    return asyncio.run(scenario())
+
+
+def test_job_geocodes_each_address_once_and_fills_every_copy(session, geocoder):
+    jobs = GeocodingJobManager(max_concurrency=2)
+    notified = []
+    jobs.add_listener(lambda s, package_ids: notified.append(sorted(package_ids)))
+
+    job = _run_job(jobs, session)
+
+    assert job.status == JobStatus.COMPLETED
+    assert sorted(geocoder) == ["Rua A, 1", "Rua B, 2"]  # P3 já tinha coordenadas
+    assert (job.resolved_count, job.failed_count) == (1, 1)
+    assert notified == [["P0", "P1"]]
+    assert session.get_route("r1").get_point("P0").lat == -22.90
+    assert session.romaneios[0].points[1].lng == -43.20
+    assert job.unrouted == ["P1"]  # sessão já dividida: P1 não está em rota nenhuma
+    assert job.summary()["resumable"]
+
+
+def test_resume_retries_only_failed_addresses(session, geocoder, monkeypatch):
+    jobs = GeocodingJobManager()
+    job = _run_job(jobs, session)
+    geocoder.clear()
+    monkeypatch.setitem(COORDS, "Rua B, 2", (-22.91, -43.21))
+
+    async def resume():
+        jobs.resume(job.id)
+        await jobs._tasks[job.id]
+    asyncio.run(resume())
+
+    assert geocoder == ["Rua B, 2"]
+    assert (job.resolved_count, job.failed_count, job.status) == (2, 0, JobStatus.COMPLETED)
+
+
+def test_ensure_reuses_the_running_job(session, monkeypatch):
+    release = threading.Event()
+
+    def slow_geocode(address, bairro=None):
+        release.wait(5)
+        return COORDS["Rua A, 1"]
+
+    monkeypatch.setattr(geocoding_service, "geocode", slow_geocode)
+    jobs = GeocodingJobManager()
+
+    async def scenario():
+        first = jobs.ensure(session.session_id, session.romaneios[0].points)
+        await asyncio.sleep(0)
+        second = jobs.ensure(session.session_id, session.romaneios[0].points)
+        release.set()
+        await jobs._tasks[first.id]
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert second is first
+    assert len(jobs.jobs) == 1
+
+
+def test_map_answers_without_waiting_for_geocoding(session, fresh_manager, geocoder, monkeypatch):
+    monkeypatch.setattr(map_realtime, "session_manager", fresh_manager)
+    monkeypatch.setattr(map_realtime, "geocoding_jobs", GeocodingJobManager())
+    app = FastAPI()
+    app.include_router(map_realtime.router)
+
+    with TestClient(app) as client:
+        state = client.get(f"/map/realtime/{session.session_id}").json()
+
+    assert [p["id"] for p in state["points"]] == ["P0", "P3"]  # pontos da rota
+    assert state["geocoding"]["total_addresses"] == 2
+    assert state["geocoding"]["pending"] == 2  # o job ainda nem começou: resposta não espera
@@ -0,0 +1,114 @@
+"""
+🧪 Cascata de geocoding com providers stub
+Ordem por custo esperado (latência / taxa de sucesso), recuperação de um
+provider rebaixado (decaimento para o prior) e pago sempre por último.
+"""
+import pytest
+
+from bot_multidelivery.services.geocoding_service import (
+    GeocodingProvider, GeocodingService, ProviderStats, UngeocodableAddressError
+)
+
+COORDS = (-22.97, -43.19)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubProvider:
+    """Provider controlável: ok=False simula queda, latency entra direto nas estatísticas"""
+
+    def __init__(self, name, latency, ok=True, **kwargs):
+        self.calls = 0
+        self.ok = ok
+        self.latency = latency
+        self.provider = GeocodingProvider(name=name, geocode=self._geocode, prior_latency=latency, **kwargs)
+
+    def _geocode(self, query, raw, bairro, expected):
+        self.calls += 1
+        if not self.ok:
+            raise ConnectionError("timeout")
+        return COORDS
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, clock):
+    monkeypatch.chdir(tmp_path)  # caches em JSON ficam no diretório do teste
+    svc = GeocodingService()
+    svc.provider_stats = ProviderStats(half_life_s=300, clock=clock)
+    return svc
+
+
+def _use(service, *stubs):
+    service.providers = [s.provider for s in stubs]
+    # Latência medida = a do stub (sem depender do relógio real)
+    record = service.provider_stats.record
+    latency = {s.provider.name: s for s in stubs}
+    service.provider_stats.record = lambda name, _, success, error=None: record(
+        name, latency[name].latency, success, error
+    )
+
+
+def _order(service):
+    return [p.name for p in service._ordered_providers()]
+
+
+def test_failures_push_provider_down_the_cascade(service):
+    fast, slow = StubProvider("fast", 0.2), StubProvider("slow", 1.0)
+    _use(service, fast, slow)
+    assert _order(service) == ["fast", "slow"]
+
+    fast.ok = False
+    for i in range(10):
+        assert service.geocode(f"Rua Stub {i}, 10") == COORDS
+    assert _order(service) == ["slow", "fast"]
+    assert slow.calls == 10 and fast.calls < 10  # parou de tentar o que falha primeiro
+
+
+def test_demoted_provider_recovers_after_decay(service, clock):
+    fast, slow = StubProvider("fast", 0.2), StubProvider("slow", 1.0)
+    _use(service, fast, slow)
+    fast.ok = False
+    for i in range(10):
+        service.geocode(f"Rua Queda {i}, 10")
+    assert _order(service)[0] == "slow"
+
+    # Sem medições do "fast" por algumas meias-vidas: volta para o prior
+    fast.ok = True
+    clock.now += 300 * 4
+    assert _order(service)[0] == "fast"
+    calls = fast.calls
+    service.geocode("Rua Volta, 1")
+    assert fast.calls == calls + 1
+
+
+def test_last_resort_stays_last_even_when_cheaper(service):
+    free, paid = StubProvider("free", 3.0), StubProvider("paid", 0.1, last_resort=True)
+    _use(service, paid, free)
+    assert _order(service) == ["free", "paid"]
+
+    free.ok = False
+    for i in range(10):
+        assert service.geocode(f"Rua Paga {i}, 5") == COORDS
+    assert _order(service) == ["free", "paid"]
+    assert free.calls == 10  # o gratuito é sempre tentado antes
+
+
+def test_total_failure_goes_to_negative_cache(service):
+    down = StubProvider("down", 0.2, ok=False)
+    _use(service, down)
+    with pytest.raises(UngeocodableAddressError):
+        service.geocode("Rua Inexistente, 0")
+    with pytest.raises(UngeocodableAddressError):
+        service.geocode("Rua Inexistente, 0")
+    assert down.calls == 1
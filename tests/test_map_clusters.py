@@ -0,0 +1,121 @@
+"""
+🧪 Clusters do mapa por zoom/tile
+Cada item cai em exatamente um tile (inclusive nas bordas); as contagens fecham
+em todos os zooms; expansion_zoom é o zoom em que o cluster se abre; o índice é
+reaproveitado até a versão do mapa mudar.
+"""
+import asyncio
+import random
+
+import pytest
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.services.map_clusters import ClusterIndex, MapClusterCache, project
+from bot_multidelivery.services.map_stream import map_stream
+from bot_multidelivery.session import DailySession, Route
+
+
+def _point(i, lat, lng, status="pending", color="#3b82f6"):
+    return {"id": f"P{i}", "lat": lat, "lng": lng, "status": status, "route_color": color}
+
+
+@pytest.fixture
+def rio_points():
+    rnd = random.Random(7)
+    return [
+        _point(i, -22.9 + rnd.uniform(-0.2, 0.2), -43.2 + rnd.uniform(-0.3, 0.3),
+               status=rnd.choice(["pending", "delivered", "failed"]), color=rnd.choice(["#3b82f6", "#f59e0b"]))
+        for i in range(500)
+    ]
+
+
+def _ids_in_tiles(index, z):
+    """Todos os itens do zoom, pedidos tile a tile (tiles com pontos e seus vizinhos)"""
+    n = 1 << z
+    tiles = {
+        (min(int(x * n), n - 1), min(int(y * n), n - 1))
+        for x, y in (project(p["lat"], p["lng"]) for p in index._points)
+    }
+    items = []
+    for x, y in tiles:
+        # Vizinhos também: um centróide pode cair num tile sem nenhum ponto
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if 0 <= x + dx < n and 0 <= y + dy < n and (x + dx, y + dy) not in tiles:
+                    items.extend(index.tile(z, x + dx, y + dy))
+        items.extend(index.tile(z, x, y))
+    return items
+
+
+@pytest.mark.parametrize("z", [3, 9, 12, 17])
+def test_every_item_falls_in_exactly_one_tile(rio_points, z):
+    index = ClusterIndex(rio_points, "v1")
+
+    from_tiles = _ids_in_tiles(index, z)
+    everything = index.query(z)
+
+    key = lambda item: item.get("id") if item["type"] == "point" else (item["lat"], item["lng"], item["count"])
+    assert sorted(map(key, from_tiles), key=str) == sorted(map(key, everything), key=str)
+
+
+@pytest.mark.parametrize("z", [2, 17])
+def test_point_on_a_tile_boundary_belongs_to_one_tile(z):
+    # lng -90 → x = 0.25 exato: borda vertical entre tiles em todo zoom >= 2
+    index = ClusterIndex([_point(0, -22.9, -90.0)], "v1")
+    n = 1 << z
+    x_edge, y = n // 4, int(project(-22.9, -90.0)[1] * n)
+
+    found = [x for x in (x_edge - 1, x_edge) if index.tile(z, x, y)]
+
+    assert found == [x_edge]
+
+
+@pytest.mark.parametrize("z", [0, 5, 10, 14, 16, 17])
+def test_counts_add_up_at_every_zoom(rio_points, z):
+    index = ClusterIndex(rio_points, "v1")
+    items = index.query(z)
+
+    assert sum(i.get("count", 1) for i in items) == 500
+    for cluster in (i for i in items if i["type"] == "cluster"):
+        assert sum(cluster["statuses"].values()) == cluster["count"]
+        assert cluster["expansion_zoom"] > z
+
+
+def test_cluster_opens_at_its_expansion_zoom():
+    index = ClusterIndex([_point(0, -22.9000, -43.2000), _point(1, -22.9000, -43.1990, status="delivered")], "v1")
+
+    (cluster,) = index.query(0)
+    assert cluster["type"] == "cluster" and cluster["statuses"] == {"pending": 1, "delivered": 1}
+    expansion = cluster["expansion_zoom"]
+
+    assert [i["type"] for i in index.query(expansion - 1)] == ["cluster"]
+    assert sorted(i["id"] for i in index.query(expansion)) == ["P0", "P1"]
+
+
+def test_points_without_coordinates_and_bbox(rio_points):
+    index = ClusterIndex(rio_points + [_point(999, 0, 0)], "v1")  # lat/lng 0 = não geocodificado
+
+    assert index.total_points == 500
+    inside = index.query(17, bbox=(-43.2, -22.9, -43.0, -22.7))
+    assert inside and all(-43.2 <= p["lng"] <= -43.0 and -22.9 <= p["lat"] <= -22.7 for p in inside)
+
+
+def test_cache_rebuilds_only_when_the_map_version_changes(monkeypatch):
+    session = DailySession(session_id="s1", session_name="Domingo Tarde", date="2026-10-18", routes=[
+        Route(id="r1", optimized_order=[
+            DeliveryPoint(address="Rua A, 1", lat=-22.9, lng=-43.2, romaneio_id="A", package_id="P0")
+        ])
+    ])
+    cache = MapClusterCache()
+
+    async def scenario():
+        first = await cache.index_for([session])
+        again = await cache.index_for([session])
+        monkeypatch.setitem(map_stream._seq, "s1", map_stream.current_seq("s1") + 1)  # novo delta
+        rebuilt = await cache.index_for([session])
+        return first, again, rebuilt
+
+    first, again, rebuilt = asyncio.run(scenario())
+
+    assert again is first and rebuilt is not first
+    assert (cache.builds, cache.hits) == (2, 1)
@@ -0,0 +1,127 @@
+"""
+🧪 SSE do mapa
+Cada delta sai com id "epoch:seq:shape"; reconexão com Last-Event-ID recebe só
+o que perdeu (ou o snapshot se o epoch é de outro processo); buraco na fila é
+consertado pelo próprio servidor.
+"""
+import asyncio
+import json
+
+import pytest
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.services.map_sse import MapEventStream, event_id, parse_event_id
+from bot_multidelivery.services.map_stream import map_stream, session_shape
+from bot_multidelivery.session import Route
+
+
+@pytest.fixture
+def session(fresh_manager, monkeypatch):
+    monkeypatch.setattr(map_stream, "_loop", None)  # desfaz o bind_loop dos cenários
+    session = fresh_manager.create_new_session("2026-10-19")
+    session.routes = [Route(id="r1", optimized_order=[
+        DeliveryPoint(address=f"Rua {i}, 1", lat=-22.9, lng=-43.2 + i / 100, romaneio_id="A", package_id=f"P{i}")
+        for i in range(3)
+    ])]
+    return session
+
+
+def _delta(session, package_id):
+    map_stream._publish(session.session_id, {"type": "stop_status", "route_id": "r1", "ids": [package_id]})
+
+
+def _parse(chunk: bytes):
+    """Evento SSE → (id, dados) ; comentário/retry → (None, None)"""
+    event_id_, data = None, None
+    for line in chunk.decode().splitlines():
+        if line.startswith("id: "):
+            event_id_ = line[4:]
+        elif line.startswith("data: "):
+            data = json.loads(line[6:])
+    return event_id_, data
+
+
+async def _read(events, n):
+    chunks = [await asyncio.wait_for(events.__anext__(), timeout=1) for _ in range(n)]
+    return [_parse(c) for c in chunks]
+
+
+async def _connected():
+    return False
+
+
+def _run(session, last_event_id, scenario):
+    async def main():
+        map_stream.bind_loop(asyncio.get_running_loop())
+        stream = MapEventStream(session.session_id, last_event_id, keepalive_s=5)
+        stream.open(session)
+        events = stream.events(_connected)
+        try:
+            assert (await _read(events, 1)) == [(None, None)]  # retry:
+            return await scenario(stream, events)
+        finally:
+            await events.aclose()
+    return asyncio.run(main())
+
+
+def test_first_connection_gets_a_snapshot_with_its_id(session):
+    _delta(session, "P0")
+
+    async def scenario(stream, events):
+        return await _read(events, 1)
+
+    [(snapshot_id, snapshot)] = _run(session, None, scenario)
+
+    assert snapshot["type"] == "snapshot"
+    assert snapshot_id == event_id(map_stream.epoch, 1, session_shape(session))
+
+
+def test_reconnect_with_last_event_id_gets_only_missed_deltas(session):
+    for package_id in ("P0", "P1", "P2"):
+        _delta(session, package_id)
+    last_seen = event_id(map_stream.epoch, 1, session_shape(session))
+
+    async def scenario(stream, events):
+        missed = await _read(events, 2)
+        _delta(session, "P0")  # delta ao vivo depois do replay
+        return missed + await _read(events, 1)
+
+    received = _run(session, last_seen, scenario)
+
+    shape = session_shape(session)
+    assert [i for i, _ in received] == [event_id(map_stream.epoch, seq, shape) for seq in (2, 3, 4)]
+    assert [d["ids"] for _, d in received] == [["P1"], ["P2"], ["P0"]]
+
+
+def test_last_event_id_from_another_process_gets_a_snapshot(session):
+    _delta(session, "P0")
+
+    async def scenario(stream, events):
+        return await _read(events, 1)
+
+    [(_, message)] = _run(session, f"outroepoch:1:{session_shape(session)}", scenario)
+
+    assert message["type"] == "snapshot"
+
+
+def test_gap_in_the_queue_is_repaired_from_the_replay_buffer(session):
+    _delta(session, "P0")
+    last_seen = event_id(map_stream.epoch, 1, session_shape(session))
+
+    async def scenario(stream, events):
+        assert (await _read(events, 1))[0][0] is None  # pong (": pong") - já em dia
+        map_stream.bind_loop(None)  # deltas 2 e 3 "perdidos" pela fila
+        _delta(session, "P1")
+        _delta(session, "P2")
+        map_stream.bind_loop(asyncio.get_running_loop())
+        _delta(session, "P0")  # chega o 4: o servidor percebe o buraco
+        return await _read(events, 3)
+
+    received = _run(session, last_seen, scenario)
+
+    assert [d["seq"] for _, d in received] == [2, 3, 4]
+
+
+@pytest.mark.parametrize("value", [None, "", "abc", "e:1", "e:x:3", "e:1:2:3"])
+def test_invalid_last_event_id_means_snapshot(value):
+    assert parse_event_id(value) == (None, None, None)
@@ -0,0 +1,161 @@
+"""
+🧪 MapStream
+Eventos da sessão viram deltas pequenos com seq contínuo por sessão; quem reconecta
+recebe só os deltas perdidos, ou o snapshot se epoch/shape não batem ou o buraco
+saiu do buffer.
+"""
+import pytest
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.services.map_stream import DELIVERED_COLOR, MapStream, session_shape
+from bot_multidelivery.session import DailySession, Route
+from bot_multidelivery.session_events import EventType, SessionEvent, apply_event
+
+
+def _session():
+    def points(prefix, n):
+        return [DeliveryPoint(address=f"Rua {prefix}{i}, 1", lat=-22.9, lng=-43.2 + i / 100,
+                              romaneio_id="A", package_id=f"{prefix}{i}") for i in range(n)]
+    return DailySession(session_id="s1", session_name="Domingo Tarde", date="2026-10-18", routes=[
+        Route(id="r1", color="#3b82f6", assigned_to_name="Ana", optimized_order=points("P", 3)),
+        Route(id="r2", color="#f59e0b", assigned_to_name="Bia", optimized_order=points("Q", 2)),
+    ])
+
+
+@pytest.fixture
+def stream():
+    """Stream isolado: sem broker global nem loop de WebSocket; `sent` = o que iria ao fan-out"""
+    stream = MapStream(replay_size=8)
+    stream.sent = []
+    stream._emit = lambda session_id, message: stream._on_broker_message(
+        {"session_id": session_id, "message": message})
+    stream._dispatch = lambda session_id, message, key=None: stream.sent.append(message)
+    return stream
+
+
+def _record(stream, session, type_, route_id, package_ids, **data):
+    event = SessionEvent(session_id=session.session_id, type=type_, route_id=route_id,
+                         package_ids=tuple(package_ids), data=data)
+    apply_event(session, event)
+    stream.on_session_event(session, event)
+
+
+def test_delivery_becomes_a_stop_status_delta(stream):
+    session = _session()
+
+    _record(stream, session, EventType.DELIVERED, "r1", ["P1"])
+
+    (delta,) = stream.sent
+    assert delta["type"] == "stop_status" and delta["seq"] == 1
+    assert (delta["ids"], delta["status"], delta["color"]) == (["P1"], "delivered", DELIVERED_COLOR)
+    assert delta["route"]["delivered"] == 1
+    assert "points" not in delta  # não manda o estado inteiro
+
+
+def test_transfer_carries_the_new_shape(stream):
+    session = _session()
+
+    _record(stream, session, EventType.TRANSFERRED, "r1", ["P2"], to_route="r2")
+
+    (delta,) = stream.sent
+    assert delta["type"] == "stop_moved"
+    assert (delta["from_route"], delta["to_route"]) == ("r1", "r2")
+    assert [p["id"] for p in delta["points"]] == ["P2"]
+    assert delta["shape"] == session_shape(session)
+
+
+def test_seq_is_contiguous_per_session(stream):
+    session = _session()
+
+    _record(stream, session, EventType.DELIVERED, "r1", ["P0"])
+    _record(stream, session, EventType.FAILED, "r1", ["P1"], reason="Cliente Ausente")
+    stream.deliverer_position("s1", "r1", -22.9, -43.2)  # posição não é estado: sem seq
+    _record(stream, session, EventType.REORDERED, "r2", [], order=["Q1", "Q0"])
+
+    assert [m.get("seq") for m in stream.sent] == [1, 2, None, 3]
+    assert stream.current_seq("s1") == 3 and stream.current_seq("outra") == 0
+
+
+def test_snapshot_carries_epoch_seq_and_shape(stream):
+    session = _session()
+    _record(stream, session, EventType.DELIVERED, "r1", ["P0"])
+
+    snapshot = stream.snapshot(session)
+
+    assert (snapshot["type"], snapshot["epoch"], snapshot["seq"]) == ("snapshot", stream.epoch, 1)
+    assert snapshot["shape"] == session_shape(session)
+    assert snapshot["total_points"] == 5
+
+
+# ==================== REPLAY (catch_up) ====================
+
+def _deliver_all(stream, session, route_id="r1"):
+    for point in session.get_route(route_id).optimized_order:
+        _record(stream, session, EventType.DELIVERED, route_id, [point.package_id])
+
+
+def test_client_up_to_date_gets_a_pong(stream):
+    session = _session()
+    _deliver_all(stream, session)
+
+    (reply,) = stream.catch_up(session, stream.epoch, 3, session_shape(session))
+
+    assert (reply["type"], reply["seq"]) == ("pong", 3)
+
+
+def test_missed_deltas_are_replayed_from_the_buffer(stream):
+    session = _session()
+    shape = session_shape(session)
+    _deliver_all(stream, session)
+
+    missed = stream.catch_up(session, stream.epoch, 1, shape)
+
+    assert [(m["type"], m["seq"]) for m in missed] == [("stop_status", 2), ("stop_status", 3)]
+    assert stream.replays == 1
+
+
+def test_foreign_epoch_gets_a_snapshot(stream):
+    session = _session()
+    _deliver_all(stream, session)
+
+    (reply,) = stream.catch_up(session, "outro-processo", 1, session_shape(session))
+
+    assert (reply["type"], reply["epoch"], reply["seq"]) == ("snapshot", stream.epoch, 3)
+
+
+def test_shape_mismatch_gets_a_snapshot(stream):
+    session = _session()
+    shape = session_shape(session)
+    _record(stream, session, EventType.DELIVERED, "r1", ["P0"])
+    session.get_route("r2").assigned_to_name = "Carla"  # atribuição fora do log de eventos
+
+    (reply,) = stream.catch_up(session, stream.epoch, 0, shape)
+
+    assert reply["type"] == "snapshot"
+
+
+def test_shape_change_carried_by_a_replayed_delta_is_accepted(stream):
+    session = _session()
+    shape = session_shape(session)
+    _record(stream, session, EventType.TRANSFERRED, "r1", ["P2"], to_route="r2")
+
+    missed = stream.catch_up(session, stream.epoch, 0, shape)
+
+    assert [m["type"] for m in missed] == ["stop_moved"]
+
+
+def test_gap_older_than_the_buffer_gets_a_snapshot(stream):
+    session = _session()
+    for _ in range(4):  # 12 deltas, buffer de 8
+        _deliver_all(stream, session)
+
+    assert stream.catch_up(session, stream.epoch, 2, session_shape(session))[0]["type"] == "snapshot"
+    assert len(stream.catch_up(session, stream.epoch, 4, session_shape(session))) == 8
+
+
+def test_seq_ahead_of_the_server_or_missing_gets_a_snapshot(stream):
+    session = _session()
+    _deliver_all(stream, session)
+
+    assert stream.catch_up(session, stream.epoch, 7, session_shape(session))[0]["type"] == "snapshot"
+    assert stream.catch_up(session, stream.epoch, None, session_shape(session))[0]["type"] == "snapshot"
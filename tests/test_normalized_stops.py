@@ -0,0 +1,82 @@
+"""
+🧪 Romaneios e rotas nas tabelas romaneios / stops / stop_packages
+Save grava paradas (pontos consecutivos no mesmo endereço) em vez do JSON; o load
+reconstrói os pontos; sessões antigas (JSON) continuam legíveis e migram no save.
+"""
+from datetime import datetime
+
+from bot_multidelivery.database import RouteDB, SessionDB, StopDB, StopPackageDB, db_manager
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import DailySession, Romaneio, Route
+from bot_multidelivery.session_changes import point_signature, point_to_dict
+from bot_multidelivery.session_persistence import SessionStore
+
+
+def _points():
+    return [
+        DeliveryPoint(address="Rua A, 1", lat=-22.90, lng=-43.20, romaneio_id="A", package_id="P0", bairro="Leblon"),
+        DeliveryPoint(address="Rua A, 1", lat=-22.90, lng=-43.20, romaneio_id="A", package_id="P1", bairro="Leblon",
+                      priority="alta"),
+        DeliveryPoint(address="Rua B, 2", lat=-22.91, lng=-43.21, romaneio_id="A", package_id="P2",
+                      status="failed", failure_reason="Cliente Ausente"),
+    ]
+
+
+def _session():
+    points = _points()
+    return DailySession(
+        session_id="s1", session_name="Domingo Tarde", date="2026-10-18",
+        romaneios=[Romaneio(id="A", filename="a.xlsx", uploaded_at=datetime(2026, 10, 18, 8, 0), points=list(points))],
+        routes=[Route(id="s1_r1", assigned_to_telegram_id=111, optimized_order=list(reversed(points)))]
+    )
+
+
+def _signatures(points):
+    return [point_signature(p) for p in points]
+
+
+def test_save_writes_stops_instead_of_json(sqlite_db, tmp_path):
+    SessionStore(data_dir=str(tmp_path)).save_session(_session())
+
+    with db_manager.get_session() as db_session:
+        assert db_session.get(SessionDB, "s1").romaneios_data is None
+        assert db_session.get(RouteDB, "s1_r1").optimized_order is None
+        route_stops = db_session.query(StopDB).filter_by(route_id="s1_r1").order_by(StopDB.sequence).all()
+        assert [s.address for s in route_stops] == ["Rua B, 2", "Rua A, 1"]
+        packages = db_session.query(StopPackageDB.package_id, StopPackageDB.stop_id).filter_by(
+            route_id="s1_r1").order_by(StopPackageDB.position).all()
+        assert [p for p, _ in packages] == ["P2", "P1", "P0"]
+        assert packages[1].stop_id == packages[2].stop_id == route_stops[1].id
+
+
+def test_load_rebuilds_points_from_stop_tables(sqlite_db, tmp_path):
+    session = _session()
+    SessionStore(data_dir=str(tmp_path)).save_session(session)
+
+    loaded = SessionStore(data_dir=str(tmp_path)).load_session("s1")
+
+    assert _signatures(loaded.romaneios[0].points) == _signatures(session.romaneios[0].points)
+    assert _signatures(loaded.get_route("s1_r1").optimized_order) == _signatures(session.get_route("s1_r1").optimized_order)
+    assert loaded.romaneios[0].filename == "a.xlsx"
+
+
+def test_legacy_json_session_loads_and_migrates_on_save(sqlite_db, tmp_path):
+    points = _points()
+    with db_manager.get_session() as db_session:
+        db_session.add(SessionDB(
+            session_id="s1", session_name="Domingo Tarde", date="2026-10-18",
+            romaneios_data=[{"id": "A", "filename": "a.xlsx", "uploaded_at": "2026-10-18T08:00:00",
+                             "points": [point_to_dict(p) for p in points]}]
+        ))
+        db_session.add(RouteDB(id="s1_r1", session_id="s1", optimized_order=[point_to_dict(p) for p in points]))
+
+    store = SessionStore(data_dir=str(tmp_path))
+    loaded = store.load_session("s1")
+    assert _signatures(loaded.get_route("s1_r1").optimized_order) == _signatures(points)
+
+    store.save_session(loaded)
+
+    with db_manager.get_session() as db_session:
+        assert db_session.get(SessionDB, "s1").romaneios_data is None
+        assert db_session.query(StopPackageDB).filter_by(route_id="s1_r1").count() == 3
+
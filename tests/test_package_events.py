@@ -0,0 +1,90 @@
+"""
+🧪 PackageDB gravado junto com o evento de entrega
+Status e delivered_at não esperam o snapshot periódico: a linha do pacote vai
+na transação do evento, com o horário do evento (não o do snapshot).
+"""
+from datetime import datetime
+
+import pytest
+
+from bot_multidelivery.database import PackageDB, SessionEventDB, db_manager
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import DailySession, Route
+from bot_multidelivery.session_events import EventType, SessionEvent, apply_event
+from bot_multidelivery.session_persistence import SessionStore
+
+DELIVERED_AT = datetime(2026, 10, 18, 23, 50)
+
+
+@pytest.fixture
+def store(sqlite_db, tmp_path):
+    return SessionStore(data_dir=str(tmp_path))
+
+
+def _point(package_id):
+    return DeliveryPoint(address=f"Rua {package_id}, 1", lat=-22.9, lng=-43.2,
+                         romaneio_id="A", package_id=package_id)
+
+
+def _session():
+    return DailySession(session_id="s1", date="2026-10-18", session_name="Domingo Tarde", routes=[
+        Route(id="s1_r1", assigned_to_telegram_id=111, optimized_order=[_point("P1"), _point("P2")]),
+        Route(id="s1_r2", assigned_to_telegram_id=222),
+    ])
+
+
+def _record(store, session, event_type, route_id, package_ids, created_at=DELIVERED_AT, **data):
+    event = SessionEvent(session_id=session.session_id, type=event_type, route_id=route_id,
+                         package_ids=tuple(package_ids), data=data, created_at=created_at)
+    apply_event(session, event)
+    return store.append_event(event, session)
+
+
+def _package(package_id):
+    with db_manager.get_session() as db_session:
+        row = db_session.get(PackageDB, package_id)
+        return row.status, row.delivered_at, row.failure_reason, row.route_id, row.assigned_to_telegram_id
+
+
+def test_delivery_event_updates_package_without_snapshot(store):
+    session = _session()
+    store.save_session(session)
+
+    event = _record(store, session, EventType.DELIVERED, "s1_r1", ["P1"])
+
+    assert event.seq > 0
+    assert _package("P1")[:2] == ("delivered", DELIVERED_AT)
+    assert _package("P2")[:2] == ("pending", None)
+    with db_manager.get_session() as db_session:
+        assert db_session.query(SessionEventDB).count() == 1
+
+
+def test_snapshot_keeps_the_event_delivery_time(store):
+    session = _session()
+    store.save_session(session)
+    _record(store, session, EventType.DELIVERED, "s1_r1", ["P1"])
+
+    store.save_session(session)  # snapshot periódico, horas depois
+
+    assert _package("P1")[:2] == ("delivered", DELIVERED_AT)
+
+
+def test_failure_after_delivery_clears_delivered_at(store):
+    session = _session()
+    store.save_session(session)
+    _record(store, session, EventType.DELIVERED, "s1_r1", ["P1"])
+
+    _record(store, session, EventType.FAILED, "s1_r1", ["P1"], reason="Cliente Ausente")
+
+    assert _package("P1")[:3] == ("failed", None, "Cliente Ausente")
+
+
+def test_transfer_moves_package_and_keeps_delivered_at(store):
+    session = _session()
+    store.save_session(session)
+    _record(store, session, EventType.DELIVERED, "s1_r1", ["P1"])
+
+    _record(store, session, EventType.TRANSFERRED, "s1_r1", ["P1"],
+            created_at=datetime(2026, 10, 19, 8, 0), to_route="s1_r2")
+
+    assert _package("P1") == ("delivered", DELIVERED_AT, None, "s1_r2", 222)
@@ -0,0 +1,69 @@
+"""
+🧪 PackageDB em lote (INSERT ... ON CONFLICT DO UPDATE)
+Round-trips por save: um upsert por lote de PACKAGE_UPSERT_BATCH, nenhum SELECT
+por pacote; package_id repetido no mesmo lote não quebra o upsert.
+"""
+import math
+
+from bot_multidelivery.database import PackageDB, db_manager
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import DailySession, Route
+from bot_multidelivery.session_persistence import SessionStore
+
+
+def _session(n, duplicate=False):
+    points = [
+        DeliveryPoint(address=f"Rua {i}, 1", lat=-22.9 - i / 1000, lng=-43.2, romaneio_id="A", package_id=f"P{i}")
+        for i in range(n)
+    ]
+    if duplicate:
+        # Mesmo id em outro romaneio (o import numera por romaneio)
+        points.append(DeliveryPoint(address="Rua X, 9", lat=-22.8, lng=-43.1, romaneio_id="B", package_id="P0"))
+    return DailySession(session_id="s1", session_name="Domingo Tarde", date="2026-10-18",
+                        routes=[Route(id="s1_r1", assigned_to_telegram_id=111, optimized_order=points)])
+
+
+def _packages():
+    with db_manager.get_session() as db_session:
+        return {row.id: (row.status, row.route_id) for row in db_session.query(PackageDB)}
+
+
+def test_full_save_upserts_packages_in_batches(sqlite_db, tmp_path):
+    store = SessionStore(data_dir=str(tmp_path))
+    store.package_upsert_batch = 100
+
+    store.save_session(_session(250))
+
+    log = sqlite_db.statements
+    assert len(log.matching("INSERT", "packages")) == math.ceil(250 / 100)
+    assert not log.matching("SELECT", "packages")
+    assert len(_packages()) == 250
+
+
+def test_changed_packages_update_existing_rows(sqlite_db, tmp_path):
+    store = SessionStore(data_dir=str(tmp_path))
+    session = _session(250)
+    store.save_session(session)
+    sqlite_db.statements.clear()
+
+    route = session.get_route("s1_r1")
+    route.mark_as_delivered("P10")
+    route.mark_as_failed("P20", reason="Endereço não encontrado")
+    store.save_session(session)
+
+    assert len(sqlite_db.statements.matching("INSERT", "packages")) == 1
+    packages = _packages()
+    assert len(packages) == 250
+    assert packages["P10"] == ("delivered", "s1_r1")
+    assert packages["P20"] == ("failed", "s1_r1")
+
+
+def test_repeated_package_id_keeps_one_row(sqlite_db, tmp_path):
+    store = SessionStore(data_dir=str(tmp_path))
+
+    store.save_session(_session(3, duplicate=True))
+
+    assert sorted(_packages()) == ["P0", "P1", "P2"]
+    with db_manager.get_session() as db_session:
+        # Um valor por id no lote (o PostgreSQL recusa o mesmo id duas vezes): vale o último
+        assert db_session.get(PackageDB, "P0").address == "Rua X, 9"
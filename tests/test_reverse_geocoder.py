@@ -0,0 +1,36 @@
+"""
+🧪 Bairros por polígono (reverse geocoding offline)
+O mesmo bairro em mais de um GeoJSON é a união das geometrias: os recortes de
+bairros_rj.geojson não podem esconder o polígono completo de zona_sul_rio.json.
+"""
+from pathlib import Path
+
+import pytest
+
+from bot_multidelivery.services.reverse_geocoder import DEFAULT_GEOJSON_FILES, NeighborhoodIndex
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NeighborhoodIndex([str(ROOT / path) for path in DEFAULT_GEOJSON_FILES])
+
+
+@pytest.mark.parametrize("lat, lng, expected", [
+    # Resolvidos pela heurística anterior (BAIRROS_BOUNDS / if-chain)
+    (-23.0, -43.22, "Leblon"),
+    (-23.005, -43.225, "Leblon"),
+    (-22.995, -43.195, "Ipanema"),
+    (-22.987, -43.215, "Ipanema"),
+    (-22.91, -43.18, "Centro"),  # sem polígono: bounding box de fallback
+])
+def test_lookup_keeps_neighborhoods_the_old_heuristic_resolved(index, lat, lng, expected):
+    assert index.lookup(lat, lng) == expected
+
+
+def test_same_name_geometries_are_merged(index):
+    assert index.names.count("Leblon") == 1
+    lat_min, lat_max, lng_min, lng_max = index.bounds("Leblon")
+    # O recorte de bairros_rj.geojson vai só até -22.99 de latitude
+    assert lat_min <= -23.01 and lng_min <= -43.23
@@ -0,0 +1,58 @@
+"""
+🧪 Índices da Route com package_id repetido
+O import numera os pacotes por romaneio ("<sessão>_pkg_<n>"), então o mesmo id
+aparece em romaneios diferentes. Baixa pelo id vale para todas as ocorrências;
+com point_key, só para a parada indicada.
+"""
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import Route
+
+
+def _point(romaneio_id, idx, lat, lng, address):
+    return DeliveryPoint(
+        address=address, lat=lat, lng=lng, romaneio_id=romaneio_id, package_id=f"s1_pkg_{idx}"
+    )
+
+
+def _route():
+    # Romaneio A: pkg_0 e pkg_1 na Rua A; romaneio B: pkg_0 e pkg_1 de novo, na Rua B
+    points = [
+        _point("A", 0, -22.90, -43.20, "Rua A, 1"),
+        _point("A", 1, -22.90, -43.20, "Rua A, 1"),
+        _point("B", 0, -22.95, -43.25, "Rua B, 2"),
+        _point("B", 1, -22.95, -43.25, "Rua B, 2"),
+    ]
+    return Route(id="r1", optimized_order=points)
+
+
+def test_index_keeps_every_occurrence_of_a_package_id():
+    route = _route()
+    assert route.point_indexes("s1_pkg_0") == [0, 2]
+    assert [s.stop_number for s in route.stops_of("s1_pkg_0")] == [1, 2]
+    assert len(route.points_of("s1_pkg_1")) == 2
+
+
+def test_mark_without_keys_updates_all_matches():
+    route = _route()
+    route.mark_as_delivered("s1_pkg_0")
+    assert [p.status for p in route.optimized_order] == ["delivered", "pending", "delivered", "pending"]
+
+    route.mark_as_failed("s1_pkg_0", reason="Ausente")
+    assert [p.status for p in route.points_of("s1_pkg_0")] == ["failed", "failed"]
+    assert not route.is_delivered("s1_pkg_0")
+
+
+def test_mark_with_point_keys_updates_only_that_stop():
+    route = _route()
+    stop = route.get_stop(2)
+    keys = {Route.point_key(p) for p in stop.packages}
+    for package_id in stop.package_ids:
+        route.mark_as_returned(package_id, reason="Recusado", keys=keys)
+    assert [p.status for p in route.optimized_order] == ["pending", "pending", "returned", "returned"]
+
+
+def test_in_place_reorder_is_detected():
+    route = _route()
+    route.point_indexes("s1_pkg_0")
+    route.optimized_order.reverse()  # mesma lista, mesmo tamanho: sem reindex()
+    assert route.point_indexes("s1_pkg_0") == [1, 3]
@@ -0,0 +1,99 @@
+"""
+🧪 Resequenciamento ao vivo
+Reordena as paradas pendentes a partir da posição do entregador; baixa que chega
+durante o await da matriz não pode ser reordenada com a lista velha.
+"""
+import asyncio
+
+import pytest
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.services.osrm_service import DistanceMatrixResult, osrm_client
+from bot_multidelivery.services.route_resequencer import RouteResequencer, pending_stops
+from bot_multidelivery.session import Route
+
+# Paradas numa linha (~1 km entre vizinhas), na ordem ruim 0, 3, 1, 2
+LNGS = [-43.20, -43.23, -43.21, -43.22]
+START = (-22.9, -43.19)
+
+
+@pytest.fixture(autouse=True)
+def haversine_only(monkeypatch):
+    async def table(points, sources=None, destinations=None):
+        return DistanceMatrixResult(
+            distances_km=osrm_client._haversine_matrix(points, sources, destinations),
+            durations_min=None, fallback_used=True
+        )
+    monkeypatch.setattr(osrm_client, "get_distance_matrix_async", table)
+
+
+@pytest.fixture
+def reorders(fresh_manager):
+    events = []
+    fresh_manager.add_event_listener(lambda s, e: events.append(e) if e.type.value == "reordered" else None)
+    return events
+
+
+@pytest.fixture
+def session(fresh_manager):
+    session = fresh_manager.create_new_session("2026-10-19")
+    session.routes = [Route(id="r1", optimized_order=[
+        DeliveryPoint(address=f"Rua {i}, 1", lat=-22.9, lng=lng, romaneio_id="A", package_id=f"P{i}")
+        for i, lng in enumerate(LNGS)
+    ])]
+    fresh_manager.save_session(session)
+    return session
+
+
+def _during_matrix(resequencer, on_await):
+    """Roda on_await(chamada) logo depois de cada await da matriz (baixa chegando no meio)"""
+    real = resequencer._matrix
+    calls = []
+
+    async def matrix(session_id, route, stops):
+        entry = await real(session_id, route, stops)
+        calls.append(len(calls))
+        on_await(len(calls))
+        return entry
+    resequencer._matrix = matrix
+    return calls
+
+
+def test_remaining_stops_are_reordered(session, reorders):
+    resequencer = RouteResequencer()
+
+    summary = asyncio.run(resequencer.resequence(session, session.get_route("r1"), *START))
+
+    assert summary["applied"] and summary["remaining_stops"] == 4
+    assert reorders[-1].data["order"] == ["P0", "P2", "P3", "P1"]
+
+
+def test_stop_completed_during_the_matrix_await_is_not_reordered(session, fresh_manager, reorders):
+    resequencer = RouteResequencer()
+    route = session.get_route("r1")
+
+    def deliver_first_time(call):
+        if call == 1:
+            fresh_manager.record_event(session, "delivered", "r1", ["P2"])
+    calls = _during_matrix(resequencer, deliver_first_time)
+
+    summary = asyncio.run(resequencer.resequence(session, route, *START))
+
+    assert len(calls) == 2  # releu as pendentes e tentou de novo
+    assert summary["remaining_stops"] == 3
+    order = reorders[-1].data["order"]
+    assert order[0] == "P2"  # concluída vai para a frente, fora da nova sequência
+    assert order[1:] == ["P0", "P3", "P1"]
+
+
+def test_route_changing_on_every_await_aborts(session, fresh_manager, reorders):
+    resequencer = RouteResequencer()
+    route = session.get_route("r1")
+    packages = iter(["P3", "P1"])
+
+    calls = _during_matrix(resequencer, lambda call: fresh_manager.record_event(session, "delivered", "r1", [next(packages)]))
+
+    assert asyncio.run(resequencer.resequence(session, route, *START)) is None
+    assert len(calls) == 2
+    assert reorders == []
+    assert [s.packages[0].package_id for s in pending_stops(route)] == ["P0", "P2"]
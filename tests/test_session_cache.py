@@ -0,0 +1,101 @@
+"""
+🧪 LRU de sessões completas
+Expulsa a menos usada acima do limite, as ociosas além do TTL e as finalizadas
+mais cedo; fixadas nunca saem.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from bot_multidelivery import session_cache
+from bot_multidelivery.session_cache import SessionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_cache, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def _session(session_id, finalized=False):
+    return SimpleNamespace(session_id=session_id, is_finalized=finalized)
+
+
+def _cache(pinned=(), **kwargs):
+    evicted = []
+    cache = SessionCache(on_evict=lambda s: evicted.append(s.session_id),
+                         is_pinned=lambda session_id: session_id in pinned, **kwargs)
+    return cache, evicted
+
+
+def test_evicts_least_recently_used_above_max_size(clock):
+    cache, evicted = _cache(max_size=2)
+    cache.put(_session("a"))
+    cache.put(_session("b"))
+    clock.now += 1
+    cache.get("a")  # "b" passa a ser a menos usada
+
+    cache.put(_session("c"))
+
+    assert evicted == ["b"]
+    assert cache.keys() == ["a", "c"]
+
+
+def test_evicts_idle_sessions_after_ttl(clock):
+    cache, evicted = _cache(ttl_s=100)
+    cache.put(_session("a"))
+    cache.put(_session("b"))
+    clock.now += 60
+    cache.get("b")
+    clock.now += 50
+
+    cache.sweep()
+
+    assert evicted == ["a"]
+    assert "b" in cache
+
+
+def test_finalized_sessions_leave_earlier(clock):
+    cache, evicted = _cache(ttl_s=1800, finalized_ttl_s=60)
+    cache.put(_session("open"))
+    cache.put(_session("done", finalized=True))
+    clock.now += 61
+
+    cache.sweep()
+
+    assert evicted == ["done"]
+    assert cache.keys() == ["open"]
+
+
+def test_pinned_sessions_are_never_evicted(clock):
+    cache, evicted = _cache(pinned={"a"}, max_size=1, ttl_s=10)
+    cache.put(_session("a"))
+    cache.put(_session("b"))
+    cache.put(_session("c"))
+    clock.now += 1000
+
+    cache.sweep()
+
+    assert evicted == ["b", "c"]
+    assert cache.keys() == ["a"]
+
+
+def test_on_evict_error_does_not_block_eviction(clock):
+    def failing(session):
+        raise RuntimeError("disco cheio")
+
+    cache = SessionCache(max_size=1, on_evict=failing)
+    cache.put(_session("a"))
+    cache.put(_session("b"))
+
+    assert cache.keys() == ["b"]
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,103 @@
+"""
+🧪 Save incremental de sessões
+diff_session devolve só os pontos/pacotes alterados; o fallback em arquivo vira
+uma linha de journal e o PostgreSQL só atualiza as linhas tocadas.
+"""
+from datetime import datetime
+
+import pytest
+
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import DailySession, Romaneio, Route
+from bot_multidelivery.session_changes import SessionSnapshot, diff_session
+from bot_multidelivery.session_persistence import SessionStore
+
+
+def _point(idx, address):
+    return DeliveryPoint(address=address, lat=-22.9 - idx / 1000, lng=-43.2, romaneio_id="A",
+                         package_id=f"P{idx}")
+
+
+def _session():
+    points = [_point(0, "Rua A, 1"), _point(1, "Rua A, 1"), _point(2, "Rua B, 2"), _point(3, "Rua C, 3")]
+    return DailySession(
+        session_id="s1", session_name="Domingo Tarde", date="2026-10-18",
+        romaneios=[Romaneio(id="A", uploaded_at=datetime(2026, 10, 18, 8, 0), points=list(points))],
+        routes=[Route(id="s1_r1", assigned_to_telegram_id=111, optimized_order=list(points))]
+    )
+
+
+def test_unchanged_session_has_no_changes():
+    session = _session()
+    changes, _ = diff_session(SessionSnapshot.capture(session), session)
+
+    assert changes.is_empty
+
+
+def test_status_change_touches_only_that_point_and_package():
+    session = _session()
+    previous = SessionSnapshot.capture(session)
+
+    session.get_route("s1_r1").mark_as_delivered("P2")
+    changes, _ = diff_session(previous, session)
+
+    assert not changes.is_structural
+    assert list(changes.route_points) == ["s1_r1"]
+    assert list(changes.route_points["s1_r1"]) == [2]
+    assert changes.route_points["s1_r1"][2]["status"] == "delivered"
+    assert changes.packages == {"P2": "s1_r1"}
+    assert changes.route_fields == {"s1_r1": {"delivered_packages": ["P2"]}}
+    assert not changes.routes_relocated  # mesmo endereço: paradas não são regravadas
+
+
+def test_reorder_rewrites_the_route_order():
+    session = _session()
+    previous = SessionSnapshot.capture(session)
+
+    route = session.get_route("s1_r1")
+    route.optimized_order = list(reversed(route.optimized_order))
+    changes, _ = diff_session(previous, session)
+
+    assert changes.is_structural
+    assert [p["package_id"] for p in changes.route_fields["s1_r1"]["optimized_order"]] == ["P3", "P2", "P1", "P0"]
+    assert changes.packages == {}  # pontos iguais, só a ordem mudou
+
+
+def test_file_fallback_appends_a_patch_and_reloads_it(tmp_path):
+    store = SessionStore(data_dir=str(tmp_path))
+    session = _session()
+    store.save_session(session)
+    snapshot = store._session_file("s1").read_bytes()
+
+    session.get_route("s1_r1").mark_as_failed("P3", reason="Cliente Ausente")
+    store.save_session(session)
+
+    assert store._session_file("s1").read_bytes() == snapshot
+    journal = store._journal_file("s1").read_text(encoding="utf-8").splitlines()
+    assert len(journal) == 1
+    assert len(journal[0]) < 1000
+
+    loaded = SessionStore(data_dir=str(tmp_path)).load_session("s1")
+    point = loaded.get_route("s1_r1").get_point("P3")
+    assert (point.status, point.failure_reason) == ("failed", "Cliente Ausente")
+
+
+def test_database_save_updates_only_the_changed_rows(sqlite_db, tmp_path):
+    store = SessionStore(data_dir=str(tmp_path))
+    session = _session()
+    store.save_session(session)
+    sqlite_db.statements.clear()
+
+    session.get_route("s1_r1").mark_as_delivered("P0")
+    store.save_session(session)
+
+    log = sqlite_db.statements
+    assert not log.matching("DELETE", "stops") and not log.matching("INSERT", "stops")
+    assert not log.matching("DELETE", "routes") and not log.matching("INSERT", "routes")
+    # O ponto é o mesmo objeto no romaneio e na rota: um UPDATE por contêiner
+    assert len(log.matching("UPDATE", "stop_packages")) == 2
+    assert len(log.matching("INSERT", "packages")) == 1  # upsert só de P0
+
+    loaded = SessionStore(data_dir=str(tmp_path)).load_session("s1")
+    assert loaded.get_route("s1_r1").get_point("P0").status == "delivered"
+    assert loaded.get_route("s1_r1").delivered_packages == ["P0"]
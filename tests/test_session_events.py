@@ -0,0 +1,75 @@
+"""
+🧪 Replay de eventos com package_id repetido entre romaneios
+Transferência e reordenação identificam pontos pela chave (id + parada);
+eventos antigos, só com package_id, continuam valendo.
+"""
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import DailySession, Route
+from bot_multidelivery.session_events import EventType, SessionEvent, apply_event
+
+
+def _point(romaneio_id, idx, lat, lng, address):
+    return DeliveryPoint(
+        address=address, lat=lat, lng=lng, romaneio_id=romaneio_id, package_id=f"s1_pkg_{idx}"
+    )
+
+
+def _session():
+    # pkg_0 aparece na Rua A (romaneio A) e na Rua B (romaneio B)
+    source = Route(id="r1", optimized_order=[
+        _point("A", 0, -22.90, -43.20, "Rua A, 1"),
+        _point("A", 1, -22.91, -43.21, "Rua C, 3"),
+        _point("B", 0, -22.95, -43.25, "Rua B, 2"),
+    ])
+    target = Route(id="r2")
+    return DailySession(session_id="s1", routes=[source, target])
+
+
+def _event(event_type, package_ids=(), **data):
+    return SessionEvent(session_id="s1", type=event_type, route_id="r1",
+                        package_ids=tuple(package_ids), data=data)
+
+
+def test_transfer_moves_only_the_points_of_that_stop():
+    session = _session()
+    source, target = session.routes
+    stop = source.get_stop(3)  # Rua B
+    event = _event(EventType.TRANSFERRED, stop.package_ids, to_route="r2",
+                   point_keys=[Route.point_key(p) for p in stop.packages])
+
+    assert apply_event(session, event)
+    assert [p.address for p in source.optimized_order] == ["Rua A, 1", "Rua C, 3"]
+    assert [p.address for p in target.optimized_order] == ["Rua B, 2"]
+
+
+def test_status_event_with_point_keys_marks_only_that_stop():
+    session = _session()
+    source = session.routes[0]
+    stop = source.get_stop(1)
+    event = _event(EventType.FAILED, stop.package_ids, reason="Ausente",
+                   point_keys=[Route.point_key(p) for p in stop.packages])
+
+    apply_event(session, event)
+    assert [p.status for p in source.optimized_order] == ["failed", "pending", "pending"]
+
+
+def test_reorder_by_point_keys_keeps_duplicates_apart():
+    session = _session()
+    source = session.routes[0]
+    wanted = [source.optimized_order[i] for i in (2, 1, 0)]
+    event = _event(EventType.REORDERED, order=[p.package_id for p in wanted],
+                   order_keys=[Route.point_key(p) for p in wanted])
+
+    apply_event(session, event)
+    assert [p.address for p in source.optimized_order] == ["Rua B, 2", "Rua C, 3", "Rua A, 1"]
+
+
+def test_legacy_events_fall_back_to_package_ids():
+    session = _session()
+    source = session.routes[0]
+    apply_event(session, _event(EventType.DELIVERED, ["s1_pkg_0"]))
+    assert [p.status for p in source.optimized_order] == ["delivered", "pending", "delivered"]
+
+    # Sem order_keys: id repetido fica na primeira posição em que aparece
+    apply_event(session, _event(EventType.REORDERED, order=["s1_pkg_1", "s1_pkg_0"]))
+    assert [p.address for p in source.optimized_order] == ["Rua C, 3", "Rua A, 1", "Rua B, 2"]
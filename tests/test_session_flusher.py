@@ -0,0 +1,130 @@
+"""
+🧪 Write-behind de sessões
+Marcações na janela viram um save só, flush() grava na hora, erro no save não
+mata a thread e SESSION_FLUSH_WINDOW_MS=0 grava de forma síncrona.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from bot_multidelivery import session_persistence
+from bot_multidelivery.session import SessionManager
+from bot_multidelivery.session_flusher import WriteBehindFlusher
+from bot_multidelivery.session_persistence import SessionStore
+
+
+class Recorder:
+    """save_fn que registra cada save (sessão e thread) e pode falhar nas primeiras chamadas"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.saved = []
+        self.threads = []
+        self.done = threading.Event()
+
+    def __call__(self, session):
+        self.threads.append(threading.current_thread())
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("banco fora do ar")
+        self.saved.append(session.session_id)
+        self.done.set()
+
+
+def _session(session_id="s1"):
+    return SimpleNamespace(session_id=session_id)
+
+
+@pytest.fixture
+def flushers():
+    created = []
+
+    def make(save_fn, window_s):
+        flusher = WriteBehindFlusher(save_fn, window_s=window_s)
+        created.append(flusher)
+        return flusher
+
+    yield make
+    for flusher in created:
+        flusher.close()
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_marks_within_the_window_coalesce_into_one_save(flushers):
+    recorder = Recorder()
+    flusher = flushers(recorder, window_s=0.1)
+    session = _session()
+
+    for _ in range(5):
+        flusher.mark_dirty(session)
+
+    assert recorder.saved == []  # nada gravado dentro da janela
+    assert recorder.done.wait(2.0)
+    time.sleep(0.15)
+    assert recorder.saved == ["s1"]
+    assert flusher.stats()['coalesced'] == 4
+    assert flusher.stats()['pending'] == 0
+
+
+def test_flush_saves_synchronously(flushers):
+    recorder = Recorder()
+    flusher = flushers(recorder, window_s=60)
+    flusher.mark_dirty(_session("s1"))
+    flusher.mark_dirty(_session("s2"))
+
+    flusher.flush("s1")
+
+    assert recorder.saved == ["s1"]
+    assert recorder.threads == [threading.current_thread()]
+    assert flusher.stats()['pending'] == 1
+
+    flusher.flush()
+    assert sorted(recorder.saved) == ["s1", "s2"]
+
+
+def test_save_error_keeps_thread_alive_and_retries(flushers):
+    recorder = Recorder(failures=1)
+    flusher = flushers(recorder, window_s=0.05)
+
+    flusher.mark_dirty(_session("s1"))
+
+    assert recorder.done.wait(2.0)  # 1ª tentativa falha, a próxima janela regrava
+    assert recorder.saved == ["s1"]
+    assert flusher._thread.is_alive()
+
+    flusher.mark_dirty(_session("s2"))
+    assert _wait_for(lambda: "s2" in recorder.saved)
+    assert all(t is flusher._thread for t in recorder.threads)
+
+
+def test_zero_window_saves_in_the_caller_thread(flushers):
+    recorder = Recorder()
+    flusher = flushers(recorder, window_s=0)
+
+    flusher.mark_dirty(_session())
+
+    assert recorder.saved == ["s1"]
+    assert recorder.threads == [threading.current_thread()]
+    assert flusher._thread is None
+
+
+def test_session_manager_with_zero_window_writes_before_returning(tmp_path, monkeypatch):
+    store = SessionStore(data_dir=str(tmp_path))
+    monkeypatch.setattr(session_persistence, "session_store", store)
+    monkeypatch.setenv("SESSION_FLUSH_WINDOW_MS", "0")
+    manager = SessionManager()
+
+    session = manager.create_new_session("2026-10-19")
+
+    assert store._session_file(session.session_id).exists()
+    assert manager._flusher.stats()['pending'] == 0
@@ -0,0 +1,82 @@
+"""
+🧪 SessionManager com o LRU limitado
+Evento gravado por um handler com cópia órfã (sessão expulsa e recarregada
+enquanto ele aguardava) vai para a cópia viva; listagens enxergam as sessões
+fora do cache.
+"""
+import pytest
+
+from bot_multidelivery import session_persistence
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import Route, SessionManager
+from bot_multidelivery.session_persistence import SessionStore
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_persistence, "session_store", SessionStore(data_dir=str(tmp_path)))
+    monkeypatch.setenv("SESSION_FLUSH_WINDOW_MS", "0")
+    monkeypatch.setenv("SESSION_CACHE_SIZE", "1")
+    return SessionManager()
+
+
+def _route():
+    return Route(id="r1", optimized_order=[
+        DeliveryPoint(address=f"Rua {i}, 1", lat=-22.9, lng=-43.2 + i / 100, romaneio_id="A", package_id=f"P{i}")
+        for i in range(2)
+    ])
+
+
+def _evict_and_reload(manager, session):
+    """Outra sessão em foco expulsa `session` (cache de 1); o próximo acesso recarrega"""
+    manager.create_new_session("2026-10-20")
+    manager.active_sessions.sweep()
+    assert session.session_id not in manager.active_sessions
+    return manager.get_session(session.session_id)
+
+
+def test_event_from_orphan_copy_goes_to_live_session(manager):
+    orphan = manager.create_new_session("2026-10-19")
+    orphan.routes = [_route()]
+    manager.save_session(orphan)
+    live = _evict_and_reload(manager, orphan)
+    assert live is not orphan
+    live.current_step = 'separating'  # mudança da cópia viva que não pode se perder
+
+    manager.record_event(orphan, 'delivered', 'r1', ['P0'])
+
+    assert manager.active_sessions.get(orphan.session_id) is live
+    assert live.get_route('r1').get_point('P0').status == 'delivered'
+    assert live.current_step == 'separating'
+
+
+def test_event_for_deleted_session_is_dropped(manager):
+    session = manager.create_new_session("2026-10-19")
+    session.routes = [_route()]
+    manager.save_session(session)
+    manager.delete_session(session.session_id)
+
+    assert manager.record_event(session, 'delivered', 'r1', ['P0']) is None
+    assert session.session_id not in manager.active_sessions
+
+
+def test_pinned_session_survives_cache_pressure(manager):
+    session = manager.create_new_session("2026-10-19")
+
+    with manager.pinned(session.session_id):
+        manager.create_new_session("2026-10-20")
+        manager.active_sessions.sweep()
+        assert session.session_id in manager.active_sessions
+
+    assert session.session_id not in manager.active_sessions
+
+
+def test_list_sessions_includes_sessions_outside_the_cache(manager):
+    first = manager.create_new_session("2026-10-19")
+    second = manager.create_new_session("2026-10-20")
+    manager.active_sessions.sweep()
+    assert first.session_id not in manager.active_sessions
+
+    listed = [s.session_id for s in manager.list_sessions()]
+
+    assert listed == [second.session_id, first.session_id]
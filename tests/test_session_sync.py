@@ -0,0 +1,153 @@
+"""
+🧪 Sessões entre workers (broker remoto)
+Evento aplicado num worker chega na cópia em cache do outro; snapshot gravado
+num worker faz o outro recarregar do armazenamento compartilhado; versões (ETag)
+sobem nos dois. Dashboard: broadcast no loop dos clientes, mesmo publicado de
+outra thread.
+"""
+import asyncio
+import threading
+
+import pytest
+
+from bot_multidelivery import session_persistence, snapshot_format
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.services.broker import Broker, broker
+from bot_multidelivery.services.dashboard_service import DASHBOARD_TOPIC, NOTIFICATIONS_TOPIC, DashboardWebSocket
+from bot_multidelivery.session import Route, SessionManager
+from bot_multidelivery.session_persistence import SessionStore
+
+
+class LinkedBroker(Broker):
+    """Backend remoto de teste: entrega a todos os brokers ligados (como o Redis, com serialização)"""
+
+    name = "linked"
+    remote = True
+
+    def __init__(self, peers):
+        super().__init__()
+        self.peers = peers
+        peers.append(self)
+
+    def publish(self, topic, message):
+        raw = snapshot_format.dumps_json(message)
+        for peer in self.peers:
+            peer._deliver_local(topic, snapshot_format.loads_json(raw))
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Dois SessionManagers (workers) com o mesmo armazenamento e o broker ligado"""
+    monkeypatch.setattr(session_persistence, "session_store", SessionStore(data_dir=str(tmp_path)))
+    monkeypatch.setenv("SESSION_FLUSH_WINDOW_MS", "0")
+    peers = []
+    a, b = SessionManager(), SessionManager()
+    a.enable_sync(LinkedBroker(peers))
+    b.enable_sync(LinkedBroker(peers))
+    return a, b
+
+
+def _session_on(a, b):
+    session = a.create_new_session("2026-10-19")
+    session.routes = [Route(id="r1", optimized_order=[
+        DeliveryPoint(address=f"Rua {i}, 1", lat=-22.9, lng=-43.2 + i / 100, romaneio_id="A", package_id=f"P{i}")
+        for i in range(2)
+    ])]
+    a.save_session(session)
+    return session, b.get_session(session.session_id)
+
+
+def test_session_created_on_one_worker_is_visible_on_the_other(workers):
+    a, b = workers
+
+    session, copy = _session_on(a, b)
+
+    assert session.session_id in [h.session_id for h in b.list_headers()]
+    assert copy is not None and copy is not session
+    assert copy.get_route("r1").total_packages == 2
+
+
+def test_event_is_applied_to_the_other_workers_copy(workers):
+    a, b = workers
+    session, copy = _session_on(a, b)
+    version = b.version(session.session_id)[0]
+    seen_by_b = []
+    b.add_event_listener(lambda s, e: seen_by_b.append(e))
+
+    a.record_event(session, 'delivered', 'r1', ['P0'])
+
+    assert copy.get_route("r1").get_point("P0").status == 'delivered'
+    assert copy.event_seq == session.event_seq
+    assert b.version(session.session_id)[0] > version  # ETag do outro worker muda
+    assert seen_by_b == []  # deltas do mapa/dashboard já saíram do worker de origem
+
+
+def test_snapshot_on_one_worker_reloads_the_other(workers):
+    a, b = workers
+    session, copy = _session_on(a, b)
+
+    session.current_step = 'separating'
+    a.save_session(session)
+
+    assert session.session_id not in b.active_sessions
+    reloaded = b.get_session(session.session_id)
+    assert reloaded is not copy and reloaded.current_step == 'separating'
+
+
+def test_pinned_copy_is_kept_on_foreign_snapshot(workers):
+    a, b = workers
+    session, copy = _session_on(a, b)
+
+    with b.pinned(session.session_id):
+        a.save_session(session)
+        assert b.get_session(session.session_id) is copy
+
+
+def test_delete_on_one_worker_drops_the_other_copy(workers):
+    a, b = workers
+    session, _ = _session_on(a, b)
+
+    a.delete_session(session.session_id)
+
+    assert session.session_id not in b.active_sessions
+    assert session.session_id not in b.headers
+
+
+def test_memory_broker_does_not_enable_sync(fresh_manager):
+    memory = Broker()
+
+    fresh_manager.enable_sync(memory)
+
+    assert fresh_manager._sync is None
+    assert not memory.stats()["topics"]
+
+
+def test_dashboard_broadcast_runs_on_the_clients_loop():
+    dashboard = DashboardWebSocket()
+    dashboard_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=dashboard_loop.run_forever, daemon=True)
+    thread.start()
+    sent = threading.Event()
+    loops = []
+
+    class Client:
+        async def send_json(self, message):
+            loops.append(asyncio.get_running_loop())
+            sent.set()
+
+    try:
+        dashboard._loop = dashboard_loop
+        dashboard.clients.add(Client())
+
+        async def publisher():  # ex: thread do bot, com o próprio loop
+            dashboard._on_broker_message({"type": "delivery_update"})
+        asyncio.run(publisher())
+
+        assert sent.wait(2)
+        assert loops == [dashboard_loop]
+    finally:
+        for topic in (DASHBOARD_TOPIC, NOTIFICATIONS_TOPIC):
+            broker.unsubscribe(topic, dashboard._on_broker_message)
+        dashboard_loop.call_soon_threadsafe(dashboard_loop.stop)
+        thread.join(2)
+        dashboard_loop.close()
@@ -0,0 +1,94 @@
+"""
+🧪 Formato binário dos snapshots
+Round-trip, rejeição de arquivo truncado/corrompido/de versão futura, leitura do
+JSON legado (indent=2) e gravação atômica.
+"""
+import json
+import struct
+
+import pytest
+
+from bot_multidelivery import snapshot_format
+from bot_multidelivery.models import DeliveryPoint
+from bot_multidelivery.session import DailySession, Route
+from bot_multidelivery.snapshot_format import COMPRESSION_NONE, COMPRESSION_ZSTD, HEADER, SnapshotError
+from bot_multidelivery.session_persistence import SessionStore
+
+DATA = {"session_id": "s1", "date": "2026-10-18", "routes": [{"id": "s1_r1", "color": "#ff0000"}],
+        "session_name": "Domingo Tarde – Zona Sul"}
+
+
+def test_round_trip():
+    raw = snapshot_format.encode(DATA, COMPRESSION_NONE)
+
+    assert raw.startswith(snapshot_format.MAGIC)
+    assert snapshot_format.decode(raw) == DATA
+
+
+def test_round_trip_with_zstd():
+    pytest.importorskip("zstandard")
+    raw = snapshot_format.encode(DATA, COMPRESSION_ZSTD)
+
+    assert snapshot_format.decode(raw) == DATA
+
+
+def test_truncated_payload_is_rejected():
+    raw = snapshot_format.encode(DATA, COMPRESSION_NONE)
+
+    with pytest.raises(SnapshotError):
+        snapshot_format.decode(raw[:-5])
+
+
+def test_corrupted_payload_fails_crc():
+    raw = bytearray(snapshot_format.encode(DATA, COMPRESSION_NONE))
+    raw[HEADER.size + 3] ^= 0xFF
+
+    with pytest.raises(SnapshotError):
+        snapshot_format.decode(bytes(raw))
+
+
+def test_truncated_header_is_rejected():
+    raw = snapshot_format.encode(DATA, COMPRESSION_NONE)
+
+    with pytest.raises(SnapshotError):
+        snapshot_format.decode(raw[:HEADER.size - 2])
+
+
+def test_newer_version_is_rejected():
+    raw = bytearray(snapshot_format.encode(DATA, COMPRESSION_NONE))
+    struct.pack_into('<B', raw, 4, snapshot_format.VERSION + 1)
+
+    with pytest.raises(SnapshotError):
+        snapshot_format.decode(bytes(raw))
+
+
+def test_legacy_indented_json_is_read():
+    raw = json.dumps(DATA, indent=2, ensure_ascii=False).encode('utf-8')
+
+    assert snapshot_format.decode(raw) == DATA
+
+
+def test_dump_replaces_atomically(tmp_path):
+    path = tmp_path / f"s1{snapshot_format.SUFFIX}"
+    snapshot_format.dump(path, {"v": 1}, COMPRESSION_NONE)
+    snapshot_format.dump(path, DATA, COMPRESSION_NONE)
+
+    assert snapshot_format.load(path) == DATA
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]  # nenhum .s1.snap.tmp sobrando
+
+
+def test_store_reads_legacy_json_session_and_rewrites_as_snapshot(tmp_path):
+    point = DeliveryPoint(address="Rua A, 1", lat=-22.9, lng=-43.2, romaneio_id="A", package_id="P0")
+    session = DailySession(session_id="s1", session_name="Domingo Tarde", date="2026-10-18",
+                           routes=[Route(id="s1_r1", optimized_order=[point])])
+    store = SessionStore(data_dir=str(tmp_path))
+    store.sessions_dir.mkdir(parents=True, exist_ok=True)
+    legacy = store._legacy_session_file("s1")
+    legacy.write_text(json.dumps(store._session_to_dict(session), indent=2, ensure_ascii=False), encoding="utf-8")
+
+    loaded = store.load_session("s1")
+    assert loaded.get_route("s1_r1").get_point("P0").address == "Rua A, 1"
+
+    loaded.routes.append(Route(id="s1_r2"))  # mudança estrutural: reescreve a base
+    store.save_session(loaded)
+    assert store._session_file("s1").exists() and not legacy.exists()
@@ -0,0 +1,113 @@
+"""
+🧪 FanoutHub
+Cliente lento perde as mensagens mais antigas e tem a mesma chave coalescida;
+envio travado estoura o timeout e a conexão sai do canal.
+"""
+import asyncio
+
+from bot_multidelivery.services.ws_fanout import FanoutHub
+
+
+class SlowSocket:
+    """send que só termina quando o teste libera o portão"""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.received = []
+        self.closed = False
+
+    async def send(self, message):
+        await self.gate.wait()
+        self.received.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+async def _drain():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_slow_subscriber_drops_oldest_and_coalesces_by_key():
+    async def scenario():
+        hub = FanoutHub(max_queue=3, send_timeout_s=5)
+        socket = SlowSocket()
+        subscriber = hub.subscribe("s1", socket.send, socket.close)
+        hub.publish("s1", {"n": 0})
+        await _drain()  # a task de envio pegou n=0 e está presa no socket
+
+        for n in range(1, 5):
+            hub.publish("s1", {"n": n})
+        hub.publish("s1", {"point": "P1", "status": "pending"}, key=("r1", "P1"))
+        hub.publish("s1", {"point": "P1", "status": "delivered"}, key=("r1", "P1"))
+
+        socket.gate.set()
+        await _drain()
+        await hub.unsubscribe(subscriber)
+        return hub, socket, subscriber
+
+    hub, socket, subscriber = asyncio.run(scenario())
+
+    assert socket.received == [{"n": 0}, {"n": 3}, {"n": 4}, {"point": "P1", "status": "delivered"}]
+    assert (subscriber.dropped, subscriber.coalesced) == (2, 1)
+    assert not socket.closed  # saída normal não fecha o socket de novo
+    assert not hub.has_subscribers("s1")
+
+
+def test_publish_does_not_wait_for_slow_sockets():
+    async def scenario():
+        hub = FanoutHub(max_queue=8, send_timeout_s=5)
+        slow, fast = SlowSocket(), SlowSocket()
+        fast.gate.set()
+        hub.subscribe("s1", slow.send)
+        hub.subscribe("s1", fast.send)
+
+        delivered_to = hub.publish("s1", {"n": 1})
+        await _drain()
+        return delivered_to, slow, fast, hub
+
+    delivered_to, slow, fast, hub = asyncio.run(scenario())
+
+    assert delivered_to == 2
+    assert fast.received == [{"n": 1}] and slow.received == []
+    assert hub.publish("outro", {"n": 1}) == 0
+
+
+def test_stuck_send_times_out_and_evicts_connection():
+    async def scenario():
+        hub = FanoutHub(max_queue=8, send_timeout_s=0.05)
+        socket = SlowSocket()
+        hub.subscribe("s1", socket.send, socket.close)
+        hub.publish("s1", {"n": 1})
+        await asyncio.sleep(0.2)
+        return hub, socket
+
+    hub, socket = asyncio.run(scenario())
+
+    assert socket.closed
+    assert not hub.has_subscribers("s1")
+    assert hub.stats()['evicted'] == 1
+
+
+def test_failing_send_evicts_only_that_connection():
+    async def scenario():
+        hub = FanoutHub(max_queue=8, send_timeout_s=5)
+        healthy = SlowSocket()
+        healthy.gate.set()
+
+        async def broken(message):
+            raise ConnectionResetError("socket fechado")
+
+        hub.subscribe("s1", broken)
+        hub.subscribe("s1", healthy.send)
+        hub.publish("s1", {"n": 1})
+        await _drain()
+        hub.publish("s1", {"n": 2})
+        await _drain()
+        return hub, healthy
+
+    hub, healthy = asyncio.run(scenario())
+
+    assert healthy.received == [{"n": 1}, {"n": 2}]
+    assert hub.subscriber_count("s1") == 1
@@ -0,0 +1,309 @@
+/**
+ * 🧪 Harness do stream do mapa em tempo real (cliente)
+ * Exercita src/lib/mapStream.js (o mesmo reducer do MapRealtimeView) sem navegador.
+ *
+ * Uso:
+ *   node scripts/map-stream-harness.mjs
+ *       Cenários sintéticos: deltas em ordem, duplicado, buraco → um único resync,
+ *       pong defasado, transferência/reordenação idempotentes, pontos geocodificados.
+ *
+ *   node scripts/map-stream-harness.mjs --replay stream.jsonl
+ *       Reaplica mensagens gravadas (uma por linha). A primeira deve ser um snapshot;
+ *       cada snapshot seguinte é comparado com o estado montado pelos deltas.
+ *
+ *   node --experimental-websocket scripts/map-stream-harness.mjs \
+ *       --url ws://localhost:8000/api/map/ws/<session_id> [--clients 10] [--seconds 60] [--flaky 15] [--record stream.jsonl]
+ *       N clientes ao vivo: contam bytes/mensagens/resyncs e, no fim, pedem um snapshot
+ *       e comparam com o estado montado pelos deltas. --flaky N derruba o socket a
+ *       cada N s (reconexão com o último seq → replay só do que foi perdido).
+ *       (Node 22+ tem WebSocket global; no Node 20 use --experimental-websocket.)
+ */
+import assert from 'node:assert/strict';
+import { readFileSync, appendFileSync } from 'node:fs';
+import { applyMapMessage, subscribeMessage, resyncMessage, sseUrl } from '../src/lib/mapStream.js';
+
+const args = process.argv.slice(2);
+const option = (name, fallback) => {
+  const idx = args.indexOf(`--${name}`);
+  return idx >= 0 ? args[idx + 1] : fallback;
+};
+
+// Forma comparável do estado (o que o mapa desenha)
+const comparable = (state) => ({
+  points: Object.fromEntries(state.points.map(p => [p.id, [p.route_id, p.sequence, p.status, p.color]])),
+  routes: Object.fromEntries(state.routes_summary.map(r => [r.route_id, [r.total, r.delivered, r.pending]])),
+});
+
+const diff = (built, snapshot) => {
+  const a = comparable(built);
+  const b = comparable(snapshot);
+  const problems = [];
+  for (const id of new Set([...Object.keys(a.points), ...Object.keys(b.points)])) {
+    if (JSON.stringify(a.points[id]) !== JSON.stringify(b.points[id])) {
+      problems.push(`ponto ${id}: deltas=${JSON.stringify(a.points[id])} snapshot=${JSON.stringify(b.points[id])}`);
+    }
+  }
+  for (const id of new Set([...Object.keys(a.routes), ...Object.keys(b.routes)])) {
+    if (JSON.stringify(a.routes[id]) !== JSON.stringify(b.routes[id])) {
+      problems.push(`rota ${id}: deltas=${JSON.stringify(a.routes[id])} snapshot=${JSON.stringify(b.routes[id])}`);
+    }
+  }
+  if (built.shape !== snapshot.shape) problems.push(`shape: deltas=${built.shape} snapshot=${snapshot.shape}`);
+  return problems;
+};
+
+// ==================== CENÁRIOS SINTÉTICOS ====================
+
+const point = (id, route, sequence, color) => ({
+  id, route_id: route, sequence, status: 'pending', color, route_color: color,
+  deliverer: route.toUpperCase(), address: `Rua ${id}`, lat: -23.5, lng: -46.6,
+});
+
+const summary = (route, color, total, delivered) => ({
+  route_id: route, color, deliverer: route.toUpperCase(), total, delivered,
+  pending: total - delivered, completion_rate: total ? (delivered / total) * 100 : 0,
+});
+
+const baseSnapshot = () => ({
+  type: 'snapshot', status: 'success', epoch: 'e1', seq: 10, shape: 111,
+  points: [point('p1', 'a', 1, '#111'), point('p2', 'a', 2, '#111'), point('p3', 'a', 3, '#111'),
+    point('q1', 'b', 1, '#222')],
+  routes_summary: [summary('a', '#111', 3, 0), summary('b', '#222', 1, 0)],
+});
+
+const byId = (state) => Object.fromEntries(state.points.map(p => [p.id, p]));
+
+function runScenarios() {
+  const scenarios = {
+    'snapshot + delta em ordem': () => {
+      let { state } = applyMapMessage(null, baseSnapshot());
+      const r = applyMapMessage(state, {
+        type: 'stop_status', seq: 11, route_id: 'a', ids: ['p1'], status: 'delivered', color: '#22c55e',
+        route: summary('a', '#111', 3, 1),
+      });
+      state = r.state;
+      assert.equal(r.resync, false);
+      assert.deepEqual(r.changed, ['p1']);
+      assert.equal(state.seq, 11);
+      assert.equal(byId(state).p1.status, 'delivered');
+      assert.equal(state.routes_summary[0].delivered, 1);
+    },
+    'delta duplicado é ignorado': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      const r = applyMapMessage(state, { type: 'stop_status', seq: 10, route_id: 'a', ids: ['p1'], status: 'failed', color: '#f00', route: summary('a', '#111', 3, 0) });
+      assert.equal(r.state, state);
+      assert.equal(r.resync, false);
+    },
+    'buraco de seq pede um único resync': () => {
+      let { state } = applyMapMessage(null, baseSnapshot());
+      const gap = applyMapMessage(state, { type: 'route_reordered', seq: 12, route_id: 'a', order: ['p3', 'p2', 'p1'] });
+      assert.equal(gap.resync, true);
+      assert.equal(byId(gap.state).p3.sequence, 3, 'delta após buraco não pode ser aplicado');
+      const again = applyMapMessage(gap.state, { type: 'route_reordered', seq: 13, route_id: 'a', order: ['p1'] });
+      assert.equal(again.resync, false, 'resync já pedido');
+      state = applyMapMessage(again.state, { ...baseSnapshot(), seq: 13 }).state;
+      assert.equal(state.resyncing, undefined);
+      assert.equal(state.seq, 13);
+    },
+    'replay dos deltas perdidos fecha o buraco': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      const missed = { type: 'stop_status', seq: 11, route_id: 'a', ids: ['p1'], status: 'delivered', color: '#22c55e', route: summary('a', '#111', 3, 1) };
+      const late = { type: 'stop_status', seq: 12, route_id: 'a', ids: ['p2'], status: 'failed', color: '#ef4444', route: summary('a', '#111', 3, 1) };
+      const gap = applyMapMessage(state, late);
+      assert.equal(gap.resync, true);
+      assert.deepEqual(JSON.parse(resyncMessage(gap.state)), { type: 'resync', epoch: 'e1', seq: 10, shape: 111 });
+      // Servidor reenvia 11 e 12 a partir do buffer
+      let next = applyMapMessage(gap.state, missed).state;
+      next = applyMapMessage(next, late).state;
+      assert.equal(next.seq, 12);
+      assert.equal(next.resyncing, undefined);
+      assert.deepEqual([byId(next).p1.status, byId(next).p2.status], ['delivered', 'failed']);
+    },
+    'pong defasado pede resync': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      assert.equal(applyMapMessage(state, { type: 'pong', epoch: 'e1', seq: 10, shape: 111 }).resync, false);
+      assert.equal(applyMapMessage(state, { type: 'pong', epoch: 'e1', seq: 11, shape: 111 }).resync, true);
+      assert.equal(applyMapMessage(state, { type: 'pong', epoch: 'e2', seq: 10, shape: 111 }).resync, true);
+      assert.equal(applyMapMessage(state, { type: 'pong', epoch: 'e1', seq: 10, shape: 222 }).resync, true);
+    },
+    'parada movida renumera origem e destino (idempotente)': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      const moved = {
+        type: 'stop_moved', seq: 11, from_route: 'a', to_route: 'b', points: [{ id: 'p2', color: '#222' }],
+        routes: [summary('a', '#111', 2, 0), summary('b', '#222', 2, 0)], shape: 333,
+      };
+      const once = applyMapMessage(state, moved).state;
+      const points = byId(once);
+      assert.deepEqual([points.p1.sequence, points.p3.sequence], [1, 2]);
+      assert.deepEqual([points.p2.route_id, points.p2.sequence, points.p2.color], ['b', 2, '#222']);
+      assert.equal(once.shape, 333);
+      const twice = applyMapMessage({ ...once, seq: 10 }, moved).state;
+      assert.deepEqual(comparable(twice), comparable(once));
+    },
+    'reordenação mantém ids fora da ordem no fim': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      const next = applyMapMessage(state, { type: 'route_reordered', seq: 11, route_id: 'a', order: ['p3', 'p1'] }).state;
+      const points = byId(next);
+      assert.deepEqual([points.p3.sequence, points.p1.sequence, points.p2.sequence], [1, 2, 3]);
+    },
+    'geocoding em background adiciona/move pontos': () => {
+      const empty = { type: 'snapshot', status: 'empty', epoch: 'e1', seq: 10, shape: 111, points: [], routes_summary: [] };
+      let { state } = applyMapMessage(null, empty);
+      const located = { ...point('r1', 'unassigned', 0, '#9ca3af'), lat: -23.1, lng: -46.1 };
+      const r = applyMapMessage(state, { type: 'points_geocoded', seq: 11, points: [located] });
+      state = r.state;
+      assert.deepEqual(r.changed, ['r1']);
+      assert.equal(state.status, 'planning');
+      assert.equal(state.total_points, 1);
+      const moved = applyMapMessage(state, { type: 'points_geocoded', seq: 12, points: [{ ...located, lat: -23.2 }] }).state;
+      assert.equal(moved.points.length, 1, 'ponto já no mapa não duplica');
+      assert.equal(byId(moved).r1.lat, -23.2);
+    },
+    'posição do entregador não consome seq': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      const next = applyMapMessage(state, { type: 'deliverer_position', route_id: 'a', lat: 1, lng: 2 }).state;
+      assert.equal(next.seq, 10);
+      assert.equal(next.positions.a.lat, 1);
+    },
+    'subscribe informa a versão atual': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      assert.deepEqual(JSON.parse(subscribeMessage(state)), { type: 'subscribe', epoch: 'e1', seq: 10, shape: 111 });
+      assert.deepEqual(JSON.parse(subscribeMessage(null)), { type: 'subscribe', epoch: null, seq: null, shape: null });
+    },
+    'SSE retoma da versão atual': () => {
+      const { state } = applyMapMessage(null, baseSnapshot());
+      assert.equal(sseUrl('s1', state), '/api/map/sse/s1?last_event_id=e1%3A10%3A111');
+      assert.equal(sseUrl('s1', null), '/api/map/sse/s1');
+    },
+  };
+
+  let failed = 0;
+  for (const [name, run] of Object.entries(scenarios)) {
+    try {
+      run();
+      console.log(`✅ ${name}`);
+    } catch (err) {
+      failed += 1;
+      console.log(`❌ ${name}: ${err.message}`);
+    }
+  }
+  return failed;
+}
+
+// ==================== REPLAY ====================
+
+function runReplay(file) {
+  const messages = readFileSync(file, 'utf-8').split('\n').filter(Boolean).map(line => JSON.parse(line));
+  let state = null;
+  let deltas = 0;
+  let checks = 0;
+  let problems = 0;
+  for (const message of messages) {
+    // Com resync pendente o estado está sabidamente defasado: só o snapshot corrige
+    if (message.type === 'snapshot' && state && !state.resyncing) {
+      const found = diff(state, message);
+      checks += 1;
+      problems += found.length;
+      found.slice(0, 10).forEach(p => console.log(`❌ seq ${message.seq}: ${p}`));
+    }
+    const result = applyMapMessage(state, message);
+    if (result.resync) console.log(`⚠️ resync pedido em ${message.type} seq=${message.seq} (estado em ${state?.seq})`);
+    if (message.seq !== undefined && message.type !== 'snapshot' && message.type !== 'pong') deltas += 1;
+    state = result.state;
+  }
+  console.log(`📼 ${messages.length} mensagens, ${deltas} deltas, ${checks} snapshots conferidos, ${problems} divergências`);
+  return problems;
+}
+
+// ==================== AO VIVO ====================
+
+// Um cliente: se flakySeconds > 0, derruba e reabre o socket periodicamente
+// (rede instável) e reinscreve com o último seq visto.
+function runClient(url, index, seconds, flakySeconds, record) {
+  return new Promise((resolve) => {
+    const stats = { index, messages: 0, bytes: 0, snapshots: 0, deltas: 0, resyncs: 0, reconnects: 0, problems: [] };
+    let state = null;
+    let ws = null;
+    let verifying = false;
+    let done = false;
+    const timers = [];
+    const finish = () => {
+      if (done) return;
+      done = true;
+      timers.forEach(clearInterval);
+      try { ws.close(); } catch (e) { /* já fechado */ }
+      resolve(stats);
+    };
+
+    const connect = () => {
+      ws = new WebSocket(url);
+      ws.onopen = () => ws.send(subscribeMessage(state));
+      ws.onmessage = (event) => {
+        stats.messages += 1;
+        stats.bytes += event.data.length;
+        if (record && index === 0) appendFileSync(record, `${event.data}\n`);
+        const message = JSON.parse(event.data);
+        if (message.type === 'snapshot') {
+          stats.snapshots += 1;
+          if (verifying && state) {
+            stats.problems = diff(state, message);
+            finish();
+            return;
+          }
+        } else if (typeof message.seq === 'number' && message.type !== 'pong') {
+          stats.deltas += 1;
+        }
+        const result = applyMapMessage(state, message);
+        state = result.state;
+        if (result.resync && !verifying) {
+          stats.resyncs += 1;
+          ws.send(resyncMessage(state));
+        }
+      };
+      ws.onclose = () => { if (verifying) finish(); };
+    };
+
+    connect();
+    timers.push(setInterval(() => ws.readyState === WebSocket.OPEN && ws.send('ping'), 30000));
+    if (flakySeconds > 0) {
+      timers.push(setInterval(() => {
+        if (verifying) return;
+        stats.reconnects += 1;
+        ws.onclose = null;
+        ws.close();
+        setTimeout(connect, 500 + Math.random() * 1500);
+      }, flakySeconds * 1000));
+    }
+    setTimeout(() => {
+      // Confere o estado montado por deltas/replays contra um snapshot forçado
+      verifying = true;
+      if (ws.readyState === WebSocket.OPEN) ws.send(resyncMessage(null));
+      setTimeout(finish, 5000);
+    }, seconds * 1000);
+  });
+}
+
+async function runLive(url) {
+  if (typeof WebSocket === 'undefined') {
+    console.log('WebSocket indisponível neste Node: use Node 22+ ou node --experimental-websocket');
+    return 1;
+  }
+  const clients = parseInt(option('clients', '5'), 10);
+  const seconds = parseInt(option('seconds', '60'), 10);
+  const flaky = parseInt(option('flaky', '0'), 10);
+  const record = option('record', null);
+  console.log(`🔌 ${clients} clientes em ${url} por ${seconds}s${flaky ? ` (reconectando a cada ${flaky}s)` : ''}`);
+  const results = await Promise.all(Array.from({ length: clients }, (_, i) => runClient(url, i, seconds, flaky, record)));
+  let problems = 0;
+  for (const s of results) {
+    problems += s.problems.length;
+    console.log(`#${s.index}: ${s.messages} msgs, ${(s.bytes / 1024).toFixed(1)} KB, ${s.snapshots} snapshots, ${s.deltas} deltas, ${s.resyncs} resyncs, ${s.reconnects} reconexões, ${s.problems.length} divergências`);
+    s.problems.slice(0, 5).forEach(p => console.log(`   ❌ ${p}`));
+  }
+  return problems;
+}
+
+const url = option('url', null);
+const replay = option('replay', null);
+const failures = url ? await runLive(url) : replay ? runReplay(replay) : runScenarios();
+process.exit(failures ? 1 : 0);
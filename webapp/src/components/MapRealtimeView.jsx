@@ -2,30 +2,65 @@ import React, { useState, useEffect, useRef, useCallback } from 'react';
 import L from 'leaflet';
 import 'leaflet/dist/leaflet.css';
 import { Maximize, Minimize } from 'lucide-react';
+import { applyMapMessage, subscribeMessage, resyncMessage, sseUrl } from '../lib/mapStream';
+import { CLUSTER_THRESHOLD, clustersUrl, clusterRadius, createClusterLoader } from '../lib/mapClusters';
+
+const STATUS_LABELS = {
+  delivered: '✅ Entregue',
+  failed: '❌ Insucesso',
+  returned: '↩️ Devolvido',
+};
+
+const pointPopupHtml = (point) => `
+        <div style="font-size:12px; width:220px">
+          <strong>${point.address}</strong><br/>
+          <small>Rota: ${point.route_color} | Parada: ${point.sequence}</small><br/>
+          <small>Status: ${STATUS_LABELS[point.status] || '⏳ Pendente'}</small>
+          <div style="margin-top:8px; display:flex; gap:6px">
+            <a target="_blank" rel="noreferrer" href="https://www.google.com/maps/dir/?api=1&destination=${point.lat},${point.lng}" style="flex:1;padding:6px 8px;background:#2563eb;color:white;border-radius:8px;text-decoration:none;font-size:12px;text-align:center">Navegar</a>
+            ${point.status !== 'delivered' ? `<button data-point-id="${point.id}" data-route-id="${point.route_id}" data-sequence="${point.sequence}" style="flex:1;padding:6px 8px;background:#16a34a;color:white;border-radius:8px;border:none;font-size:12px;cursor:pointer">Entregar</button>` : ''}
+            <button class="generate-link" data-route-id="${point.route_id}" style="padding:6px 8px;background:#f59e0b;color:white;border-radius:8px;border:none;font-size:12px;cursor:pointer">Gerar link</button>
+          </div>
+        </div>
+      `;
 
 /**
  * MapRealtimeView
  * Mostra mapa com rotas coloridas
- * Atualiza em tempo real via WebSocket quando entregador completa entrega
+ * Atualiza em tempo real via WebSocket: deltas versionados (lib/mapStream.js);
+ * ao reconectar recebe só o que perdeu. Se o WebSocket não abre (proxy) ou com
+ * ?transport=sse, usa o stream SSE (EventSource, retoma pelo Last-Event-ID).
+ * Marcadores são redesenhados só quando a estrutura muda; mudança de status
+ * atualiza o marcador no lugar.
+ * Sessões com mais de CLUSTER_THRESHOLD pontos: marcadores agrupados pelo
+ * servidor, só da área visível, recarregados ao mover o mapa ou receber delta.
  */
 export default function MapRealtimeView({ sessionId }) {
   const mapContainer = useRef(null);
   const map = useRef(null);
   const markersLayer = useRef(null);
   const markersById = useRef({});
+  const delivererMarkers = useRef({});
+  const streamState = useRef(null);
   const [mapData, setMapData] = useState(null);
+  const [layoutVersion, setLayoutVersion] = useState(0);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [emptyState, setEmptyState] = useState(null);
   const [wsConnected, setWsConnected] = useState(false);
   const [reconnectAttempt, setReconnectAttempt] = useState(0);
   const wsRef = useRef(null);
+  const sseRef = useRef(null);
   const pingIntervalRef = useRef(null);
   const reconnectTimeoutRef = useRef(null);
   const [activeSessionId, setActiveSessionId] = useState(sessionId || null);
   const routesSummary = mapData?.routes_summary || [];
   const [isFullscreen, setIsFullscreen] = useState(false);
   const viewContainerRef = useRef(null);
+  const clusterMode = useRef(false);
+  const clusterLoader = useRef(createClusterLoader());
+  const clusterTimer = useRef(null);
+  const scheduleClusterRefresh = useRef(() => {});
 
   // Resolver sessão ativa quando sessionId não é fornecido
   useEffect(() => {
@@ -65,7 +100,7 @@ export default function MapRealtimeView({ sessionId }) {
     loadActiveSession();
   }, [sessionId]);
 
-  // Função para carregar mapa (separada para ser reutilizada no resync)
+  // Carga inicial via HTTP (com a versão do estado; depois o WebSocket só manda deltas)
   const loadInitialMap = useCallback(async (isResync = false) => {
     if (!activeSessionId) return;
     if (!isResync) setLoading(true);
@@ -78,10 +113,16 @@ export default function MapRealtimeView({ sessionId }) {
       }
       
       const data = await response.json();
-      const points = Array.isArray(data?.points) ? data.points : [];
-      setMapData({ ...data, points });
+      const { state } = applyMapMessage(null, { ...data, type: 'snapshot' });
+      streamState.current = state;
+      setMapData(state);
+      setLayoutVersion(v => v + 1);
+      const points = state.points;
       if (data?.status === 'empty' || points.length === 0) {
-        setEmptyState('Nenhuma rota iniciada. Otimize as rotas para ver o mapa.');
+        // Pontos geocodificados em background chegam pelo WebSocket e o mapa aparece sozinho
+        setEmptyState(data?.geocoding?.pending
+          ? `Geocodificando ${data.geocoding.pending} endereços em segundo plano. Os pontos aparecem aqui conforme chegam.`
+          : 'Nenhuma rota iniciada. Otimize as rotas para ver o mapa.');
       } else {
         setEmptyState(null);
       }
@@ -101,59 +142,126 @@ export default function MapRealtimeView({ sessionId }) {
     loadInitialMap();
   }, [loadInitialMap]);
 
-  const updatePointMarker = useCallback((update) => {
-    const marker = markersById.current[update.point_id];
-    if (marker) {
-      marker.setStyle({ fillColor: update.new_color });
-    }
+  // Retorna false se algum ponto ainda não tem marcador e o mapa não existe (redesenhar tudo)
+  const refreshPointMarkers = useCallback((ids, points) => {
+    const changed = new Set(ids);
+    let drawn = true;
+    points.forEach(point => {
+      if (!changed.has(point.id)) return;
+      const marker = markersById.current[point.id];
+      if (marker) {
+        marker.setLatLng([point.lat, point.lng]);
+        marker.setStyle({ fillColor: point.color });
+        marker.setPopupContent(pointPopupHtml(point));
+      } else if (markersLayer.current && point.lat && point.lng) {
+        // Coordenada que chegou do geocoding em background
+        const created = L.circleMarker([point.lat, point.lng], {
+          radius: 8, fillColor: point.color, color: '#000', weight: 2, opacity: 1, fillOpacity: 0.8
+        }).bindPopup(pointPopupHtml(point));
+        markersById.current[point.id] = created;
+        markersLayer.current.addLayer(created);
+      } else if (!markersLayer.current) {
+        drawn = false;
+      }
+    });
+    return drawn;
+  }, []);
 
-    setMapData(prev => {
-      if (!prev) return prev;
-      const updatedPoints = prev.points.map(p => {
-        if (p.id === update.point_id) {
-          return { ...p, color: update.new_color, status: update.status };
-        }
-        return p;
-      });
+  const updateDelivererMarker = useCallback((position) => {
+    if (!map.current || position.lat == null || position.lng == null) return;
+    const existing = delivererMarkers.current[position.route_id];
+    if (existing) {
+      existing.setLatLng([position.lat, position.lng]);
+      return;
+    }
+    const route = streamState.current?.routes_summary?.find(r => r.route_id === position.route_id);
+    const marker = L.circleMarker([position.lat, position.lng], {
+      radius: 10,
+      fillColor: route?.color || '#111827',
+      color: '#fff',
+      weight: 3,
+      fillOpacity: 1
+    }).bindTooltip(`🛵 ${position.deliverer || 'Entregador'}`);
+    marker.addTo(map.current);
+    delivererMarkers.current[position.route_id] = marker;
+  }, []);
 
-      const updatedRoutes = prev.routes_summary.map(r => {
-        if (r.route_id === update.route_id) {
-          return {
-            ...r,
-            delivered: update.delivered,
-            completion_rate: update.route_completion
-          };
-        }
-        return r;
-      });
+  // Modo cluster: o servidor devolve só os itens visíveis no zoom atual
+  const drawClusters = useCallback(async () => {
+    if (!map.current || !activeSessionId) return;
+    const bounds = map.current.getBounds();
+    const zoom = map.current.getZoom();
+    let data;
+    try {
+      data = await clusterLoader.current.load(clustersUrl(activeSessionId, zoom, {
+        west: bounds.getWest(), south: bounds.getSouth(), east: bounds.getEast(), north: bounds.getNorth()
+      }));
+    } catch (err) {
+      console.error('Erro ao carregar clusters:', err);
+      return;
+    }
+    if (!data || !markersLayer.current || !clusterMode.current) return;
 
-      return {
-        ...prev,
-        points: updatedPoints,
-        routes_summary: updatedRoutes
-      };
+    markersLayer.current.clearLayers();
+    markersById.current = {};
+    data.items.forEach(item => {
+      if (item.type === 'cluster') {
+        const marker = L.circleMarker([item.lat, item.lng], {
+          radius: clusterRadius(item.count),
+          fillColor: item.color || '#6b7280',
+          color: '#fff',
+          weight: 2,
+          fillOpacity: 0.85
+        }).bindTooltip(`${item.count} paradas • ${item.statuses.delivered || 0} entregues`);
+        marker.on('click', () => map.current.setView([item.lat, item.lng], Math.max(item.expansion_zoom, zoom + 1)));
+        markersLayer.current.addLayer(marker);
+        return;
+      }
+      const marker = L.circleMarker([item.lat, item.lng], {
+        radius: 8, fillColor: item.color, color: '#000', weight: 2, opacity: 1, fillOpacity: 0.8
+      }).bindPopup(pointPopupHtml(item));
+      markersById.current[item.id] = marker;
+      markersLayer.current.addLayer(marker);
     });
-  }, []);
+  }, [activeSessionId]);
 
-  const updateRoutesSummary = useCallback((update) => {
-    setMapData(prev => {
-      if (!prev) return prev;
-      return {
-        ...prev,
-        routes_summary: prev.routes_summary.map(r => {
-          const newRoute = update.routes.find(u => u.route_id === r.route_id);
-          return newRoute
-            ? { ...r, delivered: newRoute.delivered, completion_rate: newRoute.completion }
-            : r;
-        })
-      };
-    });
-  }, []);
+  // Move/zoom e rajadas de deltas viram uma única consulta
+  scheduleClusterRefresh.current = () => {
+    clearTimeout(clusterTimer.current);
+    clusterTimer.current = setTimeout(drawClusters, 300);
+  };
 
-  // Inicializar mapa (sem reiniciar WebSocket)
+  // Aplica snapshot/delta do WebSocket; retorna true se precisa pedir resync
+  const applyStreamMessage = useCallback((message) => {
+    const { state, resync, changed } = applyMapMessage(streamState.current, message);
+    streamState.current = state;
+    if (message.type === 'deliverer_position' && state) {
+      updateDelivererMarker(message);
+    }
+    if (changed === 'all') {
+      setMapData(state);
+      setLayoutVersion(v => v + 1);
+      setEmptyState(state.points.length === 0 ? 'Nenhuma rota iniciada. Otimize as rotas para ver o mapa.' : null);
+      setError(null);
+      setLoading(false);
+    } else if (changed && clusterMode.current) {
+      // Contagens dos clusters mudaram: o servidor reagrupa na nova versão
+      scheduleClusterRefresh.current();
+      setMapData(state);
+    } else if (changed) {
+      if (!refreshPointMarkers(changed, state.points)) setLayoutVersion(v => v + 1);
+      setMapData(state);
+      if (state.points.length) setEmptyState(null);
+    }
+    return resync;
+  }, [refreshPointMarkers, updateDelivererMarker]);
+
+  // Inicializar mapa (sem reiniciar WebSocket). Só roda quando a estrutura muda
+  // (snapshot, parada movida, reordenação), não a cada mudança de status.
   useEffect(() => {
-    if (!mapData || !mapContainer.current || !activeSessionId) return;
-    if (!Array.isArray(mapData.points) || mapData.points.length === 0) return;
+    const current = streamState.current;
+    if (!current || !mapContainer.current || !activeSessionId) return;
+    if (!Array.isArray(current.points) || current.points.length === 0) return;
 
     // Criar mapa
     if (!map.current) {
@@ -162,6 +270,9 @@ export default function MapRealtimeView({ sessionId }) {
         attribution: '© OpenStreetMap contributors'
       }).addTo(map.current);
       markersLayer.current = L.layerGroup().addTo(map.current);
+      map.current.on('moveend', () => {
+        if (clusterMode.current) scheduleClusterRefresh.current();
+      });
     }
 
     // Limpar marcadores anteriores
@@ -169,48 +280,49 @@ export default function MapRealtimeView({ sessionId }) {
       markersLayer.current.clearLayers();
     }
 
-    // Adicionar pontos ao mapa
-    const group = new L.FeatureGroup();
-    markersById.current = {};
-      mapData.points.forEach(point => {
-      const marker = L.circleMarker(
-        [point.lat, point.lng],
-        {
-          radius: 8,
-          fillColor: point.color,
-          color: '#000',
-          weight: 2,
-          opacity: 1,
-          fillOpacity: 0.8
-        }
-      );
-
-      // Criar popup com botão Navegar + botão Marcar entregue quando aplicável
-      const popupHtml = `
-        <div style="font-size:12px; width:220px">
-          <strong>${point.address}</strong><br/>
-          <small>Rota: ${point.route_color} | Parada: ${point.sequence}</small><br/>
-          <small>Status: ${point.status === 'delivered' ? '✅ Entregue' : '⏳ Pendente'}</small>
-          <div style="margin-top:8px; display:flex; gap:6px">
-            <a target="_blank" rel="noreferrer" href="https://www.google.com/maps/dir/?api=1&destination=${point.lat},${point.lng}" style="flex:1;padding:6px 8px;background:#2563eb;color:white;border-radius:8px;text-decoration:none;font-size:12px;text-align:center">Navegar</a>
-            ${point.status !== 'delivered' ? `<button data-point-id="${point.id}" data-route-id="${point.route_id}" data-sequence="${point.sequence}" style="flex:1;padding:6px 8px;background:#16a34a;color:white;border-radius:8px;border:none;font-size:12px;cursor:pointer">Entregar</button>` : ''}
-            <button class="generate-link" data-route-id="${point.route_id}" style="padding:6px 8px;background:#f59e0b;color:white;border-radius:8px;border:none;font-size:12px;cursor:pointer">Gerar link</button>
-          </div>
-        </div>
-      `;
+    clusterMode.current = current.points.length > CLUSTER_THRESHOLD;
+    if (clusterMode.current) {
+      // Enquadra pelos extremos (sem criar um marcador por ponto); moveend carrega os clusters
+      markersById.current = {};
+      const located = current.points.filter(p => p.lat && p.lng);
+      if (located.length > 0) {
+        const bounds = L.latLngBounds([located[0].lat, located[0].lng], [located[0].lat, located[0].lng]);
+        located.forEach(p => bounds.extend([p.lat, p.lng]));
+        map.current.fitBounds(bounds.pad(0.1));
+      }
+      scheduleClusterRefresh.current();
+    } else {
+      // Adicionar pontos ao mapa
+      const group = new L.FeatureGroup();
+      markersById.current = {};
+      current.points.forEach(point => {
+        const marker = L.circleMarker(
+          [point.lat, point.lng],
+          {
+            radius: 8,
+            fillColor: point.color,
+            color: '#000',
+            weight: 2,
+            opacity: 1,
+            fillOpacity: 0.8
+          }
+        );
 
-      marker.bindPopup(popupHtml);
+        // Popup com botão Navegar + botão Marcar entregue quando aplicável
+        marker.bindPopup(pointPopupHtml(point));
       
-      markersById.current[point.id] = marker;
-      group.addLayer(marker);
-      markersLayer.current?.addLayer(marker);
-    });
+        markersById.current[point.id] = marker;
+        group.addLayer(marker);
+        markersLayer.current?.addLayer(marker);
+      });
 
-    if (group.getLayers().length > 0) {
-      map.current.fitBounds(group.getBounds().pad(0.1));
+      if (group.getLayers().length > 0) {
+        map.current.fitBounds(group.getBounds().pad(0.1));
+      }
     }
 
     // Delegação de clique para botões dentro dos popups (marcar entrega)
+    map.current.off('popupopen');
     map.current.on('popupopen', (e) => {
       try {
         const popupNode = e.popup.getElement();
@@ -285,12 +397,41 @@ export default function MapRealtimeView({ sessionId }) {
       }
     });
 
-  }, [mapData, activeSessionId]);
+  }, [layoutVersion, activeSessionId]);
 
   // Conectar WebSocket para atualizações em tempo real
   useEffect(() => {
     if (!activeSessionId) return;
 
+    // WebSocket que falha antes de abrir 2x seguidas → SSE (só leitura, sem canal de volta)
+    let failedOpens = 0;
+
+    const connectSse = () => {
+      if (sseRef.current) sseRef.current.close();
+      const source = new EventSource(sseUrl(activeSessionId, streamState.current));
+      sseRef.current = source;
+
+      source.onopen = () => {
+        console.log('✅ SSE conectado');
+        setWsConnected(true);
+        setReconnectAttempt(0);
+      };
+
+      source.onmessage = (event) => {
+        try {
+          // O servidor conserta buracos sozinho; resync aqui = estado local divergente → reabre da versão atual
+          if (applyStreamMessage(JSON.parse(event.data))) connectSse();
+        } catch (err) {
+          console.error('Erro ao processar update SSE:', err);
+        }
+      };
+
+      // O EventSource reconecta sozinho (retry do servidor) mandando Last-Event-ID
+      source.onerror = () => {
+        setWsConnected(false);
+      };
+    };
+
     const connectWebSocket = () => {
       // Limpar conexão anterior e timeouts
       if (wsRef.current) {
@@ -312,17 +453,18 @@ export default function MapRealtimeView({ sessionId }) {
 
       const ws = new WebSocket(wsUrl);
       wsRef.current = ws;
+      let opened = false;
 
       ws.onopen = () => {
         console.log('✅ WebSocket conectado');
+        opened = true;
+        failedOpens = 0;
         setWsConnected(true);
         setReconnectAttempt(0); // Reset tentativas
         
-        // Sincronizar estado ao reconectar para garantir que não perdemos nada
-        loadInitialMap(true);
-
+        // Informa a versão que já temos: o servidor reenvia só os deltas perdidos
         if (ws.readyState === WebSocket.OPEN) {
-          ws.send('ping');
+          ws.send(subscribeMessage(streamState.current));
         }
         pingIntervalRef.current = setInterval(() => {
           if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
@@ -333,12 +475,10 @@ export default function MapRealtimeView({ sessionId }) {
 
       ws.onmessage = (event) => {
         try {
-          const update = JSON.parse(event.data);
-
-          if (update.type === 'point_update') {
-            updatePointMarker(update);
-          } else if (update.type === 'state_update') {
-            updateRoutesSummary(update);
+          const message = JSON.parse(event.data);
+          // Buraco de seq ou versão divergente no pong → pede o que falta a partir do último seq
+          if (applyStreamMessage(message) && ws.readyState === WebSocket.OPEN) {
+            ws.send(resyncMessage(streamState.current));
           }
         } catch (err) {
           console.error('Erro ao processar update WebSocket:', err);
@@ -359,6 +499,13 @@ export default function MapRealtimeView({ sessionId }) {
           pingIntervalRef.current = null;
         }
 
+        if (!opened) failedOpens += 1;
+        if (failedOpens >= 2) {
+          console.log('🔁 WebSocket indisponível, usando SSE');
+          connectSse();
+          return;
+        }
+
         // Exponential Backoff: 2s, 4s, 8s, 16s, máx 30s
         const backoff = Math.min(Math.pow(2, reconnectAttempt + 1) * 1000, 30000);
         setReconnectAttempt(prev => prev + 1);
@@ -368,9 +515,17 @@ export default function MapRealtimeView({ sessionId }) {
       };
     };
 
-    connectWebSocket();
+    if (new URLSearchParams(window.location.search).get('transport') === 'sse') {
+      connectSse();
+    } else {
+      connectWebSocket();
+    }
 
     return () => {
+      if (sseRef.current) {
+        sseRef.current.close();
+        sseRef.current = null;
+      }
       if (wsRef.current) {
         wsRef.current.close();
         wsRef.current = null;
@@ -384,7 +539,7 @@ export default function MapRealtimeView({ sessionId }) {
         reconnectTimeoutRef.current = null;
       }
     };
-  }, [activeSessionId, updatePointMarker, updateRoutesSummary]);
+  }, [activeSessionId, applyStreamMessage]);
 
   useEffect(() => {
     function onFullscreenChange() {
@@ -0,0 +1,69 @@
+/**
+ * 📍 GPS Uploader (entregador)
+ * Junta os fixes do navigator.geolocation.watchPosition e envia em lote a cada
+ * intervalo (POST /api/deliverer/gps). Sem rede, guarda os mais recentes
+ * (até maxBuffer) e reenvia quando voltar; o servidor descarta repetidos.
+ *
+ * send(batch) → true se o lote foi resolvido (aceito ou recusado de vez),
+ *               false para tentar de novo no próximo ciclo.
+ */
+export function createGpsUploader({ send, intervalMs = 5000, minGapMs = 1000, maxBuffer = 600 }) {
+  let buffer = [];
+  let inFlight = false;
+  let lastT = 0;
+
+  const push = (coords, timestamp) => {
+    const t = timestamp || Date.now();
+    // watchPosition com alta precisão pode disparar várias vezes por segundo
+    if (t - lastT < minGapMs) return;
+    lastT = t;
+    buffer.push({
+      t,
+      lat: coords.latitude,
+      lng: coords.longitude,
+      acc: coords.accuracy ?? null,
+      speed: coords.speed ?? null,
+      heading: coords.heading ?? null,
+    });
+    if (buffer.length > maxBuffer) buffer.splice(0, buffer.length - maxBuffer);
+  };
+
+  const flush = async () => {
+    if (inFlight || buffer.length === 0) return;
+    const batch = buffer;
+    buffer = [];
+    inFlight = true;
+    let done = false;
+    try {
+      done = await send(batch);
+    } catch {
+      done = false;
+    } finally {
+      inFlight = false;
+    }
+    if (!done) buffer = batch.concat(buffer).slice(-maxBuffer);
+  };
+
+  const timer = setInterval(flush, intervalMs);
+
+  return {
+    push,
+    flush,
+    stop: () => {
+      clearInterval(timer);
+      flush();
+    },
+  };
+}
+
+/** Envio pelo endpoint de lote; 401/403/410 = token inválido ou rota encerrada (não reenviar) */
+export const postGpsBatch = (fetchFn, getToken) => async (batch) => {
+  const token = getToken();
+  if (!token) return false;
+  const res = await fetchFn('/api/deliverer/gps', {
+    method: 'POST',
+    headers: { 'X-Tracking-Token': token },
+    body: JSON.stringify({ fixes: batch }),
+  });
+  return res.ok || [401, 403, 410, 413, 422].includes(res.status);
+};
@@ -0,0 +1,47 @@
+/**
+ * 🗺️ Map Clusters (cliente)
+ * Sessões grandes: em vez de um marcador por ponto, o mapa pede ao servidor os
+ * clusters do zoom atual só dentro da área visível (services/map_clusters.py).
+ * O servidor agrupa uma vez por versão do mapa; aqui só montamos a consulta e
+ * descartamos respostas velhas (o usuário moveu o mapa antes de chegarem).
+ */
+
+/** Acima disso o MapRealtimeView troca os marcadores individuais pelos clusters */
+export const CLUSTER_THRESHOLD = 1500;
+
+/** URL da consulta por zoom + bbox (oeste,sul,leste,norte) */
+export const clustersUrl = (sessionId, zoom, bounds) => {
+  const bbox = [bounds.west, bounds.south, bounds.east, bounds.north].map((v) => v.toFixed(6)).join(',');
+  return `/api/map/realtime/${sessionId}/clusters?${new URLSearchParams({ zoom: String(zoom), bbox })}`;
+};
+
+/** Raio do marcador do cluster (cresce com log da contagem) */
+export const clusterRadius = (count) => Math.min(30, 10 + Math.log2(Math.max(count, 1)) * 3);
+
+/**
+ * Carregador "última consulta vence": cancela a anterior ao pedir outra.
+ * load(url) → resposta JSON ou null se foi substituída/cancelada.
+ */
+export function createClusterLoader(fetchFn = fetch) {
+  let controller = null;
+  return {
+    async load(url) {
+      if (controller) controller.abort();
+      const current = new AbortController();
+      controller = current;
+      try {
+        const res = await fetchFn(url, { signal: current.signal });
+        if (!res.ok) throw new Error(`clusters: HTTP ${res.status}`);
+        const data = await res.json();
+        return controller === current ? data : null;
+      } catch (err) {
+        if (err.name === 'AbortError') return null;
+        throw err;
+      }
+    },
+    cancel() {
+      if (controller) controller.abort();
+      controller = null;
+    },
+  };
+}
@@ -0,0 +1,174 @@
+/**
+ * 🛰️ Map Stream (cliente)
+ * Aplica as mensagens do WebSocket do mapa em tempo real sobre o estado local.
+ * Deltas chegam com seq contínuo por sessão. Ao (re)conectar ou achar um buraco
+ * na sequência o cliente manda o último seq visto: o servidor reenvia só os
+ * deltas perdidos (buffer de replay) ou, se o buraco for antigo, o snapshot.
+ *
+ * Funções puras (sem React/Leaflet): usadas pelo MapRealtimeView e pelo
+ * harness em webapp/scripts/map-stream-harness.mjs.
+ */
+
+const versionMessage = (type, state) => JSON.stringify({
+  type,
+  epoch: state?.epoch ?? null,
+  seq: state?.seq ?? null,
+  shape: state?.shape ?? null,
+});
+
+/**
+ * Mensagem de inscrição enviada ao conectar: com a versão que o cliente já tem
+ * (GET inicial ou reconexão) o servidor manda só o que mudou desde então.
+ */
+export const subscribeMessage = (state) => versionMessage('subscribe', state);
+
+/** Pedido de ressincronização (sem estado → snapshot completo) */
+export const resyncMessage = (state) => versionMessage('resync', state);
+
+const summaryById = (summaries) => {
+  const byId = {};
+  summaries.forEach((s) => { byId[s.route_id] = s; });
+  return byId;
+};
+
+const mergeSummaries = (current, updates) => {
+  const byId = summaryById(updates);
+  return current.map((r) => (byId[r.route_id] ? { ...r, ...byId[r.route_id] } : r));
+};
+
+/** Renumera as paradas de uma rota (sequence 1..n) seguindo a ordem dada */
+const resequence = (points, routeId, orderedIds) => {
+  const position = {};
+  orderedIds.forEach((id, idx) => { position[id] = idx + 1; });
+  return points.map((p) => (
+    p.route_id === routeId && position[p.id] !== p.sequence ? { ...p, sequence: position[p.id] } : p
+  ));
+};
+
+const routeOrder = (points, routeId) => points
+  .filter((p) => p.route_id === routeId)
+  .sort((a, b) => a.sequence - b.sequence)
+  .map((p) => p.id);
+
+const applyStopStatus = (state, msg) => {
+  const ids = new Set(msg.ids);
+  return {
+    ...state,
+    points: state.points.map((p) => (ids.has(p.id) ? { ...p, status: msg.status, color: msg.color } : p)),
+    routes_summary: mergeSummaries(state.routes_summary, [msg.route]),
+  };
+};
+
+// Espelha apply_event(TRANSFERRED): sai da origem mantendo a ordem e entra no fim do destino.
+// Idempotente: reaplicar o mesmo delta (snapshot já com a mudança) não altera nada.
+const applyStopMoved = (state, msg) => {
+  const moving = msg.points.map((p) => p.id);
+  const movingSet = new Set(moving);
+  const target = summaryById(msg.routes)[msg.to_route] || {};
+  const moved = {};
+  msg.points.forEach((p) => { moved[p.id] = p; });
+
+  let points = state.points.map((p) => (movingSet.has(p.id) ? {
+    ...p,
+    route_id: msg.to_route,
+    route_color: target.color ?? p.route_color,
+    deliverer: target.deliverer || 'Não atribuído',
+    status: moved[p.id].status ?? p.status,
+    color: moved[p.id].color ?? p.color,
+  } : p));
+  const sourceOrder = routeOrder(state.points, msg.from_route).filter((id) => !movingSet.has(id));
+  const targetOrder = routeOrder(state.points, msg.to_route).filter((id) => !movingSet.has(id)).concat(moving);
+  points = resequence(points, msg.from_route, sourceOrder);
+  points = resequence(points, msg.to_route, targetOrder);
+  return { ...state, points, routes_summary: mergeSummaries(state.routes_summary, msg.routes) };
+};
+
+// Espelha apply_event(REORDERED): ids fora da ordem nova vão para o fim, na ordem atual
+const applyRouteReordered = (state, msg) => {
+  const listed = new Set(msg.order);
+  const current = routeOrder(state.points, msg.route_id);
+  const order = msg.order.filter((id) => current.includes(id)).concat(current.filter((id) => !listed.has(id)));
+  return { ...state, points: resequence(state.points, msg.route_id, order) };
+};
+
+// Coordenadas que o geocoding em background resolveu: atualiza o ponto ou o adiciona
+// (pré-separação o snapshot só traz pontos com coordenadas). Idempotente.
+const applyPointsGeocoded = (state, msg) => {
+  const incoming = {};
+  msg.points.forEach((p) => { incoming[p.id] = p; });
+  const points = state.points.map((p) => {
+    const located = incoming[p.id];
+    if (!located) return p;
+    delete incoming[p.id];
+    return { ...p, lat: located.lat, lng: located.lng };
+  }).concat(Object.values(incoming));
+  const status = state.status === 'empty' && points.length ? 'planning' : state.status;
+  return { ...state, status, points, total_points: points.length };
+};
+
+const DELTAS = {
+  stop_status: applyStopStatus,
+  stop_moved: applyStopMoved,
+  route_reordered: applyRouteReordered,
+  points_geocoded: applyPointsGeocoded,
+};
+
+/**
+ * Aplica uma mensagem do servidor.
+ * Retorna { state, resync, changed }:
+ *   resync  → enviar resyncMessage(state) (buraco de seq, epoch/shape divergente)
+ *   changed → 'all' (redesenhar), array de ids alterados ou null (nada mudou nos pontos)
+ */
+export function applyMapMessage(state, msg) {
+  if (!msg || typeof msg !== 'object') return { state, resync: false, changed: null };
+
+  if (msg.type === 'snapshot') {
+    const { type, ...snapshot } = msg;
+    const points = Array.isArray(snapshot.points) ? snapshot.points : [];
+    return {
+      state: { ...snapshot, points, routes_summary: snapshot.routes_summary || [], positions: state?.positions || {} },
+      resync: false,
+      changed: 'all',
+    };
+  }
+
+  if (msg.type === 'pong') {
+    const stale = !state || msg.epoch !== state.epoch || msg.shape !== state.shape || msg.seq > state.seq;
+    return { state, resync: stale, changed: null };
+  }
+
+  if (msg.type === 'deliverer_position') {
+    if (!state) return { state, resync: false, changed: null };
+    const positions = { ...state.positions, [msg.route_id]: msg };
+    return { state: { ...state, positions }, resync: false, changed: null };
+  }
+
+  const apply = DELTAS[msg.type];
+  // Sem estado ainda: o snapshot pedido no subscribe está a caminho
+  if (!apply || !state) return { state, resync: false, changed: null };
+  if (msg.seq <= state.seq) return { state, resync: false, changed: null }; // já refletido
+  if (msg.seq !== state.seq + 1) {
+    // Buraco: um único resync até o replay/snapshot chegar (o pong cobre resposta perdida)
+    if (state.resyncing) return { state, resync: false, changed: null };
+    return { state: { ...state, resyncing: true }, resync: true, changed: null };
+  }
+
+  const next = { ...apply(state, msg), seq: msg.seq, resyncing: undefined };
+  if (msg.shape !== undefined) next.shape = msg.shape;
+  let changed = 'all';
+  if (msg.type === 'stop_status') changed = msg.ids;
+  else if (msg.type === 'points_geocoded') changed = msg.points.map((p) => p.id);
+  return { state: next, resync: false, changed };
+}
+
+/** Id de evento SSE ("epoch:seq:shape") da versão que o cliente já tem */
+export const eventId = (state) => (state?.epoch ? `${state.epoch}:${state.seq}:${state.shape}` : '');
+
+/**
+ * URL do stream SSE (alternativa ao WebSocket): a versão vai na query na
+ * primeira conexão; nas reconexões automáticas o EventSource manda Last-Event-ID.
+ */
+export const sseUrl = (sessionId, state) => {
+  const id = eventId(state);
+  return `/api/map/sse/${sessionId}${id ? `?${new URLSearchParams({ last_event_id: id })}` : ''}`;
+};
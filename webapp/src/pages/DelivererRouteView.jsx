@@ -7,6 +7,7 @@ import {
   AlertCircle, MessageSquare
 } from 'lucide-react';
 import { fetchWithAuth } from '../api_client'
+import { createGpsUploader, postGpsBatch } from '../lib/gpsUploader'
 
 // --- CONFIGURAÇÃO DE ESTILO E ÍCONES ---
 
@@ -111,6 +112,8 @@ export default function DelivererRouteView() {
   
   const pollIntervalRef = useRef(null)
   const mapRef = useRef(null)
+  const trackingTokenRef = useRef(null)
+  const gpsUploaderRef = useRef(null)
 
   useEffect(() => {
     if (selectedStop && selectedStop.packages) {
@@ -158,12 +161,16 @@ export default function DelivererRouteView() {
       fetchUserRoute(identifier, isPublicLink, true)
     }, 5000)
     
-    // 4. Obter localização e orientação
+    // 4. Obter localização e orientação (e enviar em lote para o mapa do admin)
+    gpsUploaderRef.current = createGpsUploader({
+      send: postGpsBatch(fetchWithAuth, () => trackingTokenRef.current),
+    });
     const watchId = navigator.geolocation.watchPosition(
       (pos) => {
         const { latitude, longitude, heading: gpsHeading } = pos.coords;
         setUserLocation([latitude, longitude]);
         if (gpsHeading) setHeading(gpsHeading);
+        gpsUploaderRef.current?.push(pos.coords, pos.timestamp);
       },
       (err) => console.warn("Erro GPS:", err),
       { enableHighAccuracy: true, maximumAge: 1000, timeout: 5000 }
@@ -184,6 +191,7 @@ export default function DelivererRouteView() {
     return () => {
       if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
       navigator.geolocation.clearWatch(watchId);
+      gpsUploaderRef.current?.stop();
       window.removeEventListener('deviceorientation', handleOrientation);
       window.removeEventListener('online', () => setIsOffline(false));
       window.removeEventListener('offline', () => setIsOffline(true));
@@ -216,12 +224,15 @@ export default function DelivererRouteView() {
         ? `/api/deliverer/public-route/${identifier}`
         : `/api/deliverer/route?user_id=${identifier}`;
         
-      const res = await fetchWithAuth(url)
+      // initData assinado pelo Telegram: sem ele o servidor não emite o tracking_token
+      const initData = window.Telegram?.WebApp?.initData;
+      const res = await fetchWithAuth(url, initData && !isPublic ? { headers: { 'X-Telegram-Init-Data': initData } } : {})
       if (!res.ok) throw new Error('Rota não carregada')
       
       const data = await res.json()
       console.log("📦 Dados da rota recebidos:", data);
       setRouteInfo(data)
+      trackingTokenRef.current = data.tracking_token || null
       
       // Lógica para selecionar a parada correta
       if (!selectedStop && data.stops && data.stops.length > 0) {
@@ -232,8 +243,8 @@ export default function DelivererRouteView() {
           setSelectedStop(firstPending);
         }
       } else if (selectedStop && data.stops) {
-        // Atualizar objeto selectedStop com dados novos
-        const updated = data.stops.find(s => s.id === selectedStop.id) || data.stops.find(s => s.lat === selectedStop.lat && s.lng === selectedStop.lng);
+        // Atualizar objeto selectedStop com dados novos (por coordenada: a rota pode ter sido reordenada)
+        const updated = data.stops.find(s => s.lat === selectedStop.lat && s.lng === selectedStop.lng) || data.stops.find(s => s.id === selectedStop.id);
         if (updated) setSelectedStop(updated);
       }
     } catch (err) {
@@ -275,6 +286,10 @@ export default function DelivererRouteView() {
         params.append('reason', reason);
       }
       
+      if (selectedStop.packages?.length) {
+        params.append('package_id', selectedStop.packages[0]);
+      }
+      
       if (userLocation) {
         params.append('lat', userLocation[0].toString())
         params.append('lng', userLocation[1].toString())